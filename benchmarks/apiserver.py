@@ -0,0 +1,457 @@
+"""Benchmarks of the API Server hot paths.
+
+A deployment with a trivial, a CPU-bound and a streaming workflow is created on
+an API Server running in-process, then every scenario is measured through two
+transports: `httpx.ASGITransport`, calling the app directly, and a real TCP
+socket, with uvicorn serving the app from another thread.
+
+The UI proxy is measured against a static upstream listening on the UI port of
+the deployment, instead of a Next.js server.
+
+Results can be saved as JSON and compared against a previous run to spot
+regressions across commits: the script exits with a non-zero status if any
+metric got worse than the threshold.
+
+Usage:
+    python benchmarks/apiserver.py [--transport asgi|socket|all] [--requests 200]
+        [--concurrency 16] [--json] [--output results.json]
+        [--compare baseline.json] [--threshold 0.2]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Literal
+
+import httpx
+import uvicorn
+
+WORKFLOWS = """
+from workflows import Context, Workflow, step
+from workflows.events import Event, StartEvent, StopEvent
+
+
+class Tick(Event):
+    i: int
+
+
+class Trivial(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result="ok")
+
+
+class CpuBound(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result=sum(i * i for i in range(ev.get("n", 100_000))))
+
+
+class Streaming(Workflow):
+    @step
+    async def run_step(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        for i in range(ev.get("events", 100)):
+            ctx.write_event_to_stream(Tick(i=i))
+        return StopEvent(result="done")
+
+
+trivial = Trivial(timeout=None)
+cpu = CpuBound(timeout=None)
+streaming = Streaming(timeout=None)
+"""
+
+DEPLOYMENT = """
+name: bench
+services:
+  trivial:
+    name: Trivial
+    source:
+      type: local
+      location: src
+    import-path: src/bench_workflows:trivial
+  cpu:
+    name: CPU bound
+    source:
+      type: local
+      location: src
+    import-path: src/bench_workflows:cpu
+  streaming:
+    name: Streaming
+    source:
+      type: local
+      location: src
+    import-path: src/bench_workflows:streaming
+ui:
+  name: UI
+  port: {ui_port}
+  source:
+    type: local
+    location: src
+"""
+
+# Served by the static upstream of the UI proxy
+UI_PAYLOAD = b"x" * 64 * 1024
+
+# Metrics where a lower value is better, the others are rates
+LOWER_IS_BETTER = {"ms", "s"}
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def static_ui(scope: dict, receive: Callable, send: Callable) -> None:
+    if scope["type"] != "http":
+        return
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/octet-stream")],
+        }
+    )
+    await send({"type": "http.response.body", "body": UI_PAYLOAD})
+
+
+class ThreadedServer:
+    """Runs an ASGI app with uvicorn on a real socket, from a thread with its own loop."""
+
+    def __init__(
+        self, app: Any, port: int, lifespan: Literal["auto", "on", "off"] = "on"
+    ) -> None:
+        self.port = port
+        self._server = uvicorn.Server(
+            uvicorn.Config(
+                app, port=port, lifespan=lifespan, log_level="warning", loop="asyncio"
+            )
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> "ThreadedServer":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Server exited before starting")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run_concurrently(
+    count: int, concurrency: int, request: Callable[[int], Awaitable[Any]]
+) -> float:
+    """Runs `count` requests, `concurrency` at a time, and returns the elapsed seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int) -> None:
+        async with semaphore:
+            await request(i)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(count)))
+    return time.perf_counter() - started_at
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, transport: str, args: Any) -> None:
+        self.client = client
+        self.transport = transport
+        self.args = args
+        self.results: list[dict] = []
+
+    def record(self, scenario: str, metric: str, value: float, unit: str) -> None:
+        self.results.append(
+            {
+                "transport": self.transport,
+                "scenario": scenario,
+                "metric": metric,
+                "value": round(value, 3),
+                "unit": unit,
+            }
+        )
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        response = await self.client.post(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def deploy(self, deployment_file: Path) -> None:
+        for reload in (False, True):
+            started_at = time.perf_counter()
+            with open(deployment_file, "rb") as f:
+                await self.post(
+                    "/deployments/create",
+                    params={
+                        "base_path": str(deployment_file.parent),
+                        "local": True,
+                        "reload": reload,
+                    },
+                    files={"config_file": f},
+                )
+            elapsed = time.perf_counter() - started_at
+            self.record("deploy", "reload" if reload else "create", elapsed, "s")
+
+    async def tasks_run(self, service_id: str, task_input: dict) -> None:
+        body = {"service_id": service_id, "input": json.dumps(task_input)}
+        for _ in range(self.args.warmup):
+            await self.post("/deployments/bench/tasks/run", json=body)
+
+        latencies = []
+        for _ in range(self.args.requests):
+            started_at = time.perf_counter()
+            await self.post("/deployments/bench/tasks/run", json=body)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+        scenario = f"tasks/run {service_id}"
+        for q in (0.5, 0.95, 0.99):
+            self.record(scenario, f"p{int(q * 100)}", percentile(latencies, q), "ms")
+
+        elapsed = await run_concurrently(
+            self.args.requests,
+            self.args.concurrency,
+            lambda _: self.post("/deployments/bench/tasks/run", json=body),
+        )
+        self.record(scenario, "throughput", self.args.requests / elapsed, "req/s")
+
+    async def tasks_create(self) -> None:
+        body = {"service_id": "trivial", "input": "{}"}
+        elapsed = await run_concurrently(
+            self.args.requests,
+            self.args.concurrency,
+            lambda _: self.post("/deployments/bench/tasks/create", json=body),
+        )
+        self.record("tasks/create", "throughput", self.args.requests / elapsed, "req/s")
+
+    async def events(self) -> None:
+        body = {
+            "service_id": "streaming",
+            "input": json.dumps({"events": self.args.events}),
+        }
+        task = (await self.post("/deployments/bench/tasks/create", json=body)).json()
+        received = 0
+        started_at = time.perf_counter()
+        async with self.client.stream(
+            "GET",
+            f"/deployments/bench/tasks/{task['task_id']}/events",
+            params={"session_id": task["session_id"]},
+        ) as response:
+            async for line in response.aiter_lines():
+                if line:
+                    received += 1
+        elapsed = time.perf_counter() - started_at
+        self.record("tasks/events", "throughput", received / elapsed, "events/s")
+
+    async def sessions(self) -> None:
+        session_ids: list[str] = []
+
+        async def create(_: int) -> None:
+            response = await self.post("/deployments/bench/sessions/create")
+            session_ids.append(response.json()["session_id"])
+
+        async def delete(i: int) -> None:
+            await self.post(
+                "/deployments/bench/sessions/delete",
+                params={"session_id": session_ids[i]},
+            )
+
+        count, concurrency = self.args.requests, self.args.concurrency
+        elapsed = await run_concurrently(count, concurrency, create)
+        self.record("sessions/create", "throughput", count / elapsed, "req/s")
+        elapsed = await run_concurrently(count, concurrency, delete)
+        self.record("sessions/delete", "throughput", count / elapsed, "req/s")
+
+    async def ui_proxy(self) -> None:
+        async def get(_: int) -> None:
+            response = await self.client.get("/deployments/bench/ui/index.html")
+            response.raise_for_status()
+
+        count = self.args.requests
+        elapsed = await run_concurrently(count, self.args.concurrency, get)
+        self.record("ui proxy", "throughput", count / elapsed, "req/s")
+        mb = count * len(UI_PAYLOAD) / 1024 / 1024
+        self.record("ui proxy", "bandwidth", mb / elapsed, "MB/s")
+
+    async def run_all(self, deployment_file: Path) -> list[dict]:
+        await self.deploy(deployment_file)
+        await self.tasks_run("trivial", {})
+        await self.tasks_run("cpu", {"n": self.args.cpu_n})
+        await self.tasks_create()
+        await self.events()
+        await self.sessions()
+        await self.ui_proxy()
+        return self.results
+
+
+def setup(root: Path) -> tuple[Path, int]:
+    """Creates the deployment and configures the API Server, returns the UI port."""
+    from llama_deploy.apiserver.deployment import Deployment
+    from llama_deploy.apiserver.settings import settings
+
+    (root / "src").mkdir()
+    (root / "src" / "bench_workflows.py").write_text(WORKFLOWS)
+    ui_port = free_port()
+    deployment_file = root / "deployment.yml"
+    deployment_file.write_text(DEPLOYMENT.format(ui_port=ui_port))
+
+    # Use the sources in place, like `llamactl serve` does
+    settings.deployments_path = root
+    # Don't deploy anything at startup and don't expose metrics
+    settings.rc_path = root / "rc"
+    settings.prometheus_enabled = False
+    settings.prewarm_services = False
+
+    async def start_static_ui_server(self: Any, port: int | None = None) -> None:
+        # The static upstream is already listening on the UI port
+        pass
+
+    Deployment._start_ui_server = start_static_ui_server  # type: ignore
+    return deployment_file, ui_port
+
+
+async def bench_asgi(deployment_file: Path, args: Any) -> list[dict]:
+    from llama_deploy.apiserver.app import app
+    from llama_deploy.apiserver.server import lifespan
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://apiserver", timeout=None
+        ) as client:
+            return await Bench(client, "asgi", args).run_all(deployment_file)
+
+
+async def bench_socket(deployment_file: Path, args: Any) -> list[dict]:
+    from llama_deploy.apiserver.app import app
+
+    with ThreadedServer(app, free_port()) as server:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{server.port}", timeout=None, limits=limits
+        ) as client:
+            return await Bench(client, "socket", args).run_all(deployment_file)
+
+
+def run_transport(transport: str, args: Any) -> list[dict]:
+    """Runs the benchmarks of a transport in a subprocess and returns the results."""
+    cmd = [sys.executable, __file__, "--transport", transport, "--json"]
+    for option in ("requests", "concurrency", "warmup", "events", "cpu_n"):
+        cmd += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)["results"]
+
+
+def metadata(args: Any) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "events": args.events,
+        "cpu_n": args.cpu_n,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> bool:
+    """Prints the change of every metric against a baseline, returns whether all are ok."""
+    previous = {(r["transport"], r["scenario"], r["metric"]): r for r in baseline}
+    ok = True
+    for r in results:
+        base = previous.get((r["transport"], r["scenario"], r["metric"]))
+        if base is None or not base["value"]:
+            continue
+        change = (r["value"] - base["value"]) / base["value"]
+        worse = (
+            change > threshold if r["unit"] in LOWER_IS_BETTER else -change > threshold
+        )
+        ok = ok and not worse
+        print(
+            f"{'FAIL' if worse else 'ok':4} {r['transport']:6} {r['scenario']:22}"
+            f" {r['metric']:10} {base['value']:>10} -> {r['value']:>10} {r['unit']:8}"
+            f" ({change:+.1%})"
+        )
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transport", choices=["asgi", "socket", "all"], default="all")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--events", type=int, default=1000, help="Events streamed by a task"
+    )
+    parser.add_argument(
+        "--cpu-n", type=int, default=100_000, help="Work done by a CPU-bound task"
+    )
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    parser.add_argument("--output", type=Path, help="Save the results as JSON")
+    parser.add_argument("--compare", type=Path, help="Results of a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative change of a metric considered a regression",
+    )
+    args = parser.parse_args()
+
+    if args.transport == "all":
+        # Every transport starts from a fresh interpreter, without loaded modules
+        # and deployments left behind by the previous one
+        results = []
+        for transport in ("asgi", "socket"):
+            results += run_transport(transport, args)
+    else:
+        logging.disable(logging.INFO)
+        with tempfile.TemporaryDirectory() as tmp:
+            deployment_file, ui_port = setup(Path(tmp))
+            with ThreadedServer(static_ui, ui_port, lifespan="off"):
+                bench = bench_asgi if args.transport == "asgi" else bench_socket
+                results = asyncio.run(bench(deployment_file, args))
+
+    report = {"metadata": metadata(args), "results": results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif not args.compare:
+        for r in results:
+            print(
+                f"{r['transport']:6} {r['scenario']:22} {r['metric']:10}"
+                f" {r['value']:>10} {r['unit']}"
+            )
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["results"]
+        return 0 if compare(results, baseline, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
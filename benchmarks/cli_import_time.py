@@ -0,0 +1,125 @@
+"""Import-time regression benchmark for `llamactl`.
+
+Every command is run in a fresh interpreter with `python -X importtime` and the
+time spent importing modules is compared against the budget of that command.
+The script exits with a non-zero status if any budget is exceeded.
+
+Usage:
+    python benchmarks/cli_import_time.py [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any
+
+# Import budget in milliseconds for each command. Commands that can't run without
+# an API Server are measured through `--help`, which still loads their module.
+BUDGETS_MS: dict[str, float] = {
+    "--help": 400,
+    "bench --help": 400,
+    "config current-profile": 400,
+    "config get-profiles": 500,
+    "status": 900,
+    "deploy --help": 400,
+    "init --help": 400,
+    "profile --help": 400,
+    "run --help": 400,
+    "serve --help": 400,
+    "sessions --help": 400,
+}
+
+# Modules that must never be imported by the CLI unless the command really needs them
+FORBIDDEN_MODULES = ("llama_index", "workflows", "fastapi", "uvicorn")
+
+CONFIG = """current_profile: default
+profiles:
+  default:
+    insecure: false
+    # Nothing listens here, commands talking to the API Server fail fast
+    server: http://127.0.0.1:1
+    timeout: 1.0
+"""
+
+CODE = """
+import sys
+from llama_deploy.cli import llamactl
+try:
+    llamactl({args!r}, standalone_mode=False)
+except Exception:
+    pass
+print("FORBIDDEN:" + ",".join(sorted(m for m in sys.modules if m.split(".")[0] in {forbidden!r})))
+"""
+
+
+def measure(command: str, config_path: Path) -> tuple[float, list[str]]:
+    """Runs `command` and returns the import time in ms and the forbidden modules loaded."""
+    args = ["-c", str(config_path)] + command.split()
+    code = CODE.format(args=args, forbidden=set(FORBIDDEN_MODULES))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    for line in result.stderr.splitlines():
+        # Format is: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us = line.split(":", 1)[1].split("|")[0]
+        total_us += int(self_us)
+
+    forbidden = result.stdout.rsplit("FORBIDDEN:", 1)[-1].strip()
+    return total_us / 1000, [m for m in forbidden.split(",") if m]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    args = parser.parse_args()
+
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = Path(tmp) / "config.yaml"
+        config_path.write_text(CONFIG)
+        for command, budget in BUDGETS_MS.items():
+            timings = []
+            forbidden: list[str] = []
+            for _ in range(args.repeat):
+                elapsed, forbidden = measure(command, config_path)
+                timings.append(elapsed)
+            median = statistics.median(timings)
+            results.append(
+                {
+                    "command": command,
+                    "median_ms": round(median, 1),
+                    "min_ms": round(min(timings), 1),
+                    "budget_ms": budget,
+                    "forbidden_modules": forbidden,
+                    "ok": median <= budget and not forbidden,
+                }
+            )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            status = "ok" if r["ok"] else "FAIL"
+            print(
+                f"{status:4} {r['command']:28} {r['median_ms']:8.1f} ms"
+                f" (budget {r['budget_ms']} ms)"
+            )
+            if r["forbidden_modules"]:
+                print(f"     imports {', '.join(r['forbidden_modules'])}")
+
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Benchmark of the encoding of large task inputs and results.
+
+Task inputs used to be a JSON string nested in the JSON body of a request, decoded
+twice by the API Server. This compares that format with a structured input, sent
+as JSON or MessagePack, and the standard library JSON encoder of the results with
+`orjson` and MessagePack. Formats whose library isn't installed are skipped.
+
+Usage:
+    python benchmarks/payloads.py [--sizes 1,4,16] [--repeat 20] [--json]
+"""
+
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+from llama_deploy.types import TaskDefinition, payloads
+
+
+def make_input(size_mb: float) -> dict[str, Any]:
+    """Returns workflow keyword arguments weighing about `size_mb` once encoded."""
+    record = {
+        "id": 123456,
+        "score": 0.987654321,
+        "tags": ["alpha", "beta", "gamma"],
+        "text": "lorem ipsum dolor sit amet " * 4,
+        "nested": {"flag": True, "value": None},
+    }
+    count = int(size_mb * 1024 * 1024 / len(json.dumps(record)))
+    return {"documents": [dict(record, id=i) for i in range(count)], "top_k": 10}
+
+
+def timeit(fn: Callable[[], Any], repeat: int) -> float:
+    """Returns the median duration of `fn` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        # Collections triggered by the objects of a previous run would add noise
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+    return statistics.median(timings)
+
+
+def bench_size(size_mb: float, repeat: int) -> list[dict[str, Any]]:
+    kwargs = make_input(size_mb)
+    nested = json.dumps({"input": json.dumps(kwargs)}).encode()
+    structured = json.dumps({"input": kwargs}).encode()
+
+    decoders: dict[str, Callable[[], Any]] = {
+        "nested json string": lambda: TaskDefinition.model_validate(
+            json.loads(nested)
+        ).run_kwargs(),
+        "structured json": lambda: TaskDefinition.model_validate(
+            payloads.loads(structured)
+        ).run_kwargs(),
+    }
+    encoders: dict[str, Callable[[], Any]] = {
+        "stdlib json": lambda: json.dumps(
+            kwargs, ensure_ascii=False, separators=(",", ":")
+        ).encode(),
+    }
+    if payloads._orjson() is not None:
+        encoders["orjson"] = lambda: payloads.dumps(kwargs)
+    if payloads.msgpack_available():
+        packed = payloads.dumps({"input": kwargs}, payloads.MSGPACK_MEDIA_TYPE)
+        decoders["structured msgpack"] = lambda: TaskDefinition.model_validate(
+            payloads.loads(packed, payloads.MSGPACK_MEDIA_TYPE)
+        ).run_kwargs()
+        encoders["msgpack"] = lambda: payloads.dumps(
+            kwargs, payloads.MSGPACK_MEDIA_TYPE
+        )
+
+    results = []
+    for operation, scenarios in (
+        ("decode input", decoders),
+        ("encode result", encoders),
+    ):
+        baseline = None
+        for name, fn in scenarios.items():
+            median = timeit(fn, repeat)
+            baseline = baseline or median
+            results.append(
+                {
+                    "size_mb": size_mb,
+                    "operation": operation,
+                    "format": name,
+                    "median_ms": round(median, 2),
+                    "speedup": round(baseline / median, 2),
+                }
+            )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,4,16", help="Payload sizes in MB")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes.split(","):
+        results.extend(bench_size(float(size), args.repeat))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(
+                f"{r['size_mb']:5g} MB {r['operation']:14} {r['format']:20}"
+                f" {r['median_ms']:9.2f} ms  x{r['speedup']:.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
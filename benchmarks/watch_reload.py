@@ -0,0 +1,204 @@
+"""Save-to-serve latency benchmark for the watch mode of the API Server.
+
+A synthetic local project with many modules is deployed in-process with the watch
+mode enabled. A module is then rewritten and the time until tasks return the
+result of the new code is measured, both for a leaf module, where only the module
+and the workflow module must be re-executed, and for the root module every other
+module depends on. The cost of re-importing the leaf module without waiting for
+the watcher is compared against a full `Deployment.reload`. The script exits with
+a non-zero status if the median latency of a watched save exceeds the target.
+
+Usage:
+    python benchmarks/watch_reload.py [--modules 200] [--repeat 10] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TARGET_MS = 500
+
+WORKFLOW = """
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+import synth
+from synth import leaf, mod_0
+
+
+class W(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result=f"{{leaf.VERSION}}:{{mod_0.VERSION}}")
+
+
+workflow = W()
+"""
+
+MODULE = """
+{imports}
+
+VERSION = {version}
+
+
+def compute_{index}(values: list[int]) -> int:
+    return sum(v * {index} for v in values)
+"""
+
+CONFIG = """
+name: watch-bench
+services:
+  synth:
+    name: Synthetic
+    source:
+      type: local
+      location: src
+    import-path: src/wf_synth:workflow
+"""
+
+
+def write_module(path: Path, index: int, version: int) -> None:
+    # Modules form a tree rooted in mod_0
+    imports = f"from synth import mod_{(index - 1) // 2}" if index else ""
+    path.write_text(MODULE.format(imports=imports, index=index, version=version))
+
+
+def create_project(root: Path, modules: int) -> Path:
+    """Creates a project with `modules` modules, returns the deployment file."""
+    package = root / "src" / "synth"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text(
+        "\n".join(f"from synth import mod_{i}" for i in range(modules))
+    )
+    for i in range(modules):
+        write_module(package / f"mod_{i}.py", i, 0)
+    (package / "leaf.py").write_text("VERSION = 0")
+    (root / "src" / "wf_synth.py").write_text(WORKFLOW.format())
+    deployment_file = root / "deployment.yml"
+    deployment_file.write_text(CONFIG)
+    return deployment_file
+
+
+async def wait_for(deployment: object, expected: str) -> None:
+    while await deployment.run_workflow("synth") != expected:  # type: ignore
+        await asyncio.sleep(0.005)
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    from llama_deploy.apiserver.deployment import Deployment
+    from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+    from llama_deploy.apiserver.settings import settings
+
+    settings.watch = True
+    settings.watch_force_polling = args.force_polling
+    settings.prewarm_services = False
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        deployment_file = create_project(root, args.modules)
+        config = DeploymentConfig.from_yaml(deployment_file)
+        deployment = Deployment(
+            config=config, base_path=root, deployment_path=root, local=True
+        )
+        await deployment.start()
+        package = root / "src" / "synth"
+        assert await deployment.run_workflow("synth") == "0:0"
+        # Let the watcher take its first snapshot
+        await asyncio.sleep(0.5)
+
+        leaf = root_version = 0
+        scenarios = {
+            "leaf module": lambda: (package / "leaf.py").write_text(
+                f"VERSION = {leaf}"
+            ),
+            "root module": lambda: write_module(package / "mod_0.py", 0, root_version),
+        }
+        for name, rewrite in scenarios.items():
+            timings = []
+            for _ in range(args.repeat):
+                if name == "leaf module":
+                    leaf += 1
+                else:
+                    root_version += 1
+                started_at = time.perf_counter()
+                rewrite()
+                await asyncio.wait_for(
+                    wait_for(deployment, f"{leaf}:{root_version}"), timeout=30
+                )
+                timings.append((time.perf_counter() - started_at) * 1000)
+                # Keep saves in different mtime ticks
+                await asyncio.sleep(0.05)
+            results.append(summary(name, timings, TARGET_MS))
+
+        if deployment._watch_task is not None:
+            deployment._watch_task.cancel()
+
+        baselines = {
+            "leaf reimport": lambda: deployment.reimport_services(
+                ["synth"], {(package / "leaf.py").resolve()}
+            ),
+            "full reload": lambda: deployment.reload(config),
+        }
+        for name, reimport in baselines.items():
+            timings = []
+            for _ in range(args.repeat):
+                leaf += 1
+                (package / "leaf.py").write_text(f"VERSION = {leaf}")
+                started_at = time.perf_counter()
+                await reimport()
+                await wait_for(deployment, f"{leaf}:{root_version}")
+                timings.append((time.perf_counter() - started_at) * 1000)
+            results.append(summary(name, timings, None))
+    return results
+
+
+def summary(name: str, timings: list[float], target: float | None) -> dict:
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "scenario": name,
+        "median_ms": round(median, 1),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 1),
+        "target_ms": target,
+        "ok": target is None or median <= target,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--force-polling", action="store_true", help="Poll instead of using inotify"
+    )
+    parser.add_argument("--json", action="store_true", help="Emit results as JSON")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    # Rewritten modules must not be loaded from stale bytecode
+    sys.dont_write_bytecode = True
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            status = "ok" if r["ok"] else "FAIL"
+            target = f" (target {r['target_ms']} ms)" if r["target_ms"] else ""
+            print(
+                f"{status:4} {r['scenario']:13} median {r['median_ms']:8.1f} ms"
+                f"  p95 {r['p95_ms']:8.1f} ms{target}"
+            )
+
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,4 +11,5 @@ if __name__ == "__main__":
         "llama_deploy.apiserver.app:app",
         host=settings.host,
         port=settings.port,
+        timeout_graceful_shutdown=int(settings.shutdown_grace_period),
     )
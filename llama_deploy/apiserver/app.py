@@ -6,10 +6,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 
-from .routers import deployments_router, status_router
-from .server import lifespan
+from .routers import debug_router, deployments_router, status_router
+from .server import lifespan, manager
 from .settings import settings
 from .tracing import configure_tracing
+from .workers import SessionAffinityMiddleware
 
 logger = logging.getLogger("uvicorn.info")
 
@@ -29,8 +30,12 @@ if not os.environ.get("DISABLE_CORS", False):
         allow_headers=["Content-Type", "Authorization"],
     )
 
+# Forward requests for sessions and tasks to the worker owning them
+app.add_middleware(SessionAffinityMiddleware, manager=manager)
+
 app.include_router(deployments_router)
 app.include_router(status_router)
+app.include_router(debug_router)
 
 
 @app.get("/")
@@ -0,0 +1,243 @@
+"""Files uploaded to a deployment or produced by its tasks, kept on disk.
+
+Artifacts are uploaded to `/deployments/{name}/artifacts` and downloaded from
+`/deployments/{name}/artifacts/{id}`. They are named after the SHA-256 of their
+content, so uploading the same file twice stores it once. A task input can refer
+to an artifact with `{"$artifact": "<id>"}`, which the workflow receives as an
+`ArtifactRef` to read it from disk rather than from the request.
+
+Workflows can also return a streamable result, an async iterator of `bytes` or
+`str` chunks or a file-like object, instead of building a large value in memory.
+Such results are sent to clients chunk by chunk, or written to an artifact, so
+the memory used doesn't depend on their size.
+"""
+
+import asyncio
+import hashlib
+import inspect
+import mmap
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import IO, Any, AsyncIterator
+
+from pydantic import BaseModel
+
+from llama_deploy.types.apiserver import ARTIFACT_REF_KEY
+
+# Size of the chunks read from file-like results
+CHUNK_SIZE = 64 * 1024
+_ARTIFACT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactNotFound(KeyError):
+    """Raised when a task input refers to an artifact that doesn't exist."""
+
+
+class ArtifactRef(BaseModel):
+    """An artifact given to a workflow, read from the disk of the API Server."""
+
+    artifact_id: str
+    path: Path
+
+    @property
+    def size(self) -> int:
+        return self.path.stat().st_size
+
+    def open(self) -> IO[bytes]:
+        """Opens the artifact for reading."""
+        return open(self.path, "rb")
+
+    def mmap(self) -> mmap.mmap:
+        """Maps the artifact in memory, read-only. Empty artifacts can't be mapped."""
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def is_streamable(result: Any) -> bool:
+    """Whether a task result is sent chunk by chunk rather than serialized as a whole."""
+    if isinstance(result, (str, bytes, bytearray, memoryview)):
+        return False
+    return hasattr(result, "__aiter__") or callable(getattr(result, "read", None))
+
+
+async def iter_chunks(result: Any) -> AsyncIterator[bytes]:
+    """Yields the content of a streamable result as bytes, then closes it."""
+    try:
+        if hasattr(result, "__aiter__"):
+            async for chunk in result:
+                yield chunk.encode() if isinstance(chunk, str) else chunk
+            return
+
+        read = result.read
+        while True:
+            if inspect.iscoroutinefunction(read):
+                chunk = await read(CHUNK_SIZE)
+            else:
+                # Reading a file blocks
+                chunk = await asyncio.to_thread(read, CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+    finally:
+        if hasattr(result, "aclose"):
+            await result.aclose()
+        elif hasattr(result, "close"):
+            closed = result.close()
+            if inspect.isawaitable(closed):
+                await closed
+
+
+async def multipart_chunks(
+    content_type: str, stream: AsyncIterator[bytes]
+) -> AsyncIterator[bytes]:
+    """Yields the content of the first file of a multipart body, as it's received.
+
+    Unlike parsing the whole form, the file isn't spooled to a temporary file.
+    """
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Missing boundary in multipart body")
+
+    pending: list[bytes] = []
+    # The header being parsed, a header can be split across chunks
+    field = value = disposition = b""
+    # Whether the current part is the file, and whether it was found
+    in_file = found = False
+
+    def on_part_begin() -> None:
+        nonlocal disposition
+        disposition = b""
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        nonlocal field
+        field += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        nonlocal value
+        value += data[start:end]
+
+    def on_header_end() -> None:
+        nonlocal field, value, disposition
+        if field.lower() == b"content-disposition":
+            disposition = value
+        field = value = b""
+
+    def on_headers_finished() -> None:
+        nonlocal in_file, found
+        _, options = parse_options_header(disposition)
+        in_file = not found and b"filename" in options
+        found = found or in_file
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if in_file:
+            pending.append(bytes(data[start:end]))
+
+    def on_part_end() -> None:
+        nonlocal in_file
+        in_file = False
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    async for chunk in stream:
+        parser.write(chunk)
+        for data in pending:
+            yield data
+        pending.clear()
+    parser.finalize()
+    if not found:
+        raise ValueError("No file in multipart body")
+
+
+def resolve_refs(store: "ArtifactStore", run_kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Replaces the artifact references in the input of a task with `ArtifactRef`s.
+
+    Only the arguments themselves and the items of list arguments are looked at,
+    large inputs aren't walked entirely.
+    """
+
+    def resolve(value: Any) -> Any:
+        if isinstance(value, dict) and len(value) == 1 and ARTIFACT_REF_KEY in value:
+            return store.ref(value[ARTIFACT_REF_KEY])
+        return value
+
+    resolved = {}
+    for name, value in run_kwargs.items():
+        if isinstance(value, list):
+            resolved[name] = [resolve(item) for item in value]
+        else:
+            resolved[name] = resolve(value)
+    return resolved
+
+
+class ArtifactStore:
+    """The artifacts of a deployment, each one a file in `path` named after the SHA-256 of its content."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> tuple[str, int]:
+        """Writes a stream to an artifact, returns its id and its size in bytes.
+
+        The artifact only becomes visible once fully written. When an artifact with
+        the same content exists, it's kept and the new copy is discarded.
+        """
+        await asyncio.to_thread(self._path.mkdir, parents=True, exist_ok=True)
+        partial = self._path / f"{uuid.uuid4().hex}.partial"
+        digest = hashlib.sha256()
+        size = 0
+        f = await asyncio.to_thread(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(self._write, f, digest, chunk)
+                size += len(chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            partial.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(f.close)
+
+        artifact_id = digest.hexdigest()
+        path = self._path / artifact_id
+        if path.exists():
+            partial.unlink()
+        else:
+            os.replace(partial, path)
+        return artifact_id, size
+
+    def get(self, artifact_id: str) -> Path | None:
+        """Returns the file of an artifact, None if there's no such artifact."""
+        if not isinstance(artifact_id, str) or not _ARTIFACT_ID.match(artifact_id):
+            return None
+        path = self._path / artifact_id
+        return path if path.is_file() else None
+
+    def ref(self, artifact_id: str) -> ArtifactRef:
+        """Returns the reference to an artifact given to workflows."""
+        path = self.get(artifact_id)
+        if path is None:
+            raise ArtifactNotFound(artifact_id)
+        return ArtifactRef(artifact_id=artifact_id, path=path)
+
+    @staticmethod
+    def _write(f: IO[bytes], digest: "hashlib._Hash", chunk: bytes) -> None:
+        f.write(chunk)
+        digest.update(chunk)
@@ -1,43 +1,170 @@
+import ast
 import asyncio
+import functools
+import hashlib
 import importlib
+import importlib.util
 import json
 import logging
 import os
+import shutil
+import signal
 import site
+import socket
 import subprocess
 import sys
 import tempfile
+import time
 from asyncio.subprocess import Process
+from collections import OrderedDict
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from typing import Any, Tuple, Type
+from types import FrameType, ModuleType
+from typing import Any, Callable, Tuple, Type
 
+import httpx
 from dotenv import dotenv_values
 from workflows import Context, Workflow
 from workflows.handler import WorkflowHandler
 
 from llama_deploy.apiserver.source_managers.base import SyncPolicy
 from llama_deploy.client import Client
-from llama_deploy.types.core import generate_id
+from llama_deploy.types.apiserver import (
+    ArtifactDefinition,
+    DeploymentStartupProfile,
+    ServiceStartupProfile,
+)
+from llama_deploy.types import payloads
+from llama_deploy.types.core import TaskDefinition, generate_id
 
+from .artifacts import ArtifactStore, iter_chunks, resolve_refs
 from .deployment_config_parser import (
     DeploymentConfig,
     Service,
     SourceType,
 )
+from .event_sinks import EventBatcher, create_publisher, tap_events
+from .ingestion import IngestionConsumer, create_broker
+from .profiling import ImportProfiler
+from .result_cache import ResultCache
+from .settings import settings
 from .source_managers import GitSourceManager, LocalSourceManager, SourceManager
-from .stats import deployment_state, service_state
+from .state_stores import StateStore, TaskRecord
+from .stats import (
+    cancelled_tasks,
+    deduplicated_tasks,
+    deployment_state,
+    drained_handlers,
+    draining_handlers,
+    recovered_tasks,
+    reload_duration,
+    service_state,
+)
+from .task_queue import (
+    WORKER_LEASE_TTL,
+    QueuedTask,
+    SavedSession,
+    SqliteTaskQueue,
+    new_worker_id,
+    worker_alive,
+)
+from .watcher import SourceWatcher
 
 logger = logging.getLogger()
+# The coroutine running each step of a workflow, its frames tell which step is running
+_STEP_WORKER_CODE = Context._step_worker.__code__
 SOURCE_MANAGERS: dict[SourceType, Type[SourceManager]] = {
     SourceType.git: GitSourceManager,
     SourceType.local: LocalSourceManager,
 }
+# Seconds given to a UI server to exit on shutdown before it's killed
+UI_SERVER_STOP_TIMEOUT = 10.0
+# Folder of the deployments path keeping the artifacts of each deployment
+ARTIFACTS_DIR = ".artifacts"
+# Number of task results written to an artifact remembered by each deployment
+RESULT_ARTIFACTS_SIZE = 1024
+# Folder of the deployments path keeping the sources synced by each worker
+WORKERS_DIR = ".workers"
 
 
 class DeploymentError(Exception): ...
 
 
+@functools.lru_cache(maxsize=4096)
+def _parse_imports(path: str, mtime_ns: int, package: str) -> frozenset[str]:
+    """Returns the names of the modules imported by a source file.
+
+    `from a import b` counts as importing both `a` and `a.b`, since `b` can be a
+    submodule. Results are cached until the file is modified.
+    """
+    try:
+        tree = ast.parse(Path(path).read_bytes(), filename=path)
+    except (OSError, SyntaxError):
+        return frozenset()
+
+    names: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                try:
+                    base = importlib.util.resolve_name("." * node.level + base, package)
+                except ImportError:
+                    continue
+            names.add(base)
+            names.update(f"{base}.{alias.name}" for alias in node.names)
+    return frozenset(names)
+
+
+def _imports_any(module: ModuleType, module_names: set[str]) -> bool:
+    """Whether the source of a module imports any of the given modules."""
+    module_file = getattr(module, "__file__", None)
+    if not module_file:
+        return False
+    try:
+        mtime_ns = os.stat(module_file).st_mtime_ns
+    except OSError:
+        return False
+    imports = _parse_imports(module_file, mtime_ns, module.__package__ or "")
+    return not imports.isdisjoint(module_names)
+
+
+def _find_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def _signal_ui_server(process: Process, kill: bool = False) -> None:
+    """Terminates or kills a UI server along with the processes it started, like Next.js."""
+    if process.returncode is not None:
+        return
+    if sys.platform == "win32":  # pragma: no cover
+        if kill:
+            process.kill()
+        else:
+            process.terminate()
+        return
+    try:
+        # The UI server leads its own process group, see `_start_ui_server`
+        os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+async def _terminate_ui_server(process: Process, timeout: float) -> None:
+    """Terminates a UI server and waits for it to exit, killing it after `timeout` seconds."""
+    _signal_ui_server(process)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Killing the UI server with PID {process.pid}")
+        _signal_ui_server(process, kill=True)
+        await process.wait()
+
+
 class Deployment:
     def __init__(
         self,
@@ -46,6 +173,9 @@ class Deployment:
         base_path: Path,
         deployment_path: Path,
         local: bool = False,
+        state_store: StateStore | None = None,
+        worker_id: str = "",
+        task_queue: SqliteTaskQueue | None = None,
     ) -> None:
         """Creates a Deployment instance.
 
@@ -53,31 +183,90 @@ class Deployment:
             config: The configuration object defining this deployment
             root_path: The path on the filesystem used to store deployment data
             local: Whether the deployment is local. If true, sources won't be synced
+            state_store: Where to record sessions and tasks when sharing state with other workers
+            worker_id: The id of the worker process running this deployment
+            task_queue: Where to persist the tasks created without waiting, to recover them after a restart
         """
         self._local = local
+        self._state_store = state_store
+        self._task_queue = task_queue
+        self._worker_id = worker_id
         self._name = config.name
         self._base_path = base_path
         # If not local, isolate the deployment in a folder with the same name to avoid conflicts
         self._deployment_path = (
             deployment_path if local else deployment_path / config.name
         )
+        # Result caches are shared by the workers, unlike the synced sources
+        self._cache_path = self._deployment_path
+        if state_store is not None and not local:
+            # Every worker syncs the sources and installs the dependencies in its own
+            # folder, never replacing the files of the services another one runs
+            self._deployment_path = (
+                deployment_path / WORKERS_DIR / worker_id / config.name
+            )
         self._client = Client()
         self._default_service: str | None = None
         self._running = False
         self._service_tasks: list[asyncio.Task] = []
         self._ui_server_process: Process | None = None
+        # Set when the UI server was moved to another port by a reload
+        self._ui_port: int | None = None
+        # Stop the UI servers replaced by a reload
+        self._ui_stop_tasks: set[asyncio.Task] = set()
+        # Services whose workflow module will be imported on first use, see `_get_workflow`
+        self._pending_services: dict[str, tuple[str, str]] = {}
+        # Held by the imports of deferred services and the reloads, which run in threads
+        self._import_lock = asyncio.Lock()
+        self._prewarm_task: asyncio.Task | None = None
+        self._startup_profile: dict[str, ServiceStartupProfile] = {}
+        # The folder and the modules of each service, to unload them on reload
+        self._service_paths: dict[str, Path] = {}
+        self._service_modules: dict[str, set[str]] = {}
+        # A hash of the source files of each service, as last imported
+        self._source_versions: dict[str, str] = {}
         # Ready to load services
-        self._workflow_services: dict[str, Workflow] = self._load_services(config)
+        self._workflow_services: dict[str, Workflow] = {}
+        self._workflow_services = self._load_services(config)
+        self._default_service = self._select_default_service(config, self.service_names)
         self._contexts: dict[str, Context] = {}
+        # The service whose workflow the context of each session belongs to
+        self._session_services: dict[str, str] = {}
         self._handlers: dict[str, WorkflowHandler] = {}
         self._handler_inputs: dict[str, str] = {}
+        # The service and the workflow version each handler is running
+        self._handler_services: dict[str, tuple[str, Workflow]] = {}
+        self._drain_tasks: set[asyncio.Task] = set()
+        # The sessions started by a task, freed when the task is cancelled
+        self._handler_sessions: dict[str, str] = {}
+        # Tasks cancelling the handlers that outlive their timeout
+        self._timeout_tasks: set[asyncio.Task] = set()
+        # Writes to the state store running in a thread, not to block the event loop
+        self._background_writes: set[asyncio.Task] = set()
+        # idempotency key -> (expiry time, task id, session id), oldest first. Only
+        # used without a state store, which otherwise shares the keys across workers
+        self._idempotency_keys: OrderedDict[str, tuple[float, str, str]] = OrderedDict()
+        self._watch_task: asyncio.Task | None = None
+        # Consume tasks from the topics in the `ingestion` configuration
+        self._consumers: list[IngestionConsumer] = []
+        # Publishes the events of the tasks to the `event_sink` of the configuration
+        self._event_batcher: EventBatcher | None = None
+        # The result cache of each service and the workflow version it caches
+        self._result_caches: dict[str, tuple[Workflow, ResultCache]] = {}
+        # Streamable results are written to artifacts, outside of the synced sources
+        self._artifacts = ArtifactStore(deployment_path / ARTIFACTS_DIR / config.name)
+        # Writes the streamable result of a task to an artifact, the first time it's
+        # requested. Least recently requested first
+        self._result_artifacts: OrderedDict[str, asyncio.Task[ArtifactDefinition]] = (
+            OrderedDict()
+        )
         self._config = config
         deployment_state.labels(self._name).state("ready")
 
     @property
     def default_service(self) -> str:
         if not self._default_service:
-            self._default_service = list(self._workflow_services.keys())[0]
+            self._default_service = self.service_names[0]
         return self._default_service
 
     @property
@@ -90,40 +279,617 @@ class Deployment:
         """Returns the name of this deployment."""
         return self._name
 
+    @property
+    def artifacts(self) -> ArtifactStore:
+        """Returns the artifacts of this deployment."""
+        return self._artifacts
+
+    async def save_artifact(self, result: Any) -> ArtifactDefinition:
+        """Writes a streamable result to a new artifact, chunk by chunk."""
+        artifact_id, size = await self._artifacts.save(iter_chunks(result))
+        return ArtifactDefinition(
+            artifact_id=artifact_id,
+            size_bytes=size,
+            url=f"/deployments/{self._name}/artifacts/{artifact_id}",
+        )
+
+    async def result_artifact(self, task_id: str, result: Any) -> ArtifactDefinition:
+        """Returns the artifact holding the streamable result of a task.
+
+        A result can only be streamed once, so it's written the first time it's
+        requested and the following requests get the same artifact. Only the last
+        `RESULT_ARTIFACTS_SIZE` results requested are remembered.
+        """
+        task = self._result_artifacts.get(task_id)
+        if task is None:
+            task = asyncio.create_task(self.save_artifact(result))
+            self._result_artifacts[task_id] = task
+            while len(self._result_artifacts) > RESULT_ARTIFACTS_SIZE:
+                # Artifacts still being written are awaited by their requests
+                if not next(iter(self._result_artifacts.values())).done():
+                    break
+                self._result_artifacts.popitem(last=False)
+        else:
+            self._result_artifacts.move_to_end(task_id)
+        return await asyncio.shield(task)
+
     @property
     def service_names(self) -> list[str]:
         """Returns the list of service names in this deployment."""
-        return list(self._workflow_services.keys())
+        return list(self._workflow_services.keys()) + list(
+            self._pending_services.keys()
+        )
+
+    @property
+    def ui_port(self) -> int | None:
+        """Returns the port where the UI server of this deployment is listening."""
+        if self._ui_port is not None:
+            return self._ui_port
+        return self._config.ui.port if self._config.ui else None
+
+    @property
+    def startup_profile(self) -> DeploymentStartupProfile:
+        """Returns the time spent loading each service of this deployment."""
+        return DeploymentStartupProfile(
+            name=self._name, services=list(self._startup_profile.values())
+        )
+
+    @property
+    def registry_sizes(self) -> dict[str, int]:
+        """Returns the number of entries in each registry, which grow with sessions and tasks."""
+        return {
+            "contexts": len(self._contexts),
+            "session_services": len(self._session_services),
+            "handlers": len(self._handlers),
+            "handler_inputs": len(self._handler_inputs),
+            "handler_services": len(self._handler_services),
+            "handler_sessions": len(self._handler_sessions),
+            "drain_tasks": len(self._drain_tasks),
+            "timeout_tasks": len(self._timeout_tasks),
+            "result_artifacts": len(self._result_artifacts),
+            "idempotency_keys": len(self._idempotency_keys),
+            "workflow_services": len(self._workflow_services),
+            "pending_services": len(self._pending_services),
+            "service_modules": sum(len(m) for m in self._service_modules.values()),
+        }
+
+    def service_of(self, workflow: Workflow) -> str | None:
+        """Returns the service running a workflow instance, including services being reloaded."""
+        for service_id, service_workflow in list(self._workflow_services.items()):
+            if service_workflow is workflow:
+                return service_id
+        for service_id, service_workflow in list(self._handler_services.values()):
+            if service_workflow is workflow:
+                return service_id
+        return None
 
     async def run_workflow(
-        self, service_id: str, session_id: str | None = None, **run_kwargs: dict
+        self,
+        service_id: str,
+        session_id: str | None = None,
+        task_timeout: float | None = None,
+        **run_kwargs: dict,
     ) -> Any:
-        workflow = self._workflow_services[service_id]
+        """Runs a task and returns its result.
+
+        The task is cancelled when the caller is, or when it runs for longer than
+        `task_timeout` or the timeout of its service, raising `asyncio.TimeoutError`.
+        """
+        workflow = await self._get_workflow(service_id)
+        timeout = self._task_timeout(service_id, task_timeout)
         if session_id:
             context = self._contexts[session_id]
-            return await workflow.run(context=context, **run_kwargs)
+            handler = workflow.run(
+                context=context, **resolve_refs(self._artifacts, run_kwargs)
+            )
+            return await self._wait(
+                self._observe(handler, service_id, session_id), timeout
+            )
 
-        if run_kwargs:
-            return await workflow.run(**run_kwargs)
+        cache = self._result_cache(service_id, workflow)
+        if cache is not None:
 
-        return await workflow.run()
+            async def run() -> Any:
+                handler = self._observe(
+                    workflow.run(**resolve_refs(self._artifacts, run_kwargs)),
+                    service_id,
+                )
+                return await self._wait(handler, timeout)
 
-    def run_workflow_no_wait(
-        self, service_id: str, session_id: str | None = None, **run_kwargs: dict
-    ) -> Tuple[str, str]:
-        workflow = self._workflow_services[service_id]
-        if session_id:
-            context = self._contexts[session_id]
-            handler = workflow.run(context=context, **run_kwargs)
+            return await cache.get_or_run(run_kwargs, run)
+
+        if run_kwargs:
+            handler = workflow.run(**resolve_refs(self._artifacts, run_kwargs))
         else:
-            handler = workflow.run(**run_kwargs)
+            handler = workflow.run()
+        return await self._wait(self._observe(handler, service_id), timeout)
+
+    async def run_workflow_no_wait(
+        self,
+        service_id: str,
+        session_id: str | None = None,
+        idempotency_key: str | None = None,
+        task_timeout: float | None = None,
+        **run_kwargs: dict,
+    ) -> Tuple[str, str]:
+        """Starts a task and returns its id and the id of its session.
+
+        When the idempotency key was already used within `idempotency_key_ttl`, the
+        ids of the task that used it are returned instead and no task is started.
+        The task is cancelled when it runs for longer than `task_timeout` or the
+        timeout of its service.
+        """
+        workflow = await self._get_workflow(service_id)
+        context = self._contexts[session_id] if session_id else None
+        # The input is persisted with the references, not the paths they resolve to
+        resolved_kwargs = resolve_refs(self._artifacts, run_kwargs)
+        if not session_id:
             session_id = generate_id()
+        task = TaskRecord(
+            task_id=generate_id(),
+            session_id=session_id,
+            input=json.dumps(run_kwargs, default=payloads.encode_binary),
+            worker_id=self._worker_id,
+        )
+        if idempotency_key is not None:
+            owner = await self._claim_idempotency_key(idempotency_key, task)
+            if owner != (task.task_id, task.session_id):
+                deduplicated_tasks.labels(self._name).inc()
+                return owner
+
+        task_queue = self._task_queue
+        try:
+            if task_queue is not None:
+                # Persisted before the task id is returned to the client, and before
+                # the task can complete
+                await asyncio.to_thread(
+                    task_queue.put,
+                    self._name,
+                    QueuedTask(
+                        task_id=task.task_id,
+                        session_id=session_id,
+                        service_id=service_id,
+                        input=task.input,
+                        worker_id=self._worker_id,
+                    ),
+                )
+
+            if context is not None:
+                handler = workflow.run(context=context, **resolved_kwargs)
+            else:
+                handler = workflow.run(**resolved_kwargs)
+        except BaseException:
+            if task_queue is not None:
+                # Never recover a task that didn't start
+                self._write_in_background(task_queue.complete, self._name, task.task_id)
+            if idempotency_key is not None:
+                # A retry with the same key must start the task
+                await self._release_idempotency_key(idempotency_key, task)
+            raise
+
+        if context is None:
             self._contexts[session_id] = handler.ctx or Context(workflow)
+            self._session_services[session_id] = service_id
+            self._handler_sessions[task.task_id] = session_id
+            if self._state_store is not None:
+                await asyncio.to_thread(
+                    self._state_store.put_session,
+                    self._name,
+                    session_id,
+                    self._worker_id,
+                )
+
+        await self._add_handler(
+            task,
+            service_id,
+            workflow,
+            handler,
+            self._task_timeout(service_id, task_timeout),
+        )
+        return task.task_id, session_id
 
-        handler_id = generate_id()
+    async def _add_handler(
+        self,
+        task: TaskRecord,
+        service_id: str,
+        workflow: Workflow,
+        handler: WorkflowHandler,
+        timeout: float | None,
+    ) -> None:
+        """Keeps track of the handler running a task until the task is cancelled or completes."""
+        handler_id = task.task_id
+        self._observe(handler, service_id, task.session_id, handler_id)
         self._handlers[handler_id] = handler
-        self._handler_inputs[handler_id] = json.dumps(run_kwargs)
-        return handler_id, session_id
+        self._handler_inputs[handler_id] = task.input
+        self._handler_services[handler_id] = (service_id, workflow)
+        callbacks: list[Callable[[WorkflowHandler], None]] = []
+        if self._state_store is not None:
+            await asyncio.to_thread(self._state_store.put_task, self._name, task)
+            callbacks.append(functools.partial(self._forget_task, handler_id))
+        if self._task_queue is not None:
+            callbacks.append(functools.partial(self._complete_queued_task, handler_id))
+        for callback in callbacks:
+            if handler.done():
+                # Completed while the task was recorded, don't defer its cleanup
+                callback(handler)
+            else:
+                handler.add_done_callback(callback)
+
+        if timeout is not None:
+            timeout_task = asyncio.create_task(
+                self._cancel_after(handler_id, handler, timeout)
+            )
+            self._timeout_tasks.add(timeout_task)
+            timeout_task.add_done_callback(self._timeout_tasks.discard)
+
+    def _observe(
+        self,
+        handler: WorkflowHandler,
+        service_id: str,
+        session_id: str | None = None,
+        task_id: str | None = None,
+    ) -> WorkflowHandler:
+        """Publishes the events and the result of a task to the event sink, if any."""
+        if self._event_batcher is not None:
+            tap_events(
+                self._event_batcher,
+                handler,
+                task_id or generate_id(),
+                session_id,
+                service_id,
+            )
+        return handler
+
+    def _forget_task(self, task_id: str, handler: WorkflowHandler) -> None:
+        """Removes a completed task from the state store.
+
+        The handler is kept by this worker, which the other workers find through
+        the owner of the session of the task.
+        """
+        if self._state_store is not None:
+            self._write_in_background(
+                self._state_store.delete_task, self._name, task_id
+            )
+
+    def _write_in_background(self, write: Callable[..., None], *args: Any) -> None:
+        task = asyncio.create_task(asyncio.to_thread(write, *args))
+        self._background_writes.add(task)
+        task.add_done_callback(self._background_writes.discard)
+
+    def _complete_queued_task(self, task_id: str, handler: WorkflowHandler) -> None:
+        """Removes a task from the queue once it completes, successfully or not."""
+        # A handler is only cancelled along with the event loop: the task was
+        # interrupted and must be recovered
+        if self._task_queue is not None and not handler.cancelled():
+            self._write_in_background(self._task_queue.complete, self._name, task_id)
+
+    async def recover_tasks(self) -> None:
+        """Runs again the queued tasks interrupted by a crash or a shutdown.
+
+        Tasks are resumed from their checkpoint when they have one, otherwise they
+        start over. The tasks of the workers whose lease didn't expire are left alone,
+        and tasks already started `task_max_attempts` times are abandoned.
+        """
+        if self._task_queue is None:
+            return
+
+        task_queue = self._task_queue
+        live_workers = await asyncio.to_thread(task_queue.live_workers)
+        for queued in await asyncio.to_thread(task_queue.list_tasks, self._name):
+            if queued.worker_id == self._worker_id or queued.worker_id in live_workers:
+                continue
+            task = await asyncio.to_thread(
+                task_queue.claim, self._name, queued, self._worker_id
+            )
+            if task is None:
+                # Recovered by another worker
+                continue
+
+            if task.attempts > settings.task_max_attempts:
+                logger.error(
+                    f"Abandoning task {task.task_id} of {self._name} after {task.attempts - 1} attempts"
+                )
+                await asyncio.to_thread(task_queue.complete, self._name, task.task_id)
+                recovered_tasks.labels(self._name, "abandoned").inc()
+                continue
+
+            try:
+                outcome = await self._resume_task(task)
+            except Exception as e:
+                logger.error(
+                    f"Failed to recover task {task.task_id} of {self._name}: {e}"
+                )
+                await asyncio.to_thread(task_queue.complete, self._name, task.task_id)
+                outcome = "failed"
+            recovered_tasks.labels(self._name, outcome).inc()
+
+    async def _resume_task(self, task: QueuedTask) -> str:
+        """Runs a recovered task, returns whether it was resumed or restarted."""
+        workflow = await self._get_workflow(task.service_id)
+        handler = None
+        if task.checkpoint is not None:
+            try:
+                ctx = Context.from_dict(workflow, json.loads(task.checkpoint))
+                handler = workflow.run(ctx=ctx)
+            except Exception as e:
+                logger.warning(
+                    f"Restarting task {task.task_id} of {self._name}, its checkpoint can't be restored: {e}"
+                )
+        outcome = "resumed" if handler is not None else "restarted"
+        if handler is None:
+            handler = workflow.run(
+                **resolve_refs(
+                    self._artifacts,
+                    json.loads(task.input, object_hook=payloads.decode_binary),
+                )
+            )
+
+        logger.info(
+            f"Recovered task {task.task_id} of {self._name} ({outcome}, attempt {task.attempts})"
+        )
+        self._contexts[task.session_id] = handler.ctx or Context(workflow)
+        self._session_services[task.session_id] = task.service_id
+        if self._state_store is not None:
+            await asyncio.to_thread(
+                self._state_store.put_session,
+                self._name,
+                task.session_id,
+                self._worker_id,
+            )
+        await self._add_handler(
+            TaskRecord(
+                task_id=task.task_id,
+                session_id=task.session_id,
+                input=task.input,
+                worker_id=self._worker_id,
+            ),
+            task.service_id,
+            workflow,
+            handler,
+            self._task_timeout(task.service_id, None),
+        )
+        return outcome
+
+    def checkpoint_tasks(self) -> int:
+        """Saves the Context of the queued tasks still running, so that they resume on restart.
+
+        Returns the number of tasks checkpointed.
+        """
+        if self._task_queue is None:
+            return 0
+
+        checkpointed = 0
+        for task_id, handler in list(self._handlers.items()):
+            if handler.done() or handler.ctx is None:
+                continue
+            try:
+                checkpoint = json.dumps(handler.ctx.to_dict())
+            except Exception as e:
+                logger.warning(
+                    f"Task {task_id} of {self._name} will start over on restart, its context can't be saved: {e}"
+                )
+                continue
+            self._task_queue.checkpoint(self._name, task_id, checkpoint)
+            checkpointed += 1
+        return checkpointed
+
+    def save_sessions(self) -> int:
+        """Saves the Context of the open sessions in the task queue, to restore them on restart.
+
+        Returns the number of sessions saved.
+        """
+        if self._task_queue is None:
+            return 0
+
+        saved = 0
+        for session_id, ctx in list(self._contexts.items()):
+            try:
+                context = json.dumps(ctx.to_dict())
+            except Exception as e:
+                logger.warning(
+                    f"Session {session_id} of {self._name} will be lost on restart, its context can't be saved: {e}"
+                )
+                continue
+            self._task_queue.put_session(
+                self._name,
+                SavedSession(
+                    session_id=session_id,
+                    service_id=self._session_services.get(
+                        session_id, self.default_service
+                    ),
+                    context=context,
+                ),
+            )
+            saved += 1
+        return saved
+
+    async def restore_sessions(self) -> None:
+        """Restores the sessions saved in the task queue when the server last stopped."""
+        if self._task_queue is None:
+            return
+
+        sessions = await asyncio.to_thread(self._task_queue.take_sessions, self._name)
+        if not sessions:
+            return
+        restored = 0
+        for session in sessions:
+            session_id = session.session_id
+            try:
+                workflow = await self._get_workflow(session.service_id)
+                self._contexts[session_id] = Context.from_dict(
+                    workflow, json.loads(session.context)
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Failed to restore session {session_id} of {self._name}: {e}"
+                )
+                continue
+            self._session_services[session_id] = session.service_id
+            if self._state_store is not None:
+                await asyncio.to_thread(
+                    self._state_store.put_session,
+                    self._name,
+                    session_id,
+                    self._worker_id,
+                )
+            restored += 1
+        logger.info(f"Restored {restored} sessions of {self._name}")
+
+    async def drain(self, timeout: float) -> int:
+        """Waits up to `timeout` seconds for the running tasks to complete.
+
+        Returns the number of tasks still running.
+        """
+        # Consumers stop fetching and complete their current batch meanwhile
+        stop_ingestion = asyncio.create_task(self._stop_ingestion(timeout))
+        running = [h for h in self._handlers.values() if not h.done()]
+        if running and timeout > 0:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            running = list(pending)
+        await stop_ingestion
+        return len(running)
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """Cancels a running task and frees the session it was started in.
+
+        Returns False if the task already completed, raises KeyError if it doesn't exist.
+        """
+        return await self._cancel_task(task_id, "request")
+
+    async def _cancel_task(self, task_id: str, reason: str) -> bool:
+        handler = self._handlers[task_id]
+        if handler.done():
+            return False
+        await self._cancel_handler(handler, reason)
+        session_id = self._handler_sessions.pop(task_id, None)
+        if session_id is not None and session_id in self._contexts:
+            await self.delete_session(session_id)
+        return True
+
+    async def _cancel_handler(self, handler: WorkflowHandler, reason: str) -> None:
+        if not handler.done():
+            await handler.cancel_run()
+            cancelled_tasks.labels(self._name, reason).inc()
+
+    async def _cancel_after(
+        self, task_id: str, handler: WorkflowHandler, timeout: float
+    ) -> None:
+        """Cancels a task still running after `timeout` seconds."""
+        done, _ = await asyncio.wait([handler], timeout=timeout)
+        if not done:
+            logger.warning(
+                f"Cancelling task {task_id} of {self._name} after {timeout}s"
+            )
+            await self._cancel_task(task_id, "timeout")
+
+    async def _wait(self, handler: WorkflowHandler, timeout: float | None) -> Any:
+        """Waits for a task, cancelling it on timeout or when the caller is cancelled."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(handler), timeout)
+        except asyncio.TimeoutError:
+            await self._cancel_handler(handler, "timeout")
+            raise
+        except asyncio.CancelledError:
+            await self._cancel_handler(handler, "disconnect")
+            raise
+
+    def _task_timeout(self, service_id: str, requested: float | None) -> float | None:
+        """Returns the shortest of the timeout of a service and the one requested."""
+        service = self._config.services.get(service_id)
+        timeouts = [t for t in (requested, service and service.timeout) if t]
+        return min(timeouts) if timeouts else None
+
+    async def _claim_idempotency_key(
+        self, key: str, task: TaskRecord
+    ) -> tuple[str, str]:
+        """Returns the ids of the task owning an idempotency key, `task` if the key is free."""
+        ttl = settings.idempotency_key_ttl
+        if self._state_store is not None:
+            # Claiming waits for the other workers holding the lock of the store
+            return await asyncio.to_thread(
+                self._state_store.claim_idempotency_key, self._name, key, task, ttl
+            )
+
+        now = time.monotonic()
+        while self._idempotency_keys:
+            oldest = next(iter(self._idempotency_keys.values()))
+            if oldest[0] > now:
+                break
+            self._idempotency_keys.popitem(last=False)
+        owner = self._idempotency_keys.get(key)
+        if owner is not None and owner[0] > now:
+            return owner[1], owner[2]
+        self._idempotency_keys.pop(key, None)
+        self._idempotency_keys[key] = (now + ttl, task.task_id, task.session_id)
+        return task.task_id, task.session_id
+
+    async def _release_idempotency_key(self, key: str, task: TaskRecord) -> None:
+        """Frees an idempotency key claimed by a task that failed to start."""
+        if self._state_store is not None:
+            await asyncio.to_thread(
+                self._state_store.release_idempotency_key,
+                self._name,
+                key,
+                task.task_id,
+            )
+            return
+
+        owner = self._idempotency_keys.get(key)
+        if owner is not None and owner[1] == task.task_id:
+            del self._idempotency_keys[key]
+
+    async def create_session(self) -> str:
+        """Creates a new context for the default service and returns its session id."""
+        service_id = self.default_service
+        workflow = await self._get_workflow(service_id)
+        session_id = generate_id()
+        self._contexts[session_id] = Context(workflow)
+        self._session_services[session_id] = service_id
+        if self._state_store is not None:
+            await asyncio.to_thread(
+                self._state_store.put_session, self._name, session_id, self._worker_id
+            )
+        return session_id
+
+    async def delete_session(self, session_id: str) -> None:
+        """Deletes the context of a session."""
+        self._contexts.pop(session_id)
+        self._session_services.pop(session_id, None)
+        if self._state_store is not None:
+            await asyncio.to_thread(
+                self._state_store.delete_session, self._name, session_id
+            )
+
+    async def list_sessions(self) -> list[str]:
+        """Returns the ids of the sessions of this deployment, across all the workers."""
+        session_ids = list(self._contexts.keys())
+        if self._state_store is not None:
+            shared = await asyncio.to_thread(
+                self._state_store.list_sessions, self._name
+            )
+            for session_id in shared:
+                if session_id not in self._contexts:
+                    session_ids.append(session_id)
+        return session_ids
+
+    async def list_tasks(self) -> list[TaskDefinition]:
+        """Returns the tasks of this deployment, across all the workers."""
+        tasks = [
+            TaskDefinition(task_id=task_id, input=self._handler_inputs[task_id])
+            for task_id in self._handlers.keys()
+        ]
+        if self._state_store is not None:
+            shared = await asyncio.to_thread(self._state_store.list_tasks, self._name)
+            for task in shared:
+                if task.task_id not in self._handlers:
+                    tasks.append(
+                        TaskDefinition(
+                            task_id=task.task_id,
+                            session_id=task.session_id,
+                            input=task.input,
+                        )
+                    )
+        return tasks
 
     async def start(self) -> None:
         """The task that will be launched in this deployment asyncio loop.
@@ -133,30 +899,344 @@ class Deployment:
         """
         self._running = True
 
+        if self._pending_services and settings.prewarm_services:
+            self._prewarm_task = asyncio.create_task(self._prewarm())
+
+        if settings.watch and self._local:
+            self._watch_task = asyncio.create_task(self._watch())
+
+        self._start_event_sink()
+        self._start_ingestion()
+
         # UI
         if self._config.ui:
             await self._start_ui_server()
 
-    async def reload(self, config: DeploymentConfig) -> None:
-        # Reset default service, it might change across reloads
-        self._default_service = None
-        # Tear down the UI server
-        self._stop_ui_server()
-        # Reload the services
-        self._workflow_services = self._load_services(config)
+    async def stop(self) -> None:
+        """Stops the background tasks and the UI server of this deployment.
+
+        The running tasks are left alone, see `drain`.
+        """
+        self._running = False
+        for task in (self._prewarm_task, self._watch_task):
+            if task is not None:
+                task.cancel()
+        await self._stop_ingestion(0)
+        await self._stop_event_sink()
+        await asyncio.gather(*self._background_writes, return_exceptions=True)
+        if self._ui_server_process is not None:
+            await _terminate_ui_server(self._ui_server_process, UI_SERVER_STOP_TIMEOUT)
+        await asyncio.gather(*self._ui_stop_tasks, return_exceptions=True)
+        deployment_state.labels(self._name).state("stopped")
+
+    async def reload(
+        self,
+        config: DeploymentConfig,
+        services: list[str] | None = None,
+        base_path: Path | None = None,
+    ) -> None:
+        """Reloads the services that changed in the new configuration, without downtime.
+
+        The new versions of the services are loaded alongside the old ones, which keep
+        serving tasks until the new versions are ready. Tasks still running on the old
+        versions are then given `reload_drain_timeout` seconds to complete before
+        being cancelled. Services whose configuration didn't change are left
+        untouched, along with their running tasks. When the configuration didn't
+        change at all and `services` is not given, every service is reloaded to pick
+        up changes in the code.
+
+        Args:
+            config: The new configuration of the deployment
+            services: Services to reload even if their configuration didn't change,
+                because their code did
+            base_path: The folder of the new configuration, when it moved
+        """
+        started_at = time.perf_counter()
+        diff = self._config.diff(config)
+        reload_all = services is None and not diff.has_changes
+        if reload_all:
+            to_unload = to_load = list(config.services.keys())
+        else:
+            code_changed = [
+                service_id
+                for service_id in services or []
+                if service_id in diff.unchanged
+            ]
+            to_unload = diff.removed + diff.changed + code_changed
+            to_load = diff.added + diff.changed + code_changed
+        logger.info(
+            "Reloading deployment %s: loading services %s, removing services %s",
+            self._name,
+            to_load,
+            diff.removed,
+        )
+
+        # Syncing and installing can take a while, keep serving tasks meanwhile
+        async with self._import_lock:
+            pending_services = {
+                service_id: pending
+                for service_id, pending in self._pending_services.items()
+                if service_id not in to_unload
+            }
+            previous_base_path = self._base_path
+            if base_path is not None:
+                self._base_path = base_path
+            try:
+                new_services, default_service = await asyncio.to_thread(
+                    self._prepare_services, config, to_unload, to_load, pending_services
+                )
+            except BaseException:
+                self._base_path = previous_base_path
+                raise
+            # Route new tasks to the new services
+            for service_id in to_unload:
+                if service_id not in to_load:
+                    self._remove_service(service_id)
+            workflow_services = {
+                service_id: workflow
+                for service_id, workflow in self._workflow_services.items()
+                if service_id not in to_unload
+            }
+            workflow_services.update(new_services)
+            self._workflow_services = workflow_services
+            self._pending_services = pending_services
+            self._default_service = default_service
+            self._config = config
+        for service_id in diff.removed:
+            try:
+                service_state.remove(self._name, service_id)
+            except KeyError:
+                pass
+
+        self._drain_stale_handlers()
+
+        if self._pending_services and settings.prewarm_services:
+            self._prewarm_task = asyncio.create_task(self._prewarm())
 
         # UI
-        if self._config.ui:
+        if diff.ui_changed or reload_all:
+            await self._reload_ui_server()
+
+        if diff.event_sink_changed:
+            await self._stop_event_sink()
+            self._start_event_sink()
+
+        if diff.ingestion_changed:
+            await self._stop_ingestion(settings.reload_drain_timeout)
+            self._start_ingestion()
+
+        reload_duration.labels(self._name).observe(time.perf_counter() - started_at)
+
+    async def reimport_services(
+        self, service_ids: list[str], changed_files: set[Path] | None = None
+    ) -> None:
+        """Re-imports the code of some services, without syncing or installing anything.
+
+        Args:
+            service_ids: The services to re-import
+            changed_files: Only re-import the modules loaded from these files and the
+                modules depending on them, defaults to all the modules of the services
+        """
+        started_at = time.perf_counter()
+        async with self._import_lock:
+            new_services = await asyncio.to_thread(
+                self._reimport, service_ids, changed_files
+            )
+            # Route new tasks to the new code
+            self._workflow_services = {**self._workflow_services, **new_services}
+            for service_id in new_services:
+                self._pending_services.pop(service_id, None)
+        self._drain_stale_handlers()
+        reload_duration.labels(self._name).observe(time.perf_counter() - started_at)
+
+    def _reimport(
+        self, service_ids: list[str], changed_files: set[Path] | None
+    ) -> dict[str, Workflow]:
+        """Imports the services again in a thread, returns the new workflows."""
+        new_services = {}
+        for service_id in service_ids:
+            import_path = self._config.services[service_id].import_path
+            if import_path is None:  # pragma: no cover
+                continue
+            module_path_str, workflow_name = import_path.split(":")
+            self._drop_modules(service_id, changed_files)
+            try:
+                new_services[service_id] = self._import_workflow(
+                    service_id, Path(module_path_str).name, workflow_name
+                )
+            except Exception as e:
+                # Likely a file saved half way through an edit, keep the old version
+                service_state.labels(self._name, service_id).state("ready")
+                logger.error(f"Failed to reload service {service_id}: {e}")
+        return new_services
+
+    def _drain_stale_handlers(self) -> None:
+        """Lets the tasks running on the old version of reloaded services complete."""
+        stale_handlers = [
+            self._handlers[handler_id]
+            for handler_id, (service_id, workflow) in self._handler_services.items()
+            if self._workflow_services.get(service_id) is not workflow
+            and not self._handlers[handler_id].done()
+        ]
+        if stale_handlers:
+            drain_task = asyncio.create_task(self._drain(stale_handlers))
+            self._drain_tasks.add(drain_task)
+            drain_task.add_done_callback(self._drain_tasks.discard)
+
+    async def _watch(self) -> None:
+        """Re-imports the services whose source files change."""
+        while True:
+            paths = set(self._service_paths.values())
+            if not paths:
+                return
+            watcher = SourceWatcher(
+                sorted(paths), force_polling=settings.watch_force_polling
+            )
+            logger.info(f"Watching {', '.join(str(p) for p in sorted(paths))}")
+            async for changed_files in watcher.changes():
+                service_ids = [
+                    service_id
+                    for service_id, path in self._service_paths.items()
+                    if any(f.is_relative_to(path) for f in changed_files)
+                ]
+                if service_ids:
+                    logger.info(f"Reloading services {', '.join(service_ids)}")
+                    await self.reimport_services(service_ids, changed_files)
+                if set(self._service_paths.values()) != paths:
+                    # A reload changed the services, watch their new folders
+                    break
+
+    def _prepare_services(
+        self,
+        config: DeploymentConfig,
+        to_unload: list[str],
+        to_load: list[str],
+        pending_services: dict[str, tuple[str, str]],
+    ) -> tuple[dict[str, Workflow], str | None]:
+        """Loads the new version of the services in a thread.
+
+        The old version keeps serving tasks, the services deferred by the new
+        version are recorded in `pending_services`. Returns the new workflows and
+        the new default service.
+        """
+        for service_id in to_unload:
+            self._drop_modules(service_id)
+        new_services = self._load_services(config, to_load, pending_services)
+        service_names = [
+            service_id
+            for service_id in self._workflow_services
+            if service_id not in to_unload
+        ]
+        service_names += list(new_services) + list(pending_services)
+        return new_services, self._select_default_service(config, service_names)
+
+    async def _drain(self, handlers: list[WorkflowHandler]) -> None:
+        """Waits for handlers to complete, cancelling the ones still running after the timeout."""
+        draining_handlers.labels(self._name).inc(len(handlers))
+        try:
+            done, pending = await asyncio.wait(
+                handlers, timeout=settings.reload_drain_timeout
+            )
+            for handler in pending:
+                logger.warning(
+                    f"Cancelling a task still running on a reloaded service of {self._name}"
+                )
+                await handler.cancel_run()
+            drained_handlers.labels(self._name, "completed").inc(len(done))
+            drained_handlers.labels(self._name, "cancelled").inc(len(pending))
+        finally:
+            draining_handlers.labels(self._name).dec(len(handlers))
+
+    def _start_ingestion(self) -> None:
+        for source in self._config.ingestion:
+            group = source.group or f"llama-deploy-{self._name}"
+            consumer = IngestionConsumer(self, source, create_broker(source, group))
+            consumer.start()
+            self._consumers.append(consumer)
+
+    async def _stop_ingestion(self, timeout: float) -> None:
+        consumers, self._consumers = self._consumers, []
+        await asyncio.gather(*(c.stop(timeout) for c in consumers))
+
+    def _start_event_sink(self) -> None:
+        config = self._config.event_sink
+        if config is not None:
+            self._event_batcher = EventBatcher(
+                self._name, config, create_publisher(config)
+            )
+            self._event_batcher.start()
+
+    async def _stop_event_sink(self) -> None:
+        batcher, self._event_batcher = self._event_batcher, None
+        if batcher is not None:
+            await batcher.stop()
+
+    async def _reload_ui_server(self) -> None:
+        """Starts the new UI server and switches to it once it's ready.
+
+        The old UI server keeps serving until the new one, started on a different
+        port, answers requests.
+        """
+        old_process = self._ui_server_process
+        if self._config.ui is None:
+            if old_process is not None:
+                self._retire_ui_server(old_process)
+            self._ui_server_process = None
+            self._ui_port = None
+            return
+
+        if old_process is None or old_process.returncode is not None:
+            self._ui_port = None
             await self._start_ui_server()
+            return
 
-    def _stop_ui_server(self) -> None:
-        if self._ui_server_process is None:
+        port = _find_free_port()
+        await self._start_ui_server(port)
+        new_process = self._ui_server_process
+        if await self._wait_ui_server_ready(port):
+            self._ui_port = port
+            self._retire_ui_server(old_process)
             return
 
-        self._ui_server_process.terminate()
+        logger.error(
+            f"The new UI server of {self._name} didn't become ready, keeping the old one"
+        )
+        if new_process is not None:
+            self._retire_ui_server(new_process)
+        self._ui_server_process = old_process
+
+    def _retire_ui_server(self, process: Process) -> None:
+        """Stops a UI server in the background, killing it if it doesn't exit in time."""
+        task = asyncio.create_task(
+            _terminate_ui_server(process, UI_SERVER_STOP_TIMEOUT)
+        )
+        self._ui_stop_tasks.add(task)
+        task.add_done_callback(self._ui_stop_tasks.discard)
+
+    async def _wait_ui_server_ready(self, port: int) -> bool:
+        """Polls the UI server until it answers or `reload_ui_ready_timeout` expires."""
+        url = f"http://localhost:{port}/deployments/{self._name}/ui"
+        deadline = time.monotonic() + settings.reload_ui_ready_timeout
+        async with httpx.AsyncClient(timeout=5) as client:
+            while time.monotonic() < deadline:
+                process = self._ui_server_process
+                if process is not None and process.returncode is not None:
+                    return False
+                try:
+                    response = await client.get(url)
+                    if response.status_code < 500:
+                        return True
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.5)
+        return False
+
+    async def _start_ui_server(self, port: int | None = None) -> None:
+        """Starts the UI server.
 
-    async def _start_ui_server(self) -> None:
-        """Creates WorkflowService instances according to the configuration object."""
+        Args:
+            port: The port where the server will listen, defaults to the one in the configuration
+        """
         if not self._config.ui:
             raise ValueError("missing ui configuration settings")
 
@@ -181,8 +1261,9 @@ class Deployment:
         env = os.environ.copy()
         env["LLAMA_DEPLOY_NEXTJS_BASE_PATH"] = f"/deployments/{self._config.name}/ui"
         env["LLAMA_DEPLOY_NEXTJS_DEPLOYMENT_NAME"] = self._config.name
-        # Override PORT and force using the one from the deployment.yaml file
-        env["PORT"] = str(self._config.ui.port)
+        # Override PORT and force using the one from the deployment.yaml file, unless
+        # the server is started next to the current one during a reload
+        env["PORT"] = str(port or self._config.ui.port)
 
         self._ui_server_process = await asyncio.create_subprocess_exec(
             "pnpm",
@@ -190,15 +1271,34 @@ class Deployment:
             "dev",
             cwd=installed_path,
             env=env,
+            # Let the whole process tree be stopped at once
+            start_new_session=True,
         )
 
         print(f"Started Next.js app with PID {self._ui_server_process.pid}")
 
-    def _load_services(self, config: DeploymentConfig) -> dict[str, Workflow]:
-        """Creates WorkflowService instances according to the configuration object."""
+    def _load_services(
+        self,
+        config: DeploymentConfig,
+        service_ids: list[str] | None = None,
+        pending_services: dict[str, tuple[str, str]] | None = None,
+    ) -> dict[str, Workflow]:
+        """Creates WorkflowService instances according to the configuration object.
+
+        Args:
+            config: The deployment configuration
+            service_ids: Only load these services, defaults to all the services in the configuration
+            pending_services: Where to record the services whose import is deferred,
+                defaults to the ones of this deployment
+        """
+        if pending_services is None:
+            pending_services = self._pending_services
         deployment_state.labels(self._name).state("loading_services")
         workflow_services = {}
         for service_id, service_config in config.services.items():
+            if service_ids is not None and service_id not in service_ids:
+                continue
+
             service_state.labels(self._name, service_id).state("loading")
             source = service_config.source
             if source is None:
@@ -213,14 +1313,21 @@ class Deployment:
 
             # Sync the service source
             service_state.labels(self._name, service_id).state("syncing")
+            started_at = time.perf_counter()
             destination = self._deployment_path.resolve()
             source_manager = SOURCE_MANAGERS[source.type](config, self._base_path)
             policy = SyncPolicy.SKIP if self._local else SyncPolicy.REPLACE
             source_manager.sync(source.location, str(destination), policy)
+            synced_at = time.perf_counter()
 
             # Install dependencies
             service_state.labels(self._name, service_id).state("installing")
             self._install_dependencies(service_config, destination)
+            self._startup_profile[service_id] = ServiceStartupProfile(
+                service_id=service_id,
+                sync_seconds=synced_at - started_at,
+                install_seconds=time.perf_counter() - synced_at,
+            )
 
             # Set environment variables
             self._set_environment_variables(service_config, destination)
@@ -230,23 +1337,231 @@ class Deployment:
             module_path = Path(module_path_str)
             module_name = module_path.name
             pythonpath = (destination / module_path.parent).resolve()
-            logger.debug("Extending PYTHONPATH to %s", pythonpath)
-            sys.path.append(str(pythonpath))
+            if str(pythonpath) not in sys.path:
+                logger.debug("Extending PYTHONPATH to %s", pythonpath)
+                sys.path.append(str(pythonpath))
+            self._service_paths[service_id] = pythonpath
+
+            if settings.lazy_load_services:
+                # The workflow will be imported by the first task targeting it
+                pending_services[service_id] = (module_name, workflow_name)
+                service_state.labels(self._name, service_id).state("deferred")
+                continue
+
+            workflow_services[service_id] = self._import_workflow(
+                service_id, module_name, workflow_name
+            )
+
+        return workflow_services
 
+    @staticmethod
+    def _select_default_service(
+        config: DeploymentConfig, service_names: list[str]
+    ) -> str | None:
+        """Returns the default service set in the configuration, if it exists."""
+        if not config.default_service:
+            return None
+        if config.default_service not in service_names:
+            msg = f"Service with id '{config.default_service}' does not exist, cannot set it as default."
+            logger.warning(msg)
+            return None
+        return config.default_service
+
+    def _result_cache(self, service_id: str, workflow: Workflow) -> ResultCache | None:
+        """Returns the result cache of a service, emptied when the service is reloaded.
+
+        Results are also keyed by the configuration and the sources of the service,
+        so that the results of another version of its code aren't read from disk
+        after a restart or by another worker.
+        """
+        service = self._config.services.get(service_id)
+        if service is None or service.cache is None:
+            return None
+
+        current = self._result_caches.get(service_id)
+        if current is not None:
+            cached_workflow, cache = current
+            if cached_workflow is workflow:
+                return cache
+            # Results of the previous version of the code can't be trusted
+            cache.clear()
+            cache.close()
+
+        version = hashlib.sha256(
+            (
+                service.model_dump_json() + self._source_versions.get(service_id, "")
+            ).encode()
+        ).hexdigest()
+        cache = ResultCache(
+            self._name, service_id, service.cache, self._cache_path, version
+        )
+        self._result_caches[service_id] = (workflow, cache)
+        return cache
+
+    async def _get_workflow(self, service_id: str) -> Workflow:
+        """Returns the workflow of a service, importing it in a thread if it was deferred."""
+        if service_id in self._pending_services:
+            # The import completes even if the task waiting for it is cancelled
+            await asyncio.shield(self._import_pending(service_id))
+        return self._workflow_services[service_id]
+
+    async def _import_pending(self, service_id: str) -> None:
+        async with self._import_lock:
+            # Another task might have imported the workflow while we were waiting
+            pending = self._pending_services.get(service_id)
+            if pending is None:
+                return
+            workflow = await asyncio.to_thread(
+                self._import_workflow, service_id, *pending
+            )
+            self._workflow_services = {**self._workflow_services, service_id: workflow}
+            del self._pending_services[service_id]
+
+    def _import_workflow(
+        self, service_id: str, module_name: str, workflow_name: str
+    ) -> Workflow:
+        """Imports the module of a service and returns its workflow instance."""
+        service_state.labels(self._name, service_id).state("loading")
+
+        started_at = time.perf_counter()
+        modules_before = set(sys.modules.keys())
+        if settings.profile_imports:
+            with ImportProfiler() as profiler:
+                module = importlib.import_module(module_name)
+            modules = dict(profiler.top())
+        else:
             module = importlib.import_module(module_name)
-            workflow_services[service_id] = getattr(module, workflow_name)
+            modules = {}
+        import_seconds = time.perf_counter() - started_at
+        self._service_modules[service_id] = (
+            self._service_modules.get(service_id, set())
+            | (set(sys.modules.keys()) - modules_before)
+            | {module_name}
+        )
 
-            service_state.labels(self._name, service_id).state("ready")
+        workflow = getattr(module, workflow_name)
+        self._source_versions[service_id] = self._hash_sources(service_id)
 
-        if config.default_service:
-            if config.default_service in workflow_services:
-                self._default_service = config.default_service
-            else:
-                msg = f"Service with id '{config.default_service}' does not exist, cannot set it as default."
-                logger.warning(msg)
-                self._default_service = None
+        profile = self._startup_profile.get(service_id) or ServiceStartupProfile(
+            service_id=service_id
+        )
+        profile.import_seconds = import_seconds
+        profile.modules = modules
+        self._startup_profile[service_id] = profile
+        logger.info(
+            "Service %s loaded in %.3fs (sync %.3fs, install %.3fs, import %.3fs)",
+            service_id,
+            profile.sync_seconds + profile.install_seconds + import_seconds,
+            profile.sync_seconds,
+            profile.install_seconds,
+            import_seconds,
+        )
 
-        return workflow_services
+        service_state.labels(self._name, service_id).state("ready")
+        return workflow
+
+    def _drop_modules(
+        self, service_id: str, changed_files: set[Path] | None = None
+    ) -> None:
+        """Drops the modules loaded from the sources of a service from `sys.modules`.
+
+        Modules imported by the service from outside its sources, like third party
+        libraries, are kept. The workflow instance keeps working with the modules it
+        was created from until the service is replaced.
+
+        Args:
+            service_id: The service whose modules will be dropped
+            changed_files: Only drop the modules loaded from these files and the modules
+                referencing them, along with the module of the workflow
+        """
+        modules = self._source_modules(service_id)
+        if changed_files is None:
+            stale = set(modules)
+        else:
+            stale = {
+                name
+                for name, module in modules.items()
+                if Path(module.__file__ or "").resolve() in changed_files
+            }
+            # Modules importing stale modules must be re-executed too
+            while True:
+                dependents = {
+                    name
+                    for name, module in modules.items()
+                    if name not in stale and _imports_any(module, stale)
+                }
+                if not dependents:
+                    break
+                stale |= dependents
+            if pending := self._pending_services.get(service_id):
+                stale.add(pending[0])
+            elif import_path := self._config.services[service_id].import_path:
+                stale.add(Path(import_path.split(":")[0]).name)
+
+        for module_name in stale:
+            module = sys.modules.pop(module_name, None)
+            # `from package import module` would still find the stale module
+            parent_name, _, child_name = module_name.rpartition(".")
+            parent = sys.modules.get(parent_name)
+            if module is not None and getattr(parent, child_name, None) is module:
+                delattr(parent, child_name)
+        self._service_modules[service_id] = set(modules) - stale
+        importlib.invalidate_caches()
+
+    def _source_modules(self, service_id: str) -> dict[str, ModuleType]:
+        """Returns the modules loaded from the sources of a service, by name."""
+        service_path = self._service_paths.get(service_id)
+        modules: dict[str, ModuleType] = {}
+        for module_name in self._service_modules.get(service_id, set()):
+            module = sys.modules.get(module_name)
+            module_file = getattr(module, "__file__", None)
+            if (
+                module is not None
+                and module_file
+                and service_path
+                and Path(module_file).resolve().is_relative_to(service_path)
+            ):
+                modules[module_name] = module
+        return modules
+
+    def _hash_sources(self, service_id: str) -> str:
+        """Returns a hash of the files of the modules loaded from the sources of a service."""
+        service_path = self._service_paths.get(service_id)
+        digest = hashlib.sha256()
+        if service_path is None:
+            return digest.hexdigest()
+        files = {
+            Path(module.__file__ or "").resolve()
+            for module in self._source_modules(service_id).values()
+        }
+        for path in sorted(files):
+            # Relative, the sources are synced in another folder by each worker
+            digest.update(str(path.relative_to(service_path)).encode())
+            try:
+                digest.update(path.read_bytes())
+            except OSError:
+                continue
+        return digest.hexdigest()
+
+    def _remove_service(self, service_id: str) -> None:
+        """Forgets a service that is no longer part of the deployment."""
+        self._pending_services.pop(service_id, None)
+        self._startup_profile.pop(service_id, None)
+        self._source_versions.pop(service_id, None)
+        service_path = self._service_paths.pop(service_id, None)
+        if service_path and service_path not in self._service_paths.values():
+            try:
+                sys.path.remove(str(service_path))
+            except ValueError:
+                pass
+
+    async def _prewarm(self) -> None:
+        """Imports the deferred services in a worker thread, without blocking the event loop."""
+        for service_id in list(self._pending_services.keys()):
+            try:
+                await self._get_workflow(service_id)
+            except Exception as e:
+                logger.error(f"Failed to pre-warm service {service_id}: {e}")
 
     @staticmethod
     def _validate_path_is_safe(
@@ -398,6 +1713,14 @@ class Manager:
         self._last_control_plane_port = 8002
         self._simple_message_queue_server: asyncio.Task | None = None
         self._serving = False
+        self._state_store: StateStore | None = None
+        self._task_queue: SqliteTaskQueue | None = None
+        self._worker_id = new_worker_id()
+        self._lease_task: asyncio.Task | None = None
+        # Cleared when the server shuts down
+        self._accepting_tasks = True
+        # The revision of each deployment as last loaded by this worker
+        self._revisions: dict[str, int] = {}
 
     @property
     def deployment_names(self) -> list[str]:
@@ -410,36 +1733,170 @@ class Manager:
             raise ValueError("Deployments path not set")
         return self._deployments_path
 
+    @property
+    def state_store(self) -> StateStore | None:
+        """Returns the store shared with the other workers, if any."""
+        return self._state_store
+
+    @property
+    def worker_id(self) -> str:
+        """Returns the id of the worker process running this manager."""
+        return self._worker_id
+
+    @property
+    def accepting_tasks(self) -> bool:
+        """Returns False once the server started shutting down."""
+        return self._accepting_tasks
+
+    async def pending_deployments(self) -> set[str]:
+        """Returns the deployments created by other workers and not yet loaded by this one."""
+        if self._state_store is None:
+            return set()
+        records = await asyncio.to_thread(self._state_store.list_deployments)
+        return {
+            record.name for record in records if record.name not in self._deployments
+        }
+
     def set_deployments_path(self, path: Path | None) -> None:
         self._deployments_path = (
             path or Path(tempfile.gettempdir()) / "llama_deploy" / "deployments"
         )
 
+    def set_state_store(self, store: StateStore | None) -> None:
+        self._state_store = store
+
+    def set_accepting_tasks(self, accepting: bool) -> None:
+        self._accepting_tasks = accepting
+
+    def set_task_queue(self, queue: SqliteTaskQueue | None) -> None:
+        self._task_queue = queue
+        for deployment in self._deployments.values():
+            deployment._task_queue = queue
+
+    def checkpoint_tasks(self) -> int:
+        """Saves the Context of the queued tasks still running in every deployment."""
+        return sum(d.checkpoint_tasks() for d in self._deployments.values())
+
+    async def shutdown(self, grace_period: float) -> None:
+        """Stops the deployments without losing work.
+
+        New tasks and sessions are refused, then the running tasks are given
+        `grace_period` seconds to complete. When a task queue is set, the tasks still
+        running are checkpointed and the open sessions saved, to be resumed on
+        restart or by the other workers. The UI servers are stopped last.
+        """
+        self._accepting_tasks = False
+        deployments = list(self._deployments.values())
+        running = await asyncio.gather(*(d.drain(grace_period) for d in deployments))
+        if sum(running):
+            logger.warning(
+                f"{sum(running)} tasks still running after {grace_period}s of grace period"
+            )
+        await self._stop_lease()
+        if self._task_queue is not None:
+            checkpointed = self.checkpoint_tasks()
+            saved = sum(d.save_sessions() for d in deployments)
+            logger.info(
+                f"Checkpointed {checkpointed} running tasks, saved {saved} sessions"
+            )
+            # The other workers recover the tasks left without waiting for the lease
+            # to expire
+            await asyncio.to_thread(self._task_queue.release_lease, self._worker_id)
+        await asyncio.gather(*(d.stop() for d in deployments))
+        if self._state_store is not None and self._deployments_path is not None:
+            await asyncio.to_thread(self._remove_worker_folders)
+
+    def _remove_worker_folders(self) -> None:
+        """Removes the sources synced by this worker and by the workers that died."""
+        assert self._deployments_path is not None
+        workers_path = self._deployments_path / WORKERS_DIR
+        if not workers_path.is_dir():
+            return
+        for path in workers_path.iterdir():
+            if path.name == self._worker_id or not worker_alive(path.name):
+                shutil.rmtree(path, ignore_errors=True)
+
     def get_deployment(self, deployment_name: str) -> Deployment | None:
         return self._deployments.get(deployment_name)
 
+    def step_labeler(self) -> Callable[[FrameType], str | None]:
+        """Returns a function naming the deployment, service and step a frame runs, for profiling.
+
+        The function may be called from another thread. Steps running in a thread
+        pool, i.e. synchronous steps, aren't recognized.
+        """
+        owners: dict[int, str] = {}
+
+        def label(frame: FrameType) -> str | None:
+            if frame.f_code is not _STEP_WORKER_CODE:
+                return None
+            frame_locals = frame.f_locals
+            step_name = frame_locals.get("name")
+            workflow = getattr(frame_locals.get("step"), "__self__", None)
+            if not isinstance(workflow, Workflow):
+                # Steps defined outside of a workflow class
+                return str(step_name)
+            if id(workflow) not in owners:
+                owners[id(workflow)] = type(workflow).__name__
+                for deployment in list(self._deployments.values()):
+                    if service_id := deployment.service_of(workflow):
+                        owners[id(workflow)] = f"{deployment.name}/{service_id}"
+                        break
+            return f"{owners[id(workflow)]}/{step_name}"
+
+        return label
+
     async def serve(self) -> None:
         """The server loop, it keeps the manager running."""
         if self._deployments_path is None:
             raise RuntimeError("Deployments path not set")
 
         self._serving = True
+        if self._task_queue is not None:
+            self._lease_task = asyncio.create_task(self._keep_lease())
 
         event = asyncio.Event()
         try:
-            # Waits indefinitely since `event` will never be set
-            await event.wait()
+            if self._state_store is None:
+                # Waits indefinitely since `event` will never be set
+                await event.wait()
+            else:
+                # Keep up with the deployments created by the other workers
+                while True:
+                    await self._sync_deployments()
+                    await asyncio.sleep(settings.shared_state_poll_interval)
         except asyncio.CancelledError:
+            await self._stop_lease()
             if self._simple_message_queue_server is not None:
                 self._simple_message_queue_server.cancel()
                 await self._simple_message_queue_server
 
+    async def _keep_lease(self) -> None:
+        """Renews the lease of this worker and recovers the tasks of the workers whose lease expired."""
+        while self._task_queue is not None:
+            try:
+                await asyncio.to_thread(self._task_queue.renew_lease, self._worker_id)
+                for deployment in list(self._deployments.values()):
+                    await deployment.recover_tasks()
+            except Exception as e:
+                logger.error(
+                    f"Failed to renew the lease of worker {self._worker_id}: {e}"
+                )
+            await asyncio.sleep(WORKER_LEASE_TTL / 3)
+
+    async def _stop_lease(self) -> None:
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+            await asyncio.gather(self._lease_task, return_exceptions=True)
+            self._lease_task = None
+
     async def deploy(
         self,
         config: DeploymentConfig,
         base_path: str,
         reload: bool = False,
         local: bool = False,
+        services: list[str] | None = None,
     ) -> None:
         """Creates a Deployment instance and starts the relative runtime.
 
@@ -447,6 +1904,8 @@ class Manager:
             config: The deployment configuration.
             reload: Reload an existing deployment instead of raising an error.
             local: Deploy a local configuration. Source code will be used in place locally.
+            services: When reloading, the services whose code changed. Defaults to all
+                the services if the configuration didn't change.
 
         Raises:
             ValueError: If a deployment with the same name already exists or the maximum number of deployment exceeded.
@@ -455,6 +1914,38 @@ class Manager:
         if not self._serving:
             raise RuntimeError("Manager main loop not started, call serve() first.")
 
+        if self._state_store is not None and not reload:
+            # Every worker deploys the startup configurations: skip the ones this
+            # worker already loaded from the store
+            records = await asyncio.to_thread(self._state_store.list_deployments)
+            for record in records:
+                if (
+                    record.name == config.name
+                    and record.config == config.model_dump_json()
+                    and self._revisions.get(record.name) == record.revision
+                ):
+                    return
+
+        await self._deploy(config, base_path, reload, local, services)
+        if self._state_store is not None:
+            # Let the other workers know about the new deployment
+            self._revisions[config.name] = await asyncio.to_thread(
+                self._state_store.put_deployment,
+                config.name,
+                config.model_dump_json(),
+                base_path,
+                local,
+            )
+
+    async def _deploy(
+        self,
+        config: DeploymentConfig,
+        base_path: str,
+        reload: bool,
+        local: bool,
+        services: list[str] | None = None,
+    ) -> None:
+        """Creates or reloads a deployment in this worker only."""
         if not reload:
             # Raise an error if deployment already exists
             if config.name in self._deployments:
@@ -471,13 +1962,41 @@ class Manager:
                 base_path=Path(base_path),
                 deployment_path=self.deployments_path,
                 local=local,
+                state_store=self._state_store,
+                worker_id=self._worker_id,
+                task_queue=self._task_queue,
             )
             self._deployments[config.name] = deployment
             await deployment.start()
+            await deployment.restore_sessions()
+            await deployment.recover_tasks()
         else:
             if config.name not in self._deployments:
                 msg = f"Cannot find deployment to reload: {config.name}"
                 raise ValueError(msg)
 
             deployment = self._deployments[config.name]
-            await deployment.reload(config)
+            await deployment.reload(config, services, Path(base_path))
+
+    async def _sync_deployments(self) -> None:
+        """Loads the deployments created or reloaded by the other workers."""
+        if self._state_store is None:
+            return
+
+        records = await asyncio.to_thread(self._state_store.list_deployments)
+        for record in records:
+            if self._revisions.get(record.name, 0) >= record.revision:
+                continue
+
+            try:
+                config = DeploymentConfig.model_validate_json(record.config)
+                await self._deploy(
+                    config,
+                    record.base_path,
+                    reload=record.name in self._deployments,
+                    local=record.local,
+                )
+            except Exception as e:
+                logger.error(f"Failed to load deployment {record.name}: {e}")
+            # Don't retry a broken revision at every poll
+            self._revisions[record.name] = record.revision
@@ -1,5 +1,8 @@
+import hashlib
 import sys
+import threading
 import warnings
+from collections import OrderedDict
 from enum import Enum
 from pathlib import Path
 from typing import Any, Optional
@@ -12,6 +15,13 @@ else:  # pragma: no cover
 import yaml
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
+# Use the libyaml bindings when PyYAML was built with them, they're much faster
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Validated configs indexed by the sha256 of their yaml source
+CONFIG_CACHE_SIZE = 128
+_config_cache: OrderedDict[str, "DeploymentConfig"] = OrderedDict()
+_config_cache_lock = threading.Lock()
+
 
 class SourceType(str, Enum):
     """Supported types for the `Service.source` parameter."""
@@ -50,6 +60,42 @@ class ServiceSource(BaseModel):
         return data
 
 
+class ServiceCache(BaseModel):
+    """Configuration for the `cache` parameter of a service.
+
+    Results of the tasks run without a session are cached by input, so the service
+    must be deterministic.
+    """
+
+    ttl: float | None = Field(
+        default=300.0,
+        description="Seconds a result is served from the cache, forever if null",
+    )
+    max_entries: int = Field(
+        default=1024,
+        description="Number of results kept in memory, the least recently used are evicted first",
+    )
+    path: str | None = Field(
+        default=None,
+        description="SQLite file keeping results on disk as a second tier, relative to the deployment folder",
+    )
+    disk_max_entries: int = Field(
+        default=100_000,
+        description="Number of results kept on disk, the oldest are evicted first",
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def validate_fields(cls, data: Any) -> Any:
+        # Handle YAML aliases
+        if isinstance(data, dict):
+            if "max-entries" in data:
+                data["max_entries"] = data.pop("max-entries")
+            if "disk-max-entries" in data:
+                data["disk_max_entries"] = data.pop("disk-max-entries")
+        return data
+
+
 class Service(BaseModel):
     """Configuration for a single service."""
 
@@ -62,6 +108,9 @@ class Service(BaseModel):
     env_files: list[str] | None = Field(None)
     python_dependencies: list[str] | None = Field(None)
     ts_dependencies: dict[str, str] | None = Field(None)
+    cache: ServiceCache | None = None
+    # Seconds a task of the service can run before being cancelled
+    timeout: float | None = None
 
     @model_validator(mode="before")
     @classmethod
@@ -87,6 +136,109 @@ class Service(BaseModel):
         return data
 
 
+class BrokerType(str, Enum):
+    """Supported message brokers for the `ingestion` and `event_sink` parameters."""
+
+    kafka = "kafka"
+    redis = "redis"
+    memory = "memory"
+
+
+class IngestionSource(BaseModel):
+    """Configuration for an item of the `ingestion` parameter of a deployment.
+
+    Every message of the topic is a `TaskDefinition` serialized as JSON, run by the
+    deployment as if it was created over HTTP.
+    """
+
+    type: BrokerType
+    topic: str = Field(
+        description="The topic, or the stream for Redis, to consume tasks from",
+    )
+    reply_topic: str | None = Field(
+        default=None,
+        description="Where to publish the result of each task, results are dropped if null",
+    )
+    url: str | None = Field(
+        default=None,
+        description="The Kafka bootstrap servers or the Redis URL, defaults to the local broker",
+    )
+    group: str | None = Field(
+        default=None,
+        description="The consumer group, shared by the workers, defaults to llama-deploy-<deployment name>",
+    )
+    service: str | None = Field(
+        default=None,
+        description="The service running the tasks without a service_id, defaults to the default service",
+    )
+    concurrency: int = Field(
+        default=4,
+        gt=0,
+        description="How many tasks of the topic run at the same time",
+    )
+    batch_size: int = Field(
+        default=16,
+        gt=0,
+        description="How many messages are fetched at once, their offsets are committed together",
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def validate_fields(cls, data: Any) -> Any:
+        # Handle YAML aliases
+        if isinstance(data, dict):
+            if "reply-topic" in data:
+                data["reply_topic"] = data.pop("reply-topic")
+            if "batch-size" in data:
+                data["batch_size"] = data.pop("batch-size")
+        return data
+
+
+class EventSink(BaseModel):
+    """Configuration for the `event_sink` parameter of a deployment.
+
+    The events streamed by every task of the deployment and their results are
+    published to the topic, in batches.
+    """
+
+    type: BrokerType
+    topic: str = Field(
+        description="The topic, or the stream for Redis, to publish the events to",
+    )
+    url: str | None = Field(
+        default=None,
+        description="The Kafka bootstrap servers or the Redis URL, defaults to the local broker",
+    )
+    batch_size: int = Field(
+        default=100,
+        gt=0,
+        description="How many events are published at once",
+    )
+    flush_interval: float = Field(
+        default=0.1,
+        gt=0,
+        description="Seconds an event waits for its batch to fill up before being published",
+    )
+    max_pending: int = Field(
+        default=10_000,
+        gt=0,
+        description="How many events wait to be published before new ones are dropped, so that a slow broker doesn't slow down tasks",
+    )
+
+    @model_validator(mode="before")
+    @classmethod
+    def validate_fields(cls, data: Any) -> Any:
+        # Handle YAML aliases
+        if isinstance(data, dict):
+            if "batch-size" in data:
+                data["batch_size"] = data.pop("batch-size")
+            if "flush-interval" in data:
+                data["flush_interval"] = data.pop("flush-interval")
+            if "max-pending" in data:
+                data["max_pending"] = data.pop("max-pending")
+        return data
+
+
 class UIService(Service):
     port: int | None = Field(
         default=3000,
@@ -103,6 +255,8 @@ class DeploymentConfig(BaseModel):
     default_service: str | None = Field(None)
     services: dict[str, Service]
     ui: UIService | None = None
+    ingestion: list[IngestionSource] = Field(default_factory=list)
+    event_sink: EventSink | None = None
 
     @model_validator(mode="before")
     @classmethod
@@ -115,19 +269,92 @@ class DeploymentConfig(BaseModel):
                 data["message_queue"] = data.pop("message-queue")
             if "default-service" in data:
                 data["default_service"] = data.pop("default-service")
+            if "event-sink" in data:
+                data["event_sink"] = data.pop("event-sink")
 
         return data
 
     @classmethod
     def from_yaml_bytes(cls, src: bytes) -> Self:
-        """Read config data from bytes containing yaml code."""
-        config = yaml.safe_load(src) or {}
-        return cls(**config)
+        """Read config data from bytes containing yaml code.
+
+        Configs are cached by content, parsing the same bytes twice returns a copy
+        of the config validated the first time.
+        """
+        key = f"{cls.__qualname__}:{hashlib.sha256(src).hexdigest()}"
+        with _config_cache_lock:
+            cached = _config_cache.get(key)
+            if cached is not None:
+                _config_cache.move_to_end(key)
+                # Callers are free to modify the config they get
+                return cached.model_copy(deep=True)  # type: ignore
+
+        config = cls(**(yaml.load(src, Loader=_YamlLoader) or {}))
+        with _config_cache_lock:
+            _config_cache[key] = config.model_copy(deep=True)
+            if len(_config_cache) > CONFIG_CACHE_SIZE:
+                _config_cache.popitem(last=False)
+        return config
 
     @classmethod
     def from_yaml(cls, path: Path) -> Self:
         """Read config data from a yaml file."""
-        with open(path, "r") as yaml_file:
-            config = yaml.safe_load(yaml_file) or {}
+        with open(path, "rb") as yaml_file:
+            return cls.from_yaml_bytes(yaml_file.read())
+
+    def diff(self, other: "DeploymentConfig") -> "DeploymentConfigDiff":
+        """Compares this config with a newer version of it.
+
+        Args:
+            other: The new config
+
+        Returns:
+            Which services were added, removed or changed in the new config.
+        """
+        old_services = set(self.services)
+        new_services = set(other.services)
+        common = old_services & new_services
+        return DeploymentConfigDiff(
+            added=sorted(new_services - old_services),
+            removed=sorted(old_services - new_services),
+            changed=sorted(s for s in common if self.services[s] != other.services[s]),
+            unchanged=sorted(
+                s for s in common if self.services[s] == other.services[s]
+            ),
+            ui_changed=self.ui != other.ui,
+            default_service_changed=self.default_service != other.default_service,
+            ingestion_changed=self.ingestion != other.ingestion,
+            event_sink_changed=self.event_sink != other.event_sink,
+        )
+
+
+class DeploymentConfigDiff(BaseModel):
+    """The differences between two versions of a deployment config."""
+
+    added: list[str] = Field(default_factory=list)
+    removed: list[str] = Field(default_factory=list)
+    changed: list[str] = Field(default_factory=list)
+    unchanged: list[str] = Field(default_factory=list)
+    ui_changed: bool = False
+    default_service_changed: bool = False
+    ingestion_changed: bool = False
+    event_sink_changed: bool = False
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether the two configs differ at all."""
+        return bool(
+            self.added
+            or self.removed
+            or self.changed
+            or self.ui_changed
+            or self.default_service_changed
+            or self.ingestion_changed
+            or self.event_sink_changed
+        )
+
 
-        return cls(**config)
+def clear_config_cache() -> None:
+    """Drops all the configs cached by `DeploymentConfig.from_yaml_bytes`."""
+    with _config_cache_lock:
+        _config_cache.clear()
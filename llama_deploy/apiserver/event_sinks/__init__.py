@@ -0,0 +1,28 @@
+"""Fan-out of task events to message brokers, configured with the `event_sink` parameter of a deployment."""
+
+from ..deployment_config_parser import BrokerType, EventSink
+from .base import EventPublisher
+from .batcher import EventBatcher, tap_events
+from .memory import MemoryEventPublisher
+
+
+def create_publisher(config: EventSink) -> EventPublisher:
+    """Returns the publisher of an event sink, importing its client library if needed."""
+    if config.type == BrokerType.kafka:
+        from .kafka import KafkaEventPublisher
+
+        return KafkaEventPublisher(config)
+    if config.type == BrokerType.redis:
+        from .redis import RedisEventPublisher
+
+        return RedisEventPublisher(config)
+    return MemoryEventPublisher(config)
+
+
+__all__ = [
+    "EventBatcher",
+    "EventPublisher",
+    "MemoryEventPublisher",
+    "create_publisher",
+    "tap_events",
+]
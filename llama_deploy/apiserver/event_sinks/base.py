@@ -0,0 +1,19 @@
+from abc import ABC, abstractmethod
+
+
+class EventPublisher(ABC):
+    """Protocol to be implemented by the message brokers task events are published to."""
+
+    @abstractmethod
+    async def start(self) -> None:  # pragma: no cover
+        """Connects to the broker."""
+
+    @abstractmethod
+    async def stop(self) -> None:  # pragma: no cover
+        """Disconnects from the broker."""
+
+    @abstractmethod
+    async def publish(
+        self, messages: list[tuple[bytes, bytes]]
+    ) -> None:  # pragma: no cover
+        """Publishes a batch of (key, value) messages, keyed by task id."""
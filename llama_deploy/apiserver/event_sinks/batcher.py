@@ -0,0 +1,187 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+from workflows.context import JsonSerializer
+from workflows.handler import WorkflowHandler
+
+from ..deployment_config_parser import EventSink
+from ..stats import event_sink_messages
+from .base import EventPublisher
+
+logger = logging.getLogger(__name__)
+
+# task id, session id, service id, type, payload, timestamp
+_Record = tuple[str, str | None, str, str, Any, float]
+
+
+class _TappedQueue(asyncio.Queue):
+    """The streaming queue of a task, handing a copy of every event to a callback."""
+
+    def __init__(self, on_event: Callable[[Any], None]) -> None:
+        super().__init__()
+        self._on_event = on_event
+
+    def put_nowait(self, item: Any) -> None:
+        if item is not None:
+            self._on_event(item)
+        super().put_nowait(item)
+
+
+class EventBatcher:
+    """Publishes the events and the results of tasks to an event sink, in the background.
+
+    Tasks only append their events to an in-memory buffer. The buffer is flushed
+    every `flush_interval` seconds, or as soon as it holds `batch_size` events, and
+    the events are serialized in a thread. When the broker can't keep up and
+    `max_pending` events are waiting, new events are dropped rather than slowing
+    down the tasks.
+    """
+
+    def __init__(
+        self, deployment_name: str, config: EventSink, publisher: EventPublisher
+    ) -> None:
+        self._deployment_name = deployment_name
+        self._config = config
+        self._publisher = publisher
+        self._pending: deque[_Record] = deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    @property
+    def config(self) -> EventSink:
+        return self._config
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Publishes the pending events, giving up after `timeout` seconds."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Dropped {len(self._pending)} events of {self._deployment_name} on shutdown"
+            )
+        self._task = None
+
+    def emit(
+        self,
+        task_id: str,
+        session_id: str | None,
+        service_id: str,
+        kind: str,
+        payload: Any,
+    ) -> None:
+        """Queues an event, a result or an error for publishing, never blocks."""
+        if len(self._pending) >= self._config.max_pending:
+            event_sink_messages.labels(self._deployment_name, "dropped").inc()
+            return
+        self._pending.append(
+            (task_id, session_id, service_id, kind, payload, time.time())
+        )
+        if len(self._pending) >= self._config.batch_size:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        started = False
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._config.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if not started:
+                    await self._publisher.start()
+                    started = True
+                await self._flush()
+            except Exception as e:
+                logger.error(
+                    f"Failed to publish the events of {self._deployment_name}: {e}"
+                )
+            if self._stopping:
+                break
+        if started:
+            await self._publisher.stop()
+
+    async def _flush(self) -> None:
+        while self._pending:
+            size = min(self._config.batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(size)]
+            messages = await asyncio.to_thread(self._encode, batch)
+            try:
+                await self._publisher.publish(messages)
+            except Exception:
+                event_sink_messages.labels(self._deployment_name, "failed").inc(size)
+                raise
+            event_sink_messages.labels(self._deployment_name, "published").inc(size)
+
+    def _encode(self, batch: list[_Record]) -> list[tuple[bytes, bytes]]:
+        serializer = JsonSerializer()
+        messages = []
+        for task_id, session_id, service_id, kind, payload, timestamp in batch:
+            message: dict[str, Any] = {
+                "deployment": self._deployment_name,
+                "service_id": service_id,
+                "task_id": task_id,
+                "session_id": session_id,
+                "type": kind,
+                "timestamp": timestamp,
+            }
+            try:
+                if kind == "event":
+                    message["event"] = json.loads(serializer.serialize(payload))
+                else:
+                    message[kind] = payload
+                value = json.dumps(message, default=str)
+            except Exception as e:
+                message.update({"type": "error", "error": f"Can't serialize: {e}"})
+                value = json.dumps(message)
+            messages.append((task_id.encode(), value.encode()))
+        return messages
+
+
+def tap_events(
+    batcher: EventBatcher,
+    handler: WorkflowHandler,
+    task_id: str,
+    session_id: str | None,
+    service_id: str,
+) -> None:
+    """Copies the events streamed by a task to an event sink, then its result.
+
+    The task must not have started yet. Clients streaming the events over HTTP
+    still receive all of them.
+    """
+    ctx = handler.ctx
+    if ctx is None:
+        return
+    queue = _TappedQueue(
+        functools.partial(batcher.emit, task_id, session_id, service_id, "event")
+    )
+    previous = ctx._streaming_queue
+    while not previous.empty():
+        queue.put_nowait(previous.get_nowait())
+    ctx._streaming_queue = queue
+
+    def emit_result(handler: WorkflowHandler) -> None:
+        if handler.cancelled():
+            batcher.emit(task_id, session_id, service_id, "error", "cancelled")
+        elif handler.exception() is not None:
+            batcher.emit(
+                task_id, session_id, service_id, "error", str(handler.exception())
+            )
+        else:
+            batcher.emit(task_id, session_id, service_id, "result", handler.result())
+
+    handler.add_done_callback(emit_result)
@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any
+
+from ..deployment_config_parser import EventSink
+from .base import EventPublisher
+
+try:
+    from aiokafka import AIOKafkaProducer
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "Publishing events to Kafka requires aiokafka, install it with `pip install llama-deploy[kafka]`"
+    ) from e
+
+DEFAULT_BOOTSTRAP_SERVERS = "localhost:9092"
+
+
+class KafkaEventPublisher(EventPublisher):
+    """Publishes to a Kafka topic, the events of a task go to the same partition."""
+
+    def __init__(self, config: EventSink) -> None:
+        self._config = config
+        self._producer: Any = None
+
+    async def start(self) -> None:
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=self._config.url or DEFAULT_BOOTSTRAP_SERVERS,
+            linger_ms=int(self._config.flush_interval * 1000),
+        )
+        await self._producer.start()
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+
+    async def publish(self, messages: list[tuple[bytes, bytes]]) -> None:
+        # Send the whole batch before waiting for the acknowledgements
+        acks = [
+            await self._producer.send(self._config.topic, value, key=key)
+            for key, value in messages
+        ]
+        await asyncio.gather(*acks)
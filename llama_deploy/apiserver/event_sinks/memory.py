@@ -0,0 +1,20 @@
+from ..deployment_config_parser import EventSink
+from ..ingestion.memory import MemoryBroker
+from .base import EventPublisher
+
+
+class MemoryEventPublisher(EventPublisher):
+    """Publishes to the in-process topics of `MemoryBroker`, where tests or ingestion sources can read them."""
+
+    def __init__(self, config: EventSink) -> None:
+        self._topic = config.topic
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, messages: list[tuple[bytes, bytes]]) -> None:
+        for key, value in messages:
+            MemoryBroker.publish(self._topic, value, key)
@@ -0,0 +1,36 @@
+from typing import Any
+
+from ..deployment_config_parser import EventSink
+from .base import EventPublisher
+
+try:
+    from redis.asyncio import Redis
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "Publishing events to Redis requires redis, install it with `pip install llama-deploy[redis]`"
+    ) from e
+
+DEFAULT_URL = "redis://localhost:6379"
+
+
+class RedisEventPublisher(EventPublisher):
+    """Appends to a Redis stream, every entry has a `key` field with the task id and a `data` field."""
+
+    def __init__(self, config: EventSink) -> None:
+        self._config = config
+        self._redis: Any = None
+
+    async def start(self) -> None:
+        self._redis = Redis.from_url(self._config.url or DEFAULT_URL)
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def publish(self, messages: list[tuple[bytes, bytes]]) -> None:
+        # A single round trip for the whole batch
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, value in messages:
+                pipe.xadd(self._config.topic, {"key": key, "data": value})
+            await pipe.execute()
@@ -0,0 +1,28 @@
+"""Ingestion of tasks from message brokers, configured with the `ingestion` parameter of a deployment."""
+
+from ..deployment_config_parser import BrokerType, IngestionSource
+from .base import IngestionBroker, IngestionMessage
+from .consumer import IngestionConsumer
+from .memory import MemoryBroker
+
+
+def create_broker(source: IngestionSource, group: str) -> IngestionBroker:
+    """Returns the broker of an ingestion source, importing its client library if needed."""
+    if source.type == BrokerType.kafka:
+        from .kafka import KafkaBroker
+
+        return KafkaBroker(source, group)
+    if source.type == BrokerType.redis:
+        from .redis import RedisStreamBroker
+
+        return RedisStreamBroker(source, group)
+    return MemoryBroker(source, group)
+
+
+__all__ = [
+    "IngestionBroker",
+    "IngestionConsumer",
+    "IngestionMessage",
+    "MemoryBroker",
+    "create_broker",
+]
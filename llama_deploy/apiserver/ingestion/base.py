@@ -0,0 +1,56 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict
+
+
+class IngestionMessage(BaseModel):
+    """A task message consumed from a topic."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # Unique within the topic, sent back along with the result
+    id: str
+    value: bytes
+    key: bytes | None = None
+    # Where the message is in the topic, for the broker to commit it
+    cursor: Any = None
+
+
+class IngestionBroker(ABC):
+    """Protocol to be implemented by the message brokers deployments consume tasks from.
+
+    Messages are delivered at least once: a message fetched but not committed, e.g.
+    because the worker crashed while running its task, is delivered again to the
+    consumer group.
+    """
+
+    @abstractmethod
+    async def start(self) -> None:  # pragma: no cover
+        """Connects to the broker and joins the consumer group."""
+
+    @abstractmethod
+    async def stop(self) -> None:  # pragma: no cover
+        """Leaves the consumer group and disconnects."""
+
+    @abstractmethod
+    async def fetch(
+        self, max_messages: int, timeout: float
+    ) -> list[IngestionMessage]:  # pragma: no cover
+        """Returns the next messages, waiting up to `timeout` seconds for one to arrive."""
+
+    @abstractmethod
+    async def reply(
+        self, message: IngestionMessage, value: bytes
+    ) -> None:  # pragma: no cover
+        """Publishes the result of the task of a message to the reply topic."""
+
+    @abstractmethod
+    async def commit(
+        self, messages: list[IngestionMessage]
+    ) -> None:  # pragma: no cover
+        """Marks messages as processed, so that they're not delivered again."""
+
+    @abstractmethod
+    async def lag(self) -> int:  # pragma: no cover
+        """Returns the number of messages waiting to be consumed by the group."""
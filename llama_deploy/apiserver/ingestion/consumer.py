@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING
+
+from llama_deploy.types.core import TaskDefinition
+
+from ..artifacts import is_streamable
+from ..deployment_config_parser import IngestionSource
+from ..stats import ingested_messages, ingestion_lag
+from .base import IngestionBroker, IngestionMessage
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..deployment import Deployment
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for new messages before checking whether to stop
+FETCH_TIMEOUT = 1.0
+# Seconds to wait before fetching again after the broker failed
+RETRY_DELAY = 5.0
+
+
+class IngestionConsumer:
+    """Runs the tasks consumed from a topic in a deployment, and publishes their results.
+
+    Messages are fetched in batches of `batch_size` and their tasks run with at most
+    `concurrency` at once. The batch is committed once every result was published,
+    so the messages of a batch interrupted by a crash are consumed again. Tasks that
+    fail are answered with their error and committed, so that a bad message doesn't
+    block the topic.
+    """
+
+    def __init__(
+        self, deployment: "Deployment", source: IngestionSource, broker: IngestionBroker
+    ) -> None:
+        self._deployment = deployment
+        self._source = source
+        self._broker = broker
+        self._semaphore = asyncio.Semaphore(source.concurrency)
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def source(self) -> IngestionSource:
+        return self._source
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self, timeout: float = 0) -> None:
+        """Stops consuming, giving the tasks of the current batch `timeout` seconds to complete.
+
+        The messages of an interrupted batch aren't committed and will be consumed again.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        await asyncio.wait([self._task], timeout=timeout)
+        if not self._task.done():
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(
+                f"Consumer of {self._source.topic} for {self._deployment.name} failed: {e}"
+            )
+        self._task = None
+
+    async def _consume(self) -> None:
+        deployment_name = self._deployment.name
+        started = False
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if not started:
+                        # The broker may be unreachable when the deployment starts
+                        await self._broker.start()
+                        started = True
+                        logger.info(
+                            f"Consuming tasks of {deployment_name} from {self._source.topic}"
+                        )
+                    messages = await self._broker.fetch(
+                        self._source.batch_size, FETCH_TIMEOUT
+                    )
+                    if messages:
+                        await asyncio.gather(*(self._run(m) for m in messages))
+                        await self._broker.commit(messages)
+                    ingestion_lag.labels(deployment_name, self._source.topic).set(
+                        await self._broker.lag()
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Failed to consume tasks of {deployment_name} from {self._source.topic}: {e}"
+                    )
+                    await asyncio.sleep(RETRY_DELAY)
+        finally:
+            if started:
+                await self._broker.stop()
+
+    async def _run(self, message: IngestionMessage) -> None:
+        """Runs the task of a message and publishes its result or its error."""
+        async with self._semaphore:
+            reply: dict = {"message_id": message.id}
+            try:
+                task = TaskDefinition.model_validate_json(message.value)
+                service_id = (
+                    task.service_id
+                    or self._source.service
+                    or self._deployment.default_service
+                )
+                run_kwargs = task.run_kwargs()
+                reply["task_id"] = task.task_id
+                result = await self._deployment.run_workflow(
+                    service_id=service_id, session_id=task.session_id, **run_kwargs
+                )
+                if is_streamable(result):
+                    # Too large for a message, the reply tells where to download it
+                    saved = await self._deployment.save_artifact(result)
+                    result = {"artifact": saved.model_dump()}
+                reply["result"] = result
+                outcome = "completed"
+            except Exception as e:
+                logger.warning(f"Task of message {message.id} failed: {e}")
+                reply["error"] = str(e)
+                outcome = "failed"
+
+            await self._broker.reply(message, json.dumps(reply, default=str).encode())
+            ingested_messages.labels(
+                self._deployment.name, self._source.topic, outcome
+            ).inc()
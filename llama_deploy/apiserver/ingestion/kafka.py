@@ -0,0 +1,86 @@
+from typing import Any
+
+from ..deployment_config_parser import IngestionSource
+from .base import IngestionBroker, IngestionMessage
+
+try:
+    from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "Consuming tasks from Kafka requires aiokafka, install it with `pip install llama-deploy[kafka]`"
+    ) from e
+
+DEFAULT_BOOTSTRAP_SERVERS = "localhost:9092"
+
+
+class KafkaBroker(IngestionBroker):
+    """Consumes a Kafka topic, committing offsets manually.
+
+    The partitions of the topic are balanced across the workers of the consumer group.
+    """
+
+    def __init__(self, source: IngestionSource, group: str) -> None:
+        self._source = source
+        self._group = group
+        self._consumer: Any = None
+        self._producer: Any = None
+
+    async def start(self) -> None:
+        bootstrap_servers = self._source.url or DEFAULT_BOOTSTRAP_SERVERS
+        self._consumer = AIOKafkaConsumer(
+            self._source.topic,
+            bootstrap_servers=bootstrap_servers,
+            group_id=self._group,
+            # Offsets are committed once the results are published
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        await self._consumer.start()
+        if self._source.reply_topic is not None:
+            self._producer = AIOKafkaProducer(bootstrap_servers=bootstrap_servers)
+            await self._producer.start()
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            await self._producer.stop()
+            self._producer = None
+        if self._consumer is not None:
+            await self._consumer.stop()
+            self._consumer = None
+
+    async def fetch(self, max_messages: int, timeout: float) -> list[IngestionMessage]:
+        batches = await self._consumer.getmany(
+            timeout_ms=int(timeout * 1000), max_records=max_messages
+        )
+        return [
+            IngestionMessage(
+                id=f"{tp.partition}:{record.offset}",
+                value=record.value,
+                key=record.key,
+                cursor=(tp, record.offset),
+            )
+            for tp, records in batches.items()
+            for record in records
+        ]
+
+    async def reply(self, message: IngestionMessage, value: bytes) -> None:
+        if self._producer is not None:
+            await self._producer.send_and_wait(
+                self._source.reply_topic, value, key=message.key
+            )
+
+    async def commit(self, messages: list[IngestionMessage]) -> None:
+        # The committed offset of a partition is the next message to consume
+        offsets: dict[Any, int] = {}
+        for message in messages:
+            tp, offset = message.cursor
+            offsets[tp] = max(offsets.get(tp, 0), offset + 1)
+        await self._consumer.commit(offsets)
+
+    async def lag(self) -> int:
+        lag = 0
+        for tp in self._consumer.assignment():
+            highwater = self._consumer.highwater(tp)
+            if highwater is not None:
+                lag += max(0, highwater - await self._consumer.position(tp))
+        return lag
@@ -0,0 +1,70 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from ..deployment_config_parser import IngestionSource
+from .base import IngestionBroker, IngestionMessage
+
+# Seconds between two checks for new messages
+POLL_INTERVAL = 0.01
+
+
+class MemoryBroker(IngestionBroker):
+    """Keeps topics in memory, to run ingestion without Kafka or Redis, e.g. in tests.
+
+    The topics and the offsets committed by each group are shared by all the brokers
+    of the process.
+    """
+
+    topics: defaultdict[str, list[tuple[bytes | None, bytes]]] = defaultdict(list)
+    committed: dict[tuple[str, str], int] = {}
+
+    def __init__(self, source: IngestionSource, group: str) -> None:
+        self._source = source
+        self._group = group
+        self._position = 0
+
+    @classmethod
+    def publish(cls, topic: str, value: bytes, key: bytes | None = None) -> None:
+        cls.topics[topic].append((key, value))
+
+    @classmethod
+    def reset(cls) -> None:
+        """Deletes all the topics and the committed offsets."""
+        cls.topics.clear()
+        cls.committed.clear()
+
+    async def start(self) -> None:
+        self._position = self.committed.get((self._source.topic, self._group), 0)
+
+    async def stop(self) -> None:
+        pass
+
+    async def fetch(self, max_messages: int, timeout: float) -> list[IngestionMessage]:
+        topic = self.topics[self._source.topic]
+        deadline = time.monotonic() + timeout
+        while self._position >= len(topic) and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+
+        messages = [
+            IngestionMessage(id=str(offset), value=value, key=key, cursor=offset)
+            for offset, (key, value) in enumerate(
+                topic[self._position : self._position + max_messages],
+                start=self._position,
+            )
+        ]
+        self._position += len(messages)
+        return messages
+
+    async def reply(self, message: IngestionMessage, value: bytes) -> None:
+        if self._source.reply_topic is not None:
+            self.publish(self._source.reply_topic, value, message.key)
+
+    async def commit(self, messages: list[IngestionMessage]) -> None:
+        key = (self._source.topic, self._group)
+        offset = max(m.cursor for m in messages) + 1
+        self.committed[key] = max(self.committed.get(key, 0), offset)
+
+    async def lag(self) -> int:
+        committed = self.committed.get((self._source.topic, self._group), 0)
+        return len(self.topics[self._source.topic]) - committed
@@ -0,0 +1,100 @@
+import os
+from typing import Any
+
+from ..deployment_config_parser import IngestionSource
+from .base import IngestionBroker, IngestionMessage
+
+try:
+    from redis.asyncio import Redis
+    from redis.exceptions import ResponseError
+except ImportError as e:  # pragma: no cover
+    raise ImportError(
+        "Consuming tasks from Redis requires redis, install it with `pip install llama-deploy[redis]`"
+    ) from e
+
+DEFAULT_URL = "redis://localhost:6379"
+# Messages delivered to a consumer that didn't acknowledge them for this long, likely
+# because its worker crashed, are delivered again
+CLAIM_IDLE_MS = 60_000
+
+
+class RedisStreamBroker(IngestionBroker):
+    """Consumes a Redis stream through a consumer group, acknowledging messages manually.
+
+    Every message is a stream entry with a `data` field holding the task and an
+    optional `key` field, copied to the reply.
+    """
+
+    def __init__(self, source: IngestionSource, group: str) -> None:
+        self._source = source
+        self._group = group
+        # Unique per worker process, the entries are spread across the group
+        self._consumer_name = f"{group}-{os.getpid()}"
+        self._redis: Any = None
+
+    async def start(self) -> None:
+        self._redis = Redis.from_url(self._source.url or DEFAULT_URL)
+        try:
+            await self._redis.xgroup_create(
+                self._source.topic, self._group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def fetch(self, max_messages: int, timeout: float) -> list[IngestionMessage]:
+        # Take over the messages left unacknowledged by crashed consumers first
+        claimed = await self._redis.xautoclaim(
+            self._source.topic,
+            self._group,
+            self._consumer_name,
+            min_idle_time=CLAIM_IDLE_MS,
+            count=max_messages,
+        )
+        entries = claimed[1]
+        if not entries:
+            streams = await self._redis.xreadgroup(
+                self._group,
+                self._consumer_name,
+                {self._source.topic: ">"},
+                count=max_messages,
+                block=int(timeout * 1000),
+            )
+            entries = streams[0][1] if streams else []
+
+        return [
+            IngestionMessage(
+                id=entry_id.decode(),
+                value=fields.get(b"data", b""),
+                key=fields.get(b"key"),
+                cursor=entry_id,
+            )
+            for entry_id, fields in entries
+        ]
+
+    async def reply(self, message: IngestionMessage, value: bytes) -> None:
+        if self._source.reply_topic is not None:
+            fields = {"data": value, "message_id": message.id}
+            if message.key is not None:
+                fields["key"] = message.key
+            await self._redis.xadd(self._source.reply_topic, fields)
+
+    async def commit(self, messages: list[IngestionMessage]) -> None:
+        await self._redis.xack(
+            self._source.topic, self._group, *(m.cursor for m in messages)
+        )
+
+    async def lag(self) -> int:
+        for group in await self._redis.xinfo_groups(self._source.topic):
+            name = group["name"]
+            if isinstance(name, bytes):
+                name = name.decode()
+            if name == self._group:
+                # Only reported by Redis 7 and later
+                return int(group.get("lag") or 0)
+        return 0
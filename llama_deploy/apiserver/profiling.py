@@ -0,0 +1,484 @@
+"""Profiling utilities for the API Server."""
+
+import asyncio
+import gc
+import importlib.abc
+import importlib.machinery
+import logging
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime, timezone
+from types import CodeType, FrameType, FunctionType, ModuleType, TracebackType
+from typing import Any, Callable, Sequence
+
+from llama_deploy.types.apiserver import AllocationStat, BlockedLoop
+
+from .stats import event_loop_blocked, event_loop_lag
+
+logger = logging.getLogger(__name__)
+
+# Objects not walked when counting what a root object keeps alive: they're shared
+# by the whole process and would lead to everything else
+_SHARED_TYPES = (ModuleType, type, FunctionType, CodeType)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Measures the time spent importing each module, like `python -X importtime` does.
+
+    The profiler is a meta path finder that delegates the actual lookup to the other
+    finders and only wraps the loader of the modules being imported while active.
+    Only the imports of the thread that entered the profiler are measured, since
+    other threads, like the ones pre-warming services, import concurrently.
+
+    Usage example:
+        ```python
+        with ImportProfiler() as profiler:
+            importlib.import_module("my_workflow")
+
+        for module_name, seconds in profiler.top(10):
+            print(module_name, seconds)
+        ```
+    """
+
+    def __init__(self) -> None:
+        # Time spent executing the module body, excluding nested imports
+        self.self_times: dict[str, float] = {}
+        # Time spent executing the module body, including nested imports
+        self.cumulative_times: dict[str, float] = {}
+        self._children_time: list[float] = []
+        self._thread_id: int | None = None
+
+    def __enter__(self) -> "ImportProfiler":
+        self._thread_id = threading.get_ident()
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    @property
+    def total_seconds(self) -> float:
+        """Returns the overall time spent importing modules."""
+        return sum(self.self_times.values())
+
+    def top(self, n: int = 20) -> list[tuple[str, float]]:
+        """Returns the `n` modules that took longer to import, including nested imports."""
+        timings = sorted(
+            self.cumulative_times.items(), key=lambda item: item[1], reverse=True
+        )
+        return timings[:n]
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None,
+        target: ModuleType | None = None,
+    ) -> importlib.machinery.ModuleSpec | None:
+        if threading.get_ident() != self._thread_id:
+            # Let the other finders import the module unmeasured
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                self._instrument(spec)
+                return spec
+        return None
+
+    def _instrument(self, spec: importlib.machinery.ModuleSpec) -> None:
+        loader: Any = spec.loader
+        # Builtin and frozen importers are classes shared by many modules, leave them alone
+        if loader is None or isinstance(loader, type):
+            return
+        exec_module = getattr(loader, "exec_module", None)
+        if exec_module is None:
+            return
+
+        def timed_exec_module(module: ModuleType) -> None:
+            self._children_time.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self._children_time.pop()
+                self.cumulative_times[spec.name] = elapsed
+                self.self_times[spec.name] = elapsed - children
+                if self._children_time:
+                    self._children_time[-1] += elapsed
+                # Restore the original method, the loader is not reused after this
+                del loader.exec_module
+
+        try:
+            loader.exec_module = timed_exec_module
+        except AttributeError:  # pragma: no cover
+            # Loaders using __slots__ can't be instrumented
+            pass
+
+
+def _type_name(obj: Any) -> str:
+    obj_type = type(obj)
+    if obj_type.__module__ == "builtins":
+        return obj_type.__qualname__
+    return f"{obj_type.__module__}.{obj_type.__qualname__}"
+
+
+def count_objects(limit: int = 20) -> dict[str, int]:
+    """Returns the `limit` most common types among the objects tracked by the garbage collector."""
+    counts = Counter(_type_name(obj) for obj in gc.get_objects())
+    return dict(counts.most_common(limit))
+
+
+def count_reachable(
+    root: Any, limit: int = 20, max_objects: int = 100_000
+) -> dict[str, int]:
+    """Returns the `limit` most common types among the objects kept alive by `root`.
+
+    Modules, classes and functions are counted but not walked, since they're shared
+    by the whole process. The walk stops after `max_objects` objects.
+    """
+    counts: Counter[str] = Counter()
+    seen = {id(root)}
+    pending = [root]
+    while pending and len(seen) < max_objects:
+        obj = pending.pop()
+        counts[_type_name(obj)] += 1
+        if isinstance(obj, _SHARED_TYPES):
+            continue
+        for referent in gc.get_referents(obj):
+            if id(referent) not in seen:
+                seen.add(id(referent))
+                pending.append(referent)
+    return dict(counts.most_common(limit))
+
+
+class MemoryProfiler:
+    """Traces the memory allocations of the process with `tracemalloc`.
+
+    Tracing slows down every allocation, so it's only started on demand. Each
+    diff compares the allocations with the snapshot taken by the previous diff, or
+    when tracing started, so that calling it periodically shows what keeps growing.
+    """
+
+    def __init__(self, frames: int = 1) -> None:
+        """Creates a MemoryProfiler instance.
+
+        Args:
+            frames: Number of frames recorded for each allocation
+        """
+        self._frames = frames
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._started = False
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._started = True
+        self._snapshot = self._take_snapshot()
+
+    def stop(self) -> None:
+        # Leave alone tracing started by someone else, e.g. with `python -X tracemalloc`
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+        self._snapshot = None
+
+    def traced_memory(self) -> tuple[int, int]:
+        """Returns the current and peak size of the traced allocations, in bytes."""
+        return tracemalloc.get_traced_memory()
+
+    def top_allocations(
+        self, limit: int = 20, diff: bool = False
+    ) -> list[AllocationStat]:
+        """Returns the locations allocating the most memory.
+
+        Args:
+            limit: Number of locations to return
+            diff: Sort by growth since the previous diff instead of by size
+        """
+        snapshot = self._take_snapshot()
+        key_type = "traceback" if self._frames > 1 else "lineno"
+        if diff and self._snapshot is not None:
+            stats = [
+                AllocationStat(
+                    location=self._format(stat.traceback),
+                    size_bytes=stat.size,
+                    count=stat.count,
+                    size_diff_bytes=stat.size_diff,
+                    count_diff=stat.count_diff,
+                )
+                for stat in snapshot.compare_to(self._snapshot, key_type)[:limit]
+            ]
+            self._snapshot = snapshot
+            return stats
+
+        return [
+            AllocationStat(
+                location=self._format(stat.traceback),
+                size_bytes=stat.size,
+                count=stat.count,
+            )
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<unknown>"),
+            )
+        )
+
+    @staticmethod
+    def _format(traceback: tracemalloc.Traceback) -> str:
+        # Most recent frame first
+        return " <- ".join(
+            f"{frame.filename}:{frame.lineno}" for frame in reversed(traceback)
+        )
+
+
+def _frame_name(code: CodeType) -> str:
+    # co_qualname was added in Python 3.11
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the call stacks of threads at a fixed interval.
+
+    Samples are taken from a background thread with `sys._current_frames`, so that
+    the profiled code runs unmodified and nothing is paid outside of a profile. The
+    result is in the collapsed stacks format read by flamegraph.pl, speedscope and
+    similar tools: one line per distinct stack, followed by its number of samples.
+
+    Every stack starts with a pseudo frame in brackets: the label returned by
+    `label_frame` for the innermost frame it recognizes, or the thread name.
+
+    Usage example:
+        ```python
+        profiler = SamplingProfiler(thread_ids={threading.get_ident()})
+        profiler.start()
+        await asyncio.sleep(10)
+        profiler.stop()
+        Path("profile.folded").write_text(profiler.collapsed())
+        ```
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.005,
+        thread_ids: set[int] | None = None,
+        label_frame: Callable[[FrameType], str | None] | None = None,
+    ) -> None:
+        """Creates a SamplingProfiler instance.
+
+        Args:
+            interval: Seconds between two samples
+            thread_ids: The threads to sample, defaults to all of them
+            label_frame: Returns the label of the stacks going through a frame, or None
+        """
+        self._interval = interval
+        self._thread_ids = thread_ids
+        self._label_frame = label_frame
+        self._stacks: Counter[tuple[str, tuple[CodeType, ...]]] = Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def samples(self) -> int:
+        """Returns the number of samples taken so far."""
+        return self._samples
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="llama-deploy-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self) -> None:
+        """Records the current stack of the sampled threads."""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if self._thread_ids is not None and thread_id not in self._thread_ids:
+                continue
+
+            codes = []
+            label = None
+            current: FrameType | None = frame
+            while current is not None:
+                codes.append(current.f_code)
+                if label is None and self._label_frame is not None:
+                    label = self._label_frame(current)
+                current = current.f_back
+            codes.reverse()
+            root = label or names.get(thread_id, str(thread_id))
+            self._stacks[(root, tuple(codes))] += 1
+        self._samples += 1
+
+    def collapsed(self, label_prefix: str | None = None) -> str:
+        """Returns the stacks sampled in the collapsed stacks format.
+
+        Args:
+            label_prefix: Only return the stacks whose label starts with this prefix
+        """
+        names: dict[CodeType, str] = {}
+        lines = []
+        for (root, codes), count in self._stacks.items():
+            if label_prefix is not None and not root.startswith(label_prefix):
+                continue
+            frames = [f"[{root}]"]
+            for code in codes:
+                if code not in names:
+                    names[code] = _frame_name(code)
+                frames.append(names[code])
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(sorted(lines)) + ("\n" if lines else "")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a callback scheduled at a fixed interval.
+
+    The lag is the time the loop was blocked by code not yielding control, like a
+    workflow step doing CPU-bound work or a synchronous call to a remote service,
+    and it's observed in the `event_loop_lag_seconds` histogram.
+
+    With a `block_threshold`, a watchdog thread checks that the loop is never late
+    by more than the threshold. When it is, the stack of the loop thread is
+    captured while it's still blocked, then logged along with the lag once the
+    loop recovers. The interval should be shorter than the threshold, since only
+    the part of a block overlapping the expected wake up time is detected.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        block_threshold: float | None = None,
+        label_frame: Callable[[FrameType], str | None] | None = None,
+        max_blocked: int = 20,
+    ) -> None:
+        """Creates a LoopLagMonitor instance.
+
+        Args:
+            interval: Seconds between two measurements
+            block_threshold: Seconds of lag after which the blocking stack is captured,
+                no stack is captured if not set
+            label_frame: Returns a label for the blocking stack from one of its frames
+            max_blocked: Number of blocking stacks kept in `blocked`
+        """
+        self._interval = interval
+        self._block_threshold = block_threshold
+        self._label_frame = label_frame
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        # The most recent blocks, the oldest first
+        self.blocked: deque[BlockedLoop] = deque(maxlen=max_blocked)
+        self._loop_thread_id: int | None = None
+        # When the loop is expected to run the next measurement, on the monotonic clock
+        self._due_at: float | None = None
+        self._capture: tuple[str | None, list[str]] | None = None
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    async def run(self) -> None:
+        self._loop_thread_id = threading.get_ident()
+        stop = threading.Event()
+        if self._block_threshold:
+            threading.Thread(
+                target=self._watch,
+                args=(stop,),
+                name="llama-deploy-watchdog",
+                daemon=True,
+            ).start()
+
+        try:
+            while True:
+                self._due_at = time.monotonic() + self._interval
+                await asyncio.sleep(self._interval)
+                self.last_lag = max(0.0, time.monotonic() - self._due_at)
+                self.max_lag = max(self.max_lag, self.last_lag)
+                event_loop_lag.observe(self.last_lag)
+                if self._capture is not None:
+                    self._report_block()
+        finally:
+            stop.set()
+
+    def _watch(self, stop: threading.Event) -> None:
+        # Check often enough to catch the loop while it's still blocked
+        assert self._block_threshold is not None
+        poll_interval = min(self._block_threshold / 2, 0.1)
+        while not stop.wait(poll_interval):
+            due_at = self._due_at
+            if (
+                due_at is None
+                or self._capture is not None
+                or time.monotonic() - due_at < self._block_threshold
+            ):
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id or 0)
+            if frame is None or self._due_at != due_at:
+                # The loop recovered in the meantime
+                continue
+            self._capture = self._describe(frame)
+
+    def _describe(self, frame: FrameType) -> tuple[str | None, list[str]]:
+        label = None
+        if self._label_frame is not None:
+            current: FrameType | None = frame
+            while current is not None and label is None:
+                label = self._label_frame(current)
+                current = current.f_back
+        return label, traceback.format_stack(frame)
+
+    def _report_block(self) -> None:
+        assert self._capture is not None
+        label, stack = self._capture
+        self._capture = None
+        block = BlockedLoop(
+            at=datetime.now(timezone.utc),
+            lag_seconds=self.last_lag,
+            label=label,
+            stack=[line.rstrip() for line in stack],
+        )
+        self.blocked.append(block)
+        event_loop_blocked.inc()
+        logger.warning(
+            "Event loop blocked for %.3fs%s, by:\n%s",
+            block.lag_seconds,
+            f" in {label}" if label else "",
+            "".join(stack),
+        )
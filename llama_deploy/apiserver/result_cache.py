@@ -0,0 +1,255 @@
+"""Caching of the results of deterministic services, see `ServiceCache`."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from llama_deploy.types import payloads
+
+from .artifacts import is_streamable
+from .deployment_config_parser import ServiceCache
+from .stats import result_cache_entries, result_cache_requests
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    deployment TEXT NOT NULL,
+    service TEXT NOT NULL,
+    value TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS results_service
+    ON results (deployment, service, stored_at);
+"""
+# Evicting from the disk tier counts its rows, only do it every so many writes
+DISK_EVICTION_INTERVAL = 100
+
+
+def cache_key(
+    deployment_name: str, service_id: str, run_kwargs: dict, version: str = ""
+) -> str:
+    """Returns the cache key of a task, the same for inputs differing only by key order.
+
+    `version` identifies the code and the configuration of the service.
+    """
+    normalized = json.dumps(
+        [deployment_name, service_id, version, run_kwargs],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=payloads.encode_binary,
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class SqliteResultStore:
+    """Keeps the results of a service in a SQLite database, possibly shared with other services and workers."""
+
+    def __init__(
+        self, path: Path, deployment_name: str, service_id: str, max_entries: int
+    ) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._deployment_name = deployment_name
+        self._service_id = service_id
+        self._max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(path), isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def put(self, key: str, value: str, ttl: float | None) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    self._deployment_name,
+                    self._service_id,
+                    value,
+                    now,
+                    now + ttl if ttl is not None else None,
+                ),
+            )
+            self._writes += 1
+            if self._writes % DISK_EVICTION_INTERVAL == 0:
+                self._evict(now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM results WHERE deployment = ? AND service = ?",
+                (self._deployment_name, self._service_id),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute(
+            "DELETE FROM results WHERE deployment = ? AND service = ? AND expires_at < ?",
+            (self._deployment_name, self._service_id, now),
+        )
+        self._conn.execute(
+            "DELETE FROM results WHERE key IN ("
+            "  SELECT key FROM results WHERE deployment = ? AND service = ?"
+            "  ORDER BY stored_at DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self._deployment_name, self._service_id, self._max_entries),
+        )
+
+
+class ResultCache:
+    """Caches the results of a service by input, with single-flight runs.
+
+    Results are kept in memory with a TTL and evicted in LRU order beyond
+    `max_entries`, then optionally on disk. Identical tasks arriving while one is
+    already running wait for it instead of running the workflow again. Failed runs
+    are never cached.
+    """
+
+    def __init__(
+        self,
+        deployment_name: str,
+        service_id: str,
+        config: ServiceCache,
+        base_path: Path,
+        version: str = "",
+    ) -> None:
+        """Creates a ResultCache instance.
+
+        Args:
+            deployment_name: The deployment of the service
+            service_id: The service whose results are cached
+            config: The cache configuration of the service
+            base_path: The folder relative paths in the configuration are resolved against
+            version: Identifies the code of the service, the results of other versions
+                are never returned
+        """
+        self._deployment_name = deployment_name
+        self._service_id = service_id
+        self._version = version
+        self._ttl = config.ttl
+        self._max_entries = config.max_entries
+        # Expiration time on the monotonic clock and result, the least recently used first
+        self._entries: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._disk: SqliteResultStore | None = None
+        if config.path:
+            self._disk = SqliteResultStore(
+                base_path / config.path,
+                deployment_name,
+                service_id,
+                config.disk_max_entries,
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_or_run(
+        self, run_kwargs: dict, run: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Returns the cached result of a task, running it if needed.
+
+        Args:
+            run_kwargs: The input of the task
+            run: Runs the task and returns its result
+        """
+        key = cache_key(
+            self._deployment_name, self._service_id, run_kwargs, self._version
+        )
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count("hit")
+                return result
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._count("coalesced")
+            # Callers going away don't cancel the run shared with the others
+            return await asyncio.shield(task)
+
+        task = asyncio.create_task(self._load(key, run))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        """Forgets all the results, e.g. because the code of the service changed."""
+        self._entries.clear()
+        result_cache_entries.labels(self._deployment_name, self._service_id).set(0)
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    async def _load(self, key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        if self._disk is not None:
+            value = await asyncio.to_thread(self._disk.get, key)
+            if value is not None:
+                result = json.loads(value)
+                self._store(key, result)
+                self._count("disk_hit")
+                return result
+
+        self._count("miss")
+        result = await run()
+        if is_streamable(result):
+            # Can only be read once
+            logger.warning(f"Streamed result of {self._service_id} not cached")
+            return result
+        self._store(key, result)
+        if self._disk is not None:
+            try:
+                value = json.dumps(result)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Result of {self._service_id} not cached on disk: {e}")
+            else:
+                await asyncio.to_thread(self._disk.put, key, value, self._ttl)
+        return result
+
+    def _store(self, key: str, result: Any) -> None:
+        expires_at = time.monotonic() + self._ttl if self._ttl is not None else None
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        result_cache_entries.labels(self._deployment_name, self._service_id).set(
+            len(self._entries)
+        )
+
+    def _count(self, outcome: str) -> None:
+        result_cache_requests.labels(
+            self._deployment_name, self._service_id, outcome
+        ).inc()
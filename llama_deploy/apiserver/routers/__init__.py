@@ -1,4 +1,5 @@
+from .debug import debug_router
 from .deployments import deployments_router
 from .status import status_router
 
-__all__ = ["deployments_router", "status_router"]
+__all__ = ["debug_router", "deployments_router", "status_router"]
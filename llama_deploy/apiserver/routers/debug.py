@@ -0,0 +1,135 @@
+import asyncio
+import sys
+import threading
+
+from fastapi import APIRouter, Query
+from fastapi.exceptions import HTTPException
+from fastapi.responses import PlainTextResponse
+
+from llama_deploy.apiserver import server
+from llama_deploy.apiserver.profiling import (
+    SamplingProfiler,
+    count_objects,
+    count_reachable,
+)
+from llama_deploy.apiserver.server import manager
+from llama_deploy.apiserver.settings import settings
+from llama_deploy.types.apiserver import DeploymentMemory, LoopStatus, MemoryReport
+
+# Longest CPU profile that can be requested, in seconds
+MAX_PROFILE_DURATION = 300.0
+
+debug_router = APIRouter(
+    prefix="/debug",
+)
+_profile_lock = asyncio.Lock()
+
+
+@debug_router.get("/memory")
+async def memory(
+    limit: int = 20, diff: bool = False, deployment: str | None = None
+) -> MemoryReport:
+    """Reports where the memory of the API Server goes, to help finding leaks.
+
+    Only available when the `debug_memory` setting is enabled. With `diff`, the top
+    allocations are sorted by growth since the previous request using `diff`.
+    Objects are counted by type for the whole process and for what each deployment
+    keeps alive, which can take a while with many objects.
+    """
+    profiler = server.memory_profiler
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Memory debugging is disabled")
+
+    deployments = list(manager._deployments.values())
+    if deployment is not None:
+        deployments = [d for d in deployments if d.name == deployment]
+        if not deployments:
+            raise HTTPException(status_code=404, detail="Deployment not found")
+
+    def build_report() -> MemoryReport:
+        current, peak = profiler.traced_memory()
+        return MemoryReport(
+            tracing=profiler.tracing,
+            traced_current_bytes=current,
+            traced_peak_bytes=peak,
+            sys_path_entries=len(sys.path),
+            modules=len(sys.modules),
+            objects=count_objects(limit),
+            top_allocations=profiler.top_allocations(limit, diff),
+            deployments=[
+                DeploymentMemory(
+                    name=d.name,
+                    registries=d.registry_sizes,
+                    objects=count_reachable(d, limit),
+                )
+                for d in deployments
+            ],
+        )
+
+    # Snapshots and object walks are slow, keep the event loop responsive meanwhile
+    return await asyncio.to_thread(build_report)
+
+
+@debug_router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    duration: float = Query(default=10.0, gt=0, le=MAX_PROFILE_DURATION),
+    interval: float = Query(default=0.005, ge=0.001, le=1.0),
+    deployment: str | None = None,
+    all_threads: bool = False,
+) -> PlainTextResponse:
+    """Samples the call stacks of the API Server for `duration` seconds.
+
+    Only available when the `debug_profiling` setting is enabled. The profile is
+    returned in the collapsed stacks format read by flamegraph tools, with stacks
+    running a workflow step rooted at `[deployment/service/step]`. Only the event
+    loop thread is sampled unless `all_threads` is set, and with `deployment` only
+    the steps of that deployment are returned. With multiple workers, pass
+    `worker_id` to profile a specific worker.
+    """
+    if not settings.debug_profiling:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if deployment is not None and manager.get_deployment(deployment) is None:
+        raise HTTPException(status_code=404, detail="Deployment not found")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    async with _profile_lock:
+        profiler = SamplingProfiler(
+            interval=interval,
+            thread_ids=None if all_threads else {threading.get_ident()},
+            label_frame=manager.step_labeler(),
+        )
+        profiler.start()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+
+    label_prefix = f"{deployment}/" if deployment is not None else None
+    return PlainTextResponse(
+        profiler.collapsed(label_prefix),
+        headers={"x-profile-samples": str(profiler.samples)},
+    )
+
+
+@debug_router.get("/loop")
+async def loop() -> LoopStatus:
+    """Reports the lag of the event loop and the stacks that recently blocked it.
+
+    Only available when the `debug_profiling` setting is enabled. Blocking stacks
+    are captured when the loop is late by more than the `loop_block_threshold`
+    setting, the most recent last.
+    """
+    if not settings.debug_profiling:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    monitor = server.loop_monitor
+    if monitor is None:
+        raise HTTPException(
+            status_code=404, detail="Event loop lag monitoring is disabled"
+        )
+    return LoopStatus(
+        interval_seconds=monitor.interval,
+        last_lag_seconds=monitor.last_lag,
+        max_lag_seconds=monitor.max_lag,
+        blocked=list(monitor.blocked),
+    )
@@ -1,7 +1,16 @@
 import asyncio
 import json
 import logging
-from typing import Annotated, AsyncGenerator, List, Optional
+from typing import (
+    Annotated,
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+)
 
 import httpx
 import websockets
@@ -9,17 +18,26 @@ from fastapi import (
     APIRouter,
     Depends,
     File,
+    Header,
     HTTPException,
     Request,
     UploadFile,
     WebSocket,
 )
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from starlette.background import BackgroundTask
-from workflows import Context
 from workflows.context import JsonSerializer
+from workflows.errors import WorkflowCancelledByUser
 from workflows.handler import WorkflowHandler
 
+from llama_deploy.apiserver.artifacts import (
+    ArtifactNotFound,
+    is_streamable,
+    iter_chunks,
+    multipart_chunks,
+)
 from llama_deploy.apiserver.deployment import Deployment
 from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
 from llama_deploy.apiserver.server import manager
@@ -28,23 +46,93 @@ from llama_deploy.types import (
     EventDefinition,
     SessionDefinition,
     TaskDefinition,
+    payloads,
 )
-from llama_deploy.types.core import TaskResult, generate_id
+from llama_deploy.types.apiserver import TASK_TIMEOUT_HEADER, ArtifactDefinition
+from llama_deploy.types.core import TaskResult
 
 deployments_router = APIRouter(
     prefix="/deployments",
 )
 logger = logging.getLogger(__name__)
 
+TaskTimeout = Annotated[
+    float | None,
+    Header(
+        alias=TASK_TIMEOUT_HEADER,
+        gt=0,
+        description="Seconds the task can run for before being cancelled",
+    ),
+]
+
 
-def deployment(deployment_name: str) -> Deployment:
+async def deployment(deployment_name: str) -> Deployment:
     """FastAPI dependency to retrieve a Deployment instance"""
     deployment = manager.get_deployment(deployment_name)
     if deployment is None:
+        if deployment_name in await manager.pending_deployments():
+            # Created by another worker, this one will load it shortly
+            raise HTTPException(status_code=503, detail="Deployment is being loaded")
         raise HTTPException(status_code=404, detail="Deployment not found")
     return deployment
 
 
+def accepting_tasks() -> None:
+    """FastAPI dependency refusing new tasks and sessions while the server shuts down"""
+    if not manager.accepting_tasks:
+        # Clients retry on another instance, the running tasks keep being served
+        raise HTTPException(
+            status_code=503,
+            detail="The API Server is shutting down",
+            headers={"Retry-After": "1"},
+        )
+
+
+def body(model: type[BaseModel]) -> Callable[[Request], Awaitable[Any]]:
+    """FastAPI dependency decoding a request body, sent as JSON or MessagePack."""
+
+    async def decode(request: Request) -> Any:
+        content = await request.body()
+        try:
+            data = (
+                payloads.loads(content, request.headers.get("content-type"))
+                if content
+                else None
+            )
+        except ImportError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        except Exception as e:
+            raise RequestValidationError(
+                [{"type": "body_invalid", "loc": ("body",), "msg": str(e)}]
+            )
+        try:
+            return model.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+
+    return decode
+
+
+def body_schema(model: type[BaseModel]) -> dict[str, Any]:
+    """The OpenAPI description of a body decoded by the `body` dependency."""
+    schema = model.model_json_schema()
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                payloads.JSON_MEDIA_TYPE: {"schema": schema},
+                payloads.MSGPACK_MEDIA_TYPE: {"schema": schema},
+            },
+        }
+    }
+
+
+def negotiated_response(request: Request, data: Any) -> Response:
+    """Encodes a response in the format the client accepts, JSON or MessagePack."""
+    media_type = payloads.negotiate(request.headers.get("accept"))
+    return Response(payloads.dumps(data, media_type), media_type=media_type)
+
+
 @deployments_router.get("/")
 async def read_deployments() -> list[DeploymentDefinition]:
     """Returns a list of active deployments."""
@@ -74,13 +162,39 @@ async def create_deployment(
     return DeploymentDefinition(name=config.name)
 
 
-@deployments_router.post("/{deployment_name}/tasks/run")
+async def _cancel_on_disconnect(request: Request, task: asyncio.Task) -> bool:
+    """Cancels a task when the client of a request disconnects.
+
+    Returns True once the client disconnected, to tell this cancellation from others.
+    """
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            task.cancel()
+            return True
+
+
+@deployments_router.post(
+    "/{deployment_name}/tasks/run",
+    dependencies=[Depends(accepting_tasks)],
+    openapi_extra=body_schema(TaskDefinition),
+)
 async def create_deployment_task(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
-    task_definition: TaskDefinition,
+    task_definition: Annotated[TaskDefinition, Depends(body(TaskDefinition))],
     session_id: str | None = None,
-) -> JSONResponse:
-    """Create a task for the deployment, wait for result and delete associated session."""
+    task_timeout: TaskTimeout = None,
+    artifact: bool = False,
+) -> Response:
+    """Create a task for the deployment, wait for result and delete associated session.
+
+    The task is cancelled when the client disconnects or when it times out.
+
+    When the workflow returns a streamable result, an async iterator or a file-like
+    object, it's sent in chunks as it's produced. With `artifact`, it's written to
+    an artifact instead, and the response tells where to download it from.
+    """
 
     service_id = task_definition.service_id or deployment.default_service
     if service_id is None:
@@ -95,19 +209,54 @@ async def create_deployment_task(
             detail=f"Service '{task_definition.service_id}' not found in deployment 'deployment_name'",
         )
 
-    run_kwargs = json.loads(task_definition.input) if task_definition.input else {}
-    result = await deployment.run_workflow(
-        service_id=service_id, session_id=session_id, **run_kwargs
+    run_kwargs = task_definition.run_kwargs()
+    run = asyncio.create_task(
+        deployment.run_workflow(
+            service_id=service_id,
+            session_id=session_id,
+            task_timeout=task_timeout,
+            **run_kwargs,
+        )
     )
-    return JSONResponse(result)
+    watch = asyncio.create_task(_cancel_on_disconnect(request, run))
+    try:
+        result = await run
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Task timed out")
+    except ArtifactNotFound as e:
+        raise HTTPException(status_code=404, detail=f"Artifact {e} not found")
+    except asyncio.CancelledError:
+        disconnected = watch.done() and not watch.cancelled() and watch.result()
+        if not disconnected:
+            # The request itself is cancelled, e.g. by a shutdown
+            raise
+        # Nobody is left to read the response
+        return Response(status_code=499)
+    finally:
+        watch.cancel()
+    if is_streamable(result):
+        if artifact:
+            saved = await deployment.save_artifact(result)
+            return negotiated_response(request, saved.model_dump())
+        return StreamingResponse(
+            iter_chunks(result), media_type="application/octet-stream"
+        )
+    return negotiated_response(request, result)
 
 
-@deployments_router.post("/{deployment_name}/tasks/create")
+@deployments_router.post(
+    "/{deployment_name}/tasks/create",
+    dependencies=[Depends(accepting_tasks)],
+    openapi_extra=body_schema(TaskDefinition),
+    response_model=TaskDefinition,
+)
 async def create_deployment_task_nowait(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
-    task_definition: TaskDefinition,
+    task_definition: Annotated[TaskDefinition, Depends(body(TaskDefinition))],
     session_id: str | None = None,
-) -> TaskDefinition:
+    task_timeout: TaskTimeout = None,
+) -> Response:
     """Create a task for the deployment but don't wait for result."""
     service_id = task_definition.service_id or deployment.default_service
     if service_id is None:
@@ -122,35 +271,65 @@ async def create_deployment_task_nowait(
             detail=f"Service '{task_definition.service_id}' not found in deployment 'deployment_name'",
         )
 
-    run_kwargs = json.loads(task_definition.input) if task_definition.input else {}
-    handler_id, session_id = deployment.run_workflow_no_wait(
-        service_id=service_id, session_id=session_id, **run_kwargs
-    )
+    run_kwargs = task_definition.run_kwargs()
+    try:
+        handler_id, session_id = await deployment.run_workflow_no_wait(
+            service_id=service_id,
+            session_id=session_id,
+            idempotency_key=task_definition.idempotency_key,
+            task_timeout=task_timeout,
+            **run_kwargs,
+        )
+    except ArtifactNotFound as e:
+        raise HTTPException(status_code=404, detail=f"Artifact {e} not found")
 
     task_definition.session_id = session_id
     task_definition.task_id = handler_id
 
-    return task_definition
+    return negotiated_response(request, task_definition.model_dump())
 
 
-@deployments_router.post("/{deployment_name}/tasks/{task_id}/events")
+@deployments_router.post("/{deployment_name}/tasks/{task_id}/cancel")
+async def cancel_task(
+    deployment: Annotated[Deployment, Depends(deployment)],
+    task_id: str,
+) -> None:
+    """Cancel a running task and free the session it was started in."""
+    try:
+        cancelled = await deployment.cancel_task(task_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
+    if not cancelled:
+        raise HTTPException(status_code=409, detail="Task already completed")
+
+
+@deployments_router.post(
+    "/{deployment_name}/tasks/{task_id}/events",
+    openapi_extra=body_schema(EventDefinition),
+    response_model=EventDefinition,
+)
 async def send_event(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
     task_id: str,
     session_id: str,
-    event_def: EventDefinition,
-) -> EventDefinition:
+    event_def: Annotated[EventDefinition, Depends(body(EventDefinition))],
+) -> Response:
     """Send a human response event to a service for a specific task and session."""
     ctx = deployment._contexts[session_id]
     serializer = JsonSerializer()
-    event = serializer.deserialize(event_def.event_obj_str)
+    if event_def.event_obj_str is not None:
+        event = serializer.deserialize(event_def.event_obj_str)
+    else:
+        event = serializer.deserialize(json.dumps(event_def.event_obj))
     ctx.send_event(event)
 
-    return event_def
+    return negotiated_response(request, event_def.model_dump())
 
 
 @deployments_router.get("/{deployment_name}/tasks/{task_id}/events")
 async def get_events(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
     session_id: str,
     task_id: str,
@@ -162,36 +341,126 @@ async def get_events(
     Args:
         raw_event (bool, default=False): Whether to return the raw event object
             or just the event data.
+
+    Events are sent as newline-delimited JSON, or as a sequence of MessagePack
+    objects when the client accepts it.
     """
+    media_type = payloads.negotiate(request.headers.get("accept"))
 
-    async def event_stream(handler: WorkflowHandler) -> AsyncGenerator[str, None]:
+    async def event_stream(handler: WorkflowHandler) -> AsyncGenerator[bytes, None]:
         serializer = JsonSerializer()
-        # need to convert back to str to use SSE
         async for event in handler.stream_events():
             data = json.loads(serializer.serialize(event))
-            if raw_event:
-                yield json.dumps(data) + "\n"
+            if not raw_event:
+                data = data.get("value")
+            if media_type == payloads.MSGPACK_MEDIA_TYPE:
+                yield payloads.dumps(data, media_type)
             else:
-                yield json.dumps(data.get("value")) + "\n"
+                yield payloads.dumps(data) + b"\n"
             await asyncio.sleep(0.01)
         await handler
 
     return StreamingResponse(
         event_stream(deployment._handlers[task_id]),
-        media_type="application/x-ndjson",
+        media_type=media_type
+        if media_type == payloads.MSGPACK_MEDIA_TYPE
+        else "application/x-ndjson",
     )
 
 
-@deployments_router.get("/{deployment_name}/tasks/{task_id}/results")
+@deployments_router.get(
+    "/{deployment_name}/tasks/{task_id}/results", response_model=TaskResult | None
+)
 async def get_task_result(
+    request: Request,
     deployment: Annotated[Deployment, Depends(deployment)],
     session_id: str,
     task_id: str,
-) -> TaskResult | None:
-    """Get the task result associated with a task and session."""
+) -> Response:
+    """Get the task result associated with a task and session.
+
+    Streamable results are written to an artifact, the result is then its download
+    URL and `data.artifact` describes it.
+    """
 
     handler = deployment._handlers[task_id]
-    return TaskResult(task_id=task_id, history=[], result=await handler)
+    try:
+        result = await handler
+    except WorkflowCancelledByUser:
+        raise HTTPException(status_code=409, detail="Task was cancelled")
+    if is_streamable(result):
+        saved = await deployment.result_artifact(task_id, result)
+        task_result = TaskResult(
+            task_id=task_id,
+            history=[],
+            result=saved.url,
+            data={"artifact": saved.model_dump()},
+        )
+    else:
+        task_result = TaskResult(task_id=task_id, history=[], result=result)
+    return negotiated_response(request, task_result.model_dump(mode="json"))
+
+
+@deployments_router.post(
+    "/{deployment_name}/artifacts",
+    response_model=ArtifactDefinition,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                },
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                },
+            },
+        }
+    },
+)
+async def upload_artifact(
+    request: Request,
+    deployment: Annotated[Deployment, Depends(deployment)],
+) -> Response:
+    """Upload an artifact, written to disk as it's received.
+
+    The body is either the raw content of the file, or a multipart form whose
+    first file is stored. Uploading content already stored returns the existing
+    artifact. Tasks refer to the artifact in their input with the value
+    `{"$artifact": "<artifact_id>"}`.
+    """
+    content_type = request.headers.get("content-type", "")
+    chunks: AsyncIterator[bytes] = request.stream()
+    if content_type.startswith("multipart/form-data"):
+        chunks = multipart_chunks(content_type, chunks)
+    try:
+        saved = await deployment.save_artifact(chunks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return negotiated_response(request, saved.model_dump())
+
+
+@deployments_router.get("/{deployment_name}/artifacts/{artifact_id}")
+async def download_artifact(
+    deployment: Annotated[Deployment, Depends(deployment)],
+    artifact_id: str,
+) -> FileResponse:
+    """Download an artifact, streamed from disk.
+
+    Parts of the artifact can be requested with a `Range` header.
+    """
+    path = deployment.artifacts.get(artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        # The content of an artifact never changes
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
 
 
 @deployments_router.get("/{deployment_name}/tasks")
@@ -200,13 +469,7 @@ async def get_tasks(
 ) -> list[TaskDefinition]:
     """Get all the tasks from all the sessions in a given deployment."""
 
-    tasks: list[TaskDefinition] = []
-    for task_id in deployment._handlers.keys():
-        tasks.append(
-            TaskDefinition(task_id=task_id, input=deployment._handler_inputs[task_id])
-        )
-
-    return tasks
+    return await deployment.list_tasks()
 
 
 @deployments_router.get("/{deployment_name}/sessions")
@@ -215,7 +478,7 @@ async def get_sessions(
 ) -> list[SessionDefinition]:
     """Get the active sessions in a deployment and service."""
 
-    return [SessionDefinition(session_id=k) for k in deployment._contexts.keys()]
+    return [SessionDefinition(session_id=k) for k in await deployment.list_sessions()]
 
 
 @deployments_router.get("/{deployment_name}/sessions/{session_id}")
@@ -227,17 +490,15 @@ async def get_session(
     return SessionDefinition(session_id=session_id)
 
 
-@deployments_router.post("/{deployment_name}/sessions/create")
+@deployments_router.post(
+    "/{deployment_name}/sessions/create", dependencies=[Depends(accepting_tasks)]
+)
 async def create_session(
     deployment: Annotated[Deployment, Depends(deployment)],
 ) -> SessionDefinition:
     """Create a new session for a deployment."""
 
-    workflow = deployment._workflow_services[deployment.default_service]
-    session_id = generate_id()
-    deployment._contexts[session_id] = Context(workflow)
-
-    return SessionDefinition(session_id=session_id)
+    return SessionDefinition(session_id=await deployment.create_session())
 
 
 @deployments_router.post("/{deployment_name}/sessions/delete")
@@ -246,7 +507,7 @@ async def delete_session(
 ) -> None:
     """Get the active sessions in a deployment and service."""
 
-    deployment._contexts.pop(session_id)
+    await deployment.delete_session(session_id)
 
 
 async def _ws_proxy(ws: WebSocket, upstream_url: str) -> None:
@@ -336,7 +597,7 @@ async def websocket_proxy(
     upstream_path = f"/deployments/{deployment.name}/ui{slash_path}"
 
     # Convert to WebSocket URL
-    upstream_url = f"ws://localhost:{deployment._config.ui.port}{upstream_path}"
+    upstream_url = f"ws://localhost:{deployment.ui_port}{upstream_path}"
     if websocket.url.query:
         upstream_url += f"?{websocket.url.query}"
 
@@ -366,7 +627,7 @@ async def proxy(
     upstream_path = f"/deployments/{deployment.name}/ui{slash_path}"
 
     upstream_url = httpx.URL(
-        f"http://localhost:{deployment._config.ui.port}{upstream_path}"
+        f"http://localhost:{deployment.ui_port}{upstream_path}"
     ).copy_with(params=request.query_params)
 
     # Debug logging
@@ -3,9 +3,10 @@ from fastapi import APIRouter
 from fastapi.exceptions import HTTPException
 from fastapi.responses import PlainTextResponse
 
+from llama_deploy.apiserver import server
 from llama_deploy.apiserver.server import manager
 from llama_deploy.apiserver.settings import settings
-from llama_deploy.types.apiserver import Status, StatusEnum
+from llama_deploy.types.apiserver import DeploymentStartupProfile, Status, StatusEnum
 
 status_router = APIRouter(
     prefix="/status",
@@ -14,14 +15,28 @@ status_router = APIRouter(
 
 @status_router.get("/")
 async def status() -> Status:
+    # Take the server out of load balancing while it drains the running tasks
+    stopping = not manager.accepting_tasks
     return Status(
-        status=StatusEnum.HEALTHY,
+        status=StatusEnum.UNHEALTHY if stopping else StatusEnum.HEALTHY,
         max_deployments=manager._max_deployments,
         deployments=list(manager._deployments.keys()),
-        status_message="",
+        status_message="Shutting down" if stopping else "",
+        autodeploy=server.autodeployer.status if server.autodeployer else None,
     )
 
 
+@status_router.get("/startup")
+async def startup() -> list[DeploymentStartupProfile]:
+    """Reports the time spent loading the services of each deployment.
+
+    Services imported lazily report a null `import_seconds` until the first task
+    targets them. The per-module breakdown is only collected when the
+    `profile_imports` setting is enabled.
+    """
+    return [d.startup_profile for d in manager._deployments.values()]
+
+
 @status_router.get("/metrics")
 async def metrics() -> PlainTextResponse:
     """Proxies the Prometheus metrics endpoint through the API Server.
@@ -5,27 +5,108 @@ from typing import Any, AsyncGenerator
 
 from fastapi import FastAPI
 
+from .autodeploy import AutoDeployer
 from .deployment import Manager
 from .deployment_config_parser import DeploymentConfig
+from .profiling import LoopLagMonitor, MemoryProfiler
 from .settings import settings
+from .state_stores import SqliteStateStore
 from .stats import apiserver_state
+from .task_queue import SqliteTaskQueue
 
 logger = logging.getLogger("uvicorn.info")
 manager = Manager()
+# Set when the deployment is checked out from a git repository
+autodeployer: AutoDeployer | None = None
+# Set when memory debugging is enabled
+memory_profiler: MemoryProfiler | None = None
+# Set when the event loop lag is measured
+loop_monitor: LoopLagMonitor | None = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
+    global autodeployer, memory_profiler, loop_monitor
     apiserver_state.state("starting")
+    # The manager outlives the app, e.g. when the lifespan runs again in the same process
+    manager.set_accepting_tasks(True)
+
+    if settings.debug_memory:
+        memory_profiler = MemoryProfiler(settings.debug_memory_frames)
+        memory_profiler.start()
+        logger.info("Tracing memory allocations, see /debug/memory")
+
+    lag_task = None
+    if settings.loop_lag_interval > 0:
+        loop_monitor = LoopLagMonitor(
+            settings.loop_lag_interval,
+            block_threshold=settings.loop_block_threshold or None,
+            label_frame=manager.step_labeler(),
+        )
+        lag_task = asyncio.create_task(loop_monitor.run())
 
     manager.set_deployments_path(settings.deployments_path)
+    store = None
+    worker_server = None
+    if settings.shared_state_path:
+        from .workers import WorkerServer
+
+        # Share deployments, sessions and tasks with the other worker processes
+        store = SqliteStateStore(settings.shared_state_path)
+        manager.set_state_store(store)
+        worker_server = WorkerServer(
+            app, settings.shared_state_path.parent / f"worker-{manager.worker_id}.sock"
+        )
+        await worker_server.start()
+        store.register_worker(manager.worker_id, worker_server.address)
+        logger.info(f"Sharing state with other workers in {store.path}")
+
+    queue = None
+    if settings.task_queue_path:
+        # Deployments recover the tasks left in the queue when they start
+        queue = SqliteTaskQueue(settings.task_queue_path)
+        manager.set_task_queue(queue)
+        logger.info(f"Persisting tasks in {queue.path}")
+
     t = asyncio.create_task(manager.serve())
     await asyncio.sleep(0)
 
     logger.info(f"deployments folder: {manager.deployments_path}")
     logger.info(f"rc folder: {settings.rc_path}")
 
-    if settings.rc_path.exists():
+    watch_task = None
+    if settings.autodeploy_repo_url:
+        deployer = AutoDeployer(
+            settings.autodeploy_repo_url,
+            work_dir=settings.rc_path,
+            deployment_file_path=settings.deployment_file_path or "deployment.yml",
+            cache_dir=settings.autodeploy_cache_dir,
+            token=settings.autodeploy_token,
+            deployment_name=settings.autodeploy_deployment_name,
+        )
+        if await asyncio.to_thread(deployer.try_lock):
+            autodeployer = deployer
+            await asyncio.to_thread(autodeployer.sync)
+            try:
+                logger.info(f"Deploying {autodeployer.deployment_file}")
+                await manager.deploy(
+                    autodeployer.load_config(),
+                    base_path=str(autodeployer.deployment_folder),
+                )
+                await asyncio.to_thread(autodeployer.set_deployed)
+            except Exception as e:
+                logger.error(
+                    f"Failed to deploy {autodeployer.deployment_file}: {str(e)}"
+                )
+                await asyncio.to_thread(autodeployer.discard)
+            if settings.autodeploy_poll_interval > 0:
+                watch_task = asyncio.create_task(
+                    autodeployer.watch(manager, settings.autodeploy_poll_interval)
+                )
+        else:
+            # The other workers load the deployment from the shared state
+            logger.info(f"Another worker deploys {settings.autodeploy_repo_url}")
+    elif settings.rc_path.exists():
         if settings.deployment_file_path:
             logger.info(
                 f"Browsing the rc folder {settings.rc_path} for deployment file {settings.deployment_file_path}"
@@ -48,13 +129,39 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, Any]:
             try:
                 logger.info(f"Deploying startup configuration from {yaml_file}")
                 config = DeploymentConfig.from_yaml(yaml_file)
-                await manager.deploy(config, base_path=str(settings.rc_path))
+                await manager.deploy(
+                    config, base_path=str(settings.rc_path), local=settings.rc_local
+                )
             except Exception as e:
                 logger.error(f"Failed to deploy {yaml_file}: {str(e)}")
 
     apiserver_state.state("running")
     yield
 
+    if watch_task is not None:
+        watch_task.cancel()
+    if lag_task is not None:
+        lag_task.cancel()
+    loop_monitor = None
+    if autodeployer is not None:
+        autodeployer.unlock()
+    autodeployer = None
+    apiserver_state.state("stopping")
+    # Let the running tasks complete, the ones left resume from where they are on
+    # restart when the task queue is enabled
+    await manager.shutdown(settings.shutdown_grace_period)
+    if queue is not None:
+        manager.set_task_queue(None)
+        queue.close()
+    if memory_profiler is not None:
+        memory_profiler.stop()
+        memory_profiler = None
     t.cancel()
+    if worker_server is not None:
+        await worker_server.stop()
+    if store is not None:
+        store.unregister_worker(manager.worker_id)
+        manager.set_state_store(None)
+        store.close()
 
     apiserver_state.state("stopped")
@@ -27,11 +27,113 @@ class ApiserverSettings(BaseSettings):
         default=None,
         description="Optional path, relative to the rc_path, where the deployment file is located. If not provided, will glob all .yml/.yaml files in the rc_path",
     )
+    rc_local: bool = Field(
+        default=False,
+        description="Deploy the configurations found in the rc_path in local mode, using their sources in place",
+    )
     use_tls: bool = Field(
         default=False,
         description="Use TLS (HTTPS) to communicate with the API Server",
     )
 
+    # Startup settings
+    lazy_load_services: bool = Field(
+        default=False,
+        description="Import the workflow of a service when the first task targets it, instead of at deploy time",
+    )
+    prewarm_services: bool = Field(
+        default=False,
+        description="When lazy loading is enabled, import the services in the background right after deploying",
+    )
+    profile_imports: bool = Field(
+        default=False,
+        description="Record a per-module breakdown of the time spent importing services, reported at /status/startup",
+    )
+
+    # Reload settings
+    reload_drain_timeout: float = Field(
+        default=30.0,
+        description="Seconds given to the tasks running on the old version of a reloaded service to complete before being cancelled",
+    )
+    reload_ui_ready_timeout: float = Field(
+        default=120.0,
+        description="Seconds to wait for the new UI server to answer requests when reloading a deployment",
+    )
+
+    # Task settings
+    idempotency_key_ttl: float = Field(
+        default=3600.0,
+        description="Seconds during which creating a task with an already used idempotency key returns the existing task instead of starting a new one",
+    )
+    task_queue_path: Path | None = Field(
+        default=None,
+        description="Path to the SQLite database persisting the tasks created with /tasks/create, to run them again after a crash or a restart. Tasks are lost on restart if not set",
+    )
+    task_max_attempts: int = Field(
+        default=3,
+        description="How many times a task interrupted by a crash or a restart is started before being abandoned",
+    )
+    shutdown_grace_period: float = Field(
+        default=30.0,
+        description="Seconds given to the running tasks to complete when the API Server shuts down. Tasks still running afterwards resume on restart if the task queue is enabled",
+    )
+
+    # Development settings
+    watch: bool = Field(
+        default=False,
+        description="Reload the services of local deployments as soon as their source files change",
+    )
+    watch_force_polling: bool = Field(
+        default=False,
+        description="Watch the source files by polling instead of using the file system notifications",
+    )
+
+    # Multi-worker settings
+    shared_state_path: Path | None = Field(
+        default=None,
+        description="Path to the SQLite database where multiple worker processes share deployments, sessions and tasks. Shared state is disabled if not set",
+    )
+    shared_state_poll_interval: float = Field(
+        default=1.0,
+        description="How often, in seconds, a worker checks the shared state for deployments created by the other workers",
+    )
+
+    # Autodeploy settings
+    autodeploy_repo_url: str | None = Field(
+        default=None,
+        description="Git repository to check out the deployment file from at startup, optionally followed by @ and a branch, a tag or a commit SHA",
+    )
+    autodeploy_token: str | None = Field(
+        default=None,
+        description="Token to access a private autodeploy repository",
+    )
+    autodeploy_deployment_name: str | None = Field(
+        default=None,
+        description="Overrides the name of the deployment checked out from the autodeploy repository",
+    )
+    autodeploy_cache_dir: Path = Field(
+        default=Path("/var/cache/llama_deploy/git"),
+        description="Folder keeping a mirror of the autodeploy repository across restarts",
+    )
+    autodeploy_poll_interval: float = Field(
+        default=0.0,
+        description="How often, in seconds, to check the autodeploy ref for new commits to deploy. Only deploy at startup if 0",
+    )
+
+    # Debug settings
+    debug_memory: bool = Field(
+        default=False,
+        description="Trace memory allocations and report them at /debug/memory along with object counts. Tracing slows down the API Server",
+    )
+    debug_memory_frames: int = Field(
+        default=1,
+        description="Number of frames recorded for each traced allocation, more frames locate allocations better at a higher cost",
+    )
+    debug_profiling: bool = Field(
+        default=False,
+        description="Allow sampling CPU profiles of the API Server at /debug/profile and reporting what blocked the event loop at /debug/loop",
+    )
+
     # Metrics collection settings
     prometheus_enabled: bool = Field(
         default=True,
@@ -41,6 +143,14 @@ class ApiserverSettings(BaseSettings):
         default=9000,
         description="The port where to serve Prometheus metrics",
     )
+    loop_lag_interval: float = Field(
+        default=0.5,
+        description="How often, in seconds, to measure how long the event loop is blocked, exported as the event_loop_lag_seconds metric. Disabled if 0",
+    )
+    loop_block_threshold: float = Field(
+        default=1.0,
+        description="Log the stack of the code blocking the event loop for longer than this many seconds, reported at /debug/loop. Disabled if 0",
+    )
 
     # Tracing settings
     tracing_enabled: bool = Field(
@@ -1,5 +1,6 @@
 from .base import SourceManager
 from .git import GitSourceManager
+from .git_mirror import GitMirror
 from .local import LocalSourceManager
 
-__all__ = ["GitSourceManager", "LocalSourceManager", "SourceManager"]
+__all__ = ["GitMirror", "GitSourceManager", "LocalSourceManager", "SourceManager"]
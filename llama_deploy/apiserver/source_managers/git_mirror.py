@@ -0,0 +1,168 @@
+import hashlib
+import re
+import shutil
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from git import GitCommandError, Repo
+
+FULL_SHA = re.compile(r"^[0-9a-f]{40}$")
+SHORT_SHA = re.compile(r"^[0-9a-f]{4,39}$")
+# Local refs keeping the fetched commits reachable, so that git gc never drops them
+MIRROR_REFS = "refs/mirror"
+
+
+def _strip_credentials(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.hostname is None or "@" not in parts.netloc:
+        return url
+    netloc = parts.hostname + (f":{parts.port}" if parts.port else "")
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+class GitMirror:
+    """A bare mirror of a remote repository, kept in a cache folder and updated incrementally.
+
+    Only the refs actually needed are fetched, so that after the first fetch every
+    update only transfers the objects that changed on the remote. Commits referenced
+    by their full SHA are fetched shallow. Credentials embedded in the URL are
+    never written to the mirror, they're passed to git on every fetch instead.
+    """
+
+    def __init__(self, url: str, cache_dir: Path) -> None:
+        """Creates a GitMirror instance.
+
+        Args:
+            url: The URL of the remote repository, optionally containing credentials
+            cache_dir: The folder where the mirrors are kept across runs
+        """
+        self._url = url
+        key = hashlib.sha256(_strip_credentials(url).encode()).hexdigest()[:16]
+        self._path = cache_dir / f"{key}.git"
+        self._repo: Repo | None = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def repo(self) -> Repo:
+        if self._repo is None:
+            if (self._path / "HEAD").exists():
+                self._repo = Repo(self._path)
+            else:
+                self._path.mkdir(parents=True, exist_ok=True)
+                self._repo = Repo.init(self._path, bare=True)
+        return self._repo
+
+    def resolve_remote(self, ref: str | None = None) -> str | None:
+        """Returns the SHA a ref points to on the remote, without fetching anything.
+
+        Args:
+            ref: A branch or a tag, defaults to the default branch of the remote
+
+        Returns:
+            The SHA of the commit, or None when the ref doesn't exist on the remote
+        """
+        if ref and FULL_SHA.match(ref):
+            return ref
+
+        name = ref or "HEAD"
+        output = self.repo.git.ls_remote(self._url, name, f"refs/tags/{name}^{{}}")
+        refs: dict[str, str] = {}
+        for line in str(output).splitlines():
+            sha, _, refname = line.partition("\t")
+            refs[refname] = sha
+        # Prefer the commit pointed to by annotated tags
+        for candidate in (
+            f"refs/tags/{name}^{{}}",
+            name,
+            f"refs/heads/{name}",
+            f"refs/tags/{name}",
+        ):
+            if candidate in refs:
+                return refs[candidate]
+        return None
+
+    def fetch(self, ref: str | None = None) -> str:
+        """Fetches a ref from the remote and returns the SHA of its commit.
+
+        Args:
+            ref: A branch, a tag or a commit SHA, defaults to the default branch of
+                the remote
+
+        Returns:
+            The full SHA of the fetched commit
+        """
+        name = ref or "HEAD"
+        if FULL_SHA.match(name):
+            if self._has_commit(name):
+                # Commits never change, nothing to fetch
+                sha = name
+            else:
+                self.repo.git.fetch(self._url, name, depth=1)
+                sha = self._rev_parse("FETCH_HEAD")
+        else:
+            try:
+                self.repo.git.fetch(self._url, name)
+                sha = self._rev_parse("FETCH_HEAD")
+            except GitCommandError:
+                if not SHORT_SHA.match(name):
+                    raise
+                # Abbreviated SHAs can only be resolved against the whole history
+                if not self._has_commit(name):
+                    self.repo.git.fetch(
+                        self._url,
+                        "+refs/heads/*:refs/heads/*",
+                        "+refs/tags/*:refs/tags/*",
+                    )
+                sha = self._rev_parse(name)
+
+        self.repo.git.update_ref(f"{MIRROR_REFS}/{name}", sha)
+        return sha
+
+    def checkout(
+        self, sha: str, destination: Path, sparse_paths: list[str] | None = None
+    ) -> None:
+        """Checks out a commit into a folder, linked to the mirror as a git worktree.
+
+        Args:
+            sha: The commit to check out
+            destination: The folder to check out the files into, replaced if existing
+            sparse_paths: Only check out these folders, defaults to the whole tree
+        """
+        self.remove_checkout(destination)
+        self.repo.git.worktree("add", "--no-checkout", "--detach", destination, sha)
+        worktree = Repo(destination)
+        if sparse_paths:
+            worktree.git.sparse_checkout("set", "--cone", *sparse_paths)
+        worktree.git.checkout(sha)
+
+    def remove_checkout(self, destination: Path) -> None:
+        """Removes a folder created with `checkout`."""
+        if destination.exists():
+            shutil.rmtree(destination)
+        self.repo.git.worktree("prune")
+
+    def changed_files(self, old_sha: str, new_sha: str, path: str = ".") -> list[str]:
+        """Returns the files added, modified or removed between two fetched commits.
+
+        Args:
+            old_sha: The commit to compare from
+            new_sha: The commit to compare to
+            path: Only compare the files in this folder of the repository
+        """
+        output = self.repo.git.diff(
+            "--name-only", "--no-renames", old_sha, new_sha, "--", path
+        )
+        return [line for line in str(output).splitlines() if line]
+
+    def _has_commit(self, ref: str) -> bool:
+        try:
+            self._rev_parse(ref)
+        except GitCommandError:
+            return False
+        return True
+
+    def _rev_parse(self, ref: str) -> str:
+        return self.repo.git.rev_parse("--verify", "--quiet", f"{ref}^{{commit}}")
@@ -0,0 +1,11 @@
+from .base import DeploymentRecord, StateStore, TaskRecord
+from .memory import MemoryStateStore
+from .sqlite import SqliteStateStore
+
+__all__ = [
+    "DeploymentRecord",
+    "MemoryStateStore",
+    "SqliteStateStore",
+    "StateStore",
+    "TaskRecord",
+]
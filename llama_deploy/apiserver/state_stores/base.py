@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+
+from pydantic import BaseModel
+
+
+class DeploymentRecord(BaseModel):
+    """A deployment as seen by every worker of the API Server."""
+
+    name: str
+    # The DeploymentConfig serialized as JSON
+    config: str
+    base_path: str
+    local: bool = False
+    revision: int = 1
+
+
+class TaskRecord(BaseModel):
+    """A task and the worker running its handler."""
+
+    task_id: str
+    session_id: str
+    input: str
+    worker_id: str
+
+
+class StateStore(ABC):
+    """Protocol to be implemented by classes storing the API Server state shared across workers.
+
+    When the API Server runs multiple worker processes, every worker keeps its own
+    deployments, contexts and handlers in memory. The state store keeps track of what
+    exists and which worker owns it, so that every worker can load the same
+    deployments and requests can be forwarded to the worker holding a live handler.
+    """
+
+    @abstractmethod
+    def put_deployment(
+        self, name: str, config: str, base_path: str, local: bool
+    ) -> int:  # pragma: no cover
+        """Stores a deployment and returns its revision, bumped every time the record changes."""
+
+    @abstractmethod
+    def list_deployments(self) -> list[DeploymentRecord]:  # pragma: no cover
+        """Returns all the deployments."""
+
+    @abstractmethod
+    def put_session(
+        self, deployment: str, session_id: str, worker_id: str
+    ) -> None:  # pragma: no cover
+        """Stores a session and the worker owning its context."""
+
+    @abstractmethod
+    def get_session_owner(
+        self, deployment: str, session_id: str
+    ) -> str | None:  # pragma: no cover
+        """Returns the id of the worker owning a session, if the session exists."""
+
+    @abstractmethod
+    def delete_session(
+        self, deployment: str, session_id: str
+    ) -> None:  # pragma: no cover
+        """Removes a session and its tasks."""
+
+    @abstractmethod
+    def list_sessions(self, deployment: str) -> list[str]:  # pragma: no cover
+        """Returns the ids of the sessions in a deployment."""
+
+    @abstractmethod
+    def put_task(self, deployment: str, task: TaskRecord) -> None:  # pragma: no cover
+        """Stores a task."""
+
+    @abstractmethod
+    def delete_task(self, deployment: str, task_id: str) -> None:  # pragma: no cover
+        """Removes a task, once it completed."""
+
+    @abstractmethod
+    def get_task(
+        self, deployment: str, task_id: str
+    ) -> TaskRecord | None:  # pragma: no cover
+        """Returns a task, if it exists."""
+
+    @abstractmethod
+    def list_tasks(self, deployment: str) -> list[TaskRecord]:  # pragma: no cover
+        """Returns the tasks in a deployment."""
+
+    @abstractmethod
+    def claim_idempotency_key(
+        self, deployment: str, key: str, task: TaskRecord, ttl: float
+    ) -> tuple[str, str]:  # pragma: no cover
+        """Assigns an idempotency key to a task for `ttl` seconds.
+
+        Returns the task id and session id the key is assigned to: the ones of `task`
+        if the key was free or expired, those of the task that claimed it first otherwise.
+        """
+
+    @abstractmethod
+    def release_idempotency_key(
+        self, deployment: str, key: str, task_id: str
+    ) -> None:  # pragma: no cover
+        """Frees an idempotency key claimed by a task that failed to start."""
+
+    @abstractmethod
+    def register_worker(self, worker_id: str, address: str) -> None:  # pragma: no cover
+        """Stores the address where a worker can be reached by the other workers."""
+
+    @abstractmethod
+    def get_worker_address(self, worker_id: str) -> str | None:  # pragma: no cover
+        """Returns the address of a worker, if the worker is registered."""
+
+    @abstractmethod
+    def unregister_worker(self, worker_id: str) -> None:  # pragma: no cover
+        """Removes a worker and the sessions, tasks and idempotency keys it owned."""
@@ -0,0 +1,119 @@
+import threading
+import time
+
+from .base import DeploymentRecord, StateStore, TaskRecord
+
+
+class MemoryStateStore(StateStore):
+    """A StateStore keeping data in memory, only useful within a single process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._deployments: dict[str, DeploymentRecord] = {}
+        # deployment name -> session id -> worker id
+        self._sessions: dict[str, dict[str, str]] = {}
+        # deployment name -> task id -> task
+        self._tasks: dict[str, dict[str, TaskRecord]] = {}
+        # deployment name -> idempotency key -> (expiry time, task)
+        self._idempotency_keys: dict[str, dict[str, tuple[float, TaskRecord]]] = {}
+        self._workers: dict[str, str] = {}
+
+    def put_deployment(
+        self, name: str, config: str, base_path: str, local: bool
+    ) -> int:
+        with self._lock:
+            previous = self._deployments.get(name)
+            record = DeploymentRecord(
+                name=name,
+                config=config,
+                base_path=base_path,
+                local=local,
+                revision=previous.revision if previous else 1,
+            )
+            if previous is not None and record != previous:
+                record.revision += 1
+            self._deployments[name] = record
+            return record.revision
+
+    def list_deployments(self) -> list[DeploymentRecord]:
+        with self._lock:
+            return list(self._deployments.values())
+
+    def put_session(self, deployment: str, session_id: str, worker_id: str) -> None:
+        with self._lock:
+            self._sessions.setdefault(deployment, {})[session_id] = worker_id
+
+    def get_session_owner(self, deployment: str, session_id: str) -> str | None:
+        with self._lock:
+            return self._sessions.get(deployment, {}).get(session_id)
+
+    def delete_session(self, deployment: str, session_id: str) -> None:
+        with self._lock:
+            self._sessions.get(deployment, {}).pop(session_id, None)
+            tasks = self._tasks.get(deployment, {})
+            for task_id in [
+                t.task_id for t in tasks.values() if t.session_id == session_id
+            ]:
+                del tasks[task_id]
+
+    def list_sessions(self, deployment: str) -> list[str]:
+        with self._lock:
+            return list(self._sessions.get(deployment, {}).keys())
+
+    def put_task(self, deployment: str, task: TaskRecord) -> None:
+        with self._lock:
+            self._tasks.setdefault(deployment, {})[task.task_id] = task
+
+    def delete_task(self, deployment: str, task_id: str) -> None:
+        with self._lock:
+            self._tasks.get(deployment, {}).pop(task_id, None)
+
+    def get_task(self, deployment: str, task_id: str) -> TaskRecord | None:
+        with self._lock:
+            return self._tasks.get(deployment, {}).get(task_id)
+
+    def list_tasks(self, deployment: str) -> list[TaskRecord]:
+        with self._lock:
+            return list(self._tasks.get(deployment, {}).values())
+
+    def claim_idempotency_key(
+        self, deployment: str, key: str, task: TaskRecord, ttl: float
+    ) -> tuple[str, str]:
+        now = time.time()
+        with self._lock:
+            keys = self._idempotency_keys.setdefault(deployment, {})
+            for expired in [k for k, (expires, _) in keys.items() if expires <= now]:
+                del keys[expired]
+            _, owner = keys.setdefault(key, (now + ttl, task))
+            return owner.task_id, owner.session_id
+
+    def release_idempotency_key(self, deployment: str, key: str, task_id: str) -> None:
+        with self._lock:
+            keys = self._idempotency_keys.get(deployment, {})
+            if key in keys and keys[key][1].task_id == task_id:
+                del keys[key]
+
+    def register_worker(self, worker_id: str, address: str) -> None:
+        with self._lock:
+            self._workers[worker_id] = address
+
+    def get_worker_address(self, worker_id: str) -> str | None:
+        with self._lock:
+            return self._workers.get(worker_id)
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._lock:
+            self._workers.pop(worker_id, None)
+            for sessions in self._sessions.values():
+                for session_id in [s for s, w in sessions.items() if w == worker_id]:
+                    del sessions[session_id]
+            for tasks in self._tasks.values():
+                for task_id in [
+                    t for t, r in tasks.items() if r.worker_id == worker_id
+                ]:
+                    del tasks[task_id]
+            for keys in self._idempotency_keys.values():
+                for key in [
+                    k for k, (_, r) in keys.items() if r.worker_id == worker_id
+                ]:
+                    del keys[key]
@@ -0,0 +1,273 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .base import DeploymentRecord, StateStore, TaskRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    name TEXT PRIMARY KEY,
+    config TEXT NOT NULL,
+    base_path TEXT NOT NULL,
+    local INTEGER NOT NULL,
+    revision INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    deployment TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    PRIMARY KEY (deployment, session_id)
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    deployment TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    input TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    PRIMARY KEY (deployment, task_id)
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    deployment TEXT NOT NULL,
+    key TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (deployment, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at
+    ON idempotency_keys (expires_at);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    address TEXT NOT NULL
+);
+"""
+
+
+class SqliteStateStore(StateStore):
+    """A StateStore backed by a SQLite database in WAL mode.
+
+    The database file can be opened concurrently by all the worker processes running
+    on the same host: WAL mode lets readers proceed while a writer is active, and
+    writers wait on each other for up to `busy_timeout` seconds.
+    """
+
+    def __init__(self, path: Path, busy_timeout: float = 5.0) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(path),
+            timeout=busy_timeout,
+            isolation_level=None,  # autocommit, transactions are explicit
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Durable enough in WAL mode, a crash can only lose the last transactions
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def put_deployment(
+        self, name: str, config: str, base_path: str, local: bool
+    ) -> int:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT config, base_path, local, revision FROM deployments "
+                    "WHERE name = ?",
+                    (name,),
+                ).fetchone()
+                if row is None:
+                    revision = 1
+                elif row[:3] == (config, base_path, int(local)):
+                    revision = row[3]
+                else:
+                    revision = row[3] + 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO deployments VALUES (?, ?, ?, ?, ?)",
+                    (name, config, base_path, int(local), revision),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return revision
+
+    def list_deployments(self) -> list[DeploymentRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, config, base_path, local, revision FROM deployments"
+            ).fetchall()
+        return [
+            DeploymentRecord(
+                name=name,
+                config=config,
+                base_path=base_path,
+                local=bool(local),
+                revision=revision,
+            )
+            for name, config, base_path, local, revision in rows
+        ]
+
+    def put_session(self, deployment: str, session_id: str, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (deployment, session_id, worker_id),
+            )
+
+    def get_session_owner(self, deployment: str, session_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT worker_id FROM sessions WHERE deployment = ? AND session_id = ?",
+                (deployment, session_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete_session(self, deployment: str, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE deployment = ? AND session_id = ?",
+                    (deployment, session_id),
+                )
+                self._conn.execute(
+                    "DELETE FROM tasks WHERE deployment = ? AND session_id = ?",
+                    (deployment, session_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def list_sessions(self, deployment: str) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM sessions WHERE deployment = ?", (deployment,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def put_task(self, deployment: str, task: TaskRecord) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?)",
+                (deployment, task.task_id, task.session_id, task.input, task.worker_id),
+            )
+
+    def delete_task(self, deployment: str, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM tasks WHERE deployment = ? AND task_id = ?",
+                (deployment, task_id),
+            )
+
+    def get_task(self, deployment: str, task_id: str) -> TaskRecord | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_id, session_id, input, worker_id FROM tasks "
+                "WHERE deployment = ? AND task_id = ?",
+                (deployment, task_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return TaskRecord(
+            task_id=row[0], session_id=row[1], input=row[2], worker_id=row[3]
+        )
+
+    def list_tasks(self, deployment: str) -> list[TaskRecord]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, session_id, input, worker_id FROM tasks "
+                "WHERE deployment = ?",
+                (deployment,),
+            ).fetchall()
+        return [
+            TaskRecord(task_id=t, session_id=s, input=i, worker_id=w)
+            for t, s, i, w in rows
+        ]
+
+    def claim_idempotency_key(
+        self, deployment: str, key: str, task: TaskRecord, ttl: float
+    ) -> tuple[str, str]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,)
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO idempotency_keys VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        deployment,
+                        key,
+                        task.task_id,
+                        task.session_id,
+                        task.worker_id,
+                        now + ttl,
+                    ),
+                )
+                row = self._conn.execute(
+                    "SELECT task_id, session_id FROM idempotency_keys "
+                    "WHERE deployment = ? AND key = ?",
+                    (deployment, key),
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0], row[1]
+
+    def release_idempotency_key(self, deployment: str, key: str, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM idempotency_keys "
+                "WHERE deployment = ? AND key = ? AND task_id = ?",
+                (deployment, key, task_id),
+            )
+
+    def register_worker(self, worker_id: str, address: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?)", (worker_id, address)
+            )
+
+    def get_worker_address(self, worker_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT address FROM workers WHERE worker_id = ?", (worker_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def unregister_worker(self, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM workers WHERE worker_id = ?", (worker_id,)
+                )
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE worker_id = ?", (worker_id,)
+                )
+                self._conn.execute(
+                    "DELETE FROM tasks WHERE worker_id = ?", (worker_id,)
+                )
+                self._conn.execute(
+                    "DELETE FROM idempotency_keys WHERE worker_id = ?", (worker_id,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
@@ -1,4 +1,4 @@
-from prometheus_client import Enum
+from prometheus_client import Counter, Enum, Gauge, Histogram, Info
 
 apiserver_state = Enum(
     "apiserver_state",
@@ -6,6 +6,7 @@ apiserver_state = Enum(
     states=[
         "starting",
         "running",
+        "stopping",
         "stopped",
     ],
 )
@@ -31,6 +32,100 @@ service_state = Enum(
         "loading",
         "syncing",
         "installing",
+        "deferred",
         "ready",
     ],
 )
+
+reload_duration = Histogram(
+    "deployment_reload_duration_seconds",
+    "Time spent reloading a deployment, until new tasks are routed to the new services",
+    ["deployment_name"],
+)
+
+draining_handlers = Gauge(
+    "deployment_draining_handlers",
+    "Tasks still running on the old version of reloaded services",
+    ["deployment_name"],
+)
+
+drained_handlers = Counter(
+    "deployment_drained_handlers",
+    "Tasks that were running on the old version of reloaded services, by outcome",
+    ["deployment_name", "outcome"],
+)
+
+autodeploy_commit = Info(
+    "autodeploy_commit",
+    "The git ref being deployed and the SHA of the commit currently serving",
+)
+
+autodeploy_checks = Counter(
+    "autodeploy_checks",
+    "Checks of the remote git ref for new commits, by outcome",
+    ["outcome"],
+)
+
+autodeploy_reload_duration = Histogram(
+    "autodeploy_reload_duration_seconds",
+    "Time spent deploying a new commit, from fetching it until it serves tasks",
+)
+
+event_loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop ran a callback, i.e. for how long it was blocked",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+event_loop_blocked = Counter(
+    "event_loop_blocked",
+    "Times the event loop was blocked for longer than the threshold, with its stack logged",
+)
+
+cancelled_tasks = Counter(
+    "deployment_cancelled_tasks",
+    "Tasks cancelled before completion, by reason: request, timeout or disconnect",
+    ["deployment_name", "reason"],
+)
+
+recovered_tasks = Counter(
+    "deployment_recovered_tasks",
+    "Queued tasks interrupted by a crash or a shutdown, by outcome: resumed from a checkpoint, restarted, abandoned or failed",
+    ["deployment_name", "outcome"],
+)
+
+deduplicated_tasks = Counter(
+    "deployment_deduplicated_tasks",
+    "Task creations answered with an existing task because their idempotency key was already used",
+    ["deployment_name"],
+)
+
+result_cache_requests = Counter(
+    "result_cache_requests",
+    "Tasks run through the result cache of a service, by outcome: hit, disk_hit, coalesced or miss",
+    ["deployment_name", "service_name", "outcome"],
+)
+
+result_cache_entries = Gauge(
+    "result_cache_entries",
+    "Results kept in the memory tier of the result cache of a service",
+    ["deployment_name", "service_name"],
+)
+
+ingestion_lag = Gauge(
+    "ingestion_lag",
+    "Messages of an ingestion topic waiting to be consumed by the consumer group of a deployment",
+    ["deployment_name", "topic"],
+)
+
+ingested_messages = Counter(
+    "ingested_messages",
+    "Messages consumed from an ingestion topic, by outcome: completed or failed",
+    ["deployment_name", "topic", "outcome"],
+)
+
+event_sink_messages = Counter(
+    "event_sink_messages",
+    "Task events and results sent to the event sink of a deployment, by outcome: published, dropped when too many were pending, or failed",
+    ["deployment_name", "outcome"],
+)
@@ -0,0 +1,256 @@
+"""Durable queue of the tasks created with /tasks/create, recovered after a crash or a restart."""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from pydantic import BaseModel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    deployment TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    service_id TEXT NOT NULL,
+    input TEXT NOT NULL,
+    worker_id TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    checkpoint TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (deployment, task_id)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    deployment TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    service_id TEXT NOT NULL,
+    context TEXT NOT NULL,
+    PRIMARY KEY (deployment, session_id)
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+"""
+# Seconds a worker is considered alive after renewing its lease
+WORKER_LEASE_TTL = 30.0
+
+
+class QueuedTask(BaseModel):
+    """A task accepted by a worker and not completed yet."""
+
+    task_id: str
+    session_id: str
+    service_id: str
+    # The run kwargs serialized as JSON
+    input: str
+    worker_id: str
+    # How many times the task was started, including the current run
+    attempts: int = 1
+    # The Context of the task serialized as JSON, to resume it where it stopped
+    checkpoint: str | None = None
+
+
+class SavedSession(BaseModel):
+    """A session open when the server stopped."""
+
+    session_id: str
+    # The service whose workflow the context belongs to
+    service_id: str
+    # The Context of the session serialized as JSON
+    context: str
+
+
+def new_worker_id() -> str:
+    """Returns the id of the worker running in this process, unique to this start.
+
+    A pid alone doesn't tell workers apart: the server of a restarted container gets
+    the same pid, and pids are reused by other processes.
+    """
+    return f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+def worker_alive(worker_id: str) -> bool:
+    """Tells whether the process of a worker may still be running on this host.
+
+    The pid the id starts with can have been reused, which makes a dead worker look
+    alive: use the leases of the task queue when that matters.
+    """
+    try:
+        pid = int(worker_id.split("-", 1)[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        return True
+    if sys.platform == "win32":  # pragma: no cover
+        # Signal 0 is CTRL_C_EVENT on Windows, where a single worker is supported
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+class SqliteTaskQueue:
+    """Keeps the tasks that are running in a SQLite database in WAL mode.
+
+    A task is stored before its id is returned to the client and removed once it
+    completes, successfully or not. Workers renew a lease while they run: the tasks
+    left in the queue by a worker whose lease expired or was released were interrupted
+    by a crash or a shutdown, and are run again by another worker, which gives them
+    at-least-once semantics. The contexts of the sessions open at shutdown are
+    kept as well, until their deployment starts again. The database can be shared by
+    all the worker processes running on the same host.
+    """
+
+    def __init__(self, path: Path, busy_timeout: float = 5.0) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(path),
+            timeout=busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # An acknowledged task must survive a power loss, not only a process crash
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def put(self, deployment: str, task: QueuedTask) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    deployment,
+                    task.task_id,
+                    task.session_id,
+                    task.service_id,
+                    task.input,
+                    task.worker_id,
+                    task.attempts,
+                    task.checkpoint,
+                    time.time(),
+                ),
+            )
+
+    def complete(self, deployment: str, task_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM tasks WHERE deployment = ? AND task_id = ?",
+                (deployment, task_id),
+            )
+
+    def checkpoint(self, deployment: str, task_id: str, checkpoint: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE tasks SET checkpoint = ? WHERE deployment = ? AND task_id = ?",
+                (checkpoint, deployment, task_id),
+            )
+
+    def list_tasks(self, deployment: str) -> list[QueuedTask]:
+        """Returns the tasks of a deployment, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT task_id, session_id, service_id, input, worker_id, attempts, "
+                "checkpoint FROM tasks WHERE deployment = ? ORDER BY created_at",
+                (deployment,),
+            ).fetchall()
+        return [
+            QueuedTask(
+                task_id=t,
+                session_id=s,
+                service_id=svc,
+                input=i,
+                worker_id=w,
+                attempts=a,
+                checkpoint=c,
+            )
+            for t, s, svc, i, w, a, c in rows
+        ]
+
+    def renew_lease(self, worker_id: str, ttl: float = WORKER_LEASE_TTL) -> None:
+        """Tells the other workers that this one is alive for `ttl` more seconds."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?)",
+                (worker_id, time.time() + ttl),
+            )
+
+    def release_lease(self, worker_id: str) -> None:
+        """Lets the other workers recover the tasks of this one right away."""
+        with self._lock:
+            self._conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def live_workers(self) -> set[str]:
+        """Returns the ids of the workers whose lease didn't expire."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT worker_id FROM workers WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def claim(
+        self, deployment: str, task: QueuedTask, worker_id: str
+    ) -> QueuedTask | None:
+        """Takes over a task interrupted on `task.worker_id`, counting a new attempt.
+
+        Returns None if another worker claimed the task first.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET worker_id = ?, attempts = attempts + 1 "
+                "WHERE deployment = ? AND task_id = ? AND worker_id = ? "
+                "AND attempts = ?",
+                (worker_id, deployment, task.task_id, task.worker_id, task.attempts),
+            )
+        if cursor.rowcount != 1:
+            return None
+        return task.model_copy(
+            update={"worker_id": worker_id, "attempts": task.attempts + 1}
+        )
+
+    def put_session(self, deployment: str, session: SavedSession) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (deployment, session.session_id, session.service_id, session.context),
+            )
+
+    def take_sessions(self, deployment: str) -> list[SavedSession]:
+        """Removes the sessions saved for a deployment and returns them."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT session_id, service_id, context FROM sessions "
+                    "WHERE deployment = ?",
+                    (deployment,),
+                ).fetchall()
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE deployment = ?", (deployment,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            SavedSession(session_id=s, service_id=svc, context=c) for s, svc, c in rows
+        ]
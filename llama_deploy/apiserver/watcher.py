@@ -0,0 +1,106 @@
+"""Watch the sources of local deployments to reload services as soon as they change."""
+
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Folders that never contain service code worth reloading
+IGNORED_DIRS = {"__pycache__", ".git", ".venv", "node_modules", ".mypy_cache"}
+
+
+class SourceWatcher:
+    """Yields the Python files changed in a set of folders.
+
+    Changes are detected with the native file system notifications of the OS through
+    `watchfiles` when it's installed, falling back to polling the modification time
+    of the files otherwise. Bursts of changes, like the ones produced by editors
+    saving a file or by a `git checkout`, are debounced and yielded as a single batch.
+    """
+
+    def __init__(
+        self,
+        paths: list[Path],
+        debounce: float = 0.05,
+        poll_interval: float = 0.2,
+        force_polling: bool = False,
+    ) -> None:
+        """Creates a SourceWatcher instance.
+
+        Args:
+            paths: The folders to watch, recursively
+            debounce: Seconds without new changes before yielding a batch
+            poll_interval: Seconds between two scans of the folders when polling
+            force_polling: Poll the folders even if native notifications are available
+        """
+        self._paths = paths
+        self._debounce = debounce
+        self._poll_interval = poll_interval
+        self._force_polling = force_polling
+
+    async def changes(self) -> AsyncIterator[set[Path]]:
+        if not self._force_polling:
+            try:
+                import watchfiles  # noqa: F401
+            except ImportError:
+                logger.info("watchfiles is not installed, polling for changes")
+            else:
+                async for changes in self._watch():
+                    yield changes
+                return
+
+        async for changes in self._poll():
+            yield changes
+
+    async def _watch(self) -> AsyncIterator[set[Path]]:
+        from watchfiles import PythonFilter, awatch
+
+        async for changes in awatch(
+            *self._paths,
+            watch_filter=PythonFilter(),
+            step=int(self._debounce * 1000),
+        ):
+            yield {Path(path).resolve() for _, path in changes}
+
+    async def _poll(self) -> AsyncIterator[set[Path]]:
+        snapshot = await asyncio.to_thread(self._scan)
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            current = await asyncio.to_thread(self._scan)
+            if current == snapshot:
+                continue
+
+            # Wait for the burst of changes to settle
+            while True:
+                await asyncio.sleep(self._debounce)
+                settled = await asyncio.to_thread(self._scan)
+                if settled == current:
+                    break
+                current = settled
+
+            yield {
+                path
+                for path in current.keys() | snapshot.keys()
+                if current.get(path) != snapshot.get(path)
+            }
+            snapshot = current
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        """Returns the modification time and size of every Python file in the folders."""
+        files: dict[Path, tuple[int, int]] = {}
+        for root in self._paths:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+                for filename in filenames:
+                    if not filename.endswith(".py"):
+                        continue
+                    path = Path(dirpath, filename).resolve()
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
@@ -0,0 +1,233 @@
+"""Support for running the API Server with multiple worker processes.
+
+Every worker loads all the deployments, but the contexts and the handlers of the
+workflows only live in the memory of the worker that created them. Each worker
+serves the app on a private unix socket too, so that a worker receiving a request
+for a session or a task owned by another worker can forward it there.
+"""
+
+import asyncio
+import contextlib
+import logging
+import re
+from pathlib import Path
+from typing import AsyncGenerator, Iterator
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .deployment import Manager
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "x-llama-deploy-forwarded"
+# Requests handled by the worker owning the handler of a task
+TASK_ROUTE = re.compile(
+    r"^/deployments/(?P<deployment>[^/]+)/tasks/(?P<task_id>[^/]+)/(events|results|cancel)/?$"
+)
+# Requests handled by the worker owning the context of the session in the query string
+SESSION_ROUTE = re.compile(
+    r"^/deployments/(?P<deployment>[^/]+)/(tasks/run|tasks/create|sessions/delete)/?$"
+)
+# Requests handled by the worker whose id is in the query string
+DEBUG_ROUTE = re.compile(r"^/debug/")
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",  # codespell:ignore
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+class _WorkerServer(uvicorn.Server):
+    """A uvicorn server that leaves signal handling to the server running the worker."""
+
+    @contextlib.contextmanager
+    def capture_signals(self) -> Iterator[None]:
+        yield
+
+
+class WorkerServer:
+    """Serves an app on a unix socket reachable by the other workers."""
+
+    def __init__(self, app: ASGIApp, socket_path: Path) -> None:
+        self._socket_path = socket_path
+        self._server = _WorkerServer(
+            uvicorn.Config(
+                app, uds=str(socket_path), lifespan="off", log_level="warning"
+            )
+        )
+        self._task: asyncio.Task | None = None
+
+    @property
+    def address(self) -> str:
+        return str(self._socket_path)
+
+    async def start(self) -> None:
+        self._socket_path.unlink(missing_ok=True)
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                # Raise the error that prevented the server from starting
+                await self._task
+                raise RuntimeError("Worker server exited before starting")
+            await asyncio.sleep(0.01)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._server.should_exit = True
+        await self._task
+        self._task = None
+        self._socket_path.unlink(missing_ok=True)
+
+
+class SessionAffinityMiddleware:
+    """Forwards the requests for a session or a task to the worker owning it.
+
+    The middleware is a no-op unless the manager shares its state with other
+    workers through a state store. The store is read in a thread, not to block
+    the event loop while another worker writes to it.
+    """
+
+    def __init__(self, app: ASGIApp, manager: Manager) -> None:
+        self.app = app
+        self.manager = manager
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.manager.state_store is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        if FORWARDED_HEADER.encode() in headers:
+            # Never forward twice
+            await self.app(scope, receive, send)
+            return
+
+        owner = await self._find_owner(scope)
+        if owner is None or owner == self.manager.worker_id:
+            await self.app(scope, receive, send)
+            return
+
+        address = await asyncio.to_thread(
+            self.manager.state_store.get_worker_address, owner
+        )
+        if address is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self._forward(address, scope, receive, send)
+
+    async def _find_owner(self, scope: Scope) -> str | None:
+        """Returns the id of the worker owning the session or task of a request."""
+        store = self.manager.state_store
+        if store is None:  # pragma: no cover
+            return None
+
+        path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode())
+        session_ids = query.get("session_id")
+        if match := TASK_ROUTE.match(path):
+            task = await asyncio.to_thread(
+                store.get_task, match["deployment"], match["task_id"]
+            )
+            if task is not None:
+                return task.worker_id
+            # Completed tasks are removed from the store, their handler is kept by
+            # the worker owning their session
+            if not session_ids:
+                return None
+            return await asyncio.to_thread(
+                store.get_session_owner, match["deployment"], session_ids[0]
+            )
+
+        if match := SESSION_ROUTE.match(path):
+            if session_ids:
+                return await asyncio.to_thread(
+                    store.get_session_owner, match["deployment"], session_ids[0]
+                )
+
+        if DEBUG_ROUTE.match(path):
+            worker_ids = query.get("worker_id")
+            if worker_ids:
+                return worker_ids[0]
+
+        return None
+
+    async def _forward(
+        self, address: str, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        async def request_body() -> AsyncGenerator[bytes, None]:
+            more_body = True
+            while more_body:
+                message = await receive()
+                yield message.get("body", b"")
+                more_body = message.get("more_body", False)
+
+        headers = [
+            (k, v)
+            for k, v in scope["headers"]
+            if k.decode().lower() not in HOP_BY_HOP_HEADERS
+        ]
+        headers.append((FORWARDED_HEADER.encode(), b"1"))
+
+        client = self._clients.get(address)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=address), timeout=None
+            )
+            self._clients[address] = client
+
+        url = httpx.URL(
+            f"http://worker{scope['path']}",
+            query=scope.get("query_string", b""),
+        )
+        request = client.build_request(
+            scope["method"], url, headers=headers, content=request_body()
+        )
+        try:
+            upstream = await client.send(request, stream=True)
+        except httpx.TransportError as e:
+            logger.error(f"Worker at {address} is unreachable: {e}")
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 502,
+                    "headers": [(b"content-type", b"application/json")],
+                }
+            )
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": b'{"detail":"Worker owning the session is unreachable"}',
+                }
+            )
+            return
+
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": upstream.status_code,
+                    "headers": [
+                        (k, v)
+                        for k, v in upstream.headers.raw
+                        if k.decode().lower() not in HOP_BY_HOP_HEADERS
+                    ],
+                }
+            )
+            async for chunk in upstream.aiter_raw():
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await upstream.aclose()
@@ -2,17 +2,26 @@ from pathlib import Path
 
 import click
 
-from .config import config as config_cmd
-from .deploy import deploy as deploy_cmd
-from .init import init as init_cmd
 from .internal.config import DEFAULT_PROFILE_NAME, load_config
-from .run import run as run_cmd
-from .serve import serve as serve_cmd
-from .sessions import sessions as sessions_cmd
-from .status import status as status_cmd
+from .internal.lazy import LazyGroup
+
+# Subcommands are imported on demand, so that each command only pays for what it uses
+SUBCOMMANDS = {
+    "bench": "llama_deploy.cli.bench:bench",
+    "config": "llama_deploy.cli.config:config",
+    "deploy": "llama_deploy.cli.deploy:deploy",
+    "init": "llama_deploy.cli.init:init",
+    "profile": "llama_deploy.cli.profile:profile",
+    "run": "llama_deploy.cli.run:run",
+    "serve": "llama_deploy.cli.serve:serve",
+    "sessions": "llama_deploy.cli.sessions:sessions",
+    "status": "llama_deploy.cli.status:status",
+}
 
 
 @click.group(
+    cls=LazyGroup,
+    lazy_subcommands=SUBCOMMANDS,
     context_settings={"help_option_names": ["-h", "--help"]},
     invoke_without_command=True,
 )
@@ -75,12 +84,3 @@ def llamactl(
     ctx.obj = config_profile
     if ctx.invoked_subcommand is None:
         click.echo(ctx.get_help())  # show the help if no subcommand was provided
-
-
-llamactl.add_command(config_cmd)
-llamactl.add_command(deploy_cmd)
-llamactl.add_command(init_cmd)
-llamactl.add_command(run_cmd)
-llamactl.add_command(serve_cmd)
-llamactl.add_command(sessions_cmd)
-llamactl.add_command(status_cmd)
@@ -0,0 +1,189 @@
+import json
+from typing import TYPE_CHECKING
+
+import click
+
+from .internal.config import ConfigProfile
+
+if TYPE_CHECKING:
+    from .internal.bench import BenchReport
+
+
+@click.command()
+@click.pass_obj  # config_profile
+@click.option(
+    "-d", "--deployment", required=True, is_flag=False, help="Deployment name"
+)
+@click.option(
+    "-a",
+    "--arg",
+    multiple=True,
+    is_flag=False,
+    type=(str, str),
+    help="'key value' argument to pass to the tasks, e.g. '-a age 30'",
+)
+@click.option("-s", "--service", is_flag=False, help="Service name")
+@click.option(
+    "-n",
+    "--requests",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of tasks to run, defaults to 100 unless --duration is set",
+)
+@click.option(
+    "--duration", type=click.FloatRange(min=0, min_open=True), help="Seconds to run"
+)
+@click.option(
+    "-c",
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+    help="Tasks running at once, or maximum number of connections with --rate",
+)
+@click.option(
+    "-r",
+    "--rate",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Start this many tasks per second regardless of completions (open loop)",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Create the tasks and consume their event streams before getting the results",
+)
+@click.option(
+    "--soak",
+    is_flag=True,
+    help="Sample the memory of the API Server during the run, requires --duration",
+)
+@click.option(
+    "--sample-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=10.0,
+    show_default=True,
+    help="Seconds between two memory samples in soak mode",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON")
+def bench(
+    config_profile: ConfigProfile,
+    deployment: str,
+    arg: tuple[tuple[str, str]],
+    service: str | None,
+    requests: int | None,
+    duration: float | None,
+    concurrency: int,
+    rate: float | None,
+    stream: bool,
+    soak: bool,
+    sample_interval: float,
+    as_json: bool,
+) -> None:
+    """Drive a deployment with concurrent tasks and report its performance.
+
+    Server-side process metrics are scraped from /status/metrics when the
+    API Server exposes them.
+    """
+    import asyncio
+
+    import httpx
+
+    from .internal.bench import LoadGenerator, MemorySample
+
+    if soak and duration is None:
+        raise click.UsageError("--soak requires --duration")
+    if requests is None and duration is None:
+        requests = 100
+
+    task: dict = {"input": json.dumps(dict(arg))}
+    if service:
+        task["service_id"] = service
+
+    def print_sample(sample: MemorySample) -> None:
+        if as_json:
+            return
+        rss = "n/a" if sample.rss_bytes is None else f"{sample.rss_bytes / 2**20:.1f}MB"
+        click.echo(
+            f"[{sample.elapsed_seconds:7.1f}s] rss={rss} completed={sample.completed}"
+        )
+
+    async def _run() -> str:
+        # A single client, so that connections are pooled and reused across tasks
+        async with httpx.AsyncClient(
+            base_url=config_profile.server,
+            verify=not config_profile.insecure,
+            timeout=config_profile.timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+        ) as client:
+            generator = LoadGenerator(client, deployment, task, stream=stream)
+            report = await generator.run(
+                concurrency,
+                requests=requests,
+                duration=duration,
+                rate=rate,
+                sample_interval=sample_interval if soak else None,
+                on_sample=print_sample,
+            )
+        if as_json:
+            return report.model_dump_json(indent=2)
+        return _format_report(report)
+
+    click.echo(asyncio.run(_run()))
+
+
+def _format_report(report: "BenchReport") -> str:
+    from .internal.bench import HISTOGRAM_BUCKETS_MS
+
+    lines = [
+        f"Mode:        {report.mode} loop",
+        f"Duration:    {report.duration_seconds:.2f}s",
+        f"Tasks:       {report.completed} ({report.throughput:.1f} successful/s)",
+        f"Errors:      {sum(report.errors.values())} ({report.error_rate:.1%})",
+    ]
+    for error, count in sorted(report.errors.items()):
+        lines.append(f"  {error}: {count}")
+    if report.events:
+        lines.append(f"Events:      {report.events}")
+
+    latency = report.latency
+    lines.append(
+        f"Latency:     mean {latency.mean_ms:.1f}ms, p50 {latency.p50_ms:.1f}ms, "
+        f"p90 {latency.p90_ms:.1f}ms, p95 {latency.p95_ms:.1f}ms, "
+        f"p99 {latency.p99_ms:.1f}ms, max {latency.max_ms:.1f}ms"
+    )
+    total = sum(latency.histogram.values())
+    for bound, count in latency.histogram.items():
+        if count:
+            label = (
+                f"> {HISTOGRAM_BUCKETS_MS[-1]}ms"
+                if bound == "+Inf"
+                else f"<= {bound}ms"
+            )
+            bar = "#" * max(1, round(40 * count / total))
+            lines.append(f"  {label:>10} {count:>7} {bar}")
+
+    before, after = report.server_metrics_before, report.server_metrics_after
+    if after:
+        lines.append("Server:")
+        rss = after.get("process_resident_memory_bytes")
+        if rss is not None:
+            delta = rss - before.get("process_resident_memory_bytes", rss)
+            lines.append(f"  rss:       {rss / 2**20:.1f}MB ({delta / 2**20:+.1f}MB)")
+        cpu = after.get("process_cpu_seconds_total")
+        if cpu is not None:
+            used = cpu - before.get("process_cpu_seconds_total", cpu)
+            lines.append(f"  cpu:       {used:.2f}s")
+        fds = after.get("process_open_fds")
+        if fds is not None:
+            lines.append(f"  open fds:  {fds:.0f}")
+    else:
+        lines.append("Server:      metrics not available")
+
+    if report.memory_growth_rate is not None:
+        lines.append(
+            f"Memory growth: {report.memory_growth_rate / 2**20:+.1f}MB/h "
+            f"over {len(report.memory_samples)} samples"
+        )
+    return "\n".join(lines)
@@ -1,7 +1,5 @@
 import click
 from pydantic import AnyHttpUrl
-from rich.console import Console
-from rich.table import Table
 
 from .internal.config import Config, load_config
 
@@ -42,6 +40,9 @@ def get_profiles(
     config: Config,
 ) -> None:
     """List all available configuration profiles."""
+    from rich.console import Console
+    from rich.table import Table
+
     table = Table(box=None)
     table.add_column("Current")
     table.add_column("Profile")
@@ -2,8 +2,6 @@ from pathlib import Path
 
 import click
 
-from llama_deploy.client import Client
-
 from .internal.config import ConfigProfile
 
 
@@ -26,6 +24,8 @@ def deploy(
     base_path: Path | None,
 ) -> None:
     """Create or reload a deployment."""
+    from llama_deploy.client import Client
+
     client = Client(
         api_server_url=config_profile.server,
         disable_ssl=config_profile.insecure,
@@ -106,8 +106,12 @@ def init(
         by_alias=True,
         exclude={  # type: ignore
             "control_plane": ["running", "internal_host", "internal_port"],
-            "services": {"__all__": ["host", "port", "ts_dependencies"]},
-            "ui": ["host", "port", "python_dependencies"],
+            "services": {
+                "__all__": ["host", "port", "ts_dependencies", "cache", "timeout"]
+            },
+            "ui": ["host", "port", "python_dependencies", "cache", "timeout"],
+            "ingestion": True,
+            "event_sink": True,
         },
     )
     write_yaml_with_comments(deployment_path, deployment_dict, deployment_config)
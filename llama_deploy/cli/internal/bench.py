@@ -0,0 +1,309 @@
+import asyncio
+import bisect
+import json
+import time
+from collections import Counter
+from typing import Callable
+
+import httpx
+from pydantic import BaseModel, Field
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+# Server side metrics reported by the Prometheus process collector
+PROCESS_METRICS = (
+    "process_resident_memory_bytes",
+    "process_cpu_seconds_total",
+    "process_open_fds",
+)
+RSS_METRIC = "process_resident_memory_bytes"
+
+
+class LatencyStats(BaseModel):
+    """Latency of the successful tasks, in milliseconds."""
+
+    mean_ms: float = 0.0
+    p50_ms: float = 0.0
+    p90_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+    # Number of tasks whose latency is up to the bucket bound, "+Inf" for the others
+    histogram: dict[str, int] = Field(default_factory=dict)
+
+    @classmethod
+    def from_latencies(cls, latencies: list[float]) -> "LatencyStats":
+        if not latencies:
+            return cls()
+
+        latencies = sorted(latencies)
+
+        def percentile(q: float) -> float:
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+        counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for latency in latencies:
+            counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, latency)] += 1
+        labels = [str(b) for b in HISTOGRAM_BUCKETS_MS] + ["+Inf"]
+
+        return cls(
+            mean_ms=sum(latencies) / len(latencies),
+            p50_ms=percentile(0.5),
+            p90_ms=percentile(0.9),
+            p95_ms=percentile(0.95),
+            p99_ms=percentile(0.99),
+            max_ms=latencies[-1],
+            histogram=dict(zip(labels, counts)),
+        )
+
+
+class MemorySample(BaseModel):
+    """Resident memory of the API Server at some point of a run."""
+
+    elapsed_seconds: float
+    rss_bytes: float | None
+    completed: int
+
+
+class BenchReport(BaseModel):
+    mode: str
+    duration_seconds: float
+    completed: int
+    errors: dict[str, int]
+    error_rate: float
+    throughput: float
+    events: int
+    latency: LatencyStats
+    # Process metrics scraped from the API Server before and after the run
+    server_metrics_before: dict[str, float] = Field(default_factory=dict)
+    server_metrics_after: dict[str, float] = Field(default_factory=dict)
+    memory_samples: list[MemorySample] = Field(default_factory=list)
+    # Bytes per hour, estimated from the memory samples
+    memory_growth_rate: float | None = None
+
+
+def parse_metrics(text: str) -> dict[str, float]:
+    """Returns the process metrics found in a Prometheus text exposition."""
+    metrics = {}
+    for line in text.splitlines():
+        if line.startswith("#") or not line.strip():
+            continue
+        name, _, value = line.rpartition(" ")
+        if name in PROCESS_METRICS:
+            metrics[name] = float(value)
+    return metrics
+
+
+def growth_rate(samples: list[MemorySample]) -> float | None:
+    """Returns the slope of the least squares fit of the memory samples, in bytes per hour."""
+    points = [
+        (s.elapsed_seconds, s.rss_bytes) for s in samples if s.rss_bytes is not None
+    ]
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_m = sum(m for _, m in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return None
+    covariance = sum((t - mean_t) * (m - mean_m) for t, m in points)
+    return covariance / variance * 3600
+
+
+class LoadGenerator:
+    """Drives a deployment with tasks over a pool of HTTP connections.
+
+    In closed-loop mode a fixed number of workers run tasks back to back, so the
+    load adapts to how fast the server answers. In open-loop mode tasks are
+    started at a fixed rate regardless of completions, and their latency is
+    measured from the time they were scheduled, so that a slow server can't hide
+    the requests it delayed.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        deployment: str,
+        task: dict,
+        stream: bool = False,
+    ) -> None:
+        """Creates a LoadGenerator instance.
+
+        Args:
+            client: The client connected to the API Server, with a connection pool
+            deployment: The deployment receiving the tasks
+            task: The task definition to submit
+            stream: Create tasks and consume their events instead of waiting for the result
+        """
+        self._client = client
+        self._deployment = deployment
+        self._task = task
+        self._stream = stream
+        self._latencies: list[float] = []
+        self._errors: Counter[str] = Counter()
+        self._events = 0
+        self._issued = 0
+        self._completed = 0
+
+    async def run(
+        self,
+        concurrency: int,
+        requests: int | None = None,
+        duration: float | None = None,
+        rate: float | None = None,
+        sample_interval: float | None = None,
+        on_sample: Callable[[MemorySample], None] | None = None,
+    ) -> BenchReport:
+        """Runs tasks until `requests` were issued or `duration` seconds passed.
+
+        Args:
+            concurrency: Tasks running at once in closed loop, maximum number of
+                connections in open loop
+            requests: Number of tasks to run
+            duration: Seconds to run for
+            rate: Tasks started per second, enables the open loop
+            sample_interval: Seconds between two samples of the server memory,
+                no samples are taken if not set
+            on_sample: Called with every memory sample, as soon as it's taken
+        """
+        before = await self.scrape_metrics()
+        started_at = time.perf_counter()
+        deadline = started_at + duration if duration else None
+
+        def should_continue() -> bool:
+            if requests is not None and self._issued >= requests:
+                return False
+            return deadline is None or time.perf_counter() < deadline
+
+        samples: list[MemorySample] = []
+        sampler = None
+        if sample_interval:
+            sampler = asyncio.create_task(
+                self._sample_memory(started_at, sample_interval, samples, on_sample)
+            )
+
+        try:
+            if rate:
+                await self._open_loop(rate, should_continue)
+            else:
+                await self._closed_loop(concurrency, should_continue)
+        finally:
+            if sampler is not None:
+                sampler.cancel()
+
+        elapsed = time.perf_counter() - started_at
+        after = await self.scrape_metrics()
+        if sample_interval:
+            await self._take_sample(started_at, samples, on_sample)
+
+        errors = sum(self._errors.values())
+        return BenchReport(
+            mode="open" if rate else "closed",
+            duration_seconds=elapsed,
+            completed=self._completed,
+            errors=dict(self._errors),
+            error_rate=errors / self._completed if self._completed else 0.0,
+            throughput=(self._completed - errors) / elapsed if elapsed else 0.0,
+            events=self._events,
+            latency=LatencyStats.from_latencies(self._latencies),
+            server_metrics_before=before,
+            server_metrics_after=after,
+            memory_samples=samples,
+            memory_growth_rate=growth_rate(samples),
+        )
+
+    async def scrape_metrics(self) -> dict[str, float]:
+        """Returns the process metrics of the API Server, empty if Prometheus is disabled."""
+        try:
+            response = await self._client.get("/status/metrics")
+        except httpx.HTTPError:
+            return {}
+        if response.status_code != 200:
+            return {}
+        return parse_metrics(response.text)
+
+    async def _closed_loop(
+        self, concurrency: int, should_continue: Callable[[], bool]
+    ) -> None:
+        async def worker() -> None:
+            while should_continue():
+                self._issued += 1
+                await self._run_task(time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def _open_loop(
+        self, rate: float, should_continue: Callable[[], bool]
+    ) -> None:
+        started_at = time.perf_counter()
+        tasks = set()
+        while should_continue():
+            scheduled_at = started_at + self._issued / rate
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._issued += 1
+            task = asyncio.create_task(self._run_task(scheduled_at))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _run_task(self, started_at: float) -> None:
+        base_url = f"/deployments/{self._deployment}/tasks"
+        try:
+            if self._stream:
+                response = await self._client.post(
+                    f"{base_url}/create", json=self._task
+                )
+                response.raise_for_status()
+                task = response.json()
+                params = {"session_id": task["session_id"]}
+                async with self._client.stream(
+                    "GET", f"{base_url}/{task['task_id']}/events", params=params
+                ) as events:
+                    events.raise_for_status()
+                    async for line in events.aiter_lines():
+                        if line:
+                            self._events += 1
+                response = await self._client.get(
+                    f"{base_url}/{task['task_id']}/results", params=params
+                )
+            else:
+                response = await self._client.post(f"{base_url}/run", json=self._task)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self._errors[f"HTTP {e.response.status_code}"] += 1
+        except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+            self._errors[type(e).__name__] += 1
+        else:
+            self._latencies.append((time.perf_counter() - started_at) * 1000)
+        finally:
+            self._completed += 1
+
+    async def _sample_memory(
+        self,
+        started_at: float,
+        interval: float,
+        samples: list[MemorySample],
+        on_sample: Callable[[MemorySample], None] | None,
+    ) -> None:
+        while True:
+            await self._take_sample(started_at, samples, on_sample)
+            await asyncio.sleep(interval)
+
+    async def _take_sample(
+        self,
+        started_at: float,
+        samples: list[MemorySample],
+        on_sample: Callable[[MemorySample], None] | None,
+    ) -> None:
+        metrics = await self.scrape_metrics()
+        sample = MemorySample(
+            elapsed_seconds=time.perf_counter() - started_at,
+            rss_bytes=metrics.get(RSS_METRIC),
+            completed=self._completed,
+        )
+        samples.append(sample)
+        if on_sample is not None:
+            on_sample(sample)
@@ -0,0 +1,36 @@
+import importlib
+from typing import Any
+
+import click
+
+
+class LazyGroup(click.Group):
+    """A click group that imports its subcommands only when they are needed.
+
+    Subcommands are declared with the import path of the click command, in the form
+    `module:attribute`, so that running a command only pays the import cost of that
+    command and not the one of its siblings.
+    """
+
+    def __init__(
+        self, *args: Any, lazy_subcommands: dict[str, str] | None = None, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(super().list_commands(ctx) + list(self.lazy_subcommands.keys()))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name in self.lazy_subcommands:
+            return self._load_command(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load_command(self, cmd_name: str) -> click.Command:
+        module_name, attr_name = self.lazy_subcommands[cmd_name].split(":")
+        module = importlib.import_module(module_name)
+        cmd = getattr(module, attr_name)
+        if not isinstance(cmd, click.Command):
+            msg = f"Lazy loading of {self.lazy_subcommands[cmd_name]} failed, it's not a click command"
+            raise ValueError(msg)
+        return cmd
@@ -0,0 +1,86 @@
+from typing import IO
+
+import click
+
+from .internal.config import ConfigProfile
+
+
+@click.command()
+@click.pass_obj  # config_profile
+@click.option(
+    "-d", "--deployment", is_flag=False, help="Only keep the steps of this deployment"
+)
+@click.option(
+    "--duration",
+    type=click.FloatRange(min=0, min_open=True, max=300),
+    default=10.0,
+    show_default=True,
+    help="Seconds to profile for",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.001, max=1),
+    default=0.005,
+    show_default=True,
+    help="Seconds between two samples",
+)
+@click.option(
+    "--all-threads",
+    is_flag=True,
+    help="Sample every thread, not only the one running the event loop",
+)
+@click.option(
+    "-w", "--worker", is_flag=False, help="Profile this worker of a multi-worker server"
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the collapsed stacks to, defaults to stdout",
+)
+def profile(
+    config_profile: ConfigProfile,
+    deployment: str | None,
+    duration: float,
+    interval: float,
+    all_threads: bool,
+    worker: str | None,
+    output: IO[str],
+) -> None:
+    """Sample a CPU profile of the API Server.
+
+    The profile is written in the collapsed stacks format, ready for flamegraph.pl
+    or speedscope. The API Server must run with LLAMA_DEPLOY_APISERVER_DEBUG_PROFILING
+    enabled.
+    """
+    import httpx
+
+    params: dict = {
+        "duration": duration,
+        "interval": interval,
+        "all_threads": all_threads,
+    }
+    if deployment:
+        params["deployment"] = deployment
+    if worker:
+        params["worker_id"] = worker
+
+    click.echo(f"Profiling for {duration}s...", err=True)
+    try:
+        response = httpx.post(
+            f"{config_profile.server}/debug/profile",
+            params=params,
+            verify=not config_profile.insecure,
+            timeout=config_profile.timeout + duration,
+        )
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        raise click.ClickException(f"{str(e)} {e.response.text}")
+    except httpx.HTTPError as e:
+        raise click.ClickException(str(e))
+
+    output.write(response.text)
+    stacks = len(response.text.splitlines())
+    samples = response.headers.get("x-profile-samples", "?")
+    click.echo(f"Collected {samples} samples, {stacks} distinct stacks", err=True)
@@ -1,10 +1,4 @@
-import json
-
 import click
-import httpx
-
-from llama_deploy.client import Client
-from llama_deploy.types import TaskDefinition
 
 from .internal.config import ConfigProfile
 
@@ -34,13 +28,18 @@ def run(
     session_id: str,
 ) -> None:
     """Run tasks from a given service."""
+    import httpx
+
+    from llama_deploy.client import Client
+    from llama_deploy.types import TaskDefinition
+
     client = Client(
         api_server_url=config_profile.server,
         disable_ssl=config_profile.insecure,
         timeout=config_profile.timeout,
     )
 
-    payload = {"input": json.dumps(dict(arg))}
+    payload: dict = {"input": dict(arg)}
     if service:
         payload["service_id"] = service
     if session_id:
@@ -1,16 +1,22 @@
 import os
-import subprocess
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Optional
+from typing import Any
 
 import click
-from prometheus_client import start_http_server
-from tenacity import RetryError, Retrying, stop_after_attempt, wait_fixed
 
-from llama_deploy.apiserver.settings import settings
-from llama_deploy.client import Client
 
-RETRY_WAIT_SECONDS = 1
+def _set_apiserver_setting(name: str, value: Any) -> None:
+    """Overrides an API Server setting both in this process and in the worker processes.
+
+    The settings object of this process was already loaded, so it's updated directly;
+    worker processes spawned by uvicorn will load the value from the environment.
+    """
+    from llama_deploy.apiserver.settings import settings
+
+    setattr(settings, name, value)
+    os.environ[f"LLAMA_DEPLOY_APISERVER_{name.upper()}"] = str(value)
 
 
 @click.command()
@@ -19,51 +25,108 @@ RETRY_WAIT_SECONDS = 1
     required=False,
     type=click.Path(dir_okay=False, resolve_path=True, path_type=Path),  # type: ignore
 )
-def serve(deployment_file: Path | None) -> None:
+@click.option("--host", default=None, help="Bind socket to this host")
+@click.option("--port", default=None, type=int, help="Bind socket to this port")
+@click.option(
+    "--workers",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of worker processes",
+)
+@click.option(
+    "--loop",
+    default="auto",
+    show_default=True,
+    type=click.Choice(["auto", "asyncio", "uvloop"]),
+    help="Event loop implementation",
+)
+@click.option(
+    "--http",
+    default="auto",
+    show_default=True,
+    type=click.Choice(["auto", "h11", "httptools"]),
+    help="HTTP protocol implementation",
+)
+@click.option(
+    "--backlog",
+    default=2048,
+    show_default=True,
+    type=int,
+    help="Maximum number of connections to hold in backlog",
+)
+@click.option(
+    "--timeout-keep-alive",
+    default=5,
+    show_default=True,
+    type=int,
+    help="Close Keep-Alive connections if no new data is received within this timeout, in seconds",
+)
+@click.option(
+    "--limit-concurrency",
+    default=None,
+    type=int,
+    help="Maximum number of concurrent connections or tasks to allow before issuing HTTP 503 responses",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Reload the services of local deployments when their source files change",
+)
+def serve(
+    deployment_file: Path | None,
+    host: str | None,
+    port: int | None,
+    workers: int,
+    loop: str,
+    http: str,
+    backlog: int,
+    timeout_keep_alive: int,
+    limit_concurrency: int | None,
+    watch: bool,
+) -> None:
     """Run the API Server in the foreground."""
+    import uvicorn
+    from prometheus_client import start_http_server
+
+    from llama_deploy.apiserver.settings import settings
+
     if settings.prometheus_enabled:
         start_http_server(settings.prometheus_port)
 
-    env = os.environ.copy()
     if deployment_file:
-        env["LLAMA_DEPLOY_APISERVER_DEPLOYMENTS_PATH"] = str(deployment_file.parent)
+        # The API Server lifespan deploys the file at startup, using the sources in place
+        _set_apiserver_setting("rc_path", deployment_file.parent)
+        _set_apiserver_setting("deployment_file_path", deployment_file.name)
+        _set_apiserver_setting("deployments_path", deployment_file.parent)
+        _set_apiserver_setting("rc_local", True)
 
-    uvicorn_p = subprocess.Popen(
-        [
-            "uvicorn",
-            "llama_deploy.apiserver.app:app",
-            "--host",
-            "localhost",
-            "--port",
-            "4501",
-        ],
-        env=env,
-    )
+    if watch:
+        _set_apiserver_setting("watch", True)
 
-    if deployment_file:
-        client = Client()
-        retrying = Retrying(
-            stop=stop_after_attempt(5), wait=wait_fixed(RETRY_WAIT_SECONDS)
-        )
-        try:
-            for attempt in retrying:
-                with attempt:
-                    client.sync.apiserver.deployments.create(
-                        deployment_file.open("rb"),
-                        base_path=deployment_file.parent,
-                        local=True,
-                    )
-        except RetryError as e:
-            uvicorn_p.terminate()
-            last: Optional[BaseException] = e.last_attempt.exception(0)
-            last_msg = ""
-            if last is not None:
-                last_msg = ": " + (
-                    last.message if hasattr(last, "message") else str(last)
-                )
-            raise click.ClickException(f"Failed to create deployment{last_msg}")
+    state_dir = None
+    if workers > 1 and settings.shared_state_path is None:
+        # Worker processes need a common place where to share their state
+        state_dir = Path(tempfile.mkdtemp(prefix="llama_deploy_"))
+        _set_apiserver_setting("shared_state_path", state_dir / "state.db")
 
     try:
-        uvicorn_p.wait()
+        uvicorn.run(
+            "llama_deploy.apiserver.app:app",
+            host=host or settings.host,
+            port=port or settings.port,
+            workers=workers,
+            loop=loop,
+            http=http,
+            backlog=backlog,
+            timeout_keep_alive=timeout_keep_alive,
+            limit_concurrency=limit_concurrency,
+            # Close the connections still open, like event streams, so that the
+            # lifespan can drain the running tasks
+            timeout_graceful_shutdown=int(settings.shutdown_grace_period),
+        )
     except KeyboardInterrupt:
         print("Shutting down...")
+    finally:
+        if state_dir is not None:
+            shutil.rmtree(state_dir, ignore_errors=True)
@@ -1,7 +1,5 @@
 import click
 
-from llama_deploy.client import Client
-
 from .internal.config import ConfigProfile
 
 
@@ -22,6 +20,9 @@ def create(
     config_profile: ConfigProfile,
     deployment: str,
 ) -> None:
+    """Create a new session."""
+    from llama_deploy.client import Client
+
     client = Client(
         api_server_url=config_profile.server,
         disable_ssl=config_profile.insecure,
@@ -1,8 +1,5 @@
 import click
 
-from llama_deploy.client import Client
-from llama_deploy.types.apiserver import StatusEnum
-
 from .internal.config import ConfigProfile
 
 
@@ -10,6 +7,9 @@ from .internal.config import ConfigProfile
 @click.pass_obj  # config_profile
 def status(config_profile: ConfigProfile) -> None:
     """Print the API Server status."""
+    from llama_deploy.client import Client
+    from llama_deploy.types.apiserver import StatusEnum
+
     client = Client(
         api_server_url=config_profile.server,
         disable_ssl=config_profile.insecure,
@@ -1,8 +1,14 @@
-from typing import Any
+import asyncio
+from typing import Any, Literal
 
 import httpx
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from llama_deploy.types import payloads
+
+# Responses of a proxy or a server that can't handle the request right now
+RETRYABLE_STATUS_CODES = (502, 503, 504)
+
 
 class _BaseClient(BaseSettings):
     """Base type for clients, to be used in Pydantic models to avoid circular imports.
@@ -17,14 +23,70 @@ class _BaseClient(BaseSettings):
     disable_ssl: bool = False
     timeout: float | None = 120.0
     poll_interval: float = 0.5
+    # Only requests that are safe to repeat are retried, like task creation which
+    # gets an idempotency key
+    max_retries: int = 0
+    retry_backoff: float = 0.5
+    # Encoding of the task inputs, events and results, MessagePack requires msgpack
+    payload_format: Literal["json", "msgpack"] = "json"
 
     async def request(
-        self, method: str, url: str | httpx.URL, **kwargs: Any
+        self, method: str, url: str | httpx.URL, retries: int = 0, **kwargs: Any
     ) -> httpx.Response:
-        """Performs an async HTTP request using httpx."""
+        """Performs an async HTTP request using httpx.
+
+        The request is sent again up to `retries` times, with an exponential backoff,
+        on network errors, timeouts and 502, 503 or 504 responses. A `json` body is
+        encoded in `payload_format`, which the response is also asked for.
+        """
         verify = kwargs.pop("verify", True)
         timeout = kwargs.pop("timeout", self.timeout)
-        async with httpx.AsyncClient(verify=verify) as client:
-            response = await client.request(method, url, timeout=timeout, **kwargs)
-            response.raise_for_status()
-            return response
+        if self.payload_format == "msgpack":
+            kwargs["headers"] = {
+                "Accept": payloads.MSGPACK_MEDIA_TYPE,
+                **kwargs.get("headers", {}),
+            }
+        if "json" in kwargs:
+            media_type = (
+                payloads.MSGPACK_MEDIA_TYPE
+                if self.payload_format == "msgpack"
+                else payloads.JSON_MEDIA_TYPE
+            )
+            kwargs["content"] = payloads.dumps(kwargs.pop("json"), media_type)
+            kwargs["headers"] = {
+                "Content-Type": media_type,
+                **kwargs.get("headers", {}),
+            }
+        attempt = 0
+        while True:
+            try:
+                async with httpx.AsyncClient(verify=verify) as client:
+                    response = await client.request(
+                        method, url, timeout=timeout, **kwargs
+                    )
+                    response.raise_for_status()
+                    return response
+            except httpx.HTTPStatusError as e:
+                if (
+                    attempt >= retries
+                    or e.response.status_code not in RETRYABLE_STATUS_CODES
+                ):
+                    raise
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+            await asyncio.sleep(self.retry_backoff * 2**attempt)
+            attempt += 1
+
+
+def decode_response(response: httpx.Response) -> Any:
+    """Decodes the body of a response, sent as JSON or MessagePack.
+
+    Streamed task results are returned as bytes.
+    """
+    content_type = response.headers.get("content-type")
+    if payloads.is_msgpack(content_type):
+        return payloads.loads(response.content, payloads.MSGPACK_MEDIA_TYPE)
+    if content_type == "application/octet-stream":
+        return response.content
+    return response.json()
@@ -6,25 +6,41 @@ Server must be up and its URL (by default `http://localhost:4501`)
 reachable by the host executing the client code.
 """
 
+from __future__ import annotations
+
 import asyncio
 import json
-from typing import Any, AsyncGenerator, TextIO
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncGenerator, AsyncIterable, BinaryIO, TextIO
 
 import httpx
 from pydantic import Field
-from workflows.context import JsonSerializer
-from workflows.events import Event
-
-from llama_deploy.types.apiserver import Status, StatusEnum
-from llama_deploy.types.core import (
-    EventDefinition,
-    SessionDefinition,
-    TaskDefinition,
-    TaskResult,
+
+from llama_deploy.types import payloads
+from llama_deploy.types.apiserver import (
+    TASK_TIMEOUT_HEADER,
+    ArtifactDefinition,
+    Status,
+    StatusEnum,
 )
 
+from ..base import decode_response
 from .model import Collection, Model
 
+if TYPE_CHECKING:
+    from workflows.events import Event
+
+    from llama_deploy.types.core import (
+        EventDefinition,
+        SessionDefinition,
+        TaskDefinition,
+        TaskResult,
+    )
+
+# Note: `workflows` and `llama_deploy.types.core` (which depends on llama_index) are
+# imported where needed, so that importing the client stays cheap.
+
 
 class SessionCollection(Collection):
     """A model representing a collection of session for a given deployment."""
@@ -54,6 +70,8 @@ class SessionCollection(Collection):
 
     async def create(self) -> SessionDefinition:
         """Create a new session."""
+        from llama_deploy.types.core import SessionDefinition
+
         create_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/sessions/create"
 
         r = await self.client.request(
@@ -81,6 +99,8 @@ class SessionCollection(Collection):
 
     async def get(self, id: str) -> SessionDefinition:
         """Gets a deployment by id."""
+        from llama_deploy.types.core import SessionDefinition
+
         get_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/sessions/{id}"
         await self.client.request(
             "GET",
@@ -102,6 +122,8 @@ class Task(Model):
 
     async def results(self) -> TaskResult | None:
         """Returns the result of a given task."""
+        from llama_deploy.types.core import TaskResult
+
         results_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/results"
 
         r = await self.client.request(
@@ -111,17 +133,39 @@ class Task(Model):
             params={"session_id": self.session_id},
             timeout=self.client.timeout,
         )
-        if r.json():
-            return TaskResult.model_validate(r.json())
+        result = decode_response(r)
+        if result:
+            return TaskResult.model_validate(result)
         return None
 
+    async def cancel(self) -> bool:
+        """Cancels the task, returns False if it had already completed."""
+        cancel_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/cancel"
+
+        try:
+            await self.client.request(
+                "POST",
+                cancel_url,
+                verify=not self.client.disable_ssl,
+                timeout=self.client.timeout,
+            )
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 409:
+                raise
+            return False
+        return True
+
     async def send_event(self, ev: Event, service_name: str) -> EventDefinition:
         """Sends a human response event."""
+        from workflows.context import JsonSerializer
+
+        from llama_deploy.types.core import EventDefinition
+
         url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/events"
 
         serializer = JsonSerializer()
         event_def = EventDefinition(
-            event_obj_str=serializer.serialize(ev), service_id=service_name
+            event_obj=json.loads(serializer.serialize(ev)), service_id=service_name
         )
 
         r = await self.client.request(
@@ -129,14 +173,17 @@ class Task(Model):
             url,
             verify=not self.client.disable_ssl,
             params={"session_id": self.session_id},
-            json=event_def.model_dump(),
+            json=event_def.model_dump(exclude_none=True),
             timeout=self.client.timeout,
         )
-        return EventDefinition.model_validate(r.json())
+        return EventDefinition.model_validate(decode_response(r))
 
     async def events(self) -> AsyncGenerator[dict[str, Any], None]:  # pragma: no cover
         """Returns a generator object to consume the events streamed from a service."""
         events_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/{self.id}/events"
+        headers = {}
+        if self.client.payload_format == "msgpack":
+            headers["Accept"] = payloads.MSGPACK_MEDIA_TYPE
 
         while True:
             try:
@@ -144,12 +191,22 @@ class Task(Model):
                     verify=not self.client.disable_ssl
                 ) as client:
                     async with client.stream(
-                        "GET", events_url, params={"session_id": self.session_id}
+                        "GET",
+                        events_url,
+                        params={"session_id": self.session_id},
+                        headers=headers,
                     ) as response:
                         response.raise_for_status()
-                        async for line in response.aiter_lines():
-                            json_line = json.loads(line)
-                            yield json_line
+                        if payloads.is_msgpack(response.headers.get("content-type")):
+                            unpacker = payloads.msgpack_unpacker()
+                            async for chunk in response.aiter_bytes():
+                                unpacker.feed(chunk)
+                                for event in unpacker:
+                                    yield event
+                        else:
+                            async for line in response.aiter_lines():
+                                json_line = json.loads(line)
+                                yield json_line
                         break  # Exit the function if successful
             except httpx.HTTPStatusError as e:
                 if e.response.status_code != 404:
@@ -164,11 +221,12 @@ class TaskCollection(Collection):
         description="The ID of the deployment these tasks belong to."
     )
 
-    async def run(self, task: TaskDefinition) -> Any:
+    async def run(self, task: TaskDefinition, timeout: float | None = None) -> Any:
         """Runs a task and returns the results once it's done.
 
         Args:
             task: The definition of the task we want to run.
+            timeout: Seconds after which the server cancels the task if still running.
         """
         run_url = (
             f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/run"
@@ -176,28 +234,47 @@ class TaskCollection(Collection):
         if task.session_id:
             run_url += f"?session_id={task.session_id}"
 
+        headers = {}
+        if timeout is not None:
+            headers[TASK_TIMEOUT_HEADER] = str(timeout)
         r = await self.client.request(
             "POST",
             run_url,
             verify=not self.client.disable_ssl,
             json=task.model_dump(),
+            headers=headers,
             timeout=self.client.timeout,
         )
 
-        return r.json()
+        return decode_response(r)
 
-    async def create(self, task: TaskDefinition) -> Task:
-        """Runs a task returns it immediately, without waiting for the results."""
+    async def create(self, task: TaskDefinition, timeout: float | None = None) -> Task:
+        """Runs a task returns it immediately, without waiting for the results.
+
+        When the client retries requests, the task gets an idempotency key if it has
+        none, so that a retried request doesn't start the task twice.
+
+        Args:
+            task: The definition of the task we want to run.
+            timeout: Seconds after which the server cancels the task if still running.
+        """
         create_url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/tasks/create"
 
+        if self.client.max_retries and task.idempotency_key is None:
+            task = task.model_copy(update={"idempotency_key": str(uuid.uuid4())})
+        headers = {}
+        if timeout is not None:
+            headers[TASK_TIMEOUT_HEADER] = str(timeout)
         r = await self.client.request(
             "POST",
             create_url,
+            retries=self.client.max_retries,
             verify=not self.client.disable_ssl,
             json=task.model_dump(),
+            headers=headers,
             timeout=self.client.timeout,
         )
-        response_fields = r.json()
+        response_fields = decode_response(r)
 
         model_class = self._prepare(Task)
         return model_class(
@@ -234,6 +311,129 @@ class TaskCollection(Collection):
         )
 
 
+# Size of the chunks read from the files uploaded
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def _read_chunks(f: BinaryIO) -> AsyncGenerator[bytes, None]:
+    while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+async def _download_chunks(
+    url: str, verify: bool, timeout: float | None, start: int, end: int | None
+) -> AsyncGenerator[bytes, None]:
+    headers = {}
+    if start or end is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+    async with httpx.AsyncClient(verify=verify) as client:
+        async with client.stream(
+            "GET", url, headers=headers, timeout=timeout
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+
+class ArtifactCollection(Collection):
+    """A model representing the artifacts of a given deployment."""
+
+    deployment_id: str = Field(
+        description="The ID of the deployment the artifacts belong to."
+    )
+
+    async def upload(
+        self, source: str | Path | BinaryIO | AsyncIterable[bytes]
+    ) -> ArtifactDefinition:
+        """Uploads a file, streamed in chunks, and returns the artifact storing it.
+
+        Pass `artifact.ref()` in the input of a task to give the artifact to the
+        workflow.
+
+        Args:
+            source: The path of the file, a file opened in binary mode or an async
+                iterable of bytes.
+        """
+        if isinstance(source, (str, Path)):
+            with open(source, "rb") as f:
+                return await self._upload(_read_chunks(f))
+        if isinstance(source, AsyncIterable):
+            return await self._upload(source)
+        return await self._upload(_read_chunks(source))
+
+    async def stream(
+        self, artifact_id: str, start: int = 0, end: int | None = None
+    ) -> AsyncGenerator[bytes, None]:
+        """Returns a generator of the chunks of an artifact, as they're downloaded.
+
+        Args:
+            artifact_id: The id of the artifact.
+            start: The offset of the first byte to download.
+            end: The offset of the last byte to download, included. Defaults to the
+                end of the artifact.
+        """
+        async for chunk in _download_chunks(
+            self._url(artifact_id),
+            not self.client.disable_ssl,
+            self.client.timeout,
+            start,
+            end,
+        ):
+            yield chunk
+
+    async def download(
+        self,
+        artifact_id: str,
+        destination: str | Path | BinaryIO,
+        start: int = 0,
+        end: int | None = None,
+    ) -> int:
+        """Downloads an artifact to a file without holding it in memory.
+
+        Returns the number of bytes written.
+
+        Args:
+            artifact_id: The id of the artifact.
+            destination: The path of the file to write, or a file opened in binary mode.
+            start: The offset of the first byte to download.
+            end: The offset of the last byte to download, included.
+        """
+        if isinstance(destination, (str, Path)):
+            with open(destination, "wb") as f:
+                return await self._download(artifact_id, f, start, end)
+        return await self._download(artifact_id, destination, start, end)
+
+    def _url(self, artifact_id: str = "") -> str:
+        url = f"{self.client.api_server_url}/deployments/{self.deployment_id}/artifacts"
+        return f"{url}/{artifact_id}" if artifact_id else url
+
+    async def _upload(self, content: AsyncIterable[bytes]) -> ArtifactDefinition:
+        r = await self.client.request(
+            "POST",
+            self._url(),
+            content=content,
+            headers={"Content-Type": "application/octet-stream"},
+            verify=not self.client.disable_ssl,
+            timeout=self.client.timeout,
+        )
+        return ArtifactDefinition.model_validate(decode_response(r))
+
+    async def _download(
+        self, artifact_id: str, f: BinaryIO, start: int, end: int | None
+    ) -> int:
+        size = 0
+        async for chunk in _download_chunks(
+            self._url(artifact_id),
+            not self.client.disable_ssl,
+            self.client.timeout,
+            start,
+            end,
+        ):
+            await asyncio.to_thread(f.write, chunk)
+            size += len(chunk)
+        return size
+
+
 class Deployment(Model):
     """A model representing a deployment."""
 
@@ -251,6 +451,13 @@ class Deployment(Model):
         coll_model_class = self._prepare(SessionCollection)
         return coll_model_class(client=self.client, deployment_id=self.id, items={})
 
+    @property
+    def artifacts(self) -> ArtifactCollection:
+        """Returns a collection of the artifacts uploaded to the given deployment."""
+
+        model_class = self._prepare(ArtifactCollection)
+        return model_class(client=self.client, deployment_id=self.id, items={})
+
 
 class DeploymentCollection(Collection):
     """A model representing a collection of deployments currently active."""
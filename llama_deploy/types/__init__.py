@@ -1,13 +1,50 @@
-from .apiserver import DeploymentDefinition, Status, StatusEnum
-from .core import (
-    ChatMessage,
-    EventDefinition,
-    SessionDefinition,
-    TaskDefinition,
-    TaskResult,
-    generate_id,
+from typing import TYPE_CHECKING, Any
+
+from .apiserver import (
+    AllocationStat,
+    ArtifactDefinition,
+    AutodeployStatus,
+    BlockedLoop,
+    DeploymentDefinition,
+    DeploymentMemory,
+    DeploymentStartupProfile,
+    LoopStatus,
+    MemoryReport,
+    ServiceStartupProfile,
+    Status,
+    StatusEnum,
 )
 
+if TYPE_CHECKING:
+    from .core import (
+        ChatMessage,
+        EventDefinition,
+        SessionDefinition,
+        TaskDefinition,
+        TaskResult,
+        generate_id,
+    )
+
+# The models in `core` depend on llama_index, which is slow to import: load them
+# on first access so that lightweight consumers like `llamactl` don't pay the price.
+_CORE_NAMES = {
+    "ChatMessage",
+    "EventDefinition",
+    "SessionDefinition",
+    "TaskDefinition",
+    "TaskResult",
+    "generate_id",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _CORE_NAMES:
+        from . import core
+
+        return getattr(core, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "ChatMessage",
     "EventDefinition",
@@ -15,7 +52,16 @@ __all__ = [
     "TaskDefinition",
     "TaskResult",
     "generate_id",
+    "AllocationStat",
+    "ArtifactDefinition",
+    "AutodeployStatus",
+    "BlockedLoop",
     "DeploymentDefinition",
+    "DeploymentMemory",
+    "DeploymentStartupProfile",
+    "LoopStatus",
+    "MemoryReport",
+    "ServiceStartupProfile",
     "Status",
     "StatusEnum",
 ]
@@ -1,6 +1,12 @@
+from datetime import datetime
 from enum import Enum
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# Request header carrying the seconds a task can run for before being cancelled
+TASK_TIMEOUT_HEADER = "X-Task-Timeout"
+# Key of the task input values referring to an artifact, e.g. {"$artifact": "<id>"}
+ARTIFACT_REF_KEY = "$artifact"
 
 
 class StatusEnum(Enum):
@@ -9,12 +15,89 @@ class StatusEnum(Enum):
     DOWN = "Down"
 
 
+class AutodeployStatus(BaseModel):
+    repo_url: str
+    ref: str | None = None
+    sha: str | None = None
+    last_reload_seconds: float | None = None
+    last_error: str | None = None
+
+
 class Status(BaseModel):
     status: StatusEnum
     status_message: str
     max_deployments: int | None = None
     deployments: list[str] | None = None
+    autodeploy: AutodeployStatus | None = None
 
 
 class DeploymentDefinition(BaseModel):
     name: str
+
+
+class ArtifactDefinition(BaseModel):
+    artifact_id: str
+    size_bytes: int
+    # Where to download the artifact from, relative to the API Server URL
+    url: str
+
+    def ref(self) -> dict[str, str]:
+        """Returns the value referring to this artifact in a task input."""
+        return {ARTIFACT_REF_KEY: self.artifact_id}
+
+
+class ServiceStartupProfile(BaseModel):
+    service_id: str
+    sync_seconds: float = 0.0
+    install_seconds: float = 0.0
+    import_seconds: float | None = None
+    modules: dict[str, float] = Field(default_factory=dict)
+
+
+class DeploymentStartupProfile(BaseModel):
+    name: str
+    services: list[ServiceStartupProfile]
+
+
+class AllocationStat(BaseModel):
+    location: str
+    size_bytes: int
+    count: int
+    # Change since the previous snapshot, only set when diffing
+    size_diff_bytes: int | None = None
+    count_diff: int | None = None
+
+
+class DeploymentMemory(BaseModel):
+    name: str
+    # Number of entries in each registry kept by the deployment
+    registries: dict[str, int]
+    # Number of objects reachable from the deployment, by type
+    objects: dict[str, int]
+
+
+class MemoryReport(BaseModel):
+    tracing: bool
+    traced_current_bytes: int | None = None
+    traced_peak_bytes: int | None = None
+    sys_path_entries: int
+    modules: int
+    # Number of objects tracked by the garbage collector, by type
+    objects: dict[str, int]
+    top_allocations: list[AllocationStat] = Field(default_factory=list)
+    deployments: list[DeploymentMemory] = Field(default_factory=list)
+
+
+class BlockedLoop(BaseModel):
+    at: datetime
+    lag_seconds: float
+    # The deployment, service and step blocking the loop, when running a workflow
+    label: str | None = None
+    stack: list[str]
+
+
+class LoopStatus(BaseModel):
+    interval_seconds: float
+    last_lag_seconds: float
+    max_lag_seconds: float
+    blocked: list[BlockedLoop] = Field(default_factory=list)
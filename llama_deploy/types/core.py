@@ -1,7 +1,9 @@
+import json
 import uuid
+from typing import Any
 
 from llama_index.core.llms import ChatMessage
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 def generate_id() -> str:
@@ -13,8 +15,9 @@ class TaskDefinition(BaseModel):
     The definition and state of a task.
 
     Attributes:
-        input (str):
-            The task input.
+        input (str | dict):
+            The task input: the keyword arguments of the workflow, either as a
+            dict or serialized as a JSON string.
         session_id (str):
             The session ID that the task belongs to.
         task_id (str):
@@ -22,12 +25,22 @@ class TaskDefinition(BaseModel):
         service_id (str):
             The service ID that the task should be sent to.
             If blank, the orchestrator decides.
+        idempotency_key (str):
+            Optional key making task creation safe to retry: creating another task
+            with the same key returns the existing task instead of starting a new one.
     """
 
-    input: str
+    input: str | dict[str, Any]
     task_id: str = Field(default_factory=generate_id)
     session_id: str | None = None
     service_id: str | None = None
+    idempotency_key: str | None = None
+
+    def run_kwargs(self) -> dict[str, Any]:
+        """Returns the keyword arguments to run the workflow with."""
+        if isinstance(self.input, dict):
+            return self.input
+        return json.loads(self.input) if self.input else {}
 
 
 class SessionDefinition(BaseModel):
@@ -55,11 +68,20 @@ class EventDefinition(BaseModel):
     Events.
 
     Attributes:
-        event_object_str (str): serialized string of event.
+        event_obj_str (str): serialized string of event.
+        event_obj (dict): the event serialized as a structure, saving a nested
+            JSON string. Either this or `event_obj_str` must be set.
     """
 
     service_id: str
-    event_obj_str: str
+    event_obj_str: str | None = None
+    event_obj: dict[str, Any] | None = None
+
+    @model_validator(mode="after")
+    def validate_event(self) -> "EventDefinition":
+        if self.event_obj_str is None and self.event_obj is None:
+            raise ValueError("Either event_obj_str or event_obj must be set")
+        return self
 
 
 class TaskResult(BaseModel):
@@ -0,0 +1,139 @@
+"""Encoding of the request and response bodies exchanged with the API Server.
+
+Bodies are JSON by default, or MessagePack when the `Content-Type` of a request or
+the `Accept` header of a client asks for it and `msgpack` is installed. JSON is
+encoded with `orjson` when it's installed, which is several times faster than the
+standard library on large payloads.
+
+MessagePack bodies can carry binary values, which JSON can't: they're written as
+base64 with `encode_binary` in JSON bodies and wherever the API Server persists or
+hashes a task input as JSON, and restored with `decode_binary`.
+"""
+
+import base64
+import importlib.util
+import json
+from functools import cache
+from types import ModuleType
+from typing import Any
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Media types used for MessagePack before it got registered
+_MSGPACK_MEDIA_TYPES = {
+    MSGPACK_MEDIA_TYPE,
+    "application/x-msgpack",
+    "application/vnd.msgpack",
+}
+# Key of the binary values of a task input written as JSON, e.g. {"$bytes": "<base64>"}
+BYTES_KEY = "$bytes"
+
+
+def _msgpack() -> ModuleType:
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError(
+            "MessagePack payloads require msgpack, install it with `pip install llama-deploy[msgpack]`"
+        ) from e
+    return msgpack
+
+
+@cache
+def msgpack_available() -> bool:
+    return importlib.util.find_spec("msgpack") is not None
+
+
+@cache
+def _orjson() -> ModuleType | None:
+    try:
+        import orjson
+    except ImportError:
+        return None
+    return orjson
+
+
+def msgpack_unpacker() -> Any:
+    """Returns a decoder of a stream of MessagePack objects, fed chunk by chunk."""
+    return _msgpack().Unpacker()
+
+
+def is_msgpack(content_type: str | None) -> bool:
+    """Whether a `Content-Type` header designates a MessagePack body."""
+    if not content_type:
+        return False
+    return content_type.split(";", 1)[0].strip().lower() in _MSGPACK_MEDIA_TYPES
+
+
+def negotiate(accept: str | None) -> str:
+    """Returns the media type of a response, given the `Accept` header of the request.
+
+    MessagePack is only used when the client prefers it to JSON and msgpack is
+    installed, anything else gets JSON.
+    """
+    if not accept or not msgpack_available():
+        return JSON_MEDIA_TYPE
+
+    best, best_quality = JSON_MEDIA_TYPE, 0.0
+    for entry in accept.split(","):
+        media_type, *params = entry.split(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= best_quality:
+            continue
+        if media_type in _MSGPACK_MEDIA_TYPES:
+            best, best_quality = MSGPACK_MEDIA_TYPE, quality
+        elif media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            best, best_quality = JSON_MEDIA_TYPE, quality
+    return best
+
+
+def dumps(data: Any, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """Encodes a payload in the given media type."""
+    if is_msgpack(media_type):
+        return _msgpack().packb(data)
+
+    orjson = _orjson()
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                data, default=encode_binary, option=orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            # Integers wider than 64 bits, or values the standard library also rejects
+            pass
+    return json.dumps(
+        data, ensure_ascii=False, separators=(",", ":"), default=encode_binary
+    ).encode()
+
+
+def encode_binary(value: Any) -> Any:
+    """`default` of `json.dumps`, writes binary values as base64."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {BYTES_KEY: base64.b64encode(value).decode()}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def decode_binary(obj: dict[str, Any]) -> Any:
+    """`object_hook` of `json.loads`, restores the values written by `encode_binary`."""
+    if len(obj) == 1 and isinstance(obj.get(BYTES_KEY), str):
+        return base64.b64decode(obj[BYTES_KEY])
+    return obj
+
+
+def loads(data: bytes, media_type: str | None = JSON_MEDIA_TYPE) -> Any:
+    """Decodes a payload of the given media type, straight from the bytes received.
+
+    JSON is decoded by the standard library, `orjson` would turn integers wider
+    than 64 bits into floats.
+    """
+    if is_msgpack(media_type):
+        return _msgpack().unpackb(data)
+    return json.loads(data)
@@ -19,12 +19,12 @@ class SmallWorkflow(Workflow):
 
 
 @pytest.fixture
-def mock_importlib() -> Iterator[None]:
+def mock_importlib() -> Iterator[mock.MagicMock]:
     with mock.patch("llama_deploy.apiserver.deployment.importlib") as importlib:
         importlib.import_module.return_value = mock.MagicMock(
             my_workflow=SmallWorkflow()
         )
-        yield
+        yield importlib
 
 
 @pytest.fixture
@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+from typing import Any
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from llama_deploy.apiserver.profiling import LoopLagMonitor, MemoryProfiler
+from llama_deploy.apiserver.settings import settings
+from llama_deploy.types.apiserver import BlockedLoop
+
+
+def test_memory_disabled(http_client: TestClient) -> None:
+    response = http_client.get("/debug/memory")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Memory debugging is disabled"}
+
+
+def test_memory(http_client: TestClient) -> None:
+    deployment = mock.MagicMock()
+    deployment.name = "test-deployment"
+    deployment.registry_sizes = {"contexts": 2, "handlers": 3}
+    profiler = MemoryProfiler()
+    profiler.start()
+    try:
+        with (
+            mock.patch("llama_deploy.apiserver.server.memory_profiler", profiler),
+            mock.patch(
+                "llama_deploy.apiserver.routers.debug.manager"
+            ) as mocked_manager,
+        ):
+            mocked_manager._deployments = {"test-deployment": deployment}
+            response = http_client.get("/debug/memory?limit=5&diff=true")
+            not_found = http_client.get("/debug/memory?deployment=other")
+    finally:
+        profiler.stop()
+
+    assert response.status_code == 200
+    report = response.json()
+    assert report["tracing"] is True
+    assert report["traced_peak_bytes"] >= report["traced_current_bytes"] > 0
+    assert report["modules"] > 0
+    assert len(report["objects"]) == 5
+    assert 0 < len(report["top_allocations"]) <= 5
+    assert report["top_allocations"][0]["size_diff_bytes"] is not None
+    assert report["deployments"][0]["name"] == "test-deployment"
+    assert report["deployments"][0]["registries"] == {"contexts": 2, "handlers": 3}
+    assert 0 < len(report["deployments"][0]["objects"]) <= 5
+
+    assert not_found.status_code == 404
+    assert not_found.json() == {"detail": "Deployment not found"}
+
+
+def test_profile_disabled(http_client: TestClient) -> None:
+    response = http_client.post("/debug/profile")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Profiling is disabled"}
+
+
+def test_profile(http_client: TestClient, monkeypatch: Any) -> None:
+    monkeypatch.setattr(settings, "debug_profiling", True)
+
+    response = http_client.post("/debug/profile?duration=0.1&interval=0.001")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert int(response.headers["x-profile-samples"]) > 0
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("[")
+        assert int(count) > 0
+
+    response = http_client.post("/debug/profile?deployment=unknown")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Deployment not found"}
+
+    response = http_client.post("/debug/profile?duration=301")
+    assert response.status_code == 422
+
+
+def test_profile_already_running(http_client: TestClient, monkeypatch: Any) -> None:
+    monkeypatch.setattr(settings, "debug_profiling", True)
+
+    with mock.patch("llama_deploy.apiserver.routers.debug._profile_lock") as lock:
+        lock.locked.return_value = True
+        response = http_client.post("/debug/profile")
+
+    assert response.status_code == 409
+    assert response.json() == {"detail": "A profile is already running"}
+
+
+def test_loop(http_client: TestClient, monkeypatch: Any) -> None:
+    monkeypatch.setattr(settings, "debug_profiling", True)
+    monitor = LoopLagMonitor(interval=0.5)
+    monitor.last_lag = 0.1
+    monitor.max_lag = 2.0
+    monitor.blocked.append(
+        BlockedLoop(
+            at=datetime(2025, 1, 1, tzinfo=timezone.utc),
+            lag_seconds=2.0,
+            label="test-deployment/svc/step",
+            stack=['  File "app.py", line 10, in step'],
+        )
+    )
+
+    with mock.patch("llama_deploy.apiserver.server.loop_monitor", monitor):
+        response = http_client.get("/debug/loop")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "interval_seconds": 0.5,
+        "last_lag_seconds": 0.1,
+        "max_lag_seconds": 2.0,
+        "blocked": [
+            {
+                "at": "2025-01-01T00:00:00Z",
+                "lag_seconds": 2.0,
+                "label": "test-deployment/svc/step",
+                "stack": ['  File "app.py", line 10, in step'],
+            }
+        ],
+    }
+
+    response = http_client.get("/debug/loop")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Event loop lag monitoring is disabled"}
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import json
 from pathlib import Path
 from types import TracebackType
@@ -10,12 +11,21 @@ from unittest.mock import MagicMock, patch
 import httpx
 import pytest
 import respx
+from fastapi import Response
 from fastapi.testclient import TestClient
+from workflows import Workflow, step
 from workflows.context import JsonSerializer
-from workflows.events import Event
-
-from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
-from llama_deploy.types import TaskResult
+from workflows.errors import WorkflowCancelledByUser
+from workflows.events import Event, StartEvent, StopEvent
+
+from llama_deploy.apiserver.app import app
+from llama_deploy.apiserver.deployment import Deployment
+from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig, Service
+from llama_deploy.apiserver.routers.deployments import (
+    _cancel_on_disconnect,
+    create_deployment_task,
+)
+from llama_deploy.types import TaskResult, payloads
 from llama_deploy.types.core import EventDefinition, TaskDefinition
 
 
@@ -25,8 +35,9 @@ def mock_manager() -> Generator[MagicMock]:
     with patch("llama_deploy.apiserver.routers.deployments.manager") as mock_mgr:
         mock_deployment = MagicMock()
         mock_deployment.name = "test-deployment"
-        mock_deployment._config.ui.port = 3000
+        mock_deployment.ui_port = 3000
         mock_mgr.get_deployment.return_value = mock_deployment
+        mock_mgr.pending_deployments = mock.AsyncMock(return_value=set())
         yield mock_mgr
 
 
@@ -149,13 +160,86 @@ def test_run_deployment_task(
     assert response.status_code == 200
 
 
+def test_run_deployment_task_timeout(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow.side_effect = asyncio.TimeoutError
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": "{}"},
+        headers={"X-Task-Timeout": "2.5"},
+    )
+    assert response.status_code == 504
+    assert deployment.run_workflow.call_args.kwargs["task_timeout"] == 2.5
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": "{}"},
+        headers={"X-Task-Timeout": "0"},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect() -> None:
+    messages = [{"type": "http.request"}, {"type": "http.disconnect"}]
+    request = mock.MagicMock()
+    request.receive = mock.AsyncMock(side_effect=messages)
+    task = asyncio.create_task(asyncio.sleep(10))
+
+    assert await _cancel_on_disconnect(request, task)
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_create_deployment_task_cancelled() -> None:
+    disconnect = asyncio.Event()
+
+    async def receive() -> dict:
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def run_workflow(**kwargs: object) -> None:
+        await asyncio.sleep(10)
+
+    request = mock.MagicMock(receive=receive)
+    deployment = mock.MagicMock(service_names=["TestService"])
+    deployment.run_workflow = run_workflow
+
+    async def create() -> Response:
+        return await create_deployment_task(
+            request, deployment, TaskDefinition(service_id="TestService", input="{}")
+        )
+
+    # The client went away
+    task = asyncio.create_task(create())
+    await asyncio.sleep(0.01)
+    disconnect.set()
+    response = await task
+    assert response.status_code == 499
+
+    # The request itself is cancelled, the cancellation isn't swallowed
+    disconnect.clear()
+    task = asyncio.create_task(create())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
 def test_create_deployment_task(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
     deployment = mock.MagicMock()
     deployment.default_service = "TestService"
     deployment.service_names = ["TestService"]
-    deployment.run_workflow_no_wait.return_value = "42"
+    deployment.run_workflow_no_wait = mock.AsyncMock(return_value="42")
     deployment._contexts = {"84": mock.MagicMock()}  # For session_id test
     mock_manager.get_deployment.return_value = deployment
 
@@ -176,6 +260,199 @@ def test_create_deployment_task(
     assert response.status_code == 200
 
 
+def test_create_deployment_task_idempotency_key(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow_no_wait = mock.AsyncMock(
+        return_value=("task_id", "session_id")
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/create/",
+        json={"input": '{"a": 1}', "idempotency_key": "my-key"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["task_id"] == "task_id"
+    assert response.json()["idempotency_key"] == "my-key"
+    deployment.run_workflow_no_wait.assert_called_once_with(
+        service_id="TestService",
+        session_id=None,
+        idempotency_key="my-key",
+        task_timeout=None,
+        a=1,
+    )
+
+
+def test_create_deployment_task_structured_input(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    deployment = mock.MagicMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow_no_wait = mock.AsyncMock(
+        return_value=("task_id", "session_id")
+    )
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/create/",
+        json={"input": {"a": 1}},
+    )
+    assert response.status_code == 200
+    assert deployment.run_workflow_no_wait.call_args.kwargs["a"] == 1
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/create/",
+        content=msgpack.packb({"input": {"data": b"x" * 10, "n": [1, 2]}}),
+        headers={
+            "Content-Type": "application/msgpack",
+            "Accept": "application/msgpack",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(response.content)["task_id"] == "task_id"
+    kwargs = deployment.run_workflow_no_wait.call_args.kwargs
+    assert kwargs["data"] == b"x" * 10
+    assert kwargs["n"] == [1, 2]
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/create/",
+        content=b"{not json",
+        headers={"Content-Type": "application/json"},
+    )
+    assert response.status_code == 422
+
+
+class LengthWorkflow(Workflow):
+    @step
+    async def measure(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result=len(ev.get("data")))
+
+
+@pytest.mark.asyncio
+async def test_binary_task_input(tmp_path: Path) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    config = DeploymentConfig(name="binary", default_service=None, services={})
+    deployment = Deployment(config=config, base_path=Path(), deployment_path=tmp_path)
+    deployment._config.services["length"] = Service.model_validate(
+        {
+            "name": "Length",
+            "source": {"type": "local", "location": "."},
+            "import-path": "workflow:workflow",
+            "cache": {},
+        }
+    )
+    deployment._workflow_services = {"length": LengthWorkflow(timeout=None)}
+    content = msgpack.packb(
+        {"input": {"data": b"\x00\xff" * 8}, "service_id": "length"}
+    )
+    headers = {"Content-Type": "application/msgpack"}
+
+    with patch("llama_deploy.apiserver.routers.deployments.manager") as manager:
+        manager.get_deployment.return_value = deployment
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            # The second run is served by the cache
+            for _ in range(2):
+                response = await client.post(
+                    "/deployments/binary/tasks/run", content=content, headers=headers
+                )
+                assert response.status_code == 200
+                assert response.json() == 16
+
+            response = await client.post(
+                "/deployments/binary/tasks/create", content=content, headers=headers
+            )
+            assert response.status_code == 200
+            # JSON responses carry the binary values as base64
+            assert response.json()["input"] == {
+                "data": {payloads.BYTES_KEY: "AP8A/wD/AP8A/wD/AP8A/w=="}
+            }
+
+    # The input is kept as JSON, the binary value can be restored from it
+    [task] = await deployment.list_tasks()
+    assert isinstance(task.input, str)
+    assert json.loads(task.input, object_hook=payloads.decode_binary) == {
+        "data": b"\x00\xff" * 8
+    }
+
+
+def test_run_deployment_task_negotiated(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    msgpack = pytest.importorskip("msgpack")
+    deployment = mock.AsyncMock()
+    deployment.default_service = "TestService"
+    deployment.service_names = ["TestService"]
+    deployment.run_workflow.return_value = {"answer": 42}
+    mock_manager.get_deployment.return_value = deployment
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": {}},
+        headers={"Accept": "application/json;q=0.5, application/msgpack"},
+    )
+    assert msgpack.unpackb(response.content) == {"answer": 42}
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/run/",
+        json={"input": {}},
+        headers={"Accept": "application/json, application/msgpack;q=0.1"},
+    )
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"answer": 42}
+
+
+def test_cancel_task(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    mock_manager.get_deployment.return_value = deployment
+
+    deployment.cancel_task.return_value = True
+    response = http_client.post("/deployments/test-deployment/tasks/task_id/cancel")
+    assert response.status_code == 200
+    deployment.cancel_task.assert_awaited_once_with("task_id")
+
+    deployment.cancel_task.return_value = False
+    response = http_client.post("/deployments/test-deployment/tasks/task_id/cancel")
+    assert response.status_code == 409
+
+    deployment.cancel_task.side_effect = KeyError("task_id")
+    response = http_client.post("/deployments/test-deployment/tasks/task_id/cancel")
+    assert response.status_code == 404
+
+
+def test_refuse_tasks_on_shutdown(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.MagicMock()
+    mock_manager.get_deployment.return_value = deployment
+    mock_manager.accepting_tasks = False
+
+    for path in ("tasks/run", "tasks/create", "sessions/create"):
+        response = http_client.post(
+            f"/deployments/test-deployment/{path}", json={"input": "{}"}
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+    deployment.run_workflow_no_wait.assert_not_called()
+    deployment.create_session.assert_not_called()
+
+    # Running tasks are still served
+    deployment.cancel_task = mock.AsyncMock(return_value=True)
+    response = http_client.post("/deployments/test-deployment/tasks/task_id/cancel")
+    assert response.status_code == 200
+
+
 def test_send_event_not_found(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
@@ -218,6 +495,34 @@ def test_send_event(
     assert ev_def.event_obj_str == event_def.event_obj_str
 
 
+def test_send_structured_event(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    mock_context = mock.MagicMock()
+    deployment._contexts = {"42": mock_context}
+    mock_manager.get_deployment.return_value = deployment
+
+    ev = SomeEvent(response="test human response")
+    event_def = EventDefinition(
+        event_obj=json.loads(JsonSerializer().serialize(ev)), service_id="TestService"
+    )
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/test_task_id/events",
+        json=event_def.model_dump(exclude_none=True),
+        params={"session_id": 42},
+    )
+    assert response.status_code == 200
+    assert mock_context.send_event.call_args.args[0] == ev
+
+    response = http_client.post(
+        "/deployments/test-deployment/tasks/test_task_id/events",
+        json={"service_id": "TestService"},
+        params={"session_id": 42},
+    )
+    assert response.status_code == 422
+
+
 def test_get_event_not_found(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
@@ -340,8 +645,9 @@ def test_get_tasks(
     http_client: TestClient, data_path: Path, mock_manager: MagicMock
 ) -> None:
     deployment = mock.AsyncMock()
-    deployment._handlers = {"task1": mock.MagicMock()}
-    deployment._handler_inputs = {"task1": "foo"}
+    deployment.list_tasks = mock.AsyncMock(
+        return_value=[TaskDefinition(task_id="task1", input="foo")]
+    )
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.get(
@@ -393,7 +699,7 @@ def test_get_sessions(
 ) -> None:
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
-    deployment._contexts = {}  # Empty contexts
+    deployment.list_sessions = mock.AsyncMock(return_value=[])  # Empty contexts
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.get(
@@ -419,13 +725,14 @@ def test_delete_session(
 ) -> None:
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
-    deployment._contexts = {"42": mock.MagicMock()}  # Mock context to be deleted
+    deployment.delete_session = mock.AsyncMock()
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.post(
         "/deployments/test-deployment/sessions/delete/?session_id=42",
     )
     assert response.status_code == 200
+    deployment.delete_session.assert_awaited_once_with("42")
 
 
 def test_get_session_not_found(
@@ -466,8 +773,7 @@ def test_create_session(
 ) -> None:
     deployment = mock.AsyncMock()
     deployment.default_service = "TestService"
-    deployment._workflow_services = {"TestService": mock.MagicMock()}
-    deployment._contexts = {}
+    deployment.create_session = mock.AsyncMock(return_value="42")
     mock_manager.get_deployment.return_value = deployment
 
     response = http_client.post(
@@ -475,13 +781,14 @@ def test_create_session(
     )
 
     assert response.status_code == 200
-    # The response should contain a generated session_id
-    assert "session_id" in response.json()
+    # The response should contain the generated session_id
+    assert response.json()["session_id"] == "42"
     assert response.json()["state"] == {}
     assert response.json()["task_ids"] == []
 
     # Verify the mocked calls
     mock_manager.get_deployment.assert_called_once_with("test-deployment")
+    deployment.create_session.assert_awaited_once_with()
 
 
 @respx.mock
@@ -873,3 +1180,20 @@ def test_websocket_connection_error(
             # We can verify this by trying to receive - it should close the connection
             with pytest.raises(Exception):  # Connection will be closed
                 websocket.receive_text()
+
+
+def test_get_task_result_cancelled(
+    http_client: TestClient, data_path: Path, mock_manager: MagicMock
+) -> None:
+    deployment = mock.AsyncMock()
+    mock_manager.get_deployment.return_value = deployment
+
+    async def cancelled() -> None:
+        raise WorkflowCancelledByUser
+
+    deployment._handlers = {"test_task_id": cancelled()}
+    response = http_client.get(
+        "/deployments/test-deployment/tasks/test_task_id/results/?session_id=42",
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Task was cancelled"
@@ -5,6 +5,11 @@ import httpx
 from fastapi.testclient import TestClient
 
 from llama_deploy.apiserver.settings import settings
+from llama_deploy.types.apiserver import (
+    AutodeployStatus,
+    DeploymentStartupProfile,
+    ServiceStartupProfile,
+)
 
 
 def test_read_main(http_client: TestClient) -> None:
@@ -15,9 +20,74 @@ def test_read_main(http_client: TestClient) -> None:
         "deployments": [],
         "status": "Healthy",
         "status_message": "",
+        "autodeploy": None,
     }
 
 
+def test_read_main_shutting_down(http_client: TestClient) -> None:
+    with mock.patch("llama_deploy.apiserver.server.manager._accepting_tasks", False):
+        response = http_client.get("/status")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "Unhealthy"
+    assert response.json()["status_message"] == "Shutting down"
+
+
+def test_read_main_autodeploy(http_client: TestClient) -> None:
+    deployer = mock.MagicMock()
+    deployer.status = AutodeployStatus(
+        repo_url="https://example.com/repo.git",
+        ref="main",
+        sha="a" * 40,
+        last_reload_seconds=1.5,
+    )
+    with mock.patch("llama_deploy.apiserver.server.autodeployer", deployer):
+        response = http_client.get("/status")
+
+    assert response.status_code == 200
+    assert response.json()["autodeploy"] == {
+        "repo_url": "https://example.com/repo.git",
+        "ref": "main",
+        "sha": "a" * 40,
+        "last_reload_seconds": 1.5,
+        "last_error": None,
+    }
+
+
+def test_startup_profile(http_client: TestClient) -> None:
+    deployment = mock.MagicMock()
+    deployment.startup_profile = DeploymentStartupProfile(
+        name="test-deployment",
+        services=[
+            ServiceStartupProfile(
+                service_id="test-service",
+                sync_seconds=1.0,
+                install_seconds=2.0,
+                import_seconds=None,
+            )
+        ],
+    )
+    with mock.patch("llama_deploy.apiserver.routers.status.manager") as mocked_manager:
+        mocked_manager._deployments = {"test-deployment": deployment}
+        response = http_client.get("/status/startup")
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "name": "test-deployment",
+            "services": [
+                {
+                    "service_id": "test-service",
+                    "sync_seconds": 1.0,
+                    "install_seconds": 2.0,
+                    "import_seconds": None,
+                    "modules": {},
+                }
+            ],
+        }
+    ]
+
+
 def test_prom_proxy_off(http_client: TestClient, monkeypatch: Any) -> None:
     monkeypatch.setattr(settings, "prometheus_enabled", False)
     response = http_client.get("/status/metrics/")
@@ -0,0 +1,39 @@
+import sqlite3
+from pathlib import Path
+
+from llama_deploy.apiserver.state_stores import SqliteStateStore, TaskRecord
+
+
+def test_wal_mode(tmp_path: Path) -> None:
+    store = SqliteStateStore(tmp_path / "nested" / "state.db")
+    assert store.path == tmp_path / "nested" / "state.db"
+
+    conn = sqlite3.connect(store.path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+    store.close()
+
+
+def test_shared_across_connections(tmp_path: Path) -> None:
+    # Every worker process opens its own connection to the same database
+    worker_1 = SqliteStateStore(tmp_path / "state.db")
+    worker_2 = SqliteStateStore(tmp_path / "state.db")
+
+    worker_1.put_deployment("foo", "{}", "/base", False)
+    worker_1.put_session("foo", "s1", "w1")
+    worker_2.put_task(
+        "foo", TaskRecord(task_id="t1", session_id="s1", input="", worker_id="w2")
+    )
+
+    assert [r.name for r in worker_2.list_deployments()] == ["foo"]
+    assert worker_2.get_session_owner("foo", "s1") == "w1"
+    task = worker_1.get_task("foo", "t1")
+    assert task is not None
+    assert task.worker_id == "w2"
+
+    # Revisions are bumped consistently whoever writes
+    assert worker_2.put_deployment("foo", '{"a": 1}', "/base", False) == 2
+    assert worker_1.put_deployment("foo", '{"a": 2}', "/base", False) == 3
+
+    worker_1.close()
+    worker_2.close()
@@ -0,0 +1,113 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from llama_deploy.apiserver.state_stores import (
+    MemoryStateStore,
+    SqliteStateStore,
+    StateStore,
+    TaskRecord,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request: pytest.FixtureRequest, tmp_path: Path) -> StateStore:
+    if request.param == "memory":
+        return MemoryStateStore()
+    return SqliteStateStore(tmp_path / "state.db")
+
+
+def test_put_deployment(store: StateStore) -> None:
+    assert store.put_deployment("foo", "{}", "/base", False) == 1
+    # Same record, same revision
+    assert store.put_deployment("foo", "{}", "/base", False) == 1
+    assert store.put_deployment("foo", '{"a": 1}', "/base", False) == 2
+    assert store.put_deployment("foo", '{"a": 1}', "/base", True) == 3
+    assert store.put_deployment("bar", "{}", "/base", False) == 1
+
+    records = {r.name: r for r in store.list_deployments()}
+    assert records.keys() == {"foo", "bar"}
+    assert records["foo"].config == '{"a": 1}'
+    assert records["foo"].local is True
+    assert records["foo"].revision == 3
+
+
+def test_sessions(store: StateStore) -> None:
+    store.put_session("foo", "s1", "w1")
+    store.put_session("foo", "s2", "w2")
+    store.put_session("bar", "s3", "w1")
+    store.put_task(
+        "foo", TaskRecord(task_id="t1", session_id="s1", input="", worker_id="w1")
+    )
+
+    assert sorted(store.list_sessions("foo")) == ["s1", "s2"]
+    assert store.get_session_owner("foo", "s2") == "w2"
+    assert store.get_session_owner("foo", "s3") is None
+
+    store.delete_session("foo", "s1")
+    assert store.list_sessions("foo") == ["s2"]
+    # Tasks go away with their session
+    assert store.get_task("foo", "t1") is None
+
+
+def test_tasks(store: StateStore) -> None:
+    task = TaskRecord(task_id="t1", session_id="s1", input='{"x": 1}', worker_id="w1")
+    store.put_task("foo", task)
+
+    assert store.get_task("foo", "t1") == task
+    assert store.get_task("bar", "t1") is None
+    assert store.list_tasks("foo") == [task]
+    assert store.list_tasks("bar") == []
+
+    store.delete_task("foo", "t1")
+    assert store.get_task("foo", "t1") is None
+    store.delete_task("foo", "t1")
+
+
+def test_idempotency_keys(store: StateStore) -> None:
+    first = TaskRecord(task_id="t1", session_id="s1", input="", worker_id="w1")
+    second = TaskRecord(task_id="t2", session_id="s2", input="", worker_id="w2")
+
+    assert store.claim_idempotency_key("foo", "key", first, 60) == ("t1", "s1")
+    assert store.claim_idempotency_key("foo", "key", second, 60) == ("t1", "s1")
+    # Keys are scoped to a deployment
+    assert store.claim_idempotency_key("bar", "key", second, 60) == ("t2", "s2")
+
+    # Expired keys can be claimed again
+    assert store.claim_idempotency_key("foo", "short", first, 0.01) == ("t1", "s1")
+    time.sleep(0.02)
+    assert store.claim_idempotency_key("foo", "short", second, 60) == ("t2", "s2")
+
+    # Only the task owning a key can release it
+    store.release_idempotency_key("foo", "key", "t2")
+    assert store.claim_idempotency_key("foo", "key", second, 60) == ("t1", "s1")
+    store.release_idempotency_key("foo", "key", "t1")
+    assert store.claim_idempotency_key("foo", "key", second, 60) == ("t2", "s2")
+
+
+def test_workers(store: StateStore) -> None:
+    store.register_worker("w1", "/tmp/w1.sock")
+    store.register_worker("w2", "/tmp/w2.sock")
+    store.put_session("foo", "s1", "w1")
+    store.put_session("foo", "s2", "w2")
+    store.put_task(
+        "foo", TaskRecord(task_id="t1", session_id="s1", input="", worker_id="w1")
+    )
+    store.claim_idempotency_key(
+        "foo",
+        "key",
+        TaskRecord(task_id="t1", session_id="s1", input="", worker_id="w1"),
+        60,
+    )
+
+    assert store.get_worker_address("w1") == "/tmp/w1.sock"
+
+    store.unregister_worker("w1")
+    assert store.get_worker_address("w1") is None
+    assert store.get_worker_address("w2") == "/tmp/w2.sock"
+    # What the worker owned is gone with it
+    assert store.list_sessions("foo") == ["s2"]
+    assert store.list_tasks("foo") == []
+    task = TaskRecord(task_id="t2", session_id="s2", input="", worker_id="w2")
+    assert store.claim_idempotency_key("foo", "key", task, 60) == ("t2", "s2")
@@ -0,0 +1,251 @@
+import io
+from pathlib import Path
+from typing import AsyncIterator, Generator
+from unittest import mock
+
+import httpx
+import pytest
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+from llama_deploy.apiserver.app import app
+from llama_deploy.apiserver.artifacts import (
+    CHUNK_SIZE,
+    ArtifactRef,
+    ArtifactStore,
+    is_streamable,
+    iter_chunks,
+    multipart_chunks,
+)
+from llama_deploy.apiserver.deployment import Deployment
+from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+
+
+async def generate(lines: int) -> AsyncIterator[str]:
+    for i in range(lines):
+        yield f"line {i}\n"
+
+
+class ReportWorkflow(Workflow):
+    @step
+    async def work(self, ev: StartEvent) -> StopEvent:
+        if ev.get("documents"):
+            heads = []
+            for doc in ev.get("documents"):
+                assert isinstance(doc, ArtifactRef)
+                with doc.mmap() as buffer:
+                    heads.append(buffer[:5].decode())
+            return StopEvent(result=heads)
+        if ev.get("file"):
+            return StopEvent(result=io.BytesIO(b"x" * (3 * CHUNK_SIZE + 1)))
+        return StopEvent(result=generate(ev.get("lines", 3)))
+
+
+@pytest.fixture
+def deployment(tmp_path: Path) -> Generator[Deployment, None, None]:
+    config = DeploymentConfig(name="reports", default_service=None, services={})
+    deployment = Deployment(config=config, base_path=Path(), deployment_path=tmp_path)
+    deployment._workflow_services = {"report": ReportWorkflow(timeout=None)}
+    with mock.patch("llama_deploy.apiserver.routers.deployments.manager") as manager:
+        manager.get_deployment.return_value = deployment
+        yield deployment
+
+
+@pytest.fixture
+def asgi_client() -> httpx.AsyncClient:
+    # Tasks must run in the loop of the test, unlike with TestClient
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    )
+
+
+def test_is_streamable() -> None:
+    assert is_streamable(generate(1))
+    assert is_streamable(io.BytesIO(b""))
+    assert not is_streamable("text")
+    assert not is_streamable(b"bytes")
+    assert not is_streamable({"read": 1})
+
+
+@pytest.mark.asyncio
+async def test_iter_chunks() -> None:
+    assert [c async for c in iter_chunks(generate(2))] == [b"line 0\n", b"line 1\n"]
+
+    f = io.BytesIO(b"x" * (2 * CHUNK_SIZE + 1))
+    chunks = [c async for c in iter_chunks(f)]
+    assert [len(c) for c in chunks] == [CHUNK_SIZE, CHUNK_SIZE, 1]
+    assert f.closed
+
+
+@pytest.mark.asyncio
+async def test_artifact_store(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path / "artifacts")
+    artifact_id, size = await store.save(iter_chunks(generate(2)))
+    assert size == 14
+    path = store.get(artifact_id)
+    assert path is not None and path.read_bytes() == b"line 0\nline 1\n"
+    assert store.get("../../etc/passwd") is None
+    assert store.get("0" * 64) is None
+
+    async def failing() -> AsyncIterator[bytes]:
+        yield b"partial"
+        raise ValueError("broken stream")
+
+    with pytest.raises(ValueError):
+        await store.save(failing())
+    # Nothing is left of the failed artifact
+    assert [p.name for p in store.path.iterdir()] == [artifact_id]
+
+
+@pytest.mark.asyncio
+async def test_stream_result(
+    asgi_client: httpx.AsyncClient, deployment: Deployment
+) -> None:
+    async with asgi_client.stream(
+        "POST",
+        "/deployments/reports/tasks/run",
+        json={"input": {"lines": 500}, "service_id": "report"},
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/octet-stream"
+        body = b"".join([c async for c in response.aiter_bytes()])
+    assert body == "".join(f"line {i}\n" for i in range(500)).encode()
+
+
+@pytest.mark.asyncio
+async def test_result_artifact(
+    asgi_client: httpx.AsyncClient, deployment: Deployment
+) -> None:
+    response = await asgi_client.post(
+        "/deployments/reports/tasks/run",
+        json={"input": {"file": True}, "service_id": "report"},
+        params={"artifact": True},
+    )
+    assert response.status_code == 200
+    artifact = response.json()
+    assert artifact["size_bytes"] == 3 * CHUNK_SIZE + 1
+
+    response = await asgi_client.get(artifact["url"])
+    assert response.status_code == 200
+    assert response.content == b"x" * (3 * CHUNK_SIZE + 1)
+
+    response = await asgi_client.get("/deployments/reports/artifacts/" + "0" * 64)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_task_result_artifact(
+    asgi_client: httpx.AsyncClient, deployment: Deployment
+) -> None:
+    response = await asgi_client.post(
+        "/deployments/reports/tasks/create",
+        json={"input": {"lines": 2}, "service_id": "report"},
+    )
+    task = response.json()
+    results_url = f"/deployments/reports/tasks/{task['task_id']}/results"
+    params = {"session_id": task["session_id"]}
+
+    first = (await asgi_client.get(results_url, params=params)).json()
+    # The result can only be read once, the same artifact is returned again
+    assert (await asgi_client.get(results_url, params=params)).json() == first
+    assert first["data"]["artifact"]["size_bytes"] == 14
+    response = await asgi_client.get(first["result"])
+    assert response.content == b"line 0\nline 1\n"
+
+
+@pytest.mark.asyncio
+async def test_result_artifacts_bounded(deployment: Deployment) -> None:
+    with mock.patch("llama_deploy.apiserver.deployment.RESULT_ARTIFACTS_SIZE", 2):
+        first = await deployment.result_artifact("first", generate(1))
+        await deployment.result_artifact("second", generate(2))
+        # Requesting a result again keeps it
+        assert await deployment.result_artifact("first", None) == first
+        await deployment.result_artifact("third", generate(3))
+    assert list(deployment._result_artifacts) == ["first", "third"]
+
+
+async def _stream(*chunks: bytes) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_multipart_chunks() -> None:
+    body = (
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="note"\r\n\r\n'
+        b"not a file\r\n"
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.txt"\r\n'
+        b"Content-Type: text/plain\r\n\r\n"
+        b"first file\r\n"
+        b"--xyz\r\n"
+        b'Content-Disposition: form-data; name="other"; filename="b.txt"\r\n\r\n'
+        b"second file\r\n"
+        b"--xyz--\r\n"
+    )
+    # Split anywhere, like the chunks of a request
+    chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+    content_type = "multipart/form-data; boundary=xyz"
+    received = [c async for c in multipart_chunks(content_type, _stream(*chunks))]
+    assert b"".join(received) == b"first file"
+
+    with pytest.raises(ValueError):
+        [c async for c in multipart_chunks(content_type, _stream(b"--xyz--\r\n"))]
+
+
+@pytest.mark.asyncio
+async def test_upload_artifacts(
+    asgi_client: httpx.AsyncClient, deployment: Deployment
+) -> None:
+    response = await asgi_client.post(
+        "/deployments/reports/artifacts",
+        content=_stream(b"hello ", b"world"),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 200
+    raw = response.json()
+    assert raw["size_bytes"] == 11
+
+    response = await asgi_client.post(
+        "/deployments/reports/artifacts", files={"file": ("a.txt", b"hello world")}
+    )
+    # Same content, same artifact
+    assert response.json() == raw
+    assert len(list(deployment.artifacts.path.iterdir())) == 1
+
+    response = await asgi_client.get(raw["url"], headers={"Range": "bytes=6-"})
+    assert response.status_code == 206
+    assert response.content == b"world"
+    assert "immutable" in response.headers["cache-control"]
+
+
+@pytest.mark.asyncio
+async def test_artifact_refs(
+    asgi_client: httpx.AsyncClient, deployment: Deployment
+) -> None:
+    ids = []
+    for content in (b"first document", b"other document"):
+        response = await asgi_client.post(
+            "/deployments/reports/artifacts", content=content
+        )
+        ids.append(response.json()["artifact_id"])
+
+    response = await asgi_client.post(
+        "/deployments/reports/tasks/run",
+        json={
+            "input": {"documents": [{"$artifact": i} for i in ids]},
+            "service_id": "report",
+        },
+    )
+    assert response.json() == ["first", "other"]
+
+    for path in ("tasks/run", "tasks/create"):
+        response = await asgi_client.post(
+            f"/deployments/reports/{path}",
+            json={
+                "input": {"documents": [{"$artifact": "0" * 64}]},
+                "service_id": "report",
+            },
+        )
+        assert response.status_code == 404
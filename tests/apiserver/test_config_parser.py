@@ -1,6 +1,16 @@
 from pathlib import Path
+from unittest import mock
 
-from llama_deploy.apiserver.deployment_config_parser import DeploymentConfig
+import pytest
+import yaml
+from pydantic import ValidationError
+
+from llama_deploy.apiserver.deployment_config_parser import (
+    BrokerType,
+    DeploymentConfig,
+    _config_cache,
+    clear_config_cache,
+)
 
 
 def do_assert(config: DeploymentConfig) -> None:
@@ -40,3 +50,171 @@ def test_from_yaml_bytes(data_path: Path) -> None:
     with open(data_path / "example.yaml", "rb") as config_f:
         config = DeploymentConfig.from_yaml_bytes(config_f.read())
         do_assert(config)
+
+
+def test_from_yaml_bytes_cached(data_path: Path) -> None:
+    clear_config_cache()
+    src = (data_path / "example.yaml").read_bytes()
+
+    with mock.patch(
+        "llama_deploy.apiserver.deployment_config_parser.yaml.load",
+        wraps=yaml.load,
+    ) as mocked_load:
+        config = DeploymentConfig.from_yaml_bytes(src)
+        config.services.clear()
+        cached = DeploymentConfig.from_yaml_bytes(src)
+        from_file = DeploymentConfig.from_yaml(data_path / "example.yaml")
+
+    # Parsed once, and changes to a returned config don't leak into the cache
+    mocked_load.assert_called_once()
+    do_assert(cached)
+    assert cached == from_file
+    assert cached is not from_file
+
+
+def test_from_yaml_bytes_cache_size(data_path: Path) -> None:
+    clear_config_cache()
+    with mock.patch(
+        "llama_deploy.apiserver.deployment_config_parser.CONFIG_CACHE_SIZE", 2
+    ):
+        for i in range(3):
+            DeploymentConfig.from_yaml_bytes(f"name: d{i}\nservices: {{}}".encode())
+
+    # The least recently used config was evicted
+    assert len(_config_cache) == 2
+    assert [c.name for c in _config_cache.values()] == ["d1", "d2"]
+
+
+def test_from_yaml_bytes_invalid() -> None:
+    clear_config_cache()
+    with pytest.raises(ValidationError):
+        DeploymentConfig.from_yaml_bytes(b"name: foo")
+    assert len(_config_cache) == 0
+
+
+def test_diff(data_path: Path) -> None:
+    old = DeploymentConfig.from_yaml(data_path / "example.yaml")
+    assert not old.diff(old).has_changes
+
+    new = old.model_copy(deep=True)
+    new.services["myworkflow"].port = 4242
+    new.services["new-workflow"] = new.services.pop("another-workflow")
+    new.default_service = "new-workflow"
+
+    diff = old.diff(new)
+    assert diff.has_changes
+    assert diff.added == ["new-workflow"]
+    assert diff.removed == ["another-workflow"]
+    assert diff.changed == ["myworkflow"]
+    assert diff.unchanged == []
+    assert diff.default_service_changed
+    assert not diff.ui_changed
+    assert not diff.ingestion_changed
+
+
+def test_service_cache() -> None:
+    config = DeploymentConfig.from_yaml_bytes(b"""
+name: cached
+services:
+  cached:
+    name: Cached
+    source:
+      type: local
+      location: src
+    import-path: src/workflow:workflow
+    cache:
+      ttl: 60
+      max-entries: 10
+      path: cache.db
+      disk-max-entries: 100
+    timeout: 30
+  uncached:
+    name: Uncached
+    source:
+      type: local
+      location: src
+    import-path: src/workflow:workflow
+""")
+
+    cache = config.services["cached"].cache
+    assert cache is not None
+    assert cache.ttl == 60
+    assert cache.max_entries == 10
+    assert cache.path == "cache.db"
+    assert cache.disk_max_entries == 100
+    assert config.services["uncached"].cache is None
+    assert config.services["cached"].timeout == 30
+    assert config.services["uncached"].timeout is None
+
+
+def test_ingestion() -> None:
+    config = DeploymentConfig.from_yaml_bytes(b"""
+name: ingesting
+services:
+  workflow:
+    name: Workflow
+    source:
+      type: local
+      location: src
+    import-path: src/workflow:workflow
+ingestion:
+  - type: kafka
+    topic: tasks
+    reply-topic: results
+    url: kafka:9092
+    batch-size: 100
+    concurrency: 10
+  - type: redis
+    topic: stream
+""")
+
+    kafka, redis = config.ingestion
+    assert kafka.type == BrokerType.kafka
+    assert kafka.topic == "tasks"
+    assert kafka.reply_topic == "results"
+    assert kafka.url == "kafka:9092"
+    assert kafka.batch_size == 100
+    assert kafka.concurrency == 10
+    assert redis.type == BrokerType.redis
+    assert redis.reply_topic is None
+    assert redis.group is None
+    assert redis.batch_size == 16
+
+    new = config.model_copy(deep=True)
+    new.ingestion.pop()
+    diff = config.diff(new)
+    assert diff.has_changes
+    assert diff.ingestion_changed
+    assert diff.unchanged == ["workflow"]
+
+    with pytest.raises(ValidationError):
+        DeploymentConfig.model_validate(
+            {
+                "name": "invalid",
+                "services": {},
+                "ingestion": [{"type": "kafka", "topic": "t", "concurrency": 0}],
+            }
+        )
+
+
+def test_event_sink() -> None:
+    config = DeploymentConfig.from_yaml_bytes(b"""
+name: sinking
+services: {}
+event-sink:
+  type: redis
+  topic: events
+  batch-size: 10
+  flush-interval: 0.5
+  max-pending: 100
+""")
+
+    assert config.event_sink is not None
+    assert config.event_sink.type == BrokerType.redis
+    assert config.event_sink.batch_size == 10
+    assert config.event_sink.flush_interval == 0.5
+    assert config.event_sink.max_pending == 100
+
+    new = config.model_copy(deep=True)
+    new.event_sink = None
+    assert config.diff(new).event_sink_changed
@@ -1,30 +1,50 @@
 import asyncio
 import json
+import signal
 import subprocess
 import sys
+import threading
+import time
 from collections.abc import Generator
 from copy import deepcopy
 from pathlib import Path
 from typing import Any
 from unittest import mock
 
+import httpx
 import pytest
-from workflows import Context, Workflow
+import respx
+from prometheus_client import REGISTRY
+from workflows import Context, Workflow, step
+from workflows.errors import WorkflowCancelledByUser
+from workflows.events import Event, StartEvent, StopEvent
 from workflows.handler import WorkflowHandler
 
 from llama_deploy.apiserver.deployment import (
     SOURCE_MANAGERS,
+    UI_SERVER_STOP_TIMEOUT,
+    WORKERS_DIR,
     Deployment,
     DeploymentError,
     Manager,
+    _terminate_ui_server,
 )
 from llama_deploy.apiserver.deployment_config_parser import (
     DeploymentConfig,
+    Service,
     ServiceSource,
     SourceType,
     SyncPolicy,
     UIService,
 )
+from llama_deploy.apiserver.profiling import SamplingProfiler
+from llama_deploy.apiserver.settings import settings
+from llama_deploy.apiserver.state_stores import (
+    MemoryStateStore,
+    SqliteStateStore,
+    TaskRecord,
+)
+from llama_deploy.apiserver.task_queue import QueuedTask, SqliteTaskQueue
 
 
 @pytest.fixture
@@ -481,6 +501,8 @@ async def test_manager_deploy(data_path: Path) -> None:
     ) as mocked_deployment:
         # Mock the start method as an async method
         mocked_deployment.return_value.start = mock.AsyncMock()
+        mocked_deployment.return_value.restore_sessions = mock.AsyncMock()
+        mocked_deployment.return_value.recover_tasks = mock.AsyncMock()
 
         m = Manager()
         m._serving = True
@@ -683,6 +705,7 @@ async def test_start_ui_server_uses_merge_sync_policy(
         run_call = mock_subprocess.call_args_list[1]
         assert run_call.args[:3] == ("pnpm", "run", "dev")
         assert run_call.kwargs["cwd"] == installed_path
+        assert run_call.kwargs["start_new_session"] is True
 
 
 @pytest.mark.asyncio
@@ -726,6 +749,41 @@ async def test_run_workflow_without_session_with_kwargs(
     mock_workflow.run.assert_awaited_once_with(**test_kwargs)
 
 
+@pytest.mark.asyncio
+async def test_run_workflow_cached(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._config.services["test_service"] = Service.model_validate(
+        {
+            "name": "Test",
+            "source": {"type": "local", "location": "."},
+            "import-path": "workflow:workflow",
+            "cache": {},
+        }
+    )
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    mock_workflow.run = mock.AsyncMock(side_effect=["first", "second", "third"])
+    deployment._workflow_services = {"test_service": mock_workflow}
+
+    assert await deployment.run_workflow("test_service", input="a") == "first"  # type:ignore
+    assert await deployment.run_workflow("test_service", input="a") == "first"  # type:ignore
+    assert await deployment.run_workflow("test_service", input="b") == "second"  # type:ignore
+    assert mock_workflow.run.await_count == 2
+
+    # Sessions bypass the cache
+    deployment._contexts = {"test_session": mock.MagicMock(spec=Context)}
+    assert await deployment.run_workflow("test_service", "test_session") == "third"
+
+    # Results of the old version of a reloaded service are dropped
+    reloaded = mock.MagicMock(spec=Workflow)
+    reloaded.run = mock.AsyncMock(return_value="reloaded")
+    deployment._workflow_services = {"test_service": reloaded}
+    assert await deployment.run_workflow("test_service", input="a") == "reloaded"  # type:ignore
+
+
 @pytest.mark.asyncio
 async def test_run_workflow_with_session_id(
     deployment_config: DeploymentConfig, tmp_path: Path
@@ -754,7 +812,8 @@ async def test_run_workflow_with_session_id(
     mock_workflow.run.assert_awaited_once_with(context=mock_context, **test_kwargs)
 
 
-def test_run_workflow_no_wait_without_session_id(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_without_session_id(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait without session_id."""
@@ -778,7 +837,7 @@ def test_run_workflow_no_wait_without_session_id(
     ) as mock_generate_id:
         mock_generate_id.side_effect = ["session_456", "handler_123"]
 
-        handler_id, session_id = deployment.run_workflow_no_wait(
+        handler_id, session_id = await deployment.run_workflow_no_wait(
             "test_service",
             None,
             **test_kwargs,  # type:ignore
@@ -789,11 +848,27 @@ def test_run_workflow_no_wait_without_session_id(
         assert deployment._handlers["handler_123"] == mock_handler
         assert deployment._contexts["session_456"] == mock_context
         assert deployment._handler_inputs["handler_123"] == json.dumps(test_kwargs)
+        assert deployment.registry_sizes == {
+            "contexts": 1,
+            "session_services": 1,
+            "handlers": 1,
+            "handler_inputs": 1,
+            "handler_services": 1,
+            "handler_sessions": 1,
+            "drain_tasks": 0,
+            "timeout_tasks": 0,
+            "result_artifacts": 0,
+            "idempotency_keys": 0,
+            "workflow_services": 1,
+            "pending_services": 0,
+            "service_modules": 0,
+        }
 
         mock_workflow.run.assert_called_once_with(**test_kwargs)
 
 
-def test_run_workflow_no_wait_with_session_id(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_with_session_id(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait with existing session_id."""
@@ -817,7 +892,7 @@ def test_run_workflow_no_wait_with_session_id(
     ) as mock_generate_id:
         mock_generate_id.return_value = "handler_789"
 
-        handler_id, session_id = deployment.run_workflow_no_wait(
+        handler_id, session_id = await deployment.run_workflow_no_wait(
             "test_service",
             "existing_session",
             **test_kwargs,  # type:ignore
@@ -834,7 +909,100 @@ def test_run_workflow_no_wait_with_session_id(
         mock_workflow.run.assert_called_once_with(context=mock_context, **test_kwargs)
 
 
-def test_run_workflow_no_wait_empty_kwargs(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_idempotency_key(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    mock_workflow = mock.MagicMock(spec=Workflow)
+    deployment._workflow_services = {"test_service": mock_workflow}
+
+    task = await deployment.run_workflow_no_wait("test_service", idempotency_key="key")
+    # A retry returns the same task without running the workflow again
+    assert (
+        await deployment.run_workflow_no_wait("test_service", idempotency_key="key")
+        == task
+    )
+    assert mock_workflow.run.call_count == 1
+    assert deployment.registry_sizes["idempotency_keys"] == 1
+    assert REGISTRY.get_sample_value(
+        "deployment_deduplicated_tasks_total", {"deployment_name": "test-deployment"}
+    )
+
+    other = await deployment.run_workflow_no_wait(
+        "test_service", idempotency_key="other"
+    )
+    assert other != task
+    assert mock_workflow.run.call_count == 2
+
+    # Keys expire
+    with mock.patch.object(settings, "idempotency_key_ttl", 0):
+        await deployment.run_workflow_no_wait("test_service", idempotency_key="short")
+        await deployment.run_workflow_no_wait("test_service", idempotency_key="short")
+    assert mock_workflow.run.call_count == 4
+    # Expired keys were dropped
+    assert deployment.registry_sizes["idempotency_keys"] == 3
+
+    # A task failing to start doesn't keep its key
+    mock_workflow.run.side_effect = RuntimeError("broken")
+    with pytest.raises(RuntimeError):
+        await deployment.run_workflow_no_wait("test_service", idempotency_key="failed")
+    mock_workflow.run.side_effect = None
+    retry = await deployment.run_workflow_no_wait(
+        "test_service", idempotency_key="failed"
+    )
+    assert retry[0] not in (task[0], other[0])
+    assert mock_workflow.run.call_count == 6
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_idempotency_key_shared(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    store = MemoryStateStore()
+    deployments = [
+        Deployment(
+            config=deployment_config,
+            base_path=Path(),
+            deployment_path=tmp_path,
+            state_store=store,
+            worker_id=worker_id,
+        )
+        for worker_id in ("w1", "w2")
+    ]
+    workflows = [mock.MagicMock(spec=Workflow) for _ in deployments]
+    for deployment, workflow in zip(deployments, workflows):
+        # Still running
+        workflow.run.return_value.done.return_value = False
+        deployment._workflow_services = {"test_service": workflow}
+
+    task_id, session_id = await deployments[0].run_workflow_no_wait(
+        "test_service", idempotency_key="key"
+    )
+    # The retry reached another worker
+    assert await deployments[1].run_workflow_no_wait(
+        "test_service", idempotency_key="key"
+    ) == (task_id, session_id)
+    workflows[1].run.assert_not_called()
+    assert store.get_task("test-deployment", task_id).worker_id == "w1"  # type: ignore
+
+    # Waiting for the lock of the store must not block the event loop
+    threads = []
+    claim = store.claim_idempotency_key
+
+    def claim_in_thread(*args: Any) -> tuple[str, str]:
+        threads.append(threading.get_ident())
+        return claim(*args)
+
+    with mock.patch.object(store, "claim_idempotency_key", claim_in_thread):
+        await deployments[1].run_workflow_no_wait("test_service", idempotency_key="new")
+    assert threads and threads[0] != threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_empty_kwargs(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait with empty run_kwargs."""
@@ -856,7 +1024,7 @@ def test_run_workflow_no_wait_empty_kwargs(
     ) as mock_generate_id:
         mock_generate_id.side_effect = ["session_empty", "handler_empty"]
 
-        handler_id, session_id = deployment.run_workflow_no_wait("test_service")
+        handler_id, session_id = await deployment.run_workflow_no_wait("test_service")
 
         assert handler_id == "handler_empty"
         assert session_id == "session_empty"
@@ -882,7 +1050,8 @@ async def test_run_workflow_service_not_found(
         await deployment.run_workflow("nonexistent_service")
 
 
-def test_run_workflow_no_wait_service_not_found(
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_service_not_found(
     deployment_config: DeploymentConfig, tmp_path: Path
 ) -> None:
     """Test run_workflow_no_wait raises KeyError when service not found."""
@@ -893,7 +1062,7 @@ def test_run_workflow_no_wait_service_not_found(
     deployment._workflow_services = {}
 
     with pytest.raises(KeyError):
-        deployment.run_workflow_no_wait("nonexistent_service")
+        await deployment.run_workflow_no_wait("nonexistent_service")
 
 
 @pytest.mark.asyncio
@@ -913,3 +1082,1228 @@ async def test_run_workflow_session_not_found(
 
     with pytest.raises(KeyError):
         await deployment.run_workflow("test_service", "nonexistent_session")
+
+
+@pytest.mark.asyncio
+async def test_deployment_lazy_load_services(
+    data_path: Path, mock_importlib: Any, tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "lazy_load_services", True)
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
+        sm_dict["git"] = mock.MagicMock()
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    # Sources are synced at deploy time, but the workflow is not imported yet
+    sm_dict["git"].return_value.sync.assert_called_once()
+    import_module = mock_importlib.import_module
+    import_module.assert_not_called()
+    assert d._workflow_services == {}
+    assert d.service_names == ["test-workflow"]
+    assert d.default_service == "test-workflow"
+    assert d.startup_profile.services[0].import_seconds is None
+
+    # First use imports the workflow
+    workflow = await d._get_workflow("test-workflow")
+    import_module.assert_called_once_with("workflow")
+    assert d._workflow_services == {"test-workflow": workflow}
+    assert d.service_names == ["test-workflow"]
+    assert d.startup_profile.services[0].import_seconds is not None
+
+    # Subsequent calls use the imported workflow
+    assert await d._get_workflow("test-workflow") is workflow
+    import_module.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_deployment_lazy_load_services_during_reload(
+    data_path: Path, mock_importlib: Any, tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "lazy_load_services", True)
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
+        sm_dict["git"] = mock.MagicMock()
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+        assert d.default_service == "test-workflow"
+
+        # Syncing the new version takes a while
+        sm_dict["git"].return_value.sync.side_effect = lambda *args: time.sleep(0.3)
+        reload_task = asyncio.create_task(d.reload(config))
+        await asyncio.sleep(0.05)
+
+        # The event loop isn't blocked, deferred services wait for the new version
+        get_workflow = asyncio.create_task(d._get_workflow("test-workflow"))
+        started_at = time.perf_counter()
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - started_at < 0.1
+        assert not get_workflow.done()
+        assert d.default_service == "test-workflow"
+
+        workflow = await get_workflow
+        assert reload_task.done()
+    assert d._workflow_services == {"test-workflow": workflow}
+    assert d._pending_services == {}
+    assert d.default_service == "test-workflow"
+
+
+@pytest.mark.asyncio
+async def test_deployment_prewarm_services(
+    data_path: Path, mock_importlib: Any, tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "lazy_load_services", True)
+    monkeypatch.setattr(settings, "prewarm_services", True)
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS") as sm_dict:
+        sm_dict["git"] = mock.MagicMock()
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+
+    assert d._pending_services
+    await d.start()
+    assert d._prewarm_task is not None
+    await d._prewarm_task
+    assert d._pending_services == {}
+    assert list(d._workflow_services.keys()) == ["test-workflow"]
+
+
+def test_deployment_profile_imports(
+    data_path: Path, tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "profile_imports", True)
+    monkeypatch.delitem(sys.modules, "workflow", raising=False)
+    monkeypatch.delitem(sys.modules, "workflow.workflow_test", raising=False)
+    config = DeploymentConfig.from_yaml(data_path / "local.yaml")
+
+    d = Deployment(
+        config=config, base_path=data_path, deployment_path=data_path, local=True
+    )
+
+    profile = d.startup_profile.services[0]
+    assert profile.service_id == "test-workflow"
+    assert profile.import_seconds is not None
+    assert "workflow" in profile.modules
+    assert "workflow.workflow_test" in profile.modules
+
+
+@pytest.mark.asyncio
+async def test_manager_shared_state(data_path: Path, tmp_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    store_path = tmp_path / "state.db"
+
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.Deployment"
+    ) as mocked_deployment:
+        mocked_deployment.return_value.start = mock.AsyncMock()
+        mocked_deployment.return_value.restore_sessions = mock.AsyncMock()
+        mocked_deployment.return_value.recover_tasks = mock.AsyncMock()
+        mocked_deployment.return_value.reload = mock.AsyncMock()
+
+        # Two workers sharing the same store
+        m1 = Manager()
+        m1._worker_id = "w1"
+        m1._serving = True
+        m1._deployments_path = tmp_path
+        m1.set_state_store(SqliteStateStore(store_path))
+        m2 = Manager()
+        m2._worker_id = "w2"
+        m2._serving = True
+        m2._deployments_path = tmp_path
+        m2.set_state_store(SqliteStateStore(store_path))
+
+        await m1.deploy(config, base_path=str(data_path))
+        assert await m2.pending_deployments() == {"TestDeployment"}
+        assert await m1.pending_deployments() == set()
+
+        # The second worker picks up the deployment from the store
+        await m2._sync_deployments()
+        assert m2.deployment_names == ["TestDeployment"]
+        assert await m2.pending_deployments() == set()
+        assert mocked_deployment.call_args.kwargs["worker_id"] == "w2"
+        # Deploying the same startup configuration again is a no-op
+        await m2.deploy(config, base_path=str(data_path))
+        assert mocked_deployment.call_count == 2
+
+        # A reload from the second worker is propagated to the first one
+        config.services = {}
+        await m2.deploy(config, base_path=str(data_path), reload=True)
+        await m1._sync_deployments()
+        mocked_deployment.return_value.reload.assert_awaited_with(
+            config, None, data_path
+        )
+        assert mocked_deployment.return_value.reload.await_count == 2
+        # Nothing new
+        await m1._sync_deployments()
+        assert mocked_deployment.return_value.reload.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_manager_shared_state_sources(
+    data_path: Path, tmp_path: Path, mock_importlib: Any
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "local.yaml")
+    store_path = tmp_path / "state.db"
+    deployments_path = tmp_path / "deployments"
+
+    managers = []
+    for worker_id in ("w1", "w2"):
+        m = Manager()
+        m._worker_id = worker_id
+        m._serving = True
+        m.set_deployments_path(deployments_path)
+        m.set_state_store(SqliteStateStore(store_path))
+        managers.append(m)
+    m1, m2 = managers
+
+    await m1.deploy(config, base_path=str(data_path))
+    sources = deployments_path / WORKERS_DIR / "w1" / config.name / "workflow"
+    assert (sources / "workflow_test.py").exists()
+    (sources / "running.txt").touch()
+
+    # The second worker syncs the same sources in its own folder
+    await m2._sync_deployments()
+    assert (deployments_path / WORKERS_DIR / "w2" / config.name / "workflow").is_dir()
+    assert (sources / "running.txt").exists()
+
+    # Workers remove their sources when they stop
+    with mock.patch(
+        "llama_deploy.apiserver.deployment.worker_alive", return_value=True
+    ):
+        await m2.shutdown(0)
+    assert [p.name for p in (deployments_path / WORKERS_DIR).iterdir()] == ["w1"]
+    await m1.shutdown(0)
+
+
+@pytest.mark.asyncio
+async def test_manager_serve_loop_shared_state(tmp_path: Path) -> None:
+    m = Manager()
+    m.set_deployments_path(tmp_path)
+    m.set_state_store(MemoryStateStore())
+    with mock.patch.object(m, "_sync_deployments") as mocked_sync:
+        serve_task = asyncio.create_task(m.serve())
+        await asyncio.sleep(0)
+        serve_task.cancel()
+        await serve_task
+        mocked_sync.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_deployment_shared_state(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    store = MemoryStateStore()
+    deployment = Deployment(
+        config=deployment_config,
+        base_path=Path(),
+        deployment_path=tmp_path,
+        state_store=store,
+        worker_id="w1",
+    )
+    deployment._workflow_services = {"test_service": mock.MagicMock(spec=Workflow)}
+
+    with mock.patch("llama_deploy.apiserver.deployment.Context"):
+        session_id = await deployment.create_session()
+    assert store.get_session_owner("test-deployment", session_id) == "w1"
+
+    task_id, _ = await deployment.run_workflow_no_wait(
+        "test_service",
+        session_id,
+        input="foo",  # type:ignore
+    )
+    task = store.get_task("test-deployment", task_id)
+    assert task is not None
+    assert task.session_id == session_id
+    assert task.worker_id == "w1"
+
+    # Sessions and tasks of the other workers are listed too
+    store.put_session("test-deployment", "other-session", "w2")
+    store.put_task(
+        "test-deployment",
+        TaskRecord(
+            task_id="other-task", session_id="other-session", input="", worker_id="w2"
+        ),
+    )
+    assert await deployment.list_sessions() == [session_id, "other-session"]
+    assert [t.task_id for t in await deployment.list_tasks()] == [task_id, "other-task"]
+
+    await deployment.delete_session(session_id)
+    assert session_id not in deployment._contexts
+    assert store.list_sessions("test-deployment") == ["other-session"]
+
+
+@pytest.mark.asyncio
+async def test_deployment_shared_state_completed_task(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    store = MemoryStateStore()
+    deployment = Deployment(
+        config=deployment_config,
+        base_path=Path(),
+        deployment_path=tmp_path,
+        state_store=store,
+        worker_id="w1",
+    )
+    deployment._workflow_services = {"sleepy": SleepyWorkflow()}
+
+    task_id, session_id = await deployment.run_workflow_no_wait("sleepy", seconds=0)  # type:ignore
+    assert store.get_task("test-deployment", task_id) is not None
+    assert await deployment._handlers[task_id] == "awake"
+    await deployment.stop()
+
+    # The task is forgotten, the session still leads to the worker keeping its result
+    assert store.get_task("test-deployment", task_id) is None
+    assert store.get_session_owner("test-deployment", session_id) == "w1"
+
+
+RELOAD_WORKFLOW = """
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+
+class W(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result="{result}")
+
+
+workflow = W()
+"""
+
+
+def _reload_config(services: dict[str, dict]) -> DeploymentConfig:
+    return DeploymentConfig.model_validate(
+        {
+            "name": "reload-test",
+            "services": {
+                service_id: {
+                    "name": service_id,
+                    "source": {"type": "local", "location": service_id},
+                    "import-path": f"{service_id}/wf_{service_id}:workflow",
+                    **extra,
+                }
+                for service_id, extra in services.items()
+            },
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_cached_code_changed(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    (tmp_path / "cached").mkdir()
+    config = _reload_config({"cached": {"cache": {"path": "results.db"}}})
+
+    def disk_hits() -> float:
+        return (
+            REGISTRY.get_sample_value(
+                "result_cache_requests_total",
+                {
+                    "deployment_name": "reload-test",
+                    "service_name": "cached",
+                    "outcome": "disk_hit",
+                },
+            )
+            or 0.0
+        )
+
+    hits = disk_hits()
+    results = []
+    for version in (1, 1, 2):
+        (tmp_path / "cached" / "wf_cached.py").write_text(
+            RELOAD_WORKFLOW.format(result=f"cached:{version}")
+        )
+        monkeypatch.delitem(sys.modules, "wf_cached", raising=False)
+        # The server restarts, possibly with new code
+        d = Deployment(
+            config=config, base_path=tmp_path, deployment_path=tmp_path, local=True
+        )
+        results.append(await d.run_workflow("cached"))
+        d._result_caches["cached"][1].close()
+
+    # The results on disk are only read by the code that produced them
+    assert results == ["cached:1", "cached:1", "cached:2"]
+    assert disk_hits() == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_deployment_reload_changed_services(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    # Rewritten modules must not be loaded from stale bytecode
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    for service_id in ("reload_a", "reload_b"):
+        (tmp_path / service_id).mkdir()
+        (tmp_path / service_id / f"wf_{service_id}.py").write_text(
+            RELOAD_WORKFLOW.format(result=f"{service_id}:1")
+        )
+        monkeypatch.delitem(sys.modules, f"wf_{service_id}", raising=False)
+
+    config = _reload_config({"reload_a": {}, "reload_b": {}})
+    d = Deployment(
+        config=config, base_path=tmp_path, deployment_path=tmp_path, local=True
+    )
+    workflow_b = d._workflow_services["reload_b"]
+    assert await d.run_workflow("reload_a") == "reload_a:1"
+
+    # Only the service whose configuration changed is reloaded
+    (tmp_path / "reload_a" / "wf_reload_a.py").write_text(
+        RELOAD_WORKFLOW.format(result="reload_a:2")
+    )
+    (tmp_path / "reload_b" / "wf_reload_b.py").write_text(
+        RELOAD_WORKFLOW.format(result="reload_b:2")
+    )
+    monkeypatch.setenv("RELOAD_TEST_VERSION", "1")
+    new_config = _reload_config(
+        {"reload_a": {"env": {"RELOAD_TEST_VERSION": "2"}}, "reload_b": {}}
+    )
+    # A task in flight on the untouched service
+    handler_id, _ = await d.run_workflow_no_wait("reload_b")
+    with mock.patch.object(
+        d, "_install_dependencies", wraps=d._install_dependencies
+    ) as install:
+        await d.reload(new_config)
+    install.assert_called_once()
+    assert d._config is new_config
+    assert await d._handlers[handler_id] == "reload_b:1"
+    assert await d.run_workflow("reload_a") == "reload_a:2"
+    assert d._workflow_services["reload_b"] is workflow_b
+    assert await d.run_workflow("reload_b") == "reload_b:1"
+
+    # Reloading the same configuration reloads the code of every service
+    await d.reload(new_config)
+    assert await d.run_workflow("reload_b") == "reload_b:2"
+
+    # Removed services are unloaded along with their modules
+    await d.reload(_reload_config({"reload_a": {}}))
+    assert d.service_names == ["reload_a"]
+    assert "wf_reload_b" not in sys.modules
+    assert str(tmp_path / "reload_b") not in sys.path
+    assert "wf_reload_a" in sys.modules
+
+
+@pytest.mark.asyncio
+async def test_deployment_reload_code_changed_services(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    for service_id in ("reload_e", "reload_f"):
+        (tmp_path / service_id).mkdir()
+        (tmp_path / service_id / f"wf_{service_id}.py").write_text(
+            RELOAD_WORKFLOW.format(result=f"{service_id}:1")
+        )
+        monkeypatch.delitem(sys.modules, f"wf_{service_id}", raising=False)
+    config = _reload_config({"reload_e": {}, "reload_f": {}})
+    d = Deployment(
+        config=config, base_path=tmp_path, deployment_path=tmp_path, local=True
+    )
+    workflow_f = d._workflow_services["reload_f"]
+
+    for service_id in ("reload_e", "reload_f"):
+        (tmp_path / service_id / f"wf_{service_id}.py").write_text(
+            RELOAD_WORKFLOW.format(result=f"{service_id}:2")
+        )
+    # Only the services whose code changed are reloaded
+    await d.reload(config.model_copy(deep=True), services=["reload_e"])
+    assert await d.run_workflow("reload_e") == "reload_e:2"
+    assert d._workflow_services["reload_f"] is workflow_f
+
+    # Nothing to reload
+    await d.reload(config.model_copy(deep=True), services=[])
+    assert d._workflow_services["reload_f"] is workflow_f
+
+
+SLOW_RELOAD_WORKFLOW = """
+import asyncio
+
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+
+class W(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        await asyncio.sleep(ev.get("sleep", 0))
+        return StopEvent(result="{result}")
+
+
+workflow = W(timeout=None)
+"""
+
+
+@pytest.mark.asyncio
+async def test_deployment_reload_blue_green(tmp_path: Path, monkeypatch: Any) -> None:
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.setattr(settings, "reload_drain_timeout", 0.5)
+    monkeypatch.delitem(sys.modules, "wf_reload_c", raising=False)
+    (tmp_path / "reload_c").mkdir()
+    module_file = tmp_path / "reload_c" / "wf_reload_c.py"
+    module_file.write_text(SLOW_RELOAD_WORKFLOW.format(result="v1"))
+
+    d = Deployment(
+        config=_reload_config({"reload_c": {}}),
+        base_path=tmp_path,
+        deployment_path=tmp_path,
+        local=True,
+    )
+    fast_id, _ = await d.run_workflow_no_wait("reload_c", sleep=0.1)  # type: ignore
+    slow_id, _ = await d.run_workflow_no_wait("reload_c", sleep=10)  # type: ignore
+
+    def sample(name: str, **labels: str) -> float:
+        value = REGISTRY.get_sample_value(
+            name, {"deployment_name": "reload-test", **labels}
+        )
+        return value or 0.0
+
+    cancelled = sample("deployment_drained_handlers_total", outcome="cancelled")
+    completed = sample("deployment_drained_handlers_total", outcome="completed")
+    reloads = sample("deployment_reload_duration_seconds_count")
+
+    module_file.write_text(SLOW_RELOAD_WORKFLOW.format(result="v2"))
+    await d.reload(d._config.model_copy(deep=True))
+
+    # New tasks run on the new version, while the old ones drain
+    assert await d.run_workflow("reload_c") == "v2"
+    assert sample("deployment_draining_handlers") == 2
+    assert await d._handlers[fast_id] == "v1"
+
+    await asyncio.gather(*d._drain_tasks)
+    with pytest.raises(WorkflowCancelledByUser):
+        await d._handlers[slow_id]
+    assert sample("deployment_draining_handlers") == 0
+    assert (
+        sample("deployment_drained_handlers_total", outcome="completed")
+        == completed + 1
+    )
+    assert (
+        sample("deployment_drained_handlers_total", outcome="cancelled")
+        == cancelled + 1
+    )
+    assert sample("deployment_reload_duration_seconds_count") == reloads + 1
+
+
+@pytest.mark.asyncio
+async def test_deployment_reload_failure_keeps_services(
+    tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    monkeypatch.delitem(sys.modules, "wf_reload_d", raising=False)
+    (tmp_path / "reload_d").mkdir()
+    module_file = tmp_path / "reload_d" / "wf_reload_d.py"
+    module_file.write_text(RELOAD_WORKFLOW.format(result="v1"))
+    config = _reload_config({"reload_d": {}})
+
+    d = Deployment(
+        config=config, base_path=tmp_path, deployment_path=tmp_path, local=True
+    )
+
+    module_file.write_text("raise RuntimeError('broken')")
+    with pytest.raises(RuntimeError, match="broken"):
+        await d.reload(config)
+
+    # The old version keeps serving
+    assert await d.run_workflow("reload_d") == "v1"
+
+
+@pytest.mark.asyncio
+async def test_deployment_reload_ui_server(
+    data_path: Path, tmp_path: Path, mock_importlib: Any
+) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS"):
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    old_process = mock.MagicMock(returncode=None)
+    new_process = mock.MagicMock(returncode=None)
+    d._ui_server_process = old_process
+    assert d.ui_port == 3000
+
+    async def start_ui_server(port: int | None = None) -> None:
+        d._ui_server_process = new_process
+
+    d._start_ui_server = mock.AsyncMock(side_effect=start_ui_server)  # type: ignore
+
+    # The old server keeps serving if the new one doesn't become ready
+    with (
+        mock.patch.object(d, "_wait_ui_server_ready", return_value=False),
+        mock.patch(
+            "llama_deploy.apiserver.deployment._terminate_ui_server"
+        ) as terminate_ui_server,
+    ):
+        await d._reload_ui_server()
+        await asyncio.gather(*d._ui_stop_tasks)
+    terminate_ui_server.assert_awaited_once_with(new_process, UI_SERVER_STOP_TIMEOUT)
+    assert d._ui_server_process is old_process
+    assert d.ui_port == 3000
+
+    # Otherwise the proxy switches to the new server before stopping the old one
+    with (
+        mock.patch.object(d, "_wait_ui_server_ready", return_value=True),
+        mock.patch(
+            "llama_deploy.apiserver.deployment._terminate_ui_server"
+        ) as terminate_ui_server,
+    ):
+        await d._reload_ui_server()
+        await asyncio.gather(*d._ui_stop_tasks)
+    port = d._start_ui_server.call_args.args[0]
+    assert port != 3000
+    assert d.ui_port == port
+    assert d._ui_server_process is new_process
+    terminate_ui_server.assert_awaited_once_with(old_process, UI_SERVER_STOP_TIMEOUT)
+
+
+@pytest.mark.asyncio
+async def test_wait_ui_server_ready(
+    data_path: Path, tmp_path: Path, mock_importlib: Any, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "reload_ui_ready_timeout", 2)
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS"):
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    url = "http://localhost:4242/deployments/test-deployment/ui"
+
+    with respx.mock:
+        respx.get(url).mock(
+            side_effect=[httpx.ConnectError("starting"), httpx.Response(200)]
+        )
+        assert await d._wait_ui_server_ready(4242)
+
+    # Give up when the server exits
+    d._ui_server_process = mock.MagicMock(returncode=1)
+    assert not await d._wait_ui_server_ready(4242)
+
+
+WATCHED_WORKFLOW = """
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+from {package} import helpers, unrelated
+
+
+class W(Workflow):
+    @step
+    async def run_step(self, ev: StartEvent) -> StopEvent:
+        return StopEvent(result=helpers.RESULT)
+
+
+workflow = W()
+"""
+
+
+def _watched_project(tmp_path: Path, service_id: str, monkeypatch: Any) -> Path:
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    package = f"pkg_{service_id}"
+    for module_name in (f"wf_{service_id}", package):
+        monkeypatch.delitem(sys.modules, module_name, raising=False)
+    for module_name in ("helpers", "unrelated"):
+        monkeypatch.delitem(sys.modules, f"{package}.{module_name}", raising=False)
+
+    service_path = tmp_path / service_id
+    (service_path / package).mkdir(parents=True)
+    (service_path / package / "__init__.py").write_text("")
+    (service_path / package / "helpers.py").write_text("RESULT = 'v1'")
+    (service_path / package / "unrelated.py").write_text("VALUE = 1")
+    (service_path / f"wf_{service_id}.py").write_text(
+        WATCHED_WORKFLOW.format(package=package)
+    )
+    return service_path
+
+
+@pytest.mark.asyncio
+async def test_deployment_reimport_services(tmp_path: Path, monkeypatch: Any) -> None:
+    service_path = _watched_project(tmp_path, "watch_a", monkeypatch)
+    d = Deployment(
+        config=_reload_config({"watch_a": {}}),
+        base_path=tmp_path,
+        deployment_path=tmp_path,
+        local=True,
+    )
+    assert await d.run_workflow("watch_a") == "v1"
+    unrelated = sys.modules["pkg_watch_a.unrelated"]
+
+    # Only the changed module and the modules depending on it are re-executed
+    helpers_file = service_path / "pkg_watch_a" / "helpers.py"
+    helpers_file.write_text("RESULT = 'v2'")
+    await d.reimport_services(["watch_a"], {helpers_file.resolve()})
+    assert await d.run_workflow("watch_a") == "v2"
+    assert sys.modules["pkg_watch_a.unrelated"] is unrelated
+
+    # A broken module keeps the old version serving
+    helpers_file.write_text("RESULT = ")
+    await d.reimport_services(["watch_a"], {helpers_file.resolve()})
+    assert await d.run_workflow("watch_a") == "v2"
+    assert "watch_a" not in d._pending_services
+
+    # Without changed files, every module of the service is re-executed
+    helpers_file.write_text("RESULT = 'v3'")
+    await d.reimport_services(["watch_a"])
+    assert await d.run_workflow("watch_a") == "v3"
+    assert sys.modules["pkg_watch_a.unrelated"] is not unrelated
+
+
+@pytest.mark.asyncio
+async def test_deployment_watch(tmp_path: Path, monkeypatch: Any) -> None:
+    monkeypatch.setattr(settings, "watch", True)
+    monkeypatch.setattr(settings, "watch_force_polling", True)
+    service_path = _watched_project(tmp_path, "watch_b", monkeypatch)
+    d = Deployment(
+        config=_reload_config({"watch_b": {}}),
+        base_path=tmp_path,
+        deployment_path=tmp_path,
+        local=True,
+    )
+    await d.start()
+    assert d._watch_task is not None
+    try:
+        await asyncio.sleep(0.3)
+        (service_path / "pkg_watch_b" / "helpers.py").write_text("RESULT = 'v2'")
+
+        async def wait_for_new_code() -> None:
+            while await d.run_workflow("watch_b") != "v2":
+                await asyncio.sleep(0.05)
+
+        await asyncio.wait_for(wait_for_new_code(), timeout=5)
+    finally:
+        d._watch_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_deployment_watch_remote(
+    data_path: Path, mock_importlib: Any, tmp_path: Path, monkeypatch: Any
+) -> None:
+    monkeypatch.setattr(settings, "watch", True)
+    config = DeploymentConfig.from_yaml(data_path / "git_service.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS"):
+        d = Deployment(config=config, base_path=data_path, deployment_path=tmp_path)
+    await d.start()
+    # Only local deployments are watched
+    assert d._watch_task is None
+
+
+class BusyWorkflow(Workflow):
+    @step
+    async def busy_step(self, ev: StartEvent) -> StopEvent:
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+        return StopEvent(result="done")
+
+
+@pytest.mark.asyncio
+async def test_manager_step_labeler(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    workflow = BusyWorkflow()
+    deployment._workflow_services = {"busy-service": workflow}
+    manager = Manager()
+    manager._deployments["test-deployment"] = deployment
+
+    profiler = SamplingProfiler(
+        interval=0.001,
+        thread_ids={threading.get_ident()},
+        label_frame=manager.step_labeler(),
+    )
+    profiler.start()
+    assert await deployment.run_workflow("busy-service") == "done"
+    # Workflows unknown to the manager are labeled with their class
+    assert await BusyWorkflow().run() == "done"
+    profiler.stop()
+
+    stacks = profiler.collapsed()
+    assert "[test-deployment/busy-service/busy_step];" in stacks
+    assert "[BusyWorkflow/busy_step];" in stacks
+    assert deployment.service_of(workflow) == "busy-service"
+    assert deployment.service_of(BusyWorkflow()) is None
+
+
+class SleepyWorkflow(Workflow):
+    cancelled_steps = 0
+
+    @step
+    async def sleep_step(self, ev: StartEvent) -> StopEvent:
+        try:
+            await asyncio.sleep(ev.get("seconds", 10))
+        except asyncio.CancelledError:
+            self.cancelled_steps += 1
+            raise
+        return StopEvent(result="awake")
+
+
+def _cancelled_tasks(reason: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "deployment_cancelled_tasks_total",
+            {"deployment_name": "test-deployment", "reason": reason},
+        )
+        or 0.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_timeout(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"sleepy": SleepyWorkflow(timeout=None)}
+    cancelled = _cancelled_tasks("timeout")
+
+    with pytest.raises(asyncio.TimeoutError):
+        await deployment.run_workflow("sleepy", task_timeout=0.05)
+    assert _cancelled_tasks("timeout") == cancelled + 1
+
+    assert await deployment.run_workflow("sleepy", task_timeout=1, seconds=0) == "awake"  # type:ignore
+
+    # The service timeout applies when shorter than the requested one
+    deployment._config.services["sleepy"] = Service.model_validate(
+        {
+            "name": "Sleepy",
+            "source": {"type": "local", "location": "."},
+            "timeout": 0.05,
+        }
+    )
+    with pytest.raises(asyncio.TimeoutError):
+        await deployment.run_workflow("sleepy", task_timeout=10)
+    with pytest.raises(asyncio.TimeoutError):
+        await deployment.run_workflow("sleepy")
+    assert _cancelled_tasks("timeout") == cancelled + 3
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_caller_cancelled(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    workflow = SleepyWorkflow(timeout=None)
+    deployment._workflow_services = {"sleepy": workflow}
+    cancelled = _cancelled_tasks("disconnect")
+
+    run = asyncio.create_task(deployment.run_workflow("sleepy"))
+    await asyncio.sleep(0.01)
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    await asyncio.sleep(0.01)
+
+    # The workflow stopped with its caller
+    assert workflow.cancelled_steps == 1
+    assert _cancelled_tasks("disconnect") == cancelled + 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_task(deployment_config: DeploymentConfig, tmp_path: Path) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"sleepy": SleepyWorkflow(timeout=None)}
+    session_id = await deployment.create_session()
+    cancelled = _cancelled_tasks("request")
+
+    task_id, task_session_id = await deployment.run_workflow_no_wait("sleepy")
+    other_task_id, _ = await deployment.run_workflow_no_wait("sleepy", session_id)
+    await asyncio.sleep(0.01)
+
+    assert await deployment.cancel_task(task_id)
+    with pytest.raises(WorkflowCancelledByUser):
+        await deployment._handlers[task_id]
+    # The session started by the task is freed
+    assert task_session_id not in deployment._contexts
+    assert await deployment.cancel_task(task_id) is False
+
+    # Sessions created by the client are kept
+    assert await deployment.cancel_task(other_task_id)
+    assert session_id in deployment._contexts
+    assert _cancelled_tasks("request") == cancelled + 2
+
+    with pytest.raises(KeyError):
+        await deployment.cancel_task("unknown")
+
+
+@pytest.mark.asyncio
+async def test_run_workflow_no_wait_timeout(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = Deployment(
+        config=deployment_config, base_path=Path(), deployment_path=tmp_path
+    )
+    deployment._workflow_services = {"sleepy": SleepyWorkflow(timeout=None)}
+
+    task_id, session_id = await deployment.run_workflow_no_wait(
+        "sleepy", task_timeout=0.05
+    )
+    done_id, _ = await deployment.run_workflow_no_wait(
+        "sleepy",
+        task_timeout=1,
+        seconds=0,  # type:ignore
+    )
+    assert deployment.registry_sizes["timeout_tasks"] == 2
+
+    with pytest.raises(WorkflowCancelledByUser):
+        await deployment._handlers[task_id]
+    assert await deployment._handlers[done_id] == "awake"
+    await asyncio.sleep(0.01)
+    assert session_id not in deployment._contexts
+    assert deployment.registry_sizes["timeout_tasks"] == 0
+
+
+class MiddleEvent(Event):
+    pass
+
+
+class ResumableWorkflow(Workflow):
+    first_steps = 0
+    sleep = 10.0
+
+    @step
+    async def first_step(self, ev: StartEvent) -> MiddleEvent:
+        type(self).first_steps += 1
+        return MiddleEvent()
+
+    @step
+    async def second_step(self, ev: MiddleEvent) -> StopEvent:
+        await asyncio.sleep(self.sleep)
+        return StopEvent(result="resumed")
+
+
+def _recovered_tasks(outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "deployment_recovered_tasks_total",
+            {"deployment_name": "test-deployment", "outcome": outcome},
+        )
+        or 0.0
+    )
+
+
+def _queued_deployment(
+    config: DeploymentConfig,
+    tmp_path: Path,
+    queue: SqliteTaskQueue | None,
+    worker_id: str,
+) -> Deployment:
+    deployment = Deployment(
+        config=config,
+        base_path=Path(),
+        deployment_path=tmp_path,
+        worker_id=worker_id,
+        task_queue=queue,
+    )
+    deployment._workflow_services = {
+        "sleepy": SleepyWorkflow(timeout=None),
+        "resumable": ResumableWorkflow(timeout=None),
+    }
+    return deployment
+
+
+async def _completed(deployment: Deployment, task_id: str) -> None:
+    """Waits for a task to complete and for its removal from the queue, done in a thread."""
+    # The callbacks of the handler run before the ones added by `wait`
+    await asyncio.wait([deployment._handlers[task_id]])
+    await asyncio.gather(*deployment._background_writes)
+
+
+@pytest.mark.asyncio
+async def test_task_queue(deployment_config: DeploymentConfig, tmp_path: Path) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    deployment = _queued_deployment(deployment_config, tmp_path, queue, "w1")
+
+    task_id, session_id = await deployment.run_workflow_no_wait("sleepy", seconds=0)  # type:ignore
+    # The task is persisted before its id is returned
+    [queued] = queue.list_tasks("test-deployment")
+    assert queued.task_id == task_id
+    assert queued.session_id == session_id
+    assert queued.service_id == "sleepy"
+    assert json.loads(queued.input) == {"seconds": 0}
+
+    assert await deployment._handlers[task_id] == "awake"
+    await _completed(deployment, task_id)
+    assert queue.list_tasks("test-deployment") == []
+
+    # Cancelled tasks are completed too
+    task_id, _ = await deployment.run_workflow_no_wait("sleepy")
+    await asyncio.sleep(0.01)
+    await deployment.cancel_task(task_id)
+    await _completed(deployment, task_id)
+    assert queue.list_tasks("test-deployment") == []
+
+    # Tasks failing to start are never recovered
+    with mock.patch.object(
+        SleepyWorkflow, "run", side_effect=RuntimeError("broken")
+    ), pytest.raises(RuntimeError):
+        await deployment.run_workflow_no_wait("sleepy")
+    await asyncio.gather(*deployment._background_writes)
+    assert queue.list_tasks("test-deployment") == []
+
+
+@pytest.mark.asyncio
+async def test_recover_tasks(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    task_id, session_id = "task", "session"
+    # A worker crashed before the task completed
+    queue.put(
+        "test-deployment",
+        QueuedTask(
+            task_id=task_id,
+            session_id=session_id,
+            service_id="sleepy",
+            input='{"seconds": 0.01}',
+            worker_id="crashed-worker",
+        ),
+    )
+    # The tasks of the workers still running are not recovered
+    queue.renew_lease("live-worker")
+    queue.put(
+        "test-deployment",
+        QueuedTask(
+            task_id="other-task",
+            session_id="other-session",
+            service_id="sleepy",
+            input="{}",
+            worker_id="live-worker",
+        ),
+    )
+    restarted = _recovered_tasks("restarted")
+
+    deployment = _queued_deployment(deployment_config, tmp_path, queue, "w2")
+    await deployment.recover_tasks()
+
+    assert list(deployment._handlers) == [task_id]
+    assert session_id in deployment._contexts
+    assert await deployment._handlers[task_id] == "awake"
+    await _completed(deployment, task_id)
+    assert _recovered_tasks("restarted") == restarted + 1
+    assert [t.task_id for t in queue.list_tasks("test-deployment")] == ["other-task"]
+
+
+@pytest.mark.asyncio
+async def test_recover_tasks_from_checkpoint(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    deployment = _queued_deployment(deployment_config, tmp_path, queue, "w1")
+    ResumableWorkflow.first_steps = 0
+    task_id, _ = await deployment.run_workflow_no_wait("resumable")
+    await asyncio.sleep(0.05)
+
+    assert deployment.checkpoint_tasks() == 1
+    [queued] = queue.list_tasks("test-deployment")
+    assert queued.checkpoint is not None
+    await deployment.cancel_task(task_id)
+    await _completed(deployment, task_id)
+    # The task was interrupted before its cancellation reached the queue
+    queue.put("test-deployment", queued)
+
+    resumed = _recovered_tasks("resumed")
+    ResumableWorkflow.sleep = 0
+    try:
+        deployment = _queued_deployment(deployment_config, tmp_path, queue, "w2")
+        await deployment.recover_tasks()
+        assert await deployment._handlers[task_id] == "resumed"
+        await _completed(deployment, task_id)
+    finally:
+        ResumableWorkflow.sleep = 10.0
+
+    # The first step didn't run again
+    assert ResumableWorkflow.first_steps == 1
+    assert _recovered_tasks("resumed") == resumed + 1
+    assert queue.list_tasks("test-deployment") == []
+
+
+@pytest.mark.asyncio
+async def test_recover_tasks_abandoned(
+    deployment_config: DeploymentConfig, tmp_path: Path, caplog: Any
+) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    queue.put(
+        "test-deployment",
+        QueuedTask(
+            task_id="task",
+            session_id="session",
+            service_id="sleepy",
+            input="{}",
+            worker_id="w1",
+            attempts=3,
+        ),
+    )
+    queue.put(
+        "test-deployment",
+        QueuedTask(
+            task_id="broken-task",
+            session_id="session",
+            service_id="removed-service",
+            input="{}",
+            worker_id="w1",
+        ),
+    )
+    abandoned = _recovered_tasks("abandoned")
+    failed = _recovered_tasks("failed")
+
+    with mock.patch.object(settings, "task_max_attempts", 3):
+        deployment = _queued_deployment(deployment_config, tmp_path, queue, "w2")
+        await deployment.recover_tasks()
+
+    assert deployment._handlers == {}
+    assert queue.list_tasks("test-deployment") == []
+    assert _recovered_tasks("abandoned") == abandoned + 1
+    assert _recovered_tasks("failed") == failed + 1
+    assert "Abandoning task task of test-deployment after 3 attempts" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_manager_shutdown(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    deployment = _queued_deployment(deployment_config, tmp_path, queue, "w1")
+    deployment._default_service = "sleepy"
+    manager = Manager()
+    manager._deployments["test-deployment"] = deployment
+    manager.set_task_queue(queue)
+
+    quick_id, _ = await deployment.run_workflow_no_wait("sleepy", seconds=0.05)  # type:ignore
+    slow_id, _ = await deployment.run_workflow_no_wait("sleepy", seconds=10)  # type:ignore
+    session_id = await deployment.create_session()
+    assert manager.accepting_tasks
+
+    await manager.shutdown(0.2)
+
+    assert not manager.accepting_tasks
+    # The quick task completed during the grace period, the slow one resumes on restart
+    assert deployment._handlers[quick_id].done()
+    [queued] = queue.list_tasks("test-deployment")
+    assert queued.task_id == slow_id
+    assert queued.checkpoint is not None
+    assert (
+        REGISTRY.get_sample_value(
+            "deployment_state",
+            {"deployment_name": "test-deployment", "deployment_state": "stopped"},
+        )
+        == 1.0
+    )
+
+    restored = _queued_deployment(deployment_config, tmp_path, queue, "w2")
+    restored._default_service = "resumable"
+    await restored.restore_sessions()
+    assert session_id in restored._contexts
+    assert len(restored._contexts) == 3
+    # Sessions are restored against the service they were created for
+    assert set(restored._session_services.values()) == {"sleepy"}
+    # Sessions are restored once
+    assert queue.take_sessions("test-deployment") == []
+
+    await deployment.cancel_task(slow_id)
+
+
+@pytest.mark.asyncio
+async def test_manager_lease(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    deployment = _queued_deployment(deployment_config, tmp_path, queue, "w2")
+    manager = Manager()
+    manager._worker_id = "w2"
+    manager.set_deployments_path(tmp_path)
+    manager.set_task_queue(queue)
+    manager._deployments["test-deployment"] = deployment
+    # A worker crashed while running a task, the restarted one has another id
+    queue.renew_lease("w1", ttl=0)
+    queue.put(
+        "test-deployment",
+        QueuedTask(
+            task_id="task",
+            session_id="session",
+            service_id="sleepy",
+            input='{"seconds": 0}',
+            worker_id="w1",
+        ),
+    )
+
+    serve_task = asyncio.create_task(manager.serve())
+    for _ in range(100):
+        if "task" in deployment._handlers:
+            break
+        await asyncio.sleep(0.01)
+    assert queue.live_workers() == {"w2"}
+    await _completed(deployment, "task")
+    assert queue.list_tasks("test-deployment") == []
+
+    # The lease is released on shutdown
+    await manager.shutdown(0)
+    assert queue.live_workers() == set()
+    serve_task.cancel()
+    await serve_task
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_deployment_drain(
+    deployment_config: DeploymentConfig, tmp_path: Path
+) -> None:
+    deployment = _queued_deployment(deployment_config, tmp_path, None, "w1")
+    assert await deployment.drain(1) == 0
+
+    task_id, _ = await deployment.run_workflow_no_wait("sleepy", seconds=10)  # type:ignore
+    assert await deployment.drain(0) == 1
+    assert await deployment.drain(0.01) == 1
+
+    await deployment.cancel_task(task_id)
+    assert await deployment.drain(1) == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="No process groups on Windows")
+async def test_terminate_ui_server() -> None:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        "import time; time.sleep(60)",
+        start_new_session=True,
+    )
+    await _terminate_ui_server(process, 10)
+    assert process.returncode == -signal.SIGTERM
+
+    # A server ignoring SIGTERM is killed
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        "import signal, sys, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+        "print(flush=True); time.sleep(60)",
+        stdout=asyncio.subprocess.PIPE,
+        start_new_session=True,
+    )
+    assert process.stdout is not None
+    await process.stdout.readline()
+    await _terminate_ui_server(process, 0.1)
+    assert process.returncode == -signal.SIGKILL
+
+
+@pytest.mark.asyncio
+async def test_deployment_stop(data_path: Path, tmp_path: Path) -> None:
+    config = DeploymentConfig.from_yaml(data_path / "with_ui.yaml")
+    with mock.patch("llama_deploy.apiserver.deployment.SOURCE_MANAGERS"):
+        deployment = Deployment(
+            config=config, base_path=data_path, deployment_path=tmp_path
+        )
+    process = mock.MagicMock()
+    deployment._ui_server_process = process
+    deployment._running = True
+
+    with mock.patch(
+        "llama_deploy.apiserver.deployment._terminate_ui_server"
+    ) as terminate_ui_server:
+        await deployment.stop()
+
+    terminate_ui_server.assert_awaited_once_with(process, UI_SERVER_STOP_TIMEOUT)
+    assert not deployment._running
@@ -0,0 +1,163 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Generator
+
+import pytest
+from prometheus_client import REGISTRY
+from workflows import Context, Workflow, step
+from workflows.errors import WorkflowRuntimeError
+from workflows.events import Event, StartEvent, StopEvent
+
+from llama_deploy.apiserver.deployment import Deployment
+from llama_deploy.apiserver.deployment_config_parser import (
+    BrokerType,
+    DeploymentConfig,
+    EventSink,
+)
+from llama_deploy.apiserver.event_sinks import EventBatcher, EventPublisher
+from llama_deploy.apiserver.ingestion import MemoryBroker
+
+
+class ProgressEvent(Event):
+    step: int
+
+
+class ProgressWorkflow(Workflow):
+    @step
+    async def work(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        for i in range(ev.get("steps", 2)):
+            ctx.write_event_to_stream(ProgressEvent(step=i))
+        if ev.get("fail"):
+            raise ValueError("failed on purpose")
+        return StopEvent(result="done")
+
+
+class FlakyPublisher(EventPublisher):
+    def __init__(self) -> None:
+        self.published: list[tuple[bytes, bytes]] = []
+        self.failures = 0
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+        self.stopped = False
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        self.stopped = True
+
+    async def publish(self, messages: list[tuple[bytes, bytes]]) -> None:
+        await self.unblocked.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker unavailable")
+        self.published.extend(messages)
+
+
+@pytest.fixture(autouse=True)
+def memory_broker() -> Generator[None, None, None]:
+    MemoryBroker.reset()
+    yield
+    MemoryBroker.reset()
+
+
+def _messages(outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "event_sink_messages_total",
+            {"deployment_name": "sinking", "outcome": outcome},
+        )
+        or 0.0
+    )
+
+
+def _published() -> list[dict]:
+    return [json.loads(value) for _, value in MemoryBroker.topics["events"]]
+
+
+@pytest.mark.asyncio
+async def test_publish_task_events(tmp_path: Path) -> None:
+    config = DeploymentConfig(
+        name="sinking",
+        default_service=None,
+        services={},
+        event_sink=EventSink(type=BrokerType.memory, topic="events"),
+    )
+    deployment = Deployment(config=config, base_path=Path(), deployment_path=tmp_path)
+    deployment._workflow_services = {"progress": ProgressWorkflow(timeout=None)}
+    published = _messages("published")
+    await deployment.start()
+
+    task_id, session_id = await deployment.run_workflow_no_wait("progress")
+    # Clients streaming over HTTP still get every event
+    streamed = [
+        ev
+        async for ev in deployment._handlers[task_id].stream_events()
+        if isinstance(ev, ProgressEvent)
+    ]
+    assert [ev.step for ev in streamed] == [0, 1]
+    assert await deployment.run_workflow("progress", steps=1) == "done"  # type: ignore
+    with pytest.raises(WorkflowRuntimeError):
+        await deployment.run_workflow("progress", steps=0, fail=True)  # type: ignore
+    await deployment.stop()
+
+    messages = _published()
+    task = [m for m in messages if m["task_id"] == task_id]
+    assert [m["type"] for m in task] == ["event", "event", "event", "result"]
+    assert task[0]["event"]["value"] == {"step": 0}
+    assert task[0]["session_id"] == session_id
+    assert task[0]["service_id"] == "progress"
+    assert task[-1]["result"] == "done"
+    # Events of a task share its key, to keep them ordered in a partition
+    keys = {key for key, value in MemoryBroker.topics["events"]}
+    assert task_id.encode() in keys
+    errors = [m for m in messages if m["type"] == "error"]
+    assert len(errors) == 1
+    assert "failed on purpose" in errors[0]["error"]
+    assert _messages("published") == published + len(messages)
+
+
+@pytest.mark.asyncio
+async def test_batcher_drops_events() -> None:
+    config = EventSink(type=BrokerType.memory, topic="events", max_pending=2)
+    publisher = FlakyPublisher()
+    publisher.unblocked.clear()
+    batcher = EventBatcher("sinking", config, publisher)
+    dropped = _messages("dropped")
+
+    batcher.start()
+    for i in range(3):
+        batcher.emit("task", None, "service", "result", i)
+    # The broker is slow, the tasks aren't
+    assert _messages("dropped") == dropped + 1
+
+    publisher.unblocked.set()
+    await batcher.stop()
+    assert [json.loads(v)["result"] for _, v in publisher.published] == [0, 1]
+    assert publisher.stopped
+
+
+@pytest.mark.asyncio
+async def test_batcher_failure() -> None:
+    config = EventSink(
+        type=BrokerType.memory, topic="events", batch_size=2, flush_interval=0.01
+    )
+    publisher = FlakyPublisher()
+    publisher.failures = 1
+    batcher = EventBatcher("sinking", config, publisher)
+    failed = _messages("failed")
+
+    batcher.start()
+    for i in range(3):
+        batcher.emit("task", None, "service", "result", i)
+    await asyncio.sleep(0.1)
+    batcher.emit("task", None, "service", "result", {"unserializable": object()})
+    await batcher.stop()
+
+    # The first batch was lost, the next ones went through
+    assert _messages("failed") == failed + 2
+    results = [json.loads(v) for _, v in publisher.published]
+    assert results[0]["result"] == 2
+    # Payloads that aren't JSON are published as strings
+    assert results[1]["result"]["unserializable"].startswith("<object object")
@@ -0,0 +1,225 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Generator
+from unittest import mock
+
+import pytest
+from prometheus_client import REGISTRY
+from workflows import Workflow, step
+from workflows.events import StartEvent, StopEvent
+
+from llama_deploy.apiserver.deployment import Deployment
+from llama_deploy.apiserver.deployment_config_parser import (
+    BrokerType,
+    DeploymentConfig,
+    IngestionSource,
+)
+from llama_deploy.apiserver.ingestion import (
+    IngestionConsumer,
+    MemoryBroker,
+    create_broker,
+)
+from llama_deploy.types.core import TaskDefinition
+
+
+class EchoWorkflow(Workflow):
+    running = 0
+    max_running = 0
+
+    @step
+    async def echo(self, ev: StartEvent) -> StopEvent:
+        EchoWorkflow.running += 1
+        EchoWorkflow.max_running = max(EchoWorkflow.max_running, self.running)
+        try:
+            await asyncio.sleep(ev.get("seconds", 0))
+        finally:
+            EchoWorkflow.running -= 1
+        if ev.get("fail"):
+            raise ValueError("failed on purpose")
+        return StopEvent(result=ev.get("text"))
+
+
+@pytest.fixture(autouse=True)
+def memory_broker() -> Generator[None, None, None]:
+    MemoryBroker.reset()
+    EchoWorkflow.max_running = 0
+    yield
+    MemoryBroker.reset()
+
+
+def _deployment(tmp_path: Path, **source: Any) -> Deployment:
+    config = DeploymentConfig(
+        name="ingesting",
+        default_service=None,
+        services={},
+        ingestion=[
+            IngestionSource(
+                type=BrokerType.memory,
+                topic="tasks",
+                reply_topic="results",
+                **source,
+            )
+        ],
+    )
+    deployment = Deployment(config=config, base_path=Path(), deployment_path=tmp_path)
+    deployment._workflow_services = {"echo": EchoWorkflow(timeout=None)}
+    return deployment
+
+
+def _publish(**run_kwargs: Any) -> None:
+    task = TaskDefinition(input=json.dumps(run_kwargs))
+    MemoryBroker.publish("tasks", task.model_dump_json().encode(), key=b"k")
+
+
+async def _wait_for_results(count: int) -> list[dict]:
+    for _ in range(500):
+        if len(MemoryBroker.topics["results"]) >= count:
+            break
+        await asyncio.sleep(0.01)
+    return [json.loads(value) for _, value in MemoryBroker.topics["results"]]
+
+
+def _ingested(outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "ingested_messages_total",
+            {"deployment_name": "ingesting", "topic": "tasks", "outcome": outcome},
+        )
+        or 0.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_consume(tmp_path: Path) -> None:
+    deployment = _deployment(tmp_path)
+    completed = _ingested("completed")
+    failed = _ingested("failed")
+    _publish(text="hello")
+    _publish(text="world", fail=True)
+    MemoryBroker.publish("tasks", b"not a task")
+
+    await deployment.start()
+    # Replies are published as tasks complete
+    results = {r["message_id"]: r for r in await _wait_for_results(3)}
+    await deployment.stop()
+
+    assert results["0"]["result"] == "hello"
+    assert "failed on purpose" in results["1"]["error"]
+    assert "error" in results["2"]
+    # Replies keep the key of their message
+    assert {key for key, _ in MemoryBroker.topics["results"]} == {b"k", None}
+    # Failed tasks are committed too
+    assert MemoryBroker.committed[("tasks", "llama-deploy-ingesting")] == 3
+    assert _ingested("completed") == completed + 1
+    assert _ingested("failed") == failed + 2
+    assert (
+        REGISTRY.get_sample_value(
+            "ingestion_lag", {"deployment_name": "ingesting", "topic": "tasks"}
+        )
+        == 0.0
+    )
+
+
+@pytest.mark.asyncio
+async def test_consume_concurrency(tmp_path: Path) -> None:
+    deployment = _deployment(tmp_path, concurrency=2, batch_size=4)
+    for i in range(8):
+        _publish(text=str(i), seconds=0.02)
+
+    await deployment.start()
+    results = await _wait_for_results(8)
+    await deployment.stop()
+
+    assert sorted(r["result"] for r in results) == [str(i) for i in range(8)]
+    assert EchoWorkflow.max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_consume_interrupted(tmp_path: Path) -> None:
+    source = IngestionSource(
+        type=BrokerType.memory, topic="tasks", reply_topic="results"
+    )
+    deployment = _deployment(tmp_path)
+    _publish(text="quick")
+    _publish(text="slow", seconds=10)
+
+    consumer = IngestionConsumer(deployment, source, create_broker(source, "group"))
+    consumer.start()
+    await _wait_for_results(1)
+    await consumer.stop(0.05)
+
+    # The batch wasn't committed, it's consumed again
+    assert ("tasks", "group") not in MemoryBroker.committed
+    broker = create_broker(source, "group")
+    await broker.start()
+    messages = await broker.fetch(10, 0)
+    assert [m.id for m in messages] == ["0", "1"]
+    assert await broker.lag() == 2
+
+
+@pytest.mark.asyncio
+async def test_drain_stops_consumers(tmp_path: Path) -> None:
+    deployment = _deployment(tmp_path)
+    await deployment.start()
+    _publish(text="hello", seconds=0.05)
+    await asyncio.sleep(0.02)
+
+    # The current batch completes before the consumer stops
+    assert await deployment.drain(5) == 0
+    assert deployment._consumers == []
+    assert MemoryBroker.committed[("tasks", "llama-deploy-ingesting")] == 1
+
+    _publish(text="ignored")
+    await asyncio.sleep(0.05)
+    assert len(MemoryBroker.topics["results"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_reload_ingestion(tmp_path: Path) -> None:
+    deployment = _deployment(tmp_path)
+    await deployment.start()
+    [consumer] = deployment._consumers
+
+    config = deployment._config.model_copy(deep=True)
+    config.ingestion[0].topic = "other-tasks"
+    with mock.patch.object(deployment, "_prepare_services", return_value=({}, None)):
+        await deployment.reload(config)
+
+    [new_consumer] = deployment._consumers
+    assert new_consumer is not consumer
+    assert new_consumer.source.topic == "other-tasks"
+    await deployment.stop()
+
+
+@pytest.mark.asyncio
+async def test_consume_broker_unreachable(tmp_path: Path) -> None:
+    source = IngestionSource(
+        type=BrokerType.memory, topic="tasks", reply_topic="results"
+    )
+    deployment = _deployment(tmp_path)
+    _publish(text="hello")
+    broker = create_broker(source, "group")
+    start = broker.start
+    attempts = 0
+
+    async def start_when_reachable() -> None:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise ConnectionError("broker down")
+        await start()
+
+    consumer = IngestionConsumer(deployment, source, broker)
+    with (
+        mock.patch.object(broker, "start", start_when_reachable),
+        mock.patch.object(broker, "stop", side_effect=ConnectionError("broker down")),
+        mock.patch("llama_deploy.apiserver.ingestion.consumer.RETRY_DELAY", 0),
+    ):
+        consumer.start()
+        results = await _wait_for_results(1)
+        # The failure to stop the broker is logged, not raised
+        await consumer.stop(1)
+
+    assert attempts == 2
+    assert results[0]["result"] == "hello"
@@ -0,0 +1,220 @@
+import asyncio
+import importlib
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+import pytest
+
+from llama_deploy.apiserver.profiling import (
+    ImportProfiler,
+    LoopLagMonitor,
+    MemoryProfiler,
+    SamplingProfiler,
+    count_objects,
+    count_reachable,
+)
+
+
+def test_import_profiler(tmp_path: Path, monkeypatch: Any) -> None:
+    pkg = tmp_path / "profiled_pkg"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("from . import child\n")
+    (pkg / "child.py").write_text("import time\ntime.sleep(0.01)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    with ImportProfiler() as profiler:
+        importlib.import_module("profiled_pkg")
+
+    assert profiler not in sys.meta_path
+    assert set(profiler.cumulative_times) == {"profiled_pkg", "profiled_pkg.child"}
+    # The package import includes the time spent importing the child module
+    assert profiler.self_times["profiled_pkg.child"] >= 0.01
+    assert profiler.self_times["profiled_pkg"] < 0.01
+    assert (
+        profiler.cumulative_times["profiled_pkg"]
+        >= profiler.cumulative_times["profiled_pkg.child"]
+    )
+    assert profiler.top(1) == [
+        ("profiled_pkg", profiler.cumulative_times["profiled_pkg"])
+    ]
+    assert profiler.total_seconds >= 0.01
+    # Loaders are restored after use
+    assert "exec_module" not in vars(sys.modules["profiled_pkg"].__loader__)
+
+    monkeypatch.delitem(sys.modules, "profiled_pkg")
+    monkeypatch.delitem(sys.modules, "profiled_pkg.child")
+
+
+def test_import_profiler_other_thread(tmp_path: Path, monkeypatch: Any) -> None:
+    (tmp_path / "profiled_main.py").write_text("import time\ntime.sleep(0.01)\n")
+    (tmp_path / "profiled_other.py").write_text("import time\ntime.sleep(0.01)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    with ImportProfiler() as profiler:
+        thread = threading.Thread(
+            target=importlib.import_module, args=("profiled_other",)
+        )
+        thread.start()
+        importlib.import_module("profiled_main")
+        thread.join()
+
+    # Imports running concurrently in other threads are left alone
+    assert set(profiler.cumulative_times) == {"profiled_main"}
+    assert "exec_module" not in vars(sys.modules["profiled_other"].__loader__)
+
+    monkeypatch.delitem(sys.modules, "profiled_main")
+    monkeypatch.delitem(sys.modules, "profiled_other")
+
+
+class Leaky:
+    def __init__(self) -> None:
+        self.items: list[bytes] = []
+
+    def grow(self) -> None:
+        self.items.extend(bytes(1024) for _ in range(100))
+
+
+def test_memory_profiler() -> None:
+    leaky = Leaky()
+    profiler = MemoryProfiler()
+    profiler.start()
+    try:
+        assert profiler.tracing
+        leaky.grow()
+
+        top = profiler.top_allocations(limit=5)
+        assert len(top) <= 5
+        assert all(stat.size_diff_bytes is None for stat in top)
+
+        diff = profiler.top_allocations(limit=1, diff=True)
+        assert diff[0].location.startswith(f"{__file__}:")
+        assert diff[0].size_diff_bytes is not None
+        assert diff[0].size_diff_bytes >= 100 * 1024
+        assert diff[0].count_diff is not None
+        assert diff[0].count_diff >= 100
+
+        # Compared with the previous diff, nothing grew in the same place
+        leaky.grow()
+        leaky.items.clear()
+        diff = profiler.top_allocations(limit=1, diff=True)
+        assert diff[0].size_diff_bytes is not None
+        assert diff[0].size_diff_bytes < 100 * 1024
+
+        current, peak = profiler.traced_memory()
+        assert peak >= current > 0
+    finally:
+        profiler.stop()
+
+    assert not profiler.tracing
+
+
+def test_memory_profiler_already_tracing() -> None:
+    tracemalloc.start()
+    try:
+        profiler = MemoryProfiler(frames=5)
+        profiler.start()
+        profiler.stop()
+        # Tracing started by someone else goes on
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_count_objects() -> None:
+    leaky = Leaky()
+    leaky.grow()
+
+    counts = count_objects(limit=3)
+    assert len(counts) == 3
+    assert list(counts.values()) == sorted(counts.values(), reverse=True)
+    assert count_reachable(leaky)["bytes"] == 100
+    assert count_reachable(leaky)[f"{__name__}.Leaky"] == 1
+    assert count_reachable(leaky, limit=1) == {"bytes": 100}
+    assert sum(count_reachable(leaky, max_objects=10).values()) < 10
+
+
+def _busy(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampling_profiler() -> None:
+    def label(frame: FrameType) -> str | None:
+        return "busy" if frame.f_code is _busy.__code__ else None
+
+    profiler = SamplingProfiler(
+        interval=0.001, thread_ids={threading.get_ident()}, label_frame=label
+    )
+    profiler.start()
+    _busy(0.1)
+    profiler.stop()
+
+    assert profiler.samples > 0
+    lines = profiler.collapsed().splitlines()
+    busy_lines = [line for line in lines if line.startswith("[busy];")]
+    assert busy_lines
+    stack, count = busy_lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert f"_busy ({__file__}:" in stack
+    # Stacks run from the outermost frame to the innermost one
+    assert stack.index("test_sampling_profiler") < stack.index("_busy")
+    assert profiler.collapsed("busy") == "\n".join(busy_lines) + "\n"
+    assert profiler.collapsed("other") == ""
+
+
+def test_sampling_profiler_all_threads() -> None:
+    thread = threading.Thread(target=_busy, args=(0.1,), name="busy-thread")
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    thread.start()
+    thread.join()
+    profiler.stop()
+
+    stacks = profiler.collapsed()
+    assert "[busy-thread];" in stacks
+    # The profiler doesn't sample itself
+    assert "[llama-deploy-profiler]" not in stacks
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor() -> None:
+    monitor = LoopLagMonitor(interval=0.01)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.02)
+    _busy(0.1)
+    await asyncio.sleep(0.02)
+    task.cancel()
+
+    assert monitor.max_lag >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_blocked(caplog: Any) -> None:
+    def label(frame: FrameType) -> str | None:
+        return "busy" if frame.f_code is _busy.__code__ else None
+
+    monitor = LoopLagMonitor(interval=0.01, block_threshold=0.05, label_frame=label)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.02)
+    _busy(0.3)
+    await asyncio.sleep(0.02)
+    # Short blocks are only measured
+    _busy(0.02)
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    assert len(monitor.blocked) == 1
+    block = monitor.blocked[0]
+    assert block.lag_seconds >= 0.2
+    assert block.label == "busy"
+    assert "in _busy" in block.stack[-1]
+    assert "Event loop blocked for" in caplog.text
+    assert "in test_loop_lag_monitor_blocked" in caplog.text
+    await asyncio.sleep(0.2)
+    assert not any(t.name == "llama-deploy-watchdog" for t in threading.enumerate())
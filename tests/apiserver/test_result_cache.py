@@ -0,0 +1,215 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+from prometheus_client import REGISTRY
+
+from llama_deploy.apiserver import result_cache
+from llama_deploy.apiserver.deployment_config_parser import ServiceCache
+from llama_deploy.apiserver.result_cache import ResultCache, cache_key
+
+
+class Runner:
+    def __init__(self, delay: float = 0.0) -> None:
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self) -> Any:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"result": self.calls}
+
+
+def _requests(service: str, outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "result_cache_requests_total",
+            {"deployment_name": "d", "service_name": service, "outcome": outcome},
+        )
+        or 0.0
+    )
+
+
+def test_cache_key() -> None:
+    assert cache_key("d", "s", {"a": 1, "b": [1, 2]}) == cache_key(
+        "d", "s", {"b": [1, 2], "a": 1}
+    )
+    assert cache_key("d", "s", {"a": 1}) != cache_key("d", "s", {"a": 2})
+    assert cache_key("d", "s", {"a": 1}) != cache_key("d", "other", {"a": 1})
+    assert cache_key("d", "s", {"a": 1}) != cache_key("d", "s", {"a": 1}, "v2")
+
+
+@pytest.mark.asyncio
+async def test_hit_and_miss(tmp_path: Path) -> None:
+    cache = ResultCache("d", "hit-miss", ServiceCache(), tmp_path)
+    run = Runner()
+
+    assert await cache.get_or_run({"q": "a"}, run) == {"result": 1}
+    assert await cache.get_or_run({"q": "a"}, run) == {"result": 1}
+    assert await cache.get_or_run({"q": "b"}, run) == {"result": 2}
+
+    assert run.calls == 2
+    assert _requests("hit-miss", "hit") == 1
+    assert _requests("hit-miss", "miss") == 2
+    assert (
+        REGISTRY.get_sample_value(
+            "result_cache_entries", {"deployment_name": "d", "service_name": "hit-miss"}
+        )
+        == 2
+    )
+
+
+@pytest.mark.asyncio
+async def test_ttl(tmp_path: Path) -> None:
+    cache = ResultCache("d", "ttl", ServiceCache(ttl=0.05), tmp_path)
+    run = Runner()
+
+    await cache.get_or_run({}, run)
+    await cache.get_or_run({}, run)
+    assert run.calls == 1
+    await asyncio.sleep(0.06)
+    assert await cache.get_or_run({}, run) == {"result": 2}
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction(tmp_path: Path) -> None:
+    cache = ResultCache("d", "lru", ServiceCache(max_entries=2), tmp_path)
+    run = Runner()
+
+    await cache.get_or_run({"q": 1}, run)
+    await cache.get_or_run({"q": 2}, run)
+    # Refresh 1, so that 2 is the least recently used
+    await cache.get_or_run({"q": 1}, run)
+    await cache.get_or_run({"q": 3}, run)
+    assert len(cache) == 2
+
+    await cache.get_or_run({"q": 1}, run)
+    assert run.calls == 3
+    await cache.get_or_run({"q": 2}, run)
+    assert run.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_single_flight(tmp_path: Path) -> None:
+    cache = ResultCache("d", "single-flight", ServiceCache(), tmp_path)
+    run = Runner(delay=0.05)
+
+    results = await asyncio.gather(*(cache.get_or_run({}, run) for _ in range(10)))
+
+    assert run.calls == 1
+    assert results == [{"result": 1}] * 10
+    assert _requests("single-flight", "coalesced") == 9
+
+
+@pytest.mark.asyncio
+async def test_single_flight_caller_cancelled(tmp_path: Path) -> None:
+    cache = ResultCache("d", "cancelled", ServiceCache(), tmp_path)
+    run = Runner(delay=0.05)
+
+    first = asyncio.create_task(cache.get_or_run({}, run))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(cache.get_or_run({}, run))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    # The run goes on for the other callers
+    assert await second == {"result": 1}
+    assert run.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_not_cached(tmp_path: Path) -> None:
+    cache = ResultCache("d", "errors", ServiceCache(), tmp_path)
+    calls = 0
+
+    async def fail() -> Any:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        cache.get_or_run({}, fail), cache.get_or_run({}, fail), return_exceptions=True
+    )
+    assert [str(r) for r in results] == ["boom", "boom"]
+    assert calls == 1
+
+    with pytest.raises(ValueError):
+        await cache.get_or_run({}, fail)
+    assert calls == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_disk_tier(tmp_path: Path) -> None:
+    config = ServiceCache(path="cache/results.db")
+    run = Runner()
+    cache = ResultCache("d", "disk", config, tmp_path)
+    await cache.get_or_run({"q": 1}, run)
+    cache.close()
+    assert (tmp_path / "cache" / "results.db").exists()
+
+    # A new cache, e.g. after a restart or in another worker, finds the result on disk
+    cache = ResultCache("d", "disk", config, tmp_path)
+    assert await cache.get_or_run({"q": 1}, run) == {"result": 1}
+    assert run.calls == 1
+    assert _requests("disk", "disk_hit") == 1
+    # Then in memory
+    assert await cache.get_or_run({"q": 1}, run) == {"result": 1}
+    assert _requests("disk", "hit") == 1
+
+    # Another version of the service doesn't read the result
+    other = ResultCache("d", "disk", config, tmp_path, version="v2")
+    assert await other.get_or_run({"q": 1}, run) == {"result": 2}
+    other.close()
+
+    cache.clear()
+    assert await cache.get_or_run({"q": 1}, run) == {"result": 3}
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_expired(tmp_path: Path) -> None:
+    config = ServiceCache(path="results.db", ttl=0.05)
+    run = Runner()
+    cache = ResultCache("d", "disk-expired", config, tmp_path)
+    await cache.get_or_run({}, run)
+    cache.close()
+    await asyncio.sleep(0.06)
+
+    cache = ResultCache("d", "disk-expired", config, tmp_path)
+    assert await cache.get_or_run({}, run) == {"result": 2}
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_eviction(tmp_path: Path, monkeypatch: Any) -> None:
+    monkeypatch.setattr(result_cache, "DISK_EVICTION_INTERVAL", 1)
+    config = ServiceCache(path="results.db", max_entries=1, disk_max_entries=2)
+    run = Runner()
+    cache = ResultCache("d", "disk-eviction", config, tmp_path)
+    for q in range(3):
+        await cache.get_or_run({"q": q}, run)
+    cache.close()
+
+    cache = ResultCache("d", "disk-eviction", config, tmp_path)
+    # The oldest result was evicted from disk
+    await cache.get_or_run({"q": 0}, run)
+    assert run.calls == 4
+    await cache.get_or_run({"q": 2}, run)
+    assert run.calls == 4
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_disk_tier_unserializable(tmp_path: Path, caplog: Any) -> None:
+    cache = ResultCache("d", "unserializable", ServiceCache(path="r.db"), tmp_path)
+
+    async def run() -> Any:
+        return object()
+
+    result = await cache.get_or_run({}, run)
+    assert await cache.get_or_run({}, run) is result
+    assert "not cached on disk" in caplog.text
+    cache.close()
@@ -1,11 +1,19 @@
+import asyncio
 import logging
+import sqlite3
+import tracemalloc
 from pathlib import Path
 from typing import Any
 from unittest import mock
 
 import pytest
+from fastapi import FastAPI
 
+from llama_deploy.apiserver import server
+from llama_deploy.apiserver.deployment import Manager
 from llama_deploy.apiserver.server import lifespan
+from llama_deploy.apiserver.state_stores import SqliteStateStore
+from llama_deploy.apiserver.task_queue import SqliteTaskQueue
 
 
 @pytest.mark.asyncio
@@ -22,10 +30,16 @@ async def test_lifespan(
         f.write(source_file.read_text())
 
     mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
     with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
         mocked_settings.rc_path = tmp_path
         mocked_settings.deployments_path = tmp_path / "foo/bar"
         mocked_settings.deployment_file_path = None
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
         mocked_manager.deployments_path = mocked_settings.deployments_path
         caplog.set_level(logging.INFO)
         async with lifespan(mock.AsyncMock()):
@@ -61,11 +75,17 @@ async def test_lifespan_with_specific_deployment_file(
         f.write(source_file.read_text())
 
     mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
     mocked_manager.deploy = mock.AsyncMock()
 
     with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
         mocked_settings.rc_path = tmp_path
         mocked_settings.deployment_file_path = "deployment.yml"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
         mocked_settings.deployments_path = tmp_path / "foo/bar"
         mocked_manager.deployments_path = mocked_settings.deployments_path
         caplog.set_level(logging.INFO)
@@ -79,3 +99,228 @@ async def test_lifespan_with_specific_deployment_file(
 
         # Should be called once for the specific file
         mocked_manager.deploy.assert_called_once()
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_rc_local(
+    mocked_manager: Any,
+    tmp_path: Path,
+    data_path: Path,
+) -> None:
+    target_file = tmp_path / "deployment.yml"
+    target_file.write_text((data_path / "git_service.yaml").read_text())
+
+    mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
+    mocked_manager.deploy = mock.AsyncMock()
+
+    with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
+        mocked_settings.rc_path = tmp_path
+        mocked_settings.deployment_file_path = "deployment.yml"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
+        mocked_settings.rc_local = True
+
+        async with lifespan(mock.AsyncMock()):
+            pass
+
+        mocked_manager.deploy.assert_awaited_once()
+        assert mocked_manager.deploy.call_args.kwargs == {
+            "base_path": str(tmp_path),
+            "local": True,
+        }
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_shared_state(mocked_manager: Any, tmp_path: Path) -> None:
+    mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
+    mocked_manager.worker_id = "42"
+
+    with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
+        mocked_settings.rc_path = tmp_path / "does-not-exist"
+        mocked_settings.shared_state_path = tmp_path / "state.db"
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
+
+        async with lifespan(FastAPI()):
+            store = mocked_manager.set_state_store.call_args.args[0]
+            assert isinstance(store, SqliteStateStore)
+            assert store.path == tmp_path / "state.db"
+            # The worker can be reached by the others
+            assert store.get_worker_address("42") == str(tmp_path / "worker-42.sock")
+            assert (tmp_path / "worker-42.sock").exists()
+
+        mocked_manager.set_state_store.assert_called_with(None)
+        assert not (tmp_path / "worker-42.sock").exists()
+        assert SqliteStateStore(tmp_path / "state.db").get_worker_address("42") is None
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_autodeploy(mocked_manager: Any, tmp_path: Path) -> None:
+    mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
+    mocked_manager.deploy = mock.AsyncMock()
+
+    with (
+        mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings,
+        mock.patch("llama_deploy.apiserver.server.AutoDeployer") as mocked_deployer,
+    ):
+        mocked_settings.rc_path = tmp_path / "work"
+        mocked_settings.deployment_file_path = "app/deployment.yml"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = "https://example.com/repo.git@main"
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
+        mocked_settings.autodeploy_poll_interval = 30.0
+        mocked_settings.rc_local = False
+        deployer: mock.MagicMock = mocked_deployer.return_value
+        deployer.try_lock.return_value = True
+        deployer.watch = mock.AsyncMock()
+
+        async with lifespan(FastAPI()):
+            assert server.autodeployer is not None
+            assert server.autodeployer is deployer
+            mocked_deployer.assert_called_once_with(
+                "https://example.com/repo.git@main",
+                work_dir=tmp_path / "work",
+                deployment_file_path="app/deployment.yml",
+                cache_dir=mocked_settings.autodeploy_cache_dir,
+                token=mocked_settings.autodeploy_token,
+                deployment_name=mocked_settings.autodeploy_deployment_name,
+            )
+            deployer.sync.assert_called_once()
+            mocked_manager.deploy.assert_awaited_once_with(
+                deployer.load_config.return_value,
+                base_path=str(deployer.deployment_folder),
+            )
+            deployer.set_deployed.assert_called_once()
+            await asyncio.sleep(0)
+            deployer.watch.assert_awaited_once_with(mocked_manager, 30.0)
+
+        assert server.autodeployer is None
+        deployer.unlock.assert_called_once()
+
+        # Another worker holds the lock, it syncs and watches the repository
+        deployer.reset_mock()
+        mocked_manager.deploy.reset_mock()
+        deployer.try_lock.return_value = False
+        async with lifespan(FastAPI()):
+            assert server.autodeployer is None
+            deployer.sync.assert_not_called()
+            mocked_manager.deploy.assert_not_awaited()
+            deployer.watch.assert_not_called()
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_debug_memory(mocked_manager: Any, tmp_path: Path) -> None:
+    mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
+
+    with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
+        mocked_settings.rc_path = tmp_path / "does-not-exist"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = True
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0
+        mocked_settings.debug_memory_frames = 1
+
+        async with lifespan(FastAPI()):
+            assert server.memory_profiler is not None
+            assert server.memory_profiler.tracing
+
+        assert server.memory_profiler is None
+        assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_loop_monitor(mocked_manager: Any, tmp_path: Path) -> None:
+    mocked_manager.serve = mock.AsyncMock()
+    mocked_manager.shutdown = mock.AsyncMock()
+
+    with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
+        mocked_settings.rc_path = tmp_path / "does-not-exist"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.task_queue_path = None
+        mocked_settings.loop_lag_interval = 0.01
+        mocked_settings.loop_block_threshold = 0.05
+
+        async with lifespan(FastAPI()):
+            assert server.loop_monitor is not None
+            await asyncio.sleep(0.05)
+            assert server.loop_monitor.last_lag < 0.05
+
+        assert server.loop_monitor is None
+
+
+@pytest.mark.asyncio
+@mock.patch("llama_deploy.apiserver.server.manager")
+async def test_lifespan_task_queue(mocked_manager: Any, tmp_path: Path) -> None:
+    mocked_manager.serve = mock.AsyncMock()
+    queues: list[SqliteTaskQueue] = []
+
+    async def shutdown(grace_period: float) -> None:
+        # The queue is still open to checkpoint the running tasks
+        queues[0].list_tasks("d")
+
+    mocked_manager.shutdown = mock.AsyncMock(side_effect=shutdown)
+
+    with mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings:
+        mocked_settings.rc_path = tmp_path / "does-not-exist"
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.loop_lag_interval = 0
+        mocked_settings.task_queue_path = tmp_path / "tasks.db"
+
+        async with lifespan(FastAPI()):
+            queue = mocked_manager.set_task_queue.call_args.args[0]
+            assert isinstance(queue, SqliteTaskQueue)
+            assert queue.path == tmp_path / "tasks.db"
+            queues.append(queue)
+            mocked_manager.shutdown.assert_not_awaited()
+
+        # Running tasks are drained and checkpointed before the queue is closed
+        mocked_manager.shutdown.assert_awaited_once_with(
+            mocked_settings.shutdown_grace_period
+        )
+        mocked_manager.set_task_queue.assert_called_with(None)
+        with pytest.raises(sqlite3.ProgrammingError):
+            queue.list_tasks("d")
+
+
+@pytest.mark.asyncio
+async def test_lifespan_twice(tmp_path: Path) -> None:
+    manager = Manager()
+    with (
+        mock.patch("llama_deploy.apiserver.server.manager", manager),
+        mock.patch("llama_deploy.apiserver.server.settings") as mocked_settings,
+    ):
+        mocked_settings.rc_path = tmp_path / "does-not-exist"
+        mocked_settings.deployments_path = tmp_path
+        mocked_settings.shared_state_path = None
+        mocked_settings.autodeploy_repo_url = None
+        mocked_settings.debug_memory = False
+        mocked_settings.loop_lag_interval = 0
+        mocked_settings.task_queue_path = None
+        mocked_settings.shutdown_grace_period = 0
+
+        # Tasks are accepted again when the app starts again in the same process
+        for _ in range(2):
+            async with lifespan(FastAPI()):
+                assert manager.accepting_tasks
+            assert not manager.accepting_tasks
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from llama_deploy.apiserver.task_queue import (
+    QueuedTask,
+    SavedSession,
+    SqliteTaskQueue,
+    new_worker_id,
+    worker_alive,
+)
+
+
+def _task(task_id: str, worker_id: str = "w1") -> QueuedTask:
+    return QueuedTask(
+        task_id=task_id,
+        session_id=f"session-{task_id}",
+        service_id="service",
+        input='{"a": 1}',
+        worker_id=worker_id,
+    )
+
+
+def test_queue(tmp_path: Path) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    queue.put("foo", _task("t1"))
+    queue.put("foo", _task("t2"))
+    queue.put("bar", _task("t3"))
+
+    assert [t.task_id for t in queue.list_tasks("foo")] == ["t1", "t2"]
+    assert queue.list_tasks("foo")[0] == _task("t1")
+
+    queue.checkpoint("foo", "t2", '{"is_running": true}')
+    queue.complete("foo", "t1")
+    tasks = queue.list_tasks("foo")
+    assert [t.task_id for t in tasks] == ["t2"]
+    assert tasks[0].checkpoint == '{"is_running": true}'
+    queue.close()
+
+    # Tasks survive a restart
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    assert [t.task_id for t in queue.list_tasks("foo")] == ["t2"]
+    queue.close()
+
+
+def test_claim(tmp_path: Path) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    other = SqliteTaskQueue(tmp_path / "tasks.db")
+    queue.put("foo", _task("t1"))
+    task = queue.list_tasks("foo")[0]
+
+    claimed = queue.claim("foo", task, "w2")
+    assert claimed is not None
+    assert claimed.worker_id == "w2"
+    assert claimed.attempts == 2
+    assert queue.list_tasks("foo") == [claimed]
+    # Another worker recovering the same task at the same time loses
+    assert other.claim("foo", task, "w3") is None
+
+    queue.close()
+    other.close()
+
+
+def test_sessions(tmp_path: Path) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    first = SavedSession(
+        session_id="s1", service_id="svc", context='{"is_running": false}'
+    )
+    second = SavedSession(session_id="s2", service_id="other", context="{}")
+    third = SavedSession(session_id="s3", service_id="svc", context="{}")
+    queue.put_session("foo", first)
+    queue.put_session("foo", second)
+    queue.put_session("bar", third)
+
+    assert sorted(queue.take_sessions("foo"), key=lambda s: s.session_id) == [
+        first,
+        second,
+    ]
+    # Sessions are restored once
+    assert queue.take_sessions("foo") == []
+    assert queue.take_sessions("bar") == [third]
+    queue.close()
+
+
+def test_leases(tmp_path: Path) -> None:
+    queue = SqliteTaskQueue(tmp_path / "tasks.db")
+    queue.renew_lease("w1")
+    queue.renew_lease("w2", ttl=0)
+    assert queue.live_workers() == {"w1"}
+
+    queue.renew_lease("w2")
+    queue.release_lease("w1")
+    assert queue.live_workers() == {"w2"}
+    queue.close()
+
+
+def test_worker_alive() -> None:
+    worker_id = new_worker_id()
+    # Unique to each start of a process
+    assert worker_id.startswith(f"{os.getpid()}-")
+    assert worker_id != new_worker_id()
+    assert worker_alive(worker_id)
+    assert not worker_alive("not-a-pid")
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    assert not worker_alive(f"{process.pid}-0123456789ab")
@@ -0,0 +1,49 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator
+
+import pytest
+
+from llama_deploy.apiserver.watcher import SourceWatcher
+
+
+async def next_change(changes: AsyncIterator[set[Path]]) -> set[Path]:
+    return await asyncio.wait_for(changes.__anext__(), timeout=5)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("force_polling", [True, False])
+async def test_changes(tmp_path: Path, force_polling: bool) -> None:
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "node_modules").mkdir()
+    module = tmp_path / "pkg" / "module.py"
+    module.write_text("x = 1")
+    watcher = SourceWatcher(
+        [tmp_path], debounce=0.05, poll_interval=0.05, force_polling=force_polling
+    )
+    changes = watcher.changes()
+    # Start watching
+    first = asyncio.ensure_future(next_change(changes))
+    await asyncio.sleep(0.3)
+
+    # Several saves in a row are reported at once, other files are ignored
+    module.write_text("x = 2")
+    (tmp_path / "pkg" / "other.py").write_text("y = 1")
+    (tmp_path / "pkg" / "notes.txt").write_text("not python")
+    (tmp_path / "node_modules" / "ignored.py").write_text("z = 1")
+    assert await first == {module.resolve(), (tmp_path / "pkg" / "other.py").resolve()}
+
+    # Deletions are changes too
+    module.unlink()
+    assert await next_change(changes) == {module.resolve()}
+    await changes.aclose()  # type: ignore
+
+
+def test_scan(tmp_path: Path) -> None:
+    (tmp_path / "a.py").write_text("a = 1")
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "a.py").write_text("a = 1")
+
+    files = SourceWatcher([tmp_path])._scan()
+
+    assert list(files) == [(tmp_path / "a.py").resolve()]
@@ -0,0 +1,120 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from llama_deploy.apiserver.deployment import Manager
+from llama_deploy.apiserver.state_stores import MemoryStateStore, TaskRecord
+from llama_deploy.apiserver.workers import SessionAffinityMiddleware, WorkerServer
+
+
+def make_app(worker_id: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/deployments/{deployment_name}/tasks/{task_id}/results")
+    async def results(request: Request) -> dict:
+        return {
+            "worker": worker_id,
+            "forwarded": "x-llama-deploy-forwarded" in request.headers,
+        }
+
+    @app.post("/deployments/{deployment_name}/tasks/create")
+    async def create(request: Request, session_id: str | None = None) -> dict:
+        return {"worker": worker_id, "body": (await request.json())}
+
+    @app.post("/debug/profile")
+    async def profile() -> dict:
+        return {"worker": worker_id}
+
+    return app
+
+
+@pytest.fixture
+def manager() -> Manager:
+    m = Manager()
+    m._worker_id = "local"
+    m.set_state_store(MemoryStateStore())
+    return m
+
+
+@pytest.fixture
+def client(manager: Manager) -> httpx.AsyncClient:
+    app = make_app("local")
+    app.add_middleware(SessionAffinityMiddleware, manager=manager)
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    )
+
+
+@pytest.mark.asyncio
+async def test_forward_to_owner(
+    manager: Manager, client: httpx.AsyncClient, tmp_path: Path
+) -> None:
+    store = manager.state_store
+    assert store is not None
+    remote = WorkerServer(make_app("remote"), tmp_path / "remote.sock")
+    await remote.start()
+    store.register_worker("remote", remote.address)
+    store.put_session("foo", "s1", "remote")
+    store.put_task(
+        "foo", TaskRecord(task_id="t1", session_id="s1", input="", worker_id="remote")
+    )
+    store.put_session("foo", "s2", "local")
+
+    try:
+        # Tasks are forwarded to the worker owning their handler
+        response = await client.get("/deployments/foo/tasks/t1/results?session_id=s1")
+        assert response.status_code == 200
+        assert response.json() == {"worker": "remote", "forwarded": True}
+
+        # Sessions are forwarded to the worker owning their context, with the body
+        response = await client.post(
+            "/deployments/foo/tasks/create?session_id=s1", json={"input": "{}"}
+        )
+        assert response.json() == {"worker": "remote", "body": {"input": "{}"}}
+
+        # Owned or unknown sessions and tasks are handled locally
+        response = await client.post(
+            "/deployments/foo/tasks/create?session_id=s2", json={}
+        )
+        assert response.json()["worker"] == "local"
+        response = await client.post("/deployments/foo/tasks/create", json={})
+        assert response.json()["worker"] == "local"
+        response = await client.get("/deployments/foo/tasks/t2/results")
+        assert response.json()["worker"] == "local"
+
+        # Completed tasks are found through the owner of their session
+        store.delete_task("foo", "t1")
+        response = await client.get("/deployments/foo/tasks/t1/results?session_id=s1")
+        assert response.json() == {"worker": "remote", "forwarded": True}
+
+        # Debug requests are forwarded to the worker in the query string
+        response = await client.post("/debug/profile?worker_id=remote")
+        assert response.json() == {"worker": "remote"}
+        response = await client.post("/debug/profile")
+        assert response.json() == {"worker": "local"}
+    finally:
+        await remote.stop()
+
+    assert not (tmp_path / "remote.sock").exists()
+
+
+@pytest.mark.asyncio
+async def test_forward_unreachable_worker(
+    manager: Manager, client: httpx.AsyncClient, tmp_path: Path
+) -> None:
+    store = manager.state_store
+    assert store is not None
+    store.register_worker("remote", str(tmp_path / "gone.sock"))
+    store.put_session("foo", "s1", "remote")
+
+    response = await client.post("/deployments/foo/tasks/create?session_id=s1", json={})
+    assert response.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_no_state_store(client: httpx.AsyncClient, manager: Manager) -> None:
+    manager.set_state_store(None)
+    response = await client.get("/deployments/foo/tasks/t1/results")
+    assert response.json() == {"worker": "local", "forwarded": False}
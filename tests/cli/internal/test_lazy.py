@@ -0,0 +1,47 @@
+import click
+import pytest
+from click.testing import CliRunner
+
+from llama_deploy.cli.internal.lazy import LazyGroup
+
+
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "status": "llama_deploy.cli.status:status",
+        "broken": "llama_deploy.cli.status:ConfigProfile",
+    },
+)
+def cli() -> None:
+    pass
+
+
+@cli.command()
+def eager() -> None:
+    click.echo("eager")
+
+
+def test_list_commands() -> None:
+    ctx = click.Context(cli)
+    assert cli.list_commands(ctx) == ["broken", "eager", "status"]
+
+
+def test_get_command() -> None:
+    ctx = click.Context(cli)
+    status = cli.get_command(ctx, "status")
+    assert isinstance(status, click.Command)
+    assert status.name == "status"
+    assert cli.get_command(ctx, "eager") is eager
+    assert cli.get_command(ctx, "does-not-exist") is None
+
+
+def test_get_command_not_a_command() -> None:
+    ctx = click.Context(cli)
+    with pytest.raises(ValueError, match="it's not a click command"):
+        cli.get_command(ctx, "broken")
+
+
+def test_invoke_eager_command() -> None:
+    result = CliRunner().invoke(cli, ["eager"])
+    assert result.exit_code == 0
+    assert result.output == "eager\n"
@@ -0,0 +1,170 @@
+import json
+from typing import Any
+
+import httpx
+import respx
+from click.testing import CliRunner
+
+from llama_deploy.cli import llamactl
+from llama_deploy.cli.internal.bench import (
+    LatencyStats,
+    MemorySample,
+    growth_rate,
+    parse_metrics,
+)
+
+BASE_URL = "http://localhost:4501"
+METRICS = """# HELP process_resident_memory_bytes Resident memory size in bytes.
+# TYPE process_resident_memory_bytes gauge
+process_resident_memory_bytes 1.048576e+08
+# TYPE process_cpu_seconds_total counter
+process_cpu_seconds_total 1.5
+process_open_fds 12.0
+python_gc_objects_collected_total{generation="0"} 42.0
+"""
+
+
+def _bench(runner: CliRunner, *args: str) -> dict[str, Any]:
+    result = runner.invoke(
+        llamactl, ["bench", "-d", "deployment_name", *args, "--json"]
+    )
+    assert result.exit_code == 0, result.output
+    return json.loads(result.output)
+
+
+@respx.mock
+def test_bench_closed_loop(runner: CliRunner) -> None:
+    run = respx.post(f"{BASE_URL}/deployments/deployment_name/tasks/run").mock(
+        return_value=httpx.Response(200, json="result")
+    )
+    respx.get(f"{BASE_URL}/status/metrics").mock(return_value=httpx.Response(204))
+
+    report = _bench(runner, "-n", "20", "-c", "4", "-s", "service_name", "-a", "a", "1")
+
+    assert run.call_count == 20
+    assert json.loads(run.calls[0].request.content) == {
+        "input": '{"a": "1"}',
+        "service_id": "service_name",
+    }
+    assert report["mode"] == "closed"
+    assert report["completed"] == 20
+    assert report["errors"] == {}
+    assert sum(report["latency"]["histogram"].values()) == 20
+    assert report["server_metrics_after"] == {}
+
+
+@respx.mock
+def test_bench_errors(runner: CliRunner) -> None:
+    respx.post(f"{BASE_URL}/deployments/deployment_name/tasks/run").mock(
+        side_effect=[httpx.Response(200, json="result")] * 6
+        + [httpx.Response(500)] * 3
+        + [httpx.ConnectError("refused")]
+    )
+    respx.get(f"{BASE_URL}/status/metrics").mock(return_value=httpx.Response(204))
+
+    report = _bench(runner, "-n", "10", "-c", "1")
+
+    assert report["completed"] == 10
+    assert report["errors"] == {"HTTP 500": 3, "ConnectError": 1}
+    assert report["error_rate"] == 0.4
+    assert sum(report["latency"]["histogram"].values()) == 6
+
+
+@respx.mock
+def test_bench_stream(runner: CliRunner) -> None:
+    base_url = f"{BASE_URL}/deployments/deployment_name/tasks"
+    respx.post(f"{base_url}/create").mock(
+        return_value=httpx.Response(
+            200, json={"task_id": "task_id", "session_id": "session_id"}
+        )
+    )
+    events = respx.get(f"{base_url}/task_id/events").mock(
+        return_value=httpx.Response(200, text='{"a": 1}\n{"b": 2}\n{"c": 3}\n')
+    )
+    results = respx.get(f"{base_url}/task_id/results").mock(
+        return_value=httpx.Response(200, json={"result": "done"})
+    )
+    respx.get(f"{BASE_URL}/status/metrics").mock(return_value=httpx.Response(204))
+
+    report = _bench(runner, "-n", "5", "--stream")
+
+    assert report["completed"] == 5
+    assert report["events"] == 15
+    assert events.calls[0].request.url.params["session_id"] == "session_id"
+    assert results.call_count == 5
+
+
+@respx.mock
+def test_bench_open_loop(runner: CliRunner) -> None:
+    run = respx.post(f"{BASE_URL}/deployments/deployment_name/tasks/run").mock(
+        return_value=httpx.Response(200, json="result")
+    )
+    respx.get(f"{BASE_URL}/status/metrics").mock(return_value=httpx.Response(204))
+
+    report = _bench(runner, "-n", "10", "--rate", "100")
+
+    assert run.call_count == 10
+    assert report["mode"] == "open"
+    # The last task is scheduled 90ms after the first one
+    assert report["duration_seconds"] >= 0.09
+
+
+@respx.mock
+def test_bench_soak(runner: CliRunner) -> None:
+    respx.post(f"{BASE_URL}/deployments/deployment_name/tasks/run").mock(
+        return_value=httpx.Response(200, json="result")
+    )
+    respx.get(f"{BASE_URL}/status/metrics").mock(
+        return_value=httpx.Response(200, text=METRICS)
+    )
+
+    result = runner.invoke(
+        llamactl,
+        ["bench", "-d", "deployment_name", "--soak", "--duration", "0.3"]
+        + ["--sample-interval", "0.1"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "rss=100.0MB" in result.output
+    assert "rss:       100.0MB (+0.0MB)" in result.output
+    assert "Memory growth: +0.0MB/h" in result.output
+
+
+def test_bench_soak_requires_duration(runner: CliRunner) -> None:
+    result = runner.invoke(llamactl, ["bench", "-d", "deployment_name", "--soak"])
+
+    assert result.exit_code == 2
+    assert "--soak requires --duration" in result.output
+
+
+def test_parse_metrics() -> None:
+    assert parse_metrics(METRICS) == {
+        "process_resident_memory_bytes": 104857600.0,
+        "process_cpu_seconds_total": 1.5,
+        "process_open_fds": 12.0,
+    }
+
+
+def test_growth_rate() -> None:
+    samples = [
+        MemorySample(elapsed_seconds=t, rss_bytes=1000 + t, completed=0)
+        for t in range(5)
+    ]
+    assert growth_rate(samples) == 3600
+    assert growth_rate(samples[:1]) is None
+    assert (
+        growth_rate([MemorySample(elapsed_seconds=0, rss_bytes=None, completed=0)])
+        is None
+    )
+
+
+def test_latency_stats() -> None:
+    stats = LatencyStats.from_latencies([float(i) for i in range(1, 101)])
+
+    assert stats.p50_ms == 51
+    assert stats.p99_ms == 100
+    assert stats.max_ms == 100
+    assert stats.histogram["1"] == 1
+    assert stats.histogram["100"] == 50
+    assert stats.histogram["+Inf"] == 0
+    assert LatencyStats.from_latencies([]) == LatencyStats()
@@ -1,5 +1,9 @@
+import subprocess
+import sys
+from pathlib import Path
 from unittest import mock
 
+import pytest
 from click.testing import CliRunner
 
 from llama_deploy.cli import llamactl
@@ -24,3 +28,33 @@ def test_root_command(runner: CliRunner) -> None:
 def test_wrong_profile(runner: CliRunner) -> None:
     result = runner.invoke(llamactl, ["-p", "foo"])
     assert result.exit_code == 1
+
+
+@pytest.mark.parametrize("args", [["--help"], ["-s", "http://127.0.0.1:1", "status"]])
+def test_no_heavy_imports(data_path: Path, args: list[str]) -> None:
+    # Run in a fresh interpreter, the test session already imported everything
+    code = (
+        "import sys\n"
+        "from llama_deploy.cli import llamactl\n"
+        f"llamactl({['-c', str(data_path / 'config.yaml')] + args!r}, standalone_mode=False)\n"
+        "heavy = [m for m in ('llama_index', 'workflows') if m in sys.modules]\n"
+        "print('HEAVY:', heavy)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert "HEAVY: []" in result.stdout
+
+
+def test_subcommands_are_lazy(data_path: Path) -> None:
+    code = (
+        "import sys\n"
+        "from llama_deploy.cli import llamactl\n"
+        f"llamactl({['-c', str(data_path / 'config.yaml'), 'config', 'current-profile']!r}, standalone_mode=False)\n"
+        "loaded = [m for m in ('llama_deploy.cli.status', 'llama_deploy.client') if m in sys.modules]\n"
+        "print('LOADED:', loaded)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert "LOADED: []" in result.stdout
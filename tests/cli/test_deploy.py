@@ -10,7 +10,7 @@ from llama_deploy.cli import llamactl
 def test_deploy(runner: CliRunner, data_path: Path) -> None:
     test_config_file = data_path / "deployment.yaml"
     mocked_result = mock.MagicMock(id="test_deployment")
-    with mock.patch("llama_deploy.cli.deploy.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.deployments.create.return_value = (
             mocked_result
         )
@@ -30,7 +30,7 @@ def test_deploy(runner: CliRunner, data_path: Path) -> None:
 
 def test_deploy_failed(runner: CliRunner, data_path: Path) -> None:
     test_config_file = data_path / "deployment.yaml"
-    with mock.patch("llama_deploy.cli.deploy.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.deployments.create.side_effect = (
             httpx.HTTPStatusError(
                 "Unauthorized!", response=mock.MagicMock(), request=mock.MagicMock()
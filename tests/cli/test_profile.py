@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import httpx
+import respx
+from click.testing import CliRunner
+
+from llama_deploy.cli import llamactl
+
+STACKS = "[test-deployment/svc/step];main (app.py:1);step (app.py:10) 42\n"
+
+
+@respx.mock
+def test_profile(runner: CliRunner, tmp_path: Path) -> None:
+    route = respx.post("http://localhost:4501/debug/profile").mock(
+        return_value=httpx.Response(
+            200, text=STACKS, headers={"x-profile-samples": "100"}
+        )
+    )
+    output = tmp_path / "profile.folded"
+
+    result = runner.invoke(
+        llamactl,
+        ["profile", "-d", "test-deployment", "--duration", "5", "-w", "42"]
+        + ["--all-threads", "-o", str(output)],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert output.read_text() == STACKS
+    assert "Collected 100 samples, 1 distinct stacks" in result.output
+    params = route.calls[0].request.url.params
+    assert params["duration"] == "5.0"
+    assert params["interval"] == "0.005"
+    assert params["all_threads"] == "true"
+    assert params["deployment"] == "test-deployment"
+    assert params["worker_id"] == "42"
+
+
+@respx.mock
+def test_profile_stdout(runner: CliRunner) -> None:
+    respx.post("http://localhost:4501/debug/profile").mock(
+        return_value=httpx.Response(200, text=STACKS)
+    )
+
+    result = runner.invoke(llamactl, ["profile", "--duration", "1"])
+
+    assert result.exit_code == 0
+    assert STACKS in result.output
+
+
+@respx.mock
+def test_profile_disabled(runner: CliRunner) -> None:
+    respx.post("http://localhost:4501/debug/profile").mock(
+        return_value=httpx.Response(404, json={"detail": "Profiling is disabled"})
+    )
+
+    result = runner.invoke(llamactl, ["profile"])
+
+    assert result.exit_code == 1
+    assert '{"detail":"Profiling is disabled"}' in result.output
@@ -8,7 +8,7 @@ from llama_deploy.types import TaskDefinition
 
 
 def test_run(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.run.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_deployment = mock.MagicMock()
         mocked_deployment.tasks.run.return_value = mock.MagicMock(id="test_deployment")
         mocked_client.return_value.sync.apiserver.deployments.get.return_value = (
@@ -26,7 +26,7 @@ def test_run(runner: CliRunner) -> None:
 
         args = mocked_deployment.tasks.run.call_args
         actual = args[0][0]
-        expected = TaskDefinition(service_id="service_name", input="{}")
+        expected = TaskDefinition(service_id="service_name", input={})
         assert expected.input == actual.input
         assert expected.service_id == actual.service_id
         assert actual.session_id is not None
@@ -34,7 +34,7 @@ def test_run(runner: CliRunner) -> None:
 
 
 def test_run_error(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.run.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         err_response = mock.MagicMock()
         err_response.text = '{"error": "test error"}'
         mocked_client.return_value.sync.apiserver.deployments.get.side_effect = (
@@ -50,7 +50,7 @@ def test_run_error(runner: CliRunner) -> None:
 
 
 def test_run_args(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.run.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_deployment = mock.MagicMock()
         mocked_deployment.tasks.run.return_value = mock.MagicMock(id="test_deployment")
         mocked_client.return_value.sync.apiserver.deployments.get.return_value = (
@@ -75,7 +75,10 @@ def test_run_args(runner: CliRunner) -> None:
         args = mocked_deployment.tasks.run.call_args
         actual = args[0][0]
         expected = TaskDefinition(
-            input='{"first_arg": "first_value", "second_arg": "\\"second value with spaces\\""}',
+            input={
+                "first_arg": "first_value",
+                "second_arg": '"second value with spaces"',
+            },
         )
         assert expected.input == actual.input
         assert expected.service_id == actual.service_id
@@ -1,10 +1,10 @@
 import os
 from pathlib import Path
-from unittest.mock import MagicMock, mock_open, patch
+from typing import Any, Iterator
+from unittest.mock import patch
 
 import pytest
 from click.testing import CliRunner
-from tenacity import RetryError
 
 from llama_deploy.apiserver.settings import settings
 from llama_deploy.cli.serve import serve
@@ -17,57 +17,111 @@ def runner() -> CliRunner:
 
 
 @pytest.fixture(autouse=True)
-def ensure_settings_defaults():  # type: ignore
-    """Fixture to ensure settings are reset before each test."""
-    original_prometheus_enabled = settings.prometheus_enabled
-    original_prometheus_port = settings.prometheus_port
+def ensure_settings_defaults(monkeypatch: Any) -> Iterator[None]:
+    """Fixture to ensure settings and environment are reset after each test."""
+    original = settings.model_copy()
+    for name in (
+        "RC_PATH",
+        "DEPLOYMENT_FILE_PATH",
+        "DEPLOYMENTS_PATH",
+        "RC_LOCAL",
+        "SHARED_STATE_PATH",
+        "WATCH",
+    ):
+        # Register the env vars with monkeypatch so they're restored after the test
+        monkeypatch.setenv(f"LLAMA_DEPLOY_APISERVER_{name}", "")
+        monkeypatch.delenv(f"LLAMA_DEPLOY_APISERVER_{name}")
     yield
-    settings.prometheus_enabled = original_prometheus_enabled
-    settings.prometheus_port = original_prometheus_port
+    for name in type(settings).model_fields:
+        setattr(settings, name, getattr(original, name))
 
 
 def test_serve_no_deployment_file(runner: CliRunner) -> None:
     """Test serve command without a deployment file."""
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch("llama_deploy.cli.serve.start_http_server") as mock_start_http_server,
-        patch("llama_deploy.cli.serve.Client") as mock_client_class,
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server") as mock_start_http_server,
     ):
-        mock_process = MagicMock()
-        mock_popen.return_value = mock_process
         settings.prometheus_enabled = False
 
-        mock_sdk_client = MagicMock()
-        mock_client_class.return_value = mock_sdk_client
-
         result = runner.invoke(serve)
 
         assert result.exit_code == 0
-        expected_env = os.environ.copy()
-        mock_popen.assert_called_once_with(
+        mock_run.assert_called_once_with(
+            "llama_deploy.apiserver.app:app",
+            host=settings.host,
+            port=settings.port,
+            workers=1,
+            loop="auto",
+            http="auto",
+            backlog=2048,
+            timeout_keep_alive=5,
+            limit_concurrency=None,
+            timeout_graceful_shutdown=30,
+        )
+        mock_start_http_server.assert_not_called()
+        assert settings.rc_local is False
+
+
+def test_serve_options(runner: CliRunner) -> None:
+    """Test serve command forwards the server options to uvicorn."""
+    with (
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server"),
+    ):
+        settings.prometheus_enabled = False
+
+        result = runner.invoke(
+            serve,
             [
-                "uvicorn",
-                "llama_deploy.apiserver.app:app",
                 "--host",
-                "localhost",
+                "0.0.0.0",
                 "--port",
-                "4501",
+                "8080",
+                "--workers",
+                "4",
+                "--loop",
+                "uvloop",
+                "--http",
+                "httptools",
+                "--backlog",
+                "4096",
+                "--timeout-keep-alive",
+                "30",
+                "--limit-concurrency",
+                "100",
             ],
-            env=expected_env,
         )
-        mock_start_http_server.assert_not_called()
-        mock_process.wait.assert_called_once()
-        mock_sdk_client.sync.apiserver.deployments.create.assert_not_called()
+
+        assert result.exit_code == 0
+        mock_run.assert_called_once_with(
+            "llama_deploy.apiserver.app:app",
+            host="0.0.0.0",
+            port=8080,
+            workers=4,
+            loop="uvloop",
+            http="httptools",
+            backlog=4096,
+            timeout_keep_alive=30,
+            limit_concurrency=100,
+            timeout_graceful_shutdown=30,
+        )
+
+
+def test_serve_invalid_workers(runner: CliRunner) -> None:
+    with patch("uvicorn.run") as mock_run:
+        result = runner.invoke(serve, ["--workers", "0"])
+
+    assert result.exit_code == 2
+    mock_run.assert_not_called()
 
 
 def test_serve_prometheus_enabled(runner: CliRunner) -> None:
     """Test serve command with Prometheus enabled."""
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch("llama_deploy.cli.serve.start_http_server") as mock_start_http_server,
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server") as mock_start_http_server,
     ):
-        mock_process = MagicMock()
-        mock_popen.return_value = mock_process
         settings.prometheus_enabled = True
         settings.prometheus_port = 9090  # Example port
 
@@ -75,8 +129,7 @@ def test_serve_prometheus_enabled(runner: CliRunner) -> None:
 
         assert result.exit_code == 0
         mock_start_http_server.assert_called_once_with(9090)
-        mock_popen.assert_called_once()  # Args checked in other tests
-        mock_process.wait.assert_called_once()
+        mock_run.assert_called_once()  # Args checked in other tests
 
 
 def test_serve_with_deployment_file(runner: CliRunner, tmp_path: Path) -> None:
@@ -85,102 +138,89 @@ def test_serve_with_deployment_file(runner: CliRunner, tmp_path: Path) -> None:
     deployment_file.write_text("dummy content")
 
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch("llama_deploy.cli.serve.start_http_server") as mock_start_http_server,
-        patch("llama_deploy.cli.serve.Client") as mock_client_class,
-        patch(
-            "pathlib.Path.open", mock_open(read_data=b"dummy content")
-        ) as mock_file_open,
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server") as mock_start_http_server,
     ):
-        mock_process = MagicMock()
-        mock_popen.return_value = mock_process
-
-        mock_sdk_client = MagicMock()
-        mock_client_class.return_value = mock_sdk_client
         settings.prometheus_enabled = False
 
         result = runner.invoke(serve, [str(deployment_file)])
 
         assert result.exit_code == 0
-
-        expected_env = os.environ.copy()
-        expected_env["LLAMA_DEPLOY_APISERVER_DEPLOYMENTS_PATH"] = str(tmp_path)
-        mock_popen.assert_called_once_with(
-            [
-                "uvicorn",
-                "llama_deploy.apiserver.app:app",
-                "--host",
-                "localhost",
-                "--port",
-                "4501",
-            ],
-            env=expected_env,
-        )
         mock_start_http_server.assert_not_called()
-        mock_client_class.assert_called_once_with()
-        mock_file_open.assert_called_once_with("rb")
-        mock_sdk_client.sync.apiserver.deployments.create.assert_called_once()
-        # Check the first argument of the create call (the file object)
-        assert (
-            mock_sdk_client.sync.apiserver.deployments.create.call_args[0][0]
-            == mock_file_open.return_value
-        )
-        # Check the local keyword argument
+        mock_run.assert_called_once()
+
+        # The deployment file is deployed by the API Server lifespan
+        assert settings.rc_path == tmp_path
+        assert settings.deployment_file_path == "test_deployment.yaml"
+        assert settings.deployments_path == tmp_path
+        assert settings.rc_local is True
+        # Worker processes get the same settings from the environment
+        assert os.environ["LLAMA_DEPLOY_APISERVER_RC_PATH"] == str(tmp_path)
         assert (
-            mock_sdk_client.sync.apiserver.deployments.create.call_args[1]["local"]
-            is True
+            os.environ["LLAMA_DEPLOY_APISERVER_DEPLOYMENT_FILE_PATH"]
+            == "test_deployment.yaml"
         )
+        assert os.environ["LLAMA_DEPLOY_APISERVER_DEPLOYMENTS_PATH"] == str(tmp_path)
+        assert os.environ["LLAMA_DEPLOY_APISERVER_RC_LOCAL"] == "True"
 
-        mock_process.wait.assert_called_once()
 
+def test_serve_keyboard_interrupt(runner: CliRunner) -> None:
+    """Test serve command handles KeyboardInterrupt."""
+    with (
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server"),
+    ):
+        mock_run.side_effect = KeyboardInterrupt
+        settings.prometheus_enabled = False
+
+        result = runner.invoke(serve)
+
+        # Exit code might be 0 or other codes depending on how Click handles KeyboardInterrupt
+        # Checking for the message is more reliable here.
+        assert "Shutting down..." in result.output
+        mock_run.assert_called_once()
+
+
+def test_serve_multiple_workers_shared_state(runner: CliRunner) -> None:
+    """Test serve command sets up shared state when running multiple workers."""
+    state_dirs = []
 
-def test_serve_deployment_creation_fails(runner: CliRunner, tmp_path: Path) -> None:
-    """Test serve command when deployment creation fails."""
-    deployment_file = tmp_path / "test_deployment_fail.yaml"
-    deployment_file.write_text("dummy fail content")
+    def run(*args: Any, **kwargs: Any) -> None:
+        assert settings.shared_state_path is not None
+        state_dirs.append(settings.shared_state_path.parent)
+        assert state_dirs[0].is_dir()
 
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch("llama_deploy.cli.serve.start_http_server"),
-        patch("llama_deploy.cli.serve.Client") as mock_client_class,
-        patch("pathlib.Path.open", mock_open(read_data=b"dummy content")),
-        patch("llama_deploy.cli.serve.RETRY_WAIT_SECONDS", 0.01),
+        patch("uvicorn.run", side_effect=run) as mock_run,
+        patch("prometheus_client.start_http_server"),
     ):
-        mock_process = MagicMock()
-        mock_popen.return_value = mock_process
-
-        mock_sdk_client = MagicMock()
-        mock_sdk_client.sync.apiserver.deployments.create.side_effect = RetryError(
-            "Failed to deploy"  # type: ignore
-        )
-        mock_client_class.return_value = mock_sdk_client
         settings.prometheus_enabled = False
+        settings.shared_state_path = None
 
-        result = runner.invoke(serve, [str(deployment_file)])
+        result = runner.invoke(serve, ["--workers", "2"])
 
-        assert result.exit_code == 1
-        assert "Failed to create deployment" in result.output
-        mock_client_class.assert_called_once_with()
-        mock_sdk_client.sync.apiserver.deployments.create.assert_called()  # Called 5 times due to retry
-        assert mock_sdk_client.sync.apiserver.deployments.create.call_count == 5
-        mock_process.terminate.assert_called_once()
-        mock_process.wait.assert_not_called()
+        assert result.exit_code == 0
+        mock_run.assert_called_once()
+        assert settings.shared_state_path is not None
+        assert settings.shared_state_path.name == "state.db"
+        assert os.environ["LLAMA_DEPLOY_APISERVER_SHARED_STATE_PATH"] == str(
+            settings.shared_state_path
+        )
+        # The temporary state is removed once the server stops
+        assert not state_dirs[0].exists()
 
 
-def test_serve_keyboard_interrupt(runner: CliRunner) -> None:
-    """Test serve command handles KeyboardInterrupt."""
+def test_serve_watch(runner: CliRunner) -> None:
+    """Test serve command enables the watch mode."""
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch("llama_deploy.cli.serve.start_http_server"),
+        patch("uvicorn.run") as mock_run,
+        patch("prometheus_client.start_http_server"),
     ):
-        mock_process = MagicMock()
-        mock_process.wait.side_effect = KeyboardInterrupt
-        mock_popen.return_value = mock_process
         settings.prometheus_enabled = False
 
-        result = runner.invoke(serve)
+        result = runner.invoke(serve, ["--watch"])
 
-        # Exit code might be 0 or other codes depending on how Click handles KeyboardInterrupt
-        # Checking for the message is more reliable here.
-        assert "Shutting down..." in result.output
-        mock_process.wait.assert_called_once()
+        assert result.exit_code == 0
+        mock_run.assert_called_once()
+        assert settings.watch is True
+        assert os.environ["LLAMA_DEPLOY_APISERVER_WATCH"] == "True"
@@ -7,7 +7,7 @@ from llama_deploy.cli import llamactl
 
 
 def test_session_create(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.sessions.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_deployment = mock.MagicMock()
         mocked_deployment.sessions.create.return_value = mock.MagicMock(
             id="test_session"
@@ -30,7 +30,7 @@ def test_session_create(runner: CliRunner) -> None:
 
 
 def test_sessions_create_error(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.sessions.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.deployments.get.side_effect = (
             httpx.HTTPStatusError(
                 "test error", response=mock.MagicMock(), request=mock.MagicMock()
@@ -7,14 +7,14 @@ from llama_deploy.types.apiserver import Status, StatusEnum
 
 
 def test_status_raised(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.status.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.status.side_effect = Exception()
         result = runner.invoke(llamactl, ["-s", "https://test", "status"])
         assert result.exit_code == 1
 
 
 def test_status_server_down(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.status.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.status.return_value = Status(
             status=StatusEnum.DOWN, status_message="API Server is down for tests"
         )
@@ -24,7 +24,7 @@ def test_status_server_down(runner: CliRunner) -> None:
 
 
 def test_status_unhealthy(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.status.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.status.return_value = Status(
             status=StatusEnum.UNHEALTHY, status_message="test_message"
         )
@@ -35,7 +35,7 @@ def test_status_unhealthy(runner: CliRunner) -> None:
 
 
 def test_status(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.status.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.status.return_value = Status(
             status=StatusEnum.HEALTHY, status_message="test_message"
         )
@@ -48,7 +48,7 @@ def test_status(runner: CliRunner) -> None:
 
 
 def test_status_with_deployments(runner: CliRunner) -> None:
-    with mock.patch("llama_deploy.cli.status.Client") as mocked_client:
+    with mock.patch("llama_deploy.client.Client") as mocked_client:
         mocked_client.return_value.sync.apiserver.status.return_value = Status(
             status=StatusEnum.HEALTHY,
             status_message="test_message",
@@ -4,9 +4,12 @@ from unittest import mock
 
 import httpx
 import pytest
+import respx
 
+from llama_deploy.client import Client
 from llama_deploy.client.models.apiserver import (
     ApiServer,
+    ArtifactCollection,
     Deployment,
     DeploymentCollection,
     SessionCollection,
@@ -134,11 +137,22 @@ async def test_task_collection_run(client: Any) -> None:
             "task_id": "test_id",
             "session_id": None,
             "service_id": None,
+            "idempotency_key": None,
         },
+        headers={},
         timeout=120.0,
     )
 
 
+@pytest.mark.asyncio
+async def test_task_collection_run_with_timeout(client: Any) -> None:
+    client.request.return_value = mock.MagicMock(json=lambda: "some result")
+    coll = TaskCollection(client=client, items={}, deployment_id="a_deployment")
+
+    await coll.run(TaskDefinition(input="{}"), timeout=30)
+    assert client.request.await_args.kwargs["headers"] == {"X-Task-Timeout": "30"}
+
+
 @pytest.mark.asyncio
 async def test_task_collection_create(client: Any) -> None:
     client.request.return_value = mock.MagicMock(
@@ -160,17 +174,78 @@ async def test_task_collection_create(client: Any) -> None:
     client.request.assert_awaited_with(
         "POST",
         "http://localhost:4501/deployments/a_deployment/tasks/create",
+        retries=0,
         verify=True,
         json={
             "input": '{"arg": "test_input"}',
             "task_id": "test_id",
             "session_id": None,
             "service_id": None,
+            "idempotency_key": None,
         },
+        headers={},
         timeout=120.0,
     )
 
 
+@pytest.mark.asyncio
+async def test_task_collection_create_with_retries(client: Any) -> None:
+    client.max_retries = 3
+    client.request.return_value = mock.MagicMock(
+        json=lambda: {"session_id": "a_session", "task_id": "test_id"}
+    )
+    coll = TaskCollection(client=client, items={}, deployment_id="a_deployment")
+
+    task = TaskDefinition(input="{}")
+    await coll.create(task)
+    # Retries are made safe with an idempotency key
+    kwargs = client.request.await_args.kwargs
+    assert kwargs["retries"] == 3
+    assert kwargs["json"]["idempotency_key"]
+    assert task.idempotency_key is None
+
+    await coll.create(TaskDefinition(input="{}", idempotency_key="my-key"))
+    assert client.request.await_args.kwargs["json"]["idempotency_key"] == "my-key"
+
+
+@pytest.mark.asyncio
+async def test_task_collection_create_with_timeout(client: Any) -> None:
+    client.request.return_value = mock.MagicMock(
+        json=lambda: {"session_id": "a_session", "task_id": "test_id"}
+    )
+    coll = TaskCollection(client=client, items={}, deployment_id="a_deployment")
+
+    await coll.create(TaskDefinition(input="{}"), timeout=30)
+    assert client.request.await_args.kwargs["headers"] == {"X-Task-Timeout": "30"}
+
+
+@pytest.mark.asyncio
+async def test_task_cancel(client: Any) -> None:
+    task = Task(
+        client=client, id="test_id", deployment_id="a_deployment", session_id="s"
+    )
+
+    assert await task.cancel()
+    client.request.assert_awaited_with(
+        "POST",
+        "http://localhost:4501/deployments/a_deployment/tasks/test_id/cancel",
+        verify=True,
+        timeout=120.0,
+    )
+
+    request = httpx.Request("POST", "http://localhost:4501")
+    client.request.side_effect = httpx.HTTPStatusError(
+        "conflict", request=request, response=httpx.Response(409, request=request)
+    )
+    assert await task.cancel() is False
+
+    client.request.side_effect = httpx.HTTPStatusError(
+        "not found", request=request, response=httpx.Response(404, request=request)
+    )
+    with pytest.raises(httpx.HTTPStatusError):
+        await task.cancel()
+
+
 @pytest.mark.asyncio
 async def test_task_deployment_tasks(client: Any) -> None:
     d = Deployment(client=client, id="a_deployment")
@@ -315,3 +390,43 @@ async def test_deployments(client: Any) -> None:
     apis = ApiServer(client=client, id="apiserver")
     await apis.deployments.list()
     client.request.assert_awaited_with("GET", "http://localhost:4501/deployments/")
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_artifact_collection_upload(tmp_path: Any) -> None:
+    artifact = {"artifact_id": "abc", "size_bytes": 5, "url": "/abc"}
+    route = respx.post("http://localhost:4501/deployments/a_deployment/artifacts").mock(
+        return_value=httpx.Response(200, json=artifact)
+    )
+    coll = ArtifactCollection(client=Client(), items={}, deployment_id="a_deployment")
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"hello")
+
+    res = await coll.upload(path)
+    assert res.artifact_id == "abc"
+    assert res.ref() == {"$artifact": "abc"}
+    request = route.calls.last.request
+    assert request.headers["content-type"] == "application/octet-stream"
+    assert request.content == b"hello"
+
+    await coll.upload(io.BytesIO(b"from a file"))
+    assert route.calls.last.request.content == b"from a file"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_artifact_collection_download(tmp_path: Any) -> None:
+    route = respx.get(
+        "http://localhost:4501/deployments/a_deployment/artifacts/abc"
+    ).mock(return_value=httpx.Response(206, content=b"llo"))
+    coll = ArtifactCollection(client=Client(), items={}, deployment_id="a_deployment")
+
+    destination = tmp_path / "file.bin"
+    assert await coll.download("abc", destination, start=2) == 3
+    assert destination.read_bytes() == b"llo"
+    assert route.calls.last.request.headers["range"] == "bytes=2-"
+
+    chunks = [c async for c in coll.stream("abc", end=9)]
+    assert b"".join(chunks) == b"llo"
+    assert route.calls.last.request.headers["range"] == "bytes=0-9"
@@ -1,8 +1,10 @@
 from unittest import mock
 
+import httpx
 import pytest
 
 from llama_deploy.client import Client
+from llama_deploy.client.base import decode_response
 from llama_deploy.client.client import _SyncClient
 from llama_deploy.client.models import ApiServer
 
@@ -58,3 +60,57 @@ async def test_client_request() -> None:
         await c.request("GET", "http://example.com", verify=False)
         _httpx.AsyncClient.assert_called_with(verify=False)
         mocked_response.raise_for_status.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_client_request_retries() -> None:
+    c = Client(retry_backoff=0)
+    with mock.patch.object(httpx.AsyncClient, "request") as request:
+        request.side_effect = [
+            httpx.ConnectError("refused"),
+            httpx.Response(503, request=httpx.Request("POST", "http://example.com")),
+            httpx.Response(200, request=httpx.Request("POST", "http://example.com")),
+        ]
+        response = await c.request("POST", "http://example.com", retries=2)
+        assert response.status_code == 200
+        assert request.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_client_request_retries_exhausted() -> None:
+    c = Client(retry_backoff=0)
+    with mock.patch.object(httpx.AsyncClient, "request") as request:
+        request.side_effect = httpx.ReadTimeout("timeout")
+        with pytest.raises(httpx.ReadTimeout):
+            await c.request("POST", "http://example.com", retries=2)
+        assert request.call_count == 3
+
+        # Client errors are not retried
+        request.side_effect = [
+            httpx.Response(400, request=httpx.Request("POST", "http://example.com"))
+        ]
+        with pytest.raises(httpx.HTTPStatusError):
+            await c.request("POST", "http://example.com", retries=2)
+        assert request.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_client_request_msgpack() -> None:
+    msgpack = pytest.importorskip("msgpack")
+    c = Client(payload_format="msgpack")
+    with mock.patch.object(httpx.AsyncClient, "request") as request:
+        request.return_value = httpx.Response(
+            200,
+            content=msgpack.packb({"result": [1, 2]}),
+            headers={"Content-Type": "application/msgpack"},
+            request=httpx.Request("POST", "http://example.com"),
+        )
+        response = await c.request(
+            "POST", "http://example.com", json={"input": {"n": 1}}
+        )
+
+    kwargs = request.call_args.kwargs
+    assert msgpack.unpackb(kwargs["content"]) == {"input": {"n": 1}}
+    assert kwargs["headers"]["Content-Type"] == "application/msgpack"
+    assert kwargs["headers"]["Accept"] == "application/msgpack"
+    assert decode_response(response) == {"result": [1, 2]}